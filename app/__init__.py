@@ -1 +1,82 @@
-# This file marks the app directory as a Python package
\ No newline at end of file
+# This file marks the app directory as a Python package
+import os
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from app.utils.engine import RoutingSession
+
+# Shared database handle, bound to each app by create_app();
+# its sessions send GET reads to the replica when one is configured
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def create_app(config=None):
+    """Build the application
+
+    ``config`` is a class from ``app.config`` or its name; by default the
+    one named by ``APP_ENV``. Blueprints, models and services are imported
+    here rather than with the package, so that importing ``app`` stays cheap.
+    """
+    from flask_cors import CORS
+    from app.config import CONFIGS
+    from app.utils.engine import configure_engines
+    from app.utils.metrics import init_metrics
+
+    if config is None or isinstance(config, str):
+        config = CONFIGS[config or os.getenv('APP_ENV', 'production')]
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    # Enable CORS
+    CORS(app)
+
+    # Initialize database
+    db.init_app(app)
+    configure_engines(app, db)
+
+    # Latency, SQL and OMDB metrics for /metrics and Server-Timing
+    init_metrics(app, db)
+
+    # Import routes
+    from app.routes.movie_routes import movie_bp
+    from app.routes.tv_routes import tv_bp
+    from app.routes.main_routes import main_bp
+    from app.routes.data_routes import data_bp
+    from app.routes.job_routes import job_bp
+    from app.routes.poster_routes import poster_bp
+    from app.routes.metrics_routes import metrics_bp
+
+    # Register blueprints
+    app.register_blueprint(movie_bp)
+    app.register_blueprint(tv_bp)
+    app.register_blueprint(main_bp)
+    app.register_blueprint(data_bp)
+    app.register_blueprint(job_bp)
+    app.register_blueprint(poster_bp)
+    app.register_blueprint(metrics_bp)
+
+    # Background jobs run in a small worker pool inside each web process,
+    # started with the first request; JOB_WORKER_THREADS=0 leaves them to run_worker.py
+    if app.config['JOB_WORKER_THREADS'] > 0:
+        from app.services.enrichment import HANDLERS
+        from app.services.jobs import ensure_worker
+
+        @app.before_request
+        def start_job_worker():
+            ensure_worker(app, HANDLERS)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create database tables and upgrade ones from older versions"""
+        from app.utils.schema import init_schema
+        init_schema()
+        print("Database tables created successfully!")
+
+    if app.config['AUTO_UPGRADE_SCHEMA']:
+        from app.utils.schema import init_schema
+        with app.app_context():
+            init_schema()
+
+    return app
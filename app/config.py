@@ -0,0 +1,108 @@
+"""Application settings, one class per environment.
+
+:func:`app.create_app` takes one of these classes or its name from
+``CONFIGS``; without either it uses ``APP_ENV`` (``production`` unless set).
+Settings are read from the environment, which ``.env`` is loaded into once,
+when this module is first imported. Engine options depend on the database:
+a bounded, pre-pinged connection pool with a statement timeout for
+PostgreSQL, and pragmas for SQLite (see ``app.utils.engine``).
+
+The schema is not touched when a production app is created: run
+``flask --app wsgi init-db`` (or ``python init_db.py``) once per deploy.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def database_url(name, default=None):
+    """The database URL in environment variable ``name`` in the form SQLAlchemy expects"""
+    url = os.getenv(name) or default
+    if url and url.startswith('postgres://'):
+        # Render uses PostgreSQL, but SQLAlchemy requires "postgresql://"
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+
+def engine_options(url):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for a database URL"""
+    if url.startswith('sqlite'):
+        # SQLite needs no pool tuning; its lock waits are set by SQLITE_PRAGMAS
+        return {}
+    options = {
+        # Size the pool for the request threads plus JOB_WORKER_THREADS of one process
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 5)),
+        # Fail a request instead of queueing it forever when the pool is exhausted
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        # Replace connections before the server or a proxy drops them as idle
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+    if url.startswith('postgresql') and statement_timeout > 0:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+def replica_binds():
+    """``SQLALCHEMY_BINDS`` with the read replica, if ``DATABASE_REPLICA_URL`` is set"""
+    url = database_url('DATABASE_REPLICA_URL')
+    if not url:
+        return {}
+    return {'replica': {'url': url, **engine_options(url)}}
+
+
+class Config:
+    # SQLite in the instance folder unless DATABASE_URL is set
+    SQLALCHEMY_DATABASE_URI = database_url('DATABASE_URL', 'sqlite:///cinemate.db')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_BINDS = replica_binds()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # WAL lets readers run alongside the writer; busy_timeout is in milliseconds
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'wal'),
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'normal'),
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 15000)),
+    }
+    # Job threads in each web process; 0 leaves jobs to run_worker.py
+    JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 2))
+    # Create and upgrade tables when the app is created, instead of in init-db
+    AUTO_UPGRADE_SCHEMA = False
+    # Requests sent with "X-Profile: 1" run under cProfile; stats go to
+    # PROFILE_DIR (default: instance/profiles)
+    PROFILE_REQUESTS = os.getenv('PROFILE_REQUESTS', '0') == '1'
+    PROFILE_DIR = os.getenv('PROFILE_DIR')
+    # Bearer token that /metrics requires, if set
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
+# Local development server: tables are kept up to date on every start
+class DevelopmentConfig(Config):
+    DEBUG = True
+    AUTO_UPGRADE_SCHEMA = True
+    PROFILE_REQUESTS = True
+
+
+# A fresh in-memory database (or TEST_DATABASE_URL) and no job threads
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL', 'sqlite://')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_BINDS = {}
+    JOB_WORKER_THREADS = 0
+    AUTO_UPGRADE_SCHEMA = True
+
+
+# Web processes behind gunicorn; the schema is managed by init-db
+class ProductionConfig(Config):
+    pass
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
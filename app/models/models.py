@@ -1,20 +1,47 @@
 from app import db
 from datetime import datetime
+import json
+
+# Which genres each title has; derived from the genre strings by app.services.genres
+movie_genre = db.Table(
+    'movie_genre',
+    db.Column('movie_id', db.Integer, db.ForeignKey('movie.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id', ondelete='CASCADE'), primary_key=True),
+    # Titles by genre, for filters and facet counts
+    db.Index('ix_movie_genre_genre', 'genre_id', 'movie_id'),
+)
+
+tv_show_genre = db.Table(
+    'tv_show_genre',
+    db.Column('tv_show_id', db.Integer, db.ForeignKey('tv_show.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_tv_show_genre_genre', 'genre_id', 'tv_show_id'),
+)
+
+class Genre(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
 
 class Movie(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    year = db.Column(db.Integer)
+    title = db.Column(db.String(200), nullable=False, index=True)
+    year = db.Column(db.Integer, index=True)
     genre = db.Column(db.String(100))
     director = db.Column(db.String(100))
     poster_url = db.Column(db.String(500))
     plot = db.Column(db.Text)
     imdb_id = db.Column(db.String(20), unique=True)
     watched = db.Column(db.Boolean, default=False)
-    rating = db.Column(db.Float, nullable=True)
+    rating = db.Column(db.Float, nullable=True, index=True)
     notes = db.Column(db.Text, nullable=True)
     watch_later = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Bumped on every change to the title or its episodes, by app.services.versions
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Last time OMDB metadata was filled in by app.services.enrichment
+    enriched_at = db.Column(db.DateTime, nullable=True, index=True)
+    genres = db.relationship('Genre', secondary=movie_genre, lazy=True)
     
     def to_dict(self):
         return {
@@ -30,28 +57,39 @@ class Movie(db.Model):
             'rating': self.rating,
             'notes': self.notes,
             'watch_later': self.watch_later,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
 class TVShow(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    year = db.Column(db.Integer)
+    title = db.Column(db.String(200), nullable=False, index=True)
+    year = db.Column(db.Integer, index=True)
     genre = db.Column(db.String(100))
     creator = db.Column(db.String(100))
     poster_url = db.Column(db.String(500))
     plot = db.Column(db.Text)
     imdb_id = db.Column(db.String(20), unique=True)
     total_episodes = db.Column(db.Integer, default=0)
-    rating = db.Column(db.Float, nullable=True)
+    # Maintained by app.services.counters whenever episodes change
+    watched_episodes = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating = db.Column(db.Float, nullable=True, index=True)
     notes = db.Column(db.Text, nullable=True)
     watch_later = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Bumped on every change to the title or its episodes, by app.services.versions
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Last time OMDB metadata was filled in by app.services.enrichment
+    enriched_at = db.Column(db.DateTime, nullable=True, index=True)
     episodes = db.relationship('Episode', backref='tv_show', lazy=True, cascade="all, delete-orphan")
+    seasons = db.relationship('Season', backref='tv_show', lazy=True, cascade="all, delete-orphan",
+                              order_by='Season.number')
+    genres = db.relationship('Genre', secondary=tv_show_genre, lazy=True)
     
-    def to_dict(self):
-        watched_episodes = sum(1 for episode in self.episodes if episode.watched)
-        return {
+    def to_dict(self, include_episodes=True):
+        watched_episodes = self.watched_episodes or 0
+        data = {
             'id': self.id,
             'title': self.title,
             'year': self.year,
@@ -67,16 +105,42 @@ class TVShow(db.Model):
             'notes': self.notes,
             'watch_later': self.watch_later,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'episodes': [episode.to_dict() for episode in self.episodes]
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        if include_episodes:
+            data['seasons'] = [season.to_dict() for season in self.seasons]
+            data['episodes'] = [episode.to_dict() for episode in self.episodes]
+        return data
+
+# Per-season episode and watched counts, maintained alongside TVShow.watched_episodes
+class Season(db.Model):
+    tv_show_id = db.Column(db.Integer, db.ForeignKey('tv_show.id'), primary_key=True)
+    number = db.Column(db.Integer, primary_key=True)
+    episode_count = db.Column(db.Integer, nullable=False, default=0)
+    watched_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'season': self.number,
+            'episode_count': self.episode_count,
+            'watched_count': self.watched_count
         }
 
 class Episode(db.Model):
+    __table_args__ = (
+        # One row per position in a show; also covers lookups by show and by season
+        db.Index('uq_episode_position', 'tv_show_id', 'season', 'episode_number', unique=True),
+        # Watched counts per show
+        db.Index('ix_episode_show_watched', 'tv_show_id', 'watched'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     tv_show_id = db.Column(db.Integer, db.ForeignKey('tv_show.id'), nullable=False)
-    season = db.Column(db.Integer, default=1)
+    season = db.Column(db.Integer, nullable=False, default=1)
     episode_number = db.Column(db.Integer, nullable=False)
     title = db.Column(db.String(200), nullable=True)
     watched = db.Column(db.Boolean, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def to_dict(self):
         return {
@@ -86,4 +150,107 @@ class Episode(db.Model):
             'episode_number': self.episode_number,
             'title': self.title,
             'watched': self.watched
-        }
\ No newline at end of file
+        }
+
+# Second-tier OMDB response cache, shared by every worker process
+class OmdbCacheEntry(db.Model):
+    __tablename__ = 'omdb_cache'
+    
+    key = db.Column(db.String(255), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    accessed_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# Image behind each poster URL, stored on disk by app.services.posters
+class PosterSource(db.Model):
+    __tablename__ = 'poster_source'
+    
+    # SHA-256 of the source URL
+    url_hash = db.Column(db.String(64), primary_key=True)
+    # SHA-256 of the downloaded image; None when the URL had no usable image
+    digest = db.Column(db.String(64), nullable=True)
+    # Image format of the file: jpeg, png, gif or webp
+    format = db.Column(db.String(10), nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=False)
+
+# Version of each collection ("movies", "tv_shows"), bumped by every commit that changes it
+class CollectionVersion(db.Model):
+    __tablename__ = 'collection_version'
+    
+    name = db.Column(db.String(20), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# Ids of deleted titles and episodes, kept for a while so /api/sync can report them
+class Tombstone(db.Model):
+    __table_args__ = (
+        db.Index('ix_tombstone_deleted', 'deleted_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# Background job queue, worked by app.services.jobs
+class Job(db.Model):
+    __table_args__ = (
+        # Due jobs in order, for workers claiming the next one
+        db.Index('ix_job_claim', 'status', 'run_after'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    # Unfinished jobs with the same key are not queued twice
+    key = db.Column(db.String(100), nullable=True, index=True)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'payload': json.loads(self.payload) if self.payload else {},
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'error': self.error,
+            'result': json.loads(self.result) if self.result else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+# Titles known without asking OMDB, loaded and searched by app.services.catalog
+class CatalogTitle(db.Model):
+    __tablename__ = 'catalog_title'
+    
+    # Number of the IMDb ID, so tt0133093 is 133093
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(500), nullable=False)
+    # OMDB's type: movie, series, episode or game
+    kind = db.Column(db.String(10), nullable=False)
+    year = db.Column(db.Integer, nullable=True)
+    end_year = db.Column(db.Integer, nullable=True)
+    runtime = db.Column(db.Integer, nullable=True)
+    genre = db.Column(db.String(200), nullable=True)
+    rating = db.Column(db.Float, nullable=True)
+    votes = db.Column(db.Integer, nullable=True)
+    # Search order, most votes first; NULL until the title is ranked
+    search_rank = db.Column(db.Integer, nullable=True, index=True)
+    # OMDB details response, once known, and when OMDB sent it
+    details = db.Column(db.Text, nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=True)
+    # Written by a bulk load (load_catalog) rather than an OMDB lookup
+    loaded = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
@@ -0,0 +1,89 @@
+from datetime import datetime
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from app.services.exporter import (ExportError, FORMATS, EXTENSIONS, MEDIA_TYPES, DEFAULT_BATCH_SIZE,
+                                   iter_export, gzip_chunks, parse_resume_point)
+from app.services.importer import BulkImporter, ImportFormatError, open_export, DEFAULT_CHUNK_SIZE
+from app.services.sync import SyncError, changes, parse_sync_args
+from app.utils.serialization import json_response
+
+data_bp = Blueprint('data', __name__, url_prefix='/api')
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-seq')
+
+@data_bp.route('/export', methods=['GET'])
+def export_collection():
+    """Stream the whole collection as JSON or JSON Lines, optionally gzipped"""
+    fmt = request.args.get('format', 'json')
+    if fmt not in FORMATS:
+        return jsonify({'error': f'format must be one of: {", ".join(FORMATS)}'}), 400
+    compress = request.args.get('compress')
+    if compress not in (None, '', 'gzip'):
+        return jsonify({'error': 'compress must be gzip'}), 400
+    try:
+        batch_size = int(request.args.get('batch_size', DEFAULT_BATCH_SIZE))
+    except ValueError:
+        return jsonify({'error': 'batch_size must be an integer'}), 400
+    
+    # Resume after a record the client already has
+    try:
+        after = parse_resume_point(request.args.get('after'))
+    except ExportError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    chunks = iter_export(fmt, after=after, batch_size=batch_size)
+    filename = f'cinemate-export-{datetime.utcnow().date().isoformat()}.{EXTENSIONS[fmt]}'
+    mimetype = MEDIA_TYPES[fmt]
+    if compress == 'gzip':
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = MEDIA_TYPES['gzip']
+    
+    # The body is generated while it is sent, so it has no Content-Length
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@data_bp.route('/import', methods=['POST'])
+def import_collection():
+    """Import an exported collection, upserting movies and TV shows by IMDb ID"""
+    try:
+        chunk_size = int(request.args.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    except ValueError:
+        return jsonify({'error': 'chunk_size must be an integer'}), 400
+    
+    # report=summary leaves out the per-record entries for very large files
+    keep_records = request.args.get('report', 'full') != 'summary'
+    importer = BulkImporter(chunk_size=chunk_size, keep_records=keep_records)
+    
+    # Either a raw body or a multipart upload; gzip is detected from the data
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': 'No file uploaded'}), 400
+        stream = upload.stream
+        filename = upload.filename or ''
+    else:
+        stream = request.stream
+        filename = ''
+    ndjson = (request.args.get('format') == 'ndjson' or request.mimetype in NDJSON_TYPES or
+              filename.endswith(('.jsonl', '.ndjson', '.jsonl.gz', '.ndjson.gz')))
+    
+    # The body is parsed as it is read, one record at a time
+    try:
+        report = importer.run(open_export(stream, ndjson=ndjson))
+    except ImportFormatError as e:
+        # Chunks before the error are already committed
+        return jsonify({'error': str(e), 'report': importer.report}), 400
+    
+    return jsonify(report)
+
+@data_bp.route('/sync', methods=['GET'])
+def sync_collection():
+    """Titles changed or deleted since the client's last sync token"""
+    try:
+        token, limit, include_episodes = parse_sync_args(request.args)
+    except SyncError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return json_response(changes(token, limit, include_episodes))
@@ -0,0 +1,53 @@
+from flask import Blueprint, jsonify, request
+from app import db
+from app.models.models import Job
+from app.services.enrichment import enqueue_refresh
+from app.services.jobs import FAILED, STATUSES, retry, status_counts
+
+job_bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+MAX_LIMIT = 200
+
+@job_bp.route('/', methods=['GET'])
+def get_jobs():
+    """List recent background jobs, newest first, with counts per status"""
+    status = request.args.get('status')
+    if status and status not in STATUSES:
+        return jsonify({'error': f'status must be one of: {", ".join(STATUSES)}'}), 400
+    try:
+        limit = min(int(request.args.get('limit', 50)), MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    # Apply filters
+    query = Job.query
+    if status:
+        query = query.filter(Job.status == status)
+    if request.args.get('kind'):
+        query = query.filter(Job.kind == request.args['kind'])
+    jobs = query.order_by(Job.id.desc()).limit(max(limit, 1)).all()
+
+    return jsonify({'items': [job.to_dict() for job in jobs], 'counts': status_counts()})
+
+@job_bp.route('/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status of one background job"""
+    job = Job.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
+
+@job_bp.route('/refresh', methods=['POST'])
+def refresh_metadata():
+    """Queue a sweep that refreshes stale OMDB metadata across the library"""
+    jobs = enqueue_refresh()
+    db.session.commit()
+    return jsonify({'items': [job.to_dict() for job in jobs]}), 202
+
+@job_bp.route('/<int:job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """Queue a failed job again"""
+    job = Job.query.get_or_404(job_id)
+    if job.status != FAILED:
+        return jsonify({'error': 'Only failed jobs can be retried'}), 409
+    retry(job)
+    db.session.commit()
+    return jsonify(job.to_dict())
@@ -1,15 +1,15 @@
 from flask import Blueprint, render_template, jsonify, request
-import requests
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from app.services.omdb import OmdbUnavailable, get_client
+from app.services.stats import collection_stats
+from app.services.genres import facet_counts
+from app.services.recommendations import (RecommendationError, RecommendationsUnavailable, index_build,
+                                          parse_recommendation_args, recommend)
+from app.services.versions import MOVIES, TV_SHOWS, collection_versions, last_change
+from app.models.models import Movie, TVShow
+from app.utils.http_cache import content_etag, make_etag, not_modified, with_validators
 
 main_bp = Blueprint('main', __name__)
 
-OMDB_API_KEY = os.getenv('OMDB_API_KEY', '')
-
 @main_bp.route('/')
 def index():
     """Render the main application page"""
@@ -24,21 +24,17 @@ def search_media():
     if not query:
         return jsonify({'error': 'Query parameter is required'}), 400
     
-    # Construct the OMDB API URL
-    url = f'http://www.omdbapi.com/?apikey={OMDB_API_KEY}&s={query}'
-    
-    if media_type:
-        url += f'&type={media_type}'
-    
     try:
-        response = requests.get(url)
-        data = response.json()
+        client = get_client()
+        data = client.search(query, media_type)
         
         if data.get('Response') == 'True':
-            return jsonify(data)
+            return omdb_response(data, client.max_age('search'))
         else:
             return jsonify({'error': data.get('Error', 'No results found')}), 404
     
+    except OmdbUnavailable as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -48,17 +44,85 @@ def get_media_details(imdb_id):
     if not imdb_id:
         return jsonify({'error': 'IMDb ID is required'}), 400
     
-    # Construct the OMDB API URL
-    url = f'http://www.omdbapi.com/?apikey={OMDB_API_KEY}&i={imdb_id}&plot=full'
-    
     try:
-        response = requests.get(url)
-        data = response.json()
+        client = get_client()
+        data = client.details(imdb_id)
         
         if data.get('Response') == 'True':
-            return jsonify(data)
+            return omdb_response(data, client.max_age('details'))
         else:
             return jsonify({'error': data.get('Error', 'Media not found')}), 404
     
+    except OmdbUnavailable as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+def omdb_response(data, max_age):
+    """JSON response for OMDB data that browsers may reuse for ``max_age`` seconds"""
+    response = jsonify(data)
+    etag = content_etag(response.get_data())
+    cache_control = f'private, max-age={max_age}'
+    # The body is already built, but a 304 still saves sending it
+    unchanged = not_modified(etag, cache_control=cache_control)
+    if unchanged:
+        return unchanged
+    return with_validators(response, etag, cache_control=cache_control)
+
+@main_bp.route('/api/omdb/stats', methods=['GET'])
+def get_omdb_stats():
+    """Hit/miss counters for the OMDB response cache of this worker"""
+    return jsonify(get_client().stats())
+
+@main_bp.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Collection totals and the most recently added titles for the dashboard"""
+    versions = collection_versions()
+    etag = make_etag('stats', versions)
+    last_modified = last_change(versions)
+    unchanged = not_modified(etag, last_modified)
+    if unchanged:
+        return unchanged
+    return with_validators(jsonify(collection_stats(versions)), etag, last_modified)
+
+
+@main_bp.route('/api/facets', methods=['GET'])
+def get_facets():
+    """Genre and year counts for the filter menus"""
+    media_type = request.args.get('type', '')  # movie, tv, or empty for both
+    models = {'movie': (Movie,), 'tv': (TVShow,), '': (Movie, TVShow)}.get(media_type)
+    if models is None:
+        return jsonify({'error': 'type must be movie or tv'}), 400
+    
+    versions = collection_versions([{Movie: MOVIES, TVShow: TV_SHOWS}[model] for model in models])
+    etag = make_etag('facets', versions)
+    last_modified = last_change(versions)
+    unchanged = not_modified(etag, last_modified)
+    if unchanged:
+        return unchanged
+    
+    facets = facet_counts(models)
+    response = {}
+    if Movie in facets:
+        response['movies'] = facets[Movie]
+    if TVShow in facets:
+        response['tv_shows'] = facets[TVShow]
+    return with_validators(jsonify(response), etag, last_modified)
+
+@main_bp.route('/api/recommendations', methods=['GET'])
+def get_recommendations():
+    """Unwatched titles ranked by similarity to the watched ones"""
+    try:
+        limit, type_code = parse_recommendation_args(request.args)
+        versions = collection_versions()
+        etag = make_etag('recommendations', versions, index_build(versions), limit, type_code)
+        last_modified = last_change(versions)
+        unchanged = not_modified(etag, last_modified)
+        if unchanged:
+            return unchanged
+        items = recommend(limit, type_code, versions)
+    except RecommendationError as e:
+        return jsonify({'error': str(e)}), 400
+    except RecommendationsUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    return with_validators(jsonify({'items': items}), etag, last_modified)
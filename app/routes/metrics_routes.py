@@ -0,0 +1,18 @@
+import hmac
+from flask import Blueprint, current_app, jsonify, request
+from app.utils.metrics import render
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Version of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request, SQL and OMDB metrics of this process in Prometheus text format"""
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'A valid metrics token is required'}), 401
+    response = current_app.response_class(render(), content_type=CONTENT_TYPE)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
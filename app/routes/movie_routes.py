@@ -1,33 +1,47 @@
 from flask import Blueprint, jsonify, request
 from app import db
 from app.models.models import Movie
-import requests
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from app.utils.pagination import SORT_FIELDS, PaginationError, parse_page_args, paginate
+from app.services.enrichment import enqueue_enrichment, needs_enrichment
+from app.services.genres import GenreFilterError, genre_filter, parse_genre_args, set_genres
+from app.services.search import RELEVANCE, paginate_ranked, rank_by_search, search_filter
+from app.services.recommendations import (RecommendationError, RecommendationsUnavailable, index_build,
+                                          parse_recommendation_args, similar_titles)
+from app.services.versions import MOVIES, collection_versions, last_change
+from app.utils.http_cache import make_etag, not_modified, with_validators
+from app.utils.serialization import FieldError, json_response, parse_fields, project, serialize_rows
 
 movie_bp = Blueprint('movies', __name__, url_prefix='/api/movies')
 
-OMDB_API_KEY = os.getenv('OMDB_API_KEY', '')
-
 @movie_bp.route('/', methods=['GET'])
 def get_all_movies():
-    """Get all movies in the user's collection"""
+    """Get one page of movies in the user's collection"""
+    try:
+        limit, sort_field, descending, cursor = parse_page_args(request.args, sort_fields=SORT_FIELDS + (RELEVANCE,))
+        genres, match_all_genres = parse_genre_args(request.args)
+        fields = parse_fields(request.args, Movie)
+    except (PaginationError, GenreFilterError, FieldError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # A revisit is answered from the collection version alone
+    version, updated_at = collection_versions((MOVIES,))[MOVIES]
+    etag = make_etag(MOVIES, version, sorted(request.args.items(multi=True)))
+    unchanged = not_modified(etag, updated_at)
+    if unchanged:
+        return unchanged
+    
     # Get filter parameters
-    genre = request.args.get('genre')
     year = request.args.get('year')
     watched = request.args.get('watched')
     watch_later = request.args.get('watch_later')
-    search = request.args.get('search', '').lower()
+    search = request.args.get('search', '').strip()
     
     # Start with all movies
     query = Movie.query
     
     # Apply filters
-    if genre:
-        query = query.filter(Movie.genre.contains(genre))
+    if genres:
+        query = query.filter(genre_filter(Movie, genres, match_all_genres))
     if year:
         query = query.filter(Movie.year == year)
     if watched is not None:
@@ -36,19 +50,68 @@ def get_all_movies():
     if watch_later is not None:
         watch_later_bool = watch_later.lower() == 'true'
         query = query.filter(Movie.watch_later == watch_later_bool)
-    if search:
-        query = query.filter(Movie.title.ilike(f'%{search}%'))
     
-    # Execute query and convert to dict
-    movies = [movie.to_dict() for movie in query.all()]
+    # Plain rows of just the needed columns, no ORM entities
+    query = project(query, Movie, fields, extra=() if sort_field == RELEVANCE else (sort_field,))
+    
+    # Ranked search joins the matches so their rank can order the page
+    rank = None
+    if sort_field == RELEVANCE:
+        try:
+            query, rank = rank_by_search(query, Movie, search)
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+    elif search:
+        query = query.filter(search_filter(Movie, search))
+    
+    response = {}
+    if request.args.get('count', '').lower() == 'true':
+        response['total'] = query.order_by(None).count()
     
-    return jsonify(movies)
+    # Fetch a single page in a stable order
+    if rank is not None:
+        movies, next_cursor = paginate_ranked(query, Movie, rank, limit, cursor, entity=lambda row: row,
+                                              descending=descending)
+    else:
+        movies, next_cursor = paginate(query, Movie, sort_field, descending, limit, cursor)
+    
+    response['items'] = serialize_rows(movies, Movie, fields)
+    response['next_cursor'] = next_cursor
+    
+    return with_validators(json_response(response), etag, updated_at)
 
 @movie_bp.route('/<int:movie_id>', methods=['GET'])
 def get_movie(movie_id):
     """Get a specific movie by ID"""
+    # The row version decides; created_at tells apart a reused id
+    current = Movie.query.with_entities(Movie.version, Movie.created_at).filter_by(id=movie_id).first_or_404()
+    updated_at = collection_versions((MOVIES,))[MOVIES][1]
+    etag = make_etag('movie', movie_id, current.version, current.created_at)
+    unchanged = not_modified(etag, updated_at)
+    if unchanged:
+        return unchanged
+    
     movie = Movie.query.get_or_404(movie_id)
-    return jsonify(movie.to_dict())
+    return with_validators(jsonify(movie.to_dict()), etag, updated_at)
+
+@movie_bp.route('/<int:movie_id>/similar', methods=['GET'])
+def get_similar_movies(movie_id):
+    """Get the titles most similar to a movie"""
+    Movie.query.with_entities(Movie.id).filter_by(id=movie_id).first_or_404()
+    try:
+        limit, type_code = parse_recommendation_args(request.args, default_type='movie')
+        versions = collection_versions()
+        etag = make_etag('similar', 'movie', movie_id, versions, index_build(versions), limit, type_code)
+        last_modified = last_change(versions)
+        unchanged = not_modified(etag, last_modified)
+        if unchanged:
+            return unchanged
+        items = similar_titles(Movie, movie_id, limit, type_code, versions)
+    except RecommendationError as e:
+        return jsonify({'error': str(e)}), 400
+    except RecommendationsUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    return with_validators(jsonify({'items': items or []}), etag, last_modified)
 
 @movie_bp.route('/', methods=['POST'])
 def add_movie():
@@ -61,25 +124,9 @@ def add_movie():
         if existing_movie:
             return jsonify({'error': 'Movie already exists in your collection'}), 400
     
-    # If IMDb ID is provided but other data is missing, fetch from OMDB
-    if 'imdb_id' in data and data['imdb_id'] and OMDB_API_KEY:
-        if not all(key in data for key in ['title', 'year', 'genre', 'director', 'poster_url', 'plot']):
-            try:
-                omdb_url = f'http://www.omdbapi.com/?apikey={OMDB_API_KEY}&i={data["imdb_id"]}&plot=full'
-                response = requests.get(omdb_url)
-                omdb_data = response.json()
-                
-                if omdb_data.get('Response') == 'True':
-                    # Update data with OMDB information
-                    data['title'] = omdb_data.get('Title', data.get('title', ''))
-                    data['year'] = int(omdb_data.get('Year', '0').split('–')[0]) or data.get('year')
-                    data['genre'] = omdb_data.get('Genre', data.get('genre', ''))
-                    data['director'] = omdb_data.get('Director', data.get('director', ''))
-                    data['poster_url'] = omdb_data.get('Poster', data.get('poster_url', ''))
-                    data['plot'] = omdb_data.get('Plot', data.get('plot', ''))
-            except Exception as e:
-                # Continue with user-provided data if OMDB fetch fails
-                pass
+    # A bare IMDb ID is enough; OMDB fills in the rest in the background
+    if not data.get('title') and data.get('imdb_id'):
+        data['title'] = data['imdb_id']
     
     # Create new movie
     new_movie = Movie(
@@ -97,9 +144,19 @@ def add_movie():
     )
     
     db.session.add(new_movie)
+    db.session.flush()
+    set_genres(Movie, {new_movie.id: new_movie.genre})
+    
+    # Queue metadata enrichment, committed together with the movie
+    job = None
+    if needs_enrichment(Movie, data):
+        job = enqueue_enrichment(Movie, new_movie.id)
     db.session.commit()
     
-    return jsonify(new_movie.to_dict()), 201
+    result = new_movie.to_dict()
+    if job is not None:
+        result['job'] = job.to_dict()
+    return jsonify(result), 201
 
 @movie_bp.route('/<int:movie_id>', methods=['PUT'])
 def update_movie(movie_id):
@@ -114,6 +171,8 @@ def update_movie(movie_id):
         movie.year = data['year']
     if 'genre' in data:
         movie.genre = data['genre']
+        set_genres(Movie, {movie.id: movie.genre})
+        db.session.expire(movie, ['genres'])
     if 'director' in data:
         movie.director = data['director']
     if 'poster_url' in data:
@@ -0,0 +1,62 @@
+import os
+from flask import Blueprint, current_app, jsonify, request, send_file
+from app.services.posters import (DEFAULT_WIDTH, PosterError, PosterUnavailable, choose_format, get_cache,
+                                  parse_width, placeholder_svg, poster_source)
+from app.utils.http_cache import content_etag, not_modified, with_validators
+
+poster_bp = Blueprint('posters', __name__, url_prefix='/api/posters')
+
+# Clients add v=<hash of the poster URL>, so a versioned URL never changes
+IMMUTABLE = 'public, max-age=31536000, immutable'
+POSTER_MAX_AGE = int(os.getenv('POSTER_MAX_AGE', 7 * 24 * 3600))
+# A missing poster may turn up once OMDB enrichment has run
+PLACEHOLDER_CACHE = 'public, max-age=3600'
+
+@poster_bp.route('/placeholder', methods=['GET'])
+def get_placeholder():
+    """Serve a generated placeholder poster for a title"""
+    try:
+        width = parse_width(request.args)
+    except PosterError as e:
+        return jsonify({'error': str(e)}), 400
+    return placeholder_response(request.args.get('title', '')[:100], width, IMMUTABLE)
+
+@poster_bp.route('/<imdb_id>', methods=['GET'])
+def get_poster(imdb_id):
+    """Serve a title's poster from the local cache, resized to the requested width"""
+    try:
+        width = parse_width(request.args)
+    except PosterError as e:
+        return jsonify({'error': str(e)}), 400
+
+    title = ''
+    try:
+        url, title = poster_source(imdb_id)
+        poster = get_cache().poster(url, width, choose_format(request.accept_mimetypes)) if url else None
+    except PosterUnavailable:
+        # Asked for again on the next load, when upstream may be back
+        return placeholder_response(title, width, 'no-cache')
+    if poster is None:
+        return placeholder_response(title, width, PLACEHOLDER_CACHE)
+
+    # Range requests and If-None-Match are handled here; the file itself goes
+    # out through the server's sendfile support where it has one
+    try:
+        response = send_file(poster.path, mimetype=poster.mimetype, conditional=True, etag=poster.etag,
+                             last_modified=poster.fetched_at, max_age=POSTER_MAX_AGE)
+    except FileNotFoundError:
+        # Evicted in between; the next request downloads it again
+        return placeholder_response(title, width, 'no-cache')
+    response.headers['Cache-Control'] = IMMUTABLE if request.args.get('v') else f'public, max-age={POSTER_MAX_AGE}'
+    response.vary.add('Accept')
+    return response
+
+def placeholder_response(title, width, cache_control):
+    """A generated placeholder SVG, answered with 304 when the client has it"""
+    data = placeholder_svg(title, width or DEFAULT_WIDTH).encode('utf-8')
+    etag = content_etag(data)
+    unchanged = not_modified(etag, cache_control=cache_control)
+    if unchanged:
+        return unchanged
+    return with_validators(current_app.response_class(data, mimetype='image/svg+xml'), etag,
+                           cache_control=cache_control)
@@ -1,50 +1,135 @@
 from flask import Blueprint, jsonify, request
 from app import db
 from app.models.models import TVShow, Episode
-import requests
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from app.utils.pagination import SORT_FIELDS, PaginationError, parse_page_args, paginate
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from app.services.omdb import get_client
+from app.services.enrichment import enqueue_enrichment, needs_enrichment
+from app.services.genres import GenreFilterError, genre_filter, parse_genre_args, set_genres
+from app.services.search import RELEVANCE, paginate_ranked, rank_by_search, search_filter
+from app.services.recommendations import (RecommendationError, RecommendationsUnavailable, index_build,
+                                          parse_recommendation_args, similar_titles)
+from app.services.versions import TV_SHOWS, collection_versions, last_change
+from app.utils.http_cache import make_etag, not_modified, with_validators
+from app.utils.serialization import FieldError, json_response, parse_fields, project, serialize_rows
+from app.services.episodes import (BATCH_FIELDS, EpisodeConflictError, EpisodeSelectionError, SeasonLayoutError,
+                                   parse_episode_update, parse_episode_values, update_episodes, change_episodes,
+                                   parse_seasons, current_layout, layout_for_total, omdb_layout, sync_episodes)
 
 tv_bp = Blueprint('tv', __name__, url_prefix='/api/tv')
 
-OMDB_API_KEY = os.getenv('OMDB_API_KEY', '')
-
 @tv_bp.route('/', methods=['GET'])
 def get_all_tv_shows():
-    """Get all TV shows in the user's collection"""
+    """Get one page of TV shows in the user's collection"""
+    try:
+        limit, sort_field, descending, cursor = parse_page_args(request.args, sort_fields=SORT_FIELDS + (RELEVANCE,))
+        genres, match_all_genres = parse_genre_args(request.args)
+        fields = parse_fields(request.args, TVShow)
+    except (PaginationError, GenreFilterError, FieldError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # A revisit is answered from the collection version alone
+    version, updated_at = collection_versions((TV_SHOWS,))[TV_SHOWS]
+    etag = make_etag(TV_SHOWS, version, sorted(request.args.items(multi=True)))
+    unchanged = not_modified(etag, updated_at)
+    if unchanged:
+        return unchanged
+    
     # Get filter parameters
-    genre = request.args.get('genre')
     year = request.args.get('year')
     watch_later = request.args.get('watch_later')
-    search = request.args.get('search', '').lower()
+    search = request.args.get('search', '').strip()
+    include = {part.strip() for part in request.args.get('include', '').split(',') if part.strip()}
     
     # Start with all TV shows
     query = TVShow.query
     
     # Apply filters
-    if genre:
-        query = query.filter(TVShow.genre.contains(genre))
+    if genres:
+        query = query.filter(genre_filter(TVShow, genres, match_all_genres))
     if year:
         query = query.filter(TVShow.year == year)
     if watch_later is not None:
         watch_later_bool = watch_later.lower() == 'true'
         query = query.filter(TVShow.watch_later == watch_later_bool)
-    if search:
-        query = query.filter(TVShow.title.ilike(f'%{search}%'))
     
-    # Execute query and convert to dict
-    tv_shows = [show.to_dict() for show in query.all()]
+    # Plain rows of just the needed columns, unless episodes are nested in
+    include_episodes = 'episodes' in include
+    if not include_episodes:
+        query = project(query, TVShow, fields, extra=() if sort_field == RELEVANCE else (sort_field,))
+    
+    # Ranked search joins the matches so their rank can order the page
+    rank = None
+    if sort_field == RELEVANCE:
+        try:
+            query, rank = rank_by_search(query, TVShow, search)
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+    elif search:
+        query = query.filter(search_filter(TVShow, search))
     
-    return jsonify(tv_shows)
+    response = {}
+    if request.args.get('count', '').lower() == 'true':
+        totals = query.with_entities(func.count(TVShow.id), func.sum(TVShow.watched_episodes)).order_by(None).one()
+        response['total'] = totals[0]
+        response['watched_episodes'] = totals[1] or 0
+    
+    # Episodes are only serialized on request, and then loaded for all
+    # shows on the page with a single SELECT ... WHERE tv_show_id IN (...).
+    # Progress comes from the stored counters either way.
+    if include_episodes:
+        query = query.options(selectinload(TVShow.episodes), selectinload(TVShow.seasons))
+    if rank is not None:
+        tv_shows, next_cursor = paginate_ranked(query, TVShow, rank, limit, cursor,
+                                                entity=lambda row: row[0] if include_episodes else row,
+                                                descending=descending)
+    else:
+        tv_shows, next_cursor = paginate(query, TVShow, sort_field, descending, limit, cursor)
+    if include_episodes:
+        nested = ('seasons', 'episodes')
+        response['items'] = [
+            {name: value for name, value in show.to_dict().items() if name in fields or name in nested}
+            for show in tv_shows
+        ]
+    else:
+        response['items'] = serialize_rows(tv_shows, TVShow, fields)
+    response['next_cursor'] = next_cursor
+    
+    return with_validators(json_response(response), etag, updated_at)
 
 @tv_bp.route('/<int:tv_id>', methods=['GET'])
 def get_tv_show(tv_id):
     """Get a specific TV show by ID"""
+    # The row version covers the episodes too; created_at tells apart a reused id
+    current = TVShow.query.with_entities(TVShow.version, TVShow.created_at).filter_by(id=tv_id).first_or_404()
+    updated_at = collection_versions((TV_SHOWS,))[TV_SHOWS][1]
+    etag = make_etag('tv', tv_id, current.version, current.created_at)
+    unchanged = not_modified(etag, updated_at)
+    if unchanged:
+        return unchanged
+    
     tv_show = TVShow.query.get_or_404(tv_id)
-    return jsonify(tv_show.to_dict())
+    return with_validators(jsonify(tv_show.to_dict()), etag, updated_at)
+
+@tv_bp.route('/<int:tv_id>/similar', methods=['GET'])
+def get_similar_shows(tv_id):
+    """Get the titles most similar to a TV show"""
+    TVShow.query.with_entities(TVShow.id).filter_by(id=tv_id).first_or_404()
+    try:
+        limit, type_code = parse_recommendation_args(request.args, default_type='tv')
+        versions = collection_versions()
+        etag = make_etag('similar', 'tv', tv_id, versions, index_build(versions), limit, type_code)
+        last_modified = last_change(versions)
+        unchanged = not_modified(etag, last_modified)
+        if unchanged:
+            return unchanged
+        items = similar_titles(TVShow, tv_id, limit, type_code, versions)
+    except RecommendationError as e:
+        return jsonify({'error': str(e)}), 400
+    except RecommendationsUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    return with_validators(jsonify({'items': items or []}), etag, last_modified)
 
 @tv_bp.route('/', methods=['POST'])
 def add_tv_show():
@@ -57,25 +142,20 @@ def add_tv_show():
         if existing_show:
             return jsonify({'error': 'TV show already exists in your collection'}), 400
     
-    # If IMDb ID is provided but other data is missing, fetch from OMDB
-    if 'imdb_id' in data and data['imdb_id'] and OMDB_API_KEY:
-        if not all(key in data for key in ['title', 'year', 'genre', 'creator', 'poster_url', 'plot']):
-            try:
-                omdb_url = f'http://www.omdbapi.com/?apikey={OMDB_API_KEY}&i={data["imdb_id"]}&plot=full'
-                response = requests.get(omdb_url)
-                omdb_data = response.json()
-                
-                if omdb_data.get('Response') == 'True':
-                    # Update data with OMDB information
-                    data['title'] = omdb_data.get('Title', data.get('title', ''))
-                    data['year'] = int(omdb_data.get('Year', '0').split('–')[0]) or data.get('year')
-                    data['genre'] = omdb_data.get('Genre', data.get('genre', ''))
-                    data['creator'] = omdb_data.get('Writer', data.get('creator', ''))
-                    data['poster_url'] = omdb_data.get('Poster', data.get('poster_url', ''))
-                    data['plot'] = omdb_data.get('Plot', data.get('plot', ''))
-            except Exception as e:
-                # Continue with user-provided data if OMDB fetch fails
-                pass
+    # A bare IMDb ID is enough; OMDB fills in the rest in the background
+    if not data.get('title') and data.get('imdb_id'):
+        data['title'] = data['imdb_id']
+    
+    # Season layout: explicit counts or one season of total_episodes. OMDB's
+    # seasons replace the latter once the enrichment job has fetched them
+    seasons_from_omdb = data.get('seasons') == 'omdb'
+    try:
+        if 'seasons' in data and not seasons_from_omdb:
+            layout = parse_seasons(data['seasons'])
+        else:
+            layout = parse_seasons([data.get('total_episodes', 0)])
+    except SeasonLayoutError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Create new TV show
     new_tv_show = TVShow(
@@ -86,30 +166,29 @@ def add_tv_show():
         poster_url=data.get('poster_url', ''),
         plot=data.get('plot', ''),
         imdb_id=data.get('imdb_id', ''),
-        total_episodes=data.get('total_episodes', 0),
+        total_episodes=sum(layout),
         rating=data.get('rating'),
         notes=data.get('notes', ''),
         watch_later=data.get('watch_later', False)
     )
     
     db.session.add(new_tv_show)
+    db.session.flush()
+    set_genres(TVShow, {new_tv_show.id: new_tv_show.genre})
+    
+    # Create all episodes with one bulk INSERT, committed with the show
+    sync_episodes(new_tv_show, layout, is_new=True)
+    
+    # Queue metadata enrichment, committed together with the show
+    job = None
+    if needs_enrichment(TVShow, data) or (seasons_from_omdb and data.get('imdb_id')):
+        job = enqueue_enrichment(TVShow, new_tv_show.id, seasons=seasons_from_omdb)
     db.session.commit()
     
-    # Create episodes if total_episodes is provided
-    if data.get('total_episodes', 0) > 0:
-        for i in range(1, data.get('total_episodes') + 1):
-            episode = Episode(
-                tv_show_id=new_tv_show.id,
-                season=1,  # Default to season 1
-                episode_number=i,
-                title=f"Episode {i}",
-                watched=False
-            )
-            db.session.add(episode)
-        
-        db.session.commit()
-    
-    return jsonify(new_tv_show.to_dict()), 201
+    result = new_tv_show.to_dict()
+    if job is not None:
+        result['job'] = job.to_dict()
+    return jsonify(result), 201
 
 @tv_bp.route('/<int:tv_id>', methods=['PUT'])
 def update_tv_show(tv_id):
@@ -117,6 +196,24 @@ def update_tv_show(tv_id):
     tv_show = TVShow.query.get_or_404(tv_id)
     data = request.json
     
+    # Work out the new season layout or total first: the OMDB lookup must
+    # not wait while this request holds write locks, since its cache
+    # writes use other connections
+    layout = None
+    titles = None
+    try:
+        if data.get('seasons') == 'omdb':
+            layout, titles = omdb_layout(get_client(), tv_show.imdb_id)
+            if layout is None:
+                return jsonify({'error': 'No season data available from OMDB'}), 502
+        elif 'seasons' in data:
+            layout = parse_seasons(data['seasons'])
+        elif 'total_episodes' in data and data['total_episodes'] != tv_show.total_episodes:
+            total = parse_seasons([data['total_episodes']])[0]
+            layout = layout_for_total(current_layout(tv_show.id), total)
+    except SeasonLayoutError as e:
+        return jsonify({'error': str(e)}), 400
+    
     # Update fields if provided
     if 'title' in data:
         tv_show.title = data['title']
@@ -124,6 +221,8 @@ def update_tv_show(tv_id):
         tv_show.year = data['year']
     if 'genre' in data:
         tv_show.genre = data['genre']
+        set_genres(TVShow, {tv_show.id: tv_show.genre})
+        db.session.expire(tv_show, ['genres'])
     if 'creator' in data:
         tv_show.creator = data['creator']
     if 'poster_url' in data:
@@ -137,29 +236,8 @@ def update_tv_show(tv_id):
     if 'watch_later' in data:
         tv_show.watch_later = data['watch_later']
     
-    # Handle total_episodes update
-    if 'total_episodes' in data and data['total_episodes'] != tv_show.total_episodes:
-        old_total = tv_show.total_episodes
-        new_total = data['total_episodes']
-        
-        if new_total > old_total:
-            # Add new episodes
-            for i in range(old_total + 1, new_total + 1):
-                episode = Episode(
-                    tv_show_id=tv_show.id,
-                    season=1,  # Default to season 1
-                    episode_number=i,
-                    title=f"Episode {i}",
-                    watched=False
-                )
-                db.session.add(episode)
-        elif new_total < old_total:
-            # Remove excess episodes
-            episodes_to_remove = Episode.query.filter_by(tv_show_id=tv_show.id).filter(Episode.episode_number > new_total).all()
-            for episode in episodes_to_remove:
-                db.session.delete(episode)
-        
-        tv_show.total_episodes = new_total
+    if layout is not None:
+        sync_episodes(tv_show, layout, titles)
     
     db.session.commit()
     
@@ -183,20 +261,48 @@ def get_episodes(tv_id):
     
     return jsonify(episodes)
 
+@tv_bp.route('/<int:tv_id>/episodes', methods=['PATCH'])
+def update_episodes_batch(tv_id):
+    """Update a set of episodes with one statement"""
+    tv_show = TVShow.query.get_or_404(tv_id)
+    
+    try:
+        selection, values = parse_episode_update(request.get_json(silent=True))
+        result = update_episodes(tv_show, selection, values)
+    except EpisodeSelectionError as e:
+        return jsonify({'error': str(e)}), 400
+    except EpisodeConflictError as e:
+        return jsonify({'error': str(e), 'positions': e.positions}), 409
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    # Only the changed episodes, plus the show's new progress
+    return jsonify(result)
+
 @tv_bp.route('/<int:tv_id>/episodes/<int:episode_id>', methods=['PUT'])
 def update_episode(tv_id, episode_id):
     """Update an episode's information"""
     episode = Episode.query.filter_by(id=episode_id, tv_show_id=tv_id).first_or_404()
     data = request.json
     
+    # Season and watched feed the show's stored counters, so they go
+    # through the same guarded update as batch changes
+    try:
+        values = parse_episode_values({name: data[name] for name in BATCH_FIELDS if name in data})
+    except EpisodeSelectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
     # Update fields if provided
     if 'title' in data:
         episode.title = data['title']
-    if 'season' in data:
-        episode.season = data['season']
-    if 'watched' in data:
-        episode.watched = data['watched']
     
+    if values:
+        try:
+            change_episodes(tv_id, [Episode.id == episode.id], values)
+        except EpisodeConflictError as e:
+            return jsonify({'error': str(e), 'positions': e.positions}), 409
     db.session.commit()
     
+    # The episode may have been removed by a concurrent resize
+    episode = Episode.query.filter_by(id=episode_id, tv_show_id=tv_id).first_or_404()
     return jsonify(episode.to_dict())
\ No newline at end of file
@@ -0,0 +1,615 @@
+"""Local title catalog, searched and read before OMDB is asked.
+
+The ``catalog_title`` table holds titles loaded in bulk from IMDb's
+dataset dumps (``title.basics.tsv`` and ``title.ratings.tsv``, gzipped or
+not), from files of OMDB details responses (one JSON object per line) or
+from the OMDB response cache, plus every details response OMDB sends
+while the app runs. :class:`OmdbClient <app.services.omdb.OmdbClient>`
+asks it first:
+
+- Searches are answered from the catalog alone when it has a full page
+  of matches, or when a dump has been loaded with :func:`load_catalog`.
+  Otherwise the catalog only holds the titles looked up so far, so OMDB
+  is asked too and the local matches are added to its results, or served
+  on their own if it fails.
+- Details are served from the catalog once it holds OMDB's response for
+  the title, for ``max_age`` seconds. Titles known only from the IMDb
+  dumps have no plot, people or poster; they are served only when OMDB
+  cannot answer.
+
+Titles are found by word prefixes in order of popularity (IMDb votes),
+through ``search_rank``: 1 for the title with the most votes. On SQLite
+the words are in a contentless FTS5 table whose rowids are the ranks, so
+the matches come out of the index in rank order and a search reads only
+as many as it returns. PostgreSQL uses a GIN index over the title's words
+and anything else ``LIKE``. :func:`reindex_catalog` renumbers the ranks
+after a load; titles added by OMDB lookups in between are ranked after
+all others.
+
+:func:`load_catalog` streams a file and writes it in batches of
+:data:`BATCH_SIZE` rows, each in its own transaction, so dumps of any size
+load in bounded memory.
+"""
+import gzip
+import json
+import logging
+import re
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func, select, text, update
+from sqlalchemy.exc import DBAPIError, IntegrityError, SQLAlchemyError
+
+from app import db
+from app.models.models import CatalogTitle, OmdbCacheEntry
+from app.services.search import search_words
+
+logger = logging.getLogger(__name__)
+
+# Rows written per transaction while loading
+BATCH_SIZE = 5000
+
+# Results per search, as many as an OMDB search page
+SEARCH_LIMIT = 10
+
+# Seconds before checking again whether a dump has been loaded
+LOADED_TTL = 60
+
+# Kinds loaded from dumps and searched when no type is given
+DEFAULT_KINDS = ('movie', 'series')
+
+# IMDb title types as OMDB types; anything else is a movie to OMDB
+TITLE_TYPES = {
+    'tvSeries': 'series',
+    'tvMiniSeries': 'series',
+    'tvEpisode': 'episode',
+    'videoGame': 'game',
+}
+
+# Columns set from each kind of record
+BASICS_COLUMNS = ('title', 'kind', 'year', 'end_year', 'runtime', 'genre')
+OMDB_COLUMNS = BASICS_COLUMNS + ('rating', 'votes', 'details', 'fetched_at')
+# Loads also mark the titles as loaded
+LOAD_COLUMNS = ('loaded',)
+
+# IMDb dumps write missing values as \N
+MISSING = '\\N'
+
+_IMDB_ID = re.compile(r'tt(\d+)$')
+
+CatalogEntry = namedtuple('CatalogEntry', 'payload complete')
+
+_backends = {}
+
+
+class CatalogError(Exception):
+    """Raised for files the loader cannot read"""
+
+
+def title_number(imdb_id):
+    """Number of an IMDb ID, or None for anything that is not one"""
+    match = _IMDB_ID.match((imdb_id or '').strip())
+    if match is None:
+        return None
+    number = int(match.group(1))
+    # Only IDs written the canonical way map back to the same string
+    return number if imdb_id_of(number) == imdb_id.strip() else None
+
+
+def imdb_id_of(number):
+    return f'tt{number:07d}'
+
+
+class LikeCatalog:
+    """Unindexed fallback: every word must appear in the title"""
+
+    name = 'like'
+
+    def install(self, connection):
+        return False
+
+    def reindex(self, connection):
+        _renumber(connection)
+
+    def add(self, connection, rank, title):
+        pass
+
+    def matches(self, words, kinds, limit):
+        return (
+            _select_titles()
+            .where(*(CatalogTitle.title.ilike(f'%{word}%') for word in words))
+            .where(CatalogTitle.kind.in_(kinds), CatalogTitle.search_rank.is_not(None))
+            .order_by(CatalogTitle.search_rank)
+            .limit(limit)
+        )
+
+
+class SqliteCatalog:
+    """Contentless FTS5 table ``catalog_fts`` keyed by ``search_rank``"""
+
+    name = 'fts5'
+
+    def install(self, connection):
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalog_fts'")
+        ).first()
+        if exists:
+            return False
+        # Contentless: the titles are stored once, in catalog_title
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE catalog_fts USING fts5(title, content='', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+        return True
+
+    def reindex(self, connection):
+        _renumber(connection)
+        connection.execute(text("INSERT INTO catalog_fts(catalog_fts) VALUES ('delete-all')"))
+        connection.execute(text(
+            'INSERT INTO catalog_fts(rowid, title) '
+            'SELECT search_rank, title FROM catalog_title WHERE search_rank IS NOT NULL'
+        ))
+
+    def add(self, connection, rank, title):
+        connection.execute(text('INSERT INTO catalog_fts(rowid, title) VALUES (:rank, :title)'),
+                           {'rank': rank, 'title': title})
+
+    # Plain SQL: building and caching a Core statement per search takes
+    # longer than running it
+    MATCHES = text(
+        'SELECT t.id, t.title, t.kind, t.year, t.end_year, t.details '
+        'FROM catalog_fts JOIN catalog_title AS t ON t.search_rank = catalog_fts.rowid '
+        'WHERE catalog_fts MATCH :match AND t.kind IN :kinds '
+        # The index yields rowids in order, so this stops after ``limit`` matches
+        'ORDER BY catalog_fts.rowid LIMIT :limit'
+    ).bindparams(bindparam('kinds', expanding=True))
+
+    def matches(self, words, kinds, limit):
+        return self.MATCHES.bindparams(match=' '.join(f'"{word}"*' for word in words), kinds=list(kinds), limit=limit)
+
+
+class PostgresCatalog:
+    """GIN expression index over the words of ``catalog_title.title``"""
+
+    name = 'tsvector'
+
+    def install(self, connection):
+        exists = connection.execute(
+            text("SELECT 1 FROM pg_indexes WHERE indexname = 'ix_catalog_title_words'")
+        ).first()
+        if exists:
+            return False
+        connection.execute(text(
+            "CREATE INDEX ix_catalog_title_words ON catalog_title USING GIN (to_tsvector('simple', title))"
+        ))
+        return True
+
+    def reindex(self, connection):
+        _renumber(connection)
+
+    def add(self, connection, rank, title):
+        pass
+
+    def matches(self, words, kinds, limit):
+        query = func.to_tsquery('simple', ' & '.join(f'{word}:*' for word in words))
+        return (
+            _select_titles()
+            .where(func.to_tsvector('simple', CatalogTitle.title).op('@@')(query))
+            .where(CatalogTitle.kind.in_(kinds), CatalogTitle.search_rank.is_not(None))
+            .order_by(CatalogTitle.search_rank)
+            .limit(limit)
+        )
+
+
+def _select_titles():
+    return select(CatalogTitle.id, CatalogTitle.title, CatalogTitle.kind, CatalogTitle.year,
+                  CatalogTitle.end_year, CatalogTitle.details)
+
+
+def _renumber(connection):
+    # Most votes first; unrated titles after all rated ones, oldest ID first
+    ranked = select(
+        CatalogTitle.id,
+        func.row_number().over(order_by=(func.coalesce(CatalogTitle.votes, 0).desc(), CatalogTitle.id))
+        .label('position')
+    ).subquery()
+    connection.execute(
+        update(CatalogTitle.__table__)
+        .where(CatalogTitle.id == ranked.c.id)
+        .values(search_rank=ranked.c.position)
+    )
+
+
+def get_backend():
+    """The catalog backend for the current database"""
+    engine = db.engine
+    backend = _backends.get(engine)
+    if backend is None:
+        backend = _backends[engine] = _detect_backend(engine)
+    return backend
+
+
+def _detect_backend(engine):
+    if engine.dialect.name == 'postgresql':
+        return PostgresCatalog()
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            installed = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalog_fts'")
+            ).first()
+        if installed:
+            return SqliteCatalog()
+    return LikeCatalog()
+
+
+def install_catalog():
+    """Create the catalog's word index if needed, filling it from existing rows"""
+    engine = db.engine
+    if engine.dialect.name == 'postgresql':
+        backend = PostgresCatalog()
+    elif engine.dialect.name == 'sqlite':
+        backend = SqliteCatalog()
+    else:
+        backend = LikeCatalog()
+
+    try:
+        with engine.begin() as connection:
+            if backend.install(connection):
+                backend.reindex(connection)
+    except DBAPIError as e:
+        # SQLite builds without FTS5 fall back to LIKE
+        logger.warning('Catalog word index unavailable, using LIKE matching: %s', e)
+        backend = LikeCatalog()
+    _backends[engine] = backend
+    return backend
+
+
+def reindex_catalog():
+    """Rank every title by votes and rebuild the word index"""
+    backend = get_backend()
+    with db.engine.begin() as connection:
+        backend.reindex(connection)
+    return backend
+
+
+class Catalog:
+    """Reads and writes the catalog for :class:`~app.services.omdb.OmdbClient`"""
+
+    def __init__(self, max_age=30 * 24 * 3600):
+        self.max_age = max_age
+        self._loaded = None
+
+    def covers(self, results):
+        """Whether a :meth:`search` response can stand in for OMDB's
+
+        True for a full page of matches or once a dump has been loaded;
+        before that the catalog only knows the titles looked up so far.
+        """
+        return len(results['Search']) >= SEARCH_LIMIT or self.bulk_loaded()
+
+    def bulk_loaded(self):
+        """Whether any title came from :func:`load_catalog`, checked every :data:`LOADED_TTL` seconds"""
+        loaded = self._loaded
+        if loaded is None or loaded[1] < time.monotonic():
+            found = db.session.execute(select(CatalogTitle.id).where(CatalogTitle.loaded).limit(1)).first()
+            loaded = self._loaded = (found is not None, time.monotonic() + LOADED_TTL)
+        return loaded[0]
+
+    def merge(self, results, local):
+        """OMDB search ``results`` followed by the ``local`` matches they lack"""
+        if local is None:
+            return results
+        if results.get('Response') != 'True':
+            return local
+        known = {item.get('imdbID') for item in results.get('Search', [])}
+        extra = [item for item in local['Search'] if item['imdbID'] not in known]
+        # A new dict: ``results`` may be the cached response
+        return {**results, 'Search': results.get('Search', []) + extra}
+
+    def search(self, query, media_type=''):
+        """OMDB-style search response from the catalog, or None if no title matches"""
+        words = search_words(query)
+        if not words:
+            return None
+        kinds = (media_type,) if media_type else DEFAULT_KINDS
+        rows = db.session.execute(get_backend().matches(words, kinds, SEARCH_LIMIT)).all()
+        if not rows:
+            return None
+        results = []
+        for row in rows:
+            details = json.loads(row.details) if row.details else {}
+            results.append({
+                'Title': row.title,
+                'Year': _year_label(row.kind, row.year, row.end_year),
+                'imdbID': imdb_id_of(row.id),
+                'Type': row.kind,
+                'Poster': details.get('Poster', 'N/A'),
+            })
+        return {'Search': results, 'totalResults': str(len(results)), 'Response': 'True'}
+
+    def details(self, imdb_id):
+        """:class:`CatalogEntry` for an IMDb ID, or None if the catalog lacks it
+
+        ``complete`` is set for OMDB responses younger than ``max_age``;
+        other entries only hold what the IMDb dumps tell.
+        """
+        number = title_number(imdb_id)
+        if number is None:
+            return None
+        title = db.session.get(CatalogTitle, number)
+        if title is None:
+            return None
+        if title.details:
+            fresh = title.fetched_at >= datetime.utcnow() - timedelta(seconds=self.max_age)
+            return CatalogEntry(json.loads(title.details), fresh)
+        return CatalogEntry(_basics_payload(title), False)
+
+    def remember(self, payload):
+        """Store an OMDB details response, ranking the title if it is new"""
+        row = omdb_row(payload)
+        if row is None:
+            return
+        row['fetched_at'] = datetime.utcnow()
+        try:
+            with db.engine.begin() as connection:
+                if _upsert(connection, [row], OMDB_COLUMNS):
+                    rank = connection.execute(select(func.coalesce(func.max(CatalogTitle.search_rank), 0) + 1)).scalar()
+                    connection.execute(
+                        update(CatalogTitle.__table__).where(CatalogTitle.id == row['id']).values(search_rank=rank)
+                    )
+                    get_backend().add(connection, rank, row['title'])
+        except IntegrityError:
+            # Another request added the same title first
+            logger.debug('%s was already added to the catalog', payload.get('imdbID'))
+        except SQLAlchemyError:
+            # Best effort, like the OMDB cache: the response is still served
+            logger.exception('Could not add %s to the catalog', payload.get('imdbID'))
+
+
+def _year_label(kind, year, end_year):
+    if year is None:
+        return 'N/A'
+    if kind == 'series':
+        return f'{year}–{end_year or ""}'
+    return str(year)
+
+
+def _basics_payload(title):
+    return {
+        'Title': title.title,
+        'Year': _year_label(title.kind, title.year, title.end_year),
+        'Rated': 'N/A',
+        'Released': 'N/A',
+        'Runtime': f'{title.runtime} min' if title.runtime else 'N/A',
+        'Genre': title.genre or 'N/A',
+        'Director': 'N/A',
+        'Writer': 'N/A',
+        'Actors': 'N/A',
+        'Plot': 'N/A',
+        'Poster': 'N/A',
+        'imdbRating': f'{title.rating:.1f}' if title.rating is not None else 'N/A',
+        'imdbVotes': f'{title.votes:,}' if title.votes is not None else 'N/A',
+        'imdbID': imdb_id_of(title.id),
+        'Type': title.kind,
+        'Response': 'True',
+    }
+
+
+def _number(value, kind=int):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def omdb_row(payload):
+    """Catalog row for an OMDB details response, or None if it describes no title"""
+    if payload.get('Response') != 'True':
+        return None
+    number = title_number(payload.get('imdbID'))
+    title = payload.get('Title')
+    if number is None or not title or title == 'N/A':
+        return None
+    years = [_number(year) for year in str(payload.get('Year', '')).split('–')]
+    runtime = str(payload.get('Runtime', '')).split(' ')[0]
+    genre = payload.get('Genre')
+    return {
+        'id': number,
+        'title': title[:500],
+        'kind': str(payload.get('Type') or 'movie')[:10],
+        'year': years[0],
+        'end_year': years[1] if len(years) > 1 else None,
+        'runtime': _number(runtime),
+        'genre': genre[:200] if genre and genre != 'N/A' else None,
+        'rating': _number(payload.get('imdbRating'), float),
+        'votes': _number(str(payload.get('imdbVotes', '')).replace(',', '')),
+        'details': json.dumps(payload),
+    }
+
+
+def _upsert(connection, rows, columns):
+    """Insert new titles and update ``columns`` of known ones; returns how many were new"""
+    known = set(connection.execute(
+        select(CatalogTitle.id).where(CatalogTitle.id.in_([row['id'] for row in rows]))
+    ).scalars())
+    new = [row for row in rows if row['id'] not in known]
+    if new:
+        connection.execute(CatalogTitle.__table__.insert(), new)
+    changed = [{'number': row['id'], **{name: row[name] for name in columns}} for row in rows if row['id'] in known]
+    if changed:
+        connection.execute(
+            update(CatalogTitle.__table__)
+            .where(CatalogTitle.id == bindparam('number'))
+            .values({name: bindparam(name) for name in columns}),
+            changed
+        )
+    return len(new)
+
+
+def _writer(columns):
+    def write(connection, rows):
+        _upsert(connection, rows, columns)
+        return len(rows)
+    return write
+
+
+def _update_ratings(connection, rows):
+    result = connection.execute(
+        update(CatalogTitle.__table__)
+        .where(CatalogTitle.id == bindparam('number'))
+        .values(rating=bindparam('rating'), votes=bindparam('votes')),
+        rows
+    )
+    return max(result.rowcount, 0)
+
+
+def _open(path):
+    with open(path, 'rb') as source:
+        compressed = source.read(2) == b'\x1f\x8b'
+    if compressed:
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def _basics_rows(lines, header, kinds):
+    position = {name: i for i, name in enumerate(header)}
+    for line in lines:
+        fields = line.rstrip('\r\n').split('\t')
+        if len(fields) < len(header):
+            yield None
+            continue
+        number = title_number(fields[position['tconst']])
+        kind = TITLE_TYPES.get(fields[position['titleType']], 'movie')
+        if number is None or kind not in kinds or fields[position['isAdult']] == '1':
+            yield None
+            continue
+        genres = fields[position['genres']]
+        yield {
+            'id': number,
+            'title': fields[position['primaryTitle']][:500],
+            'kind': kind,
+            'year': _number(fields[position['startYear']]),
+            'end_year': _number(fields[position['endYear']]),
+            'runtime': _number(fields[position['runtimeMinutes']]),
+            'genre': ', '.join(genres.split(','))[:200] if genres != MISSING else None,
+        }
+
+
+def _ratings_rows(lines, header):
+    position = {name: i for i, name in enumerate(header)}
+    for line in lines:
+        fields = line.rstrip('\r\n').split('\t')
+        number = title_number(fields[position['tconst']]) if len(fields) >= len(header) else None
+        if number is None:
+            yield None
+            continue
+        yield {
+            'number': number,
+            'rating': _number(fields[position['averageRating']], float),
+            'votes': _number(fields[position['numVotes']]),
+        }
+
+
+def _omdb_rows(lines, first, kinds, fetched_at):
+    for line in _chain(first, lines):
+        try:
+            payload = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        row = omdb_row(payload) if isinstance(payload, dict) else None
+        if row is None or row['kind'] not in kinds:
+            yield None
+            continue
+        row['fetched_at'] = fetched_at
+        yield row
+
+
+def _loaded(rows):
+    for row in rows:
+        if row is not None:
+            row['loaded'] = True
+        yield row
+
+
+def _chain(first, lines):
+    yield first
+    yield from lines
+
+
+def _write_batches(rows, write, batch_size):
+    counts = {'read': 0, 'loaded': 0, 'skipped': 0}
+    batch = {}
+
+    def flush():
+        with db.engine.begin() as connection:
+            counts['loaded'] += write(connection, list(batch.values()))
+        batch.clear()
+
+    for row in rows:
+        counts['read'] += 1
+        if row is None:
+            counts['skipped'] += 1
+            continue
+        # Later copies of a title in the same batch replace earlier ones
+        batch[row.get('id', row.get('number'))] = row
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return counts
+
+
+def load_catalog(path, kinds=DEFAULT_KINDS, reindex=True, batch_size=BATCH_SIZE):
+    """Load a title.basics or title.ratings dump or a file of OMDB responses
+
+    The format is told from the first line. Ratings only update titles
+    already loaded, so load the basics first. Returns counts of records
+    ``read``, ``loaded`` and ``skipped``; then, unless ``reindex`` is
+    false, ranks the titles again for search.
+    """
+    with _open(path) as lines:
+        first = next(lines, '')
+        header = first.rstrip('\r\n').split('\t')
+        if first.lstrip().startswith('{'):
+            rows = _loaded(_omdb_rows(lines, first, kinds, datetime.utcnow()))
+            write = _writer(OMDB_COLUMNS + LOAD_COLUMNS)
+        elif header[0] == 'tconst' and 'primaryTitle' in header:
+            rows = _loaded(_basics_rows(lines, header, kinds))
+            write = _writer(BASICS_COLUMNS + LOAD_COLUMNS)
+        elif header[0] == 'tconst' and 'numVotes' in header:
+            rows = _ratings_rows(lines, header)
+            write = _update_ratings
+        else:
+            raise CatalogError(f'{path} is neither an IMDb title.basics or title.ratings dump '
+                               'nor a file of OMDB responses')
+        counts = _write_batches(rows, write, batch_size)
+
+    if reindex:
+        reindex_catalog()
+    return counts
+
+
+def load_omdb_cache(kinds=DEFAULT_KINDS, reindex=True, batch_size=BATCH_SIZE):
+    """Load the details responses in the OMDB response cache; returns counts like :func:`load_catalog`"""
+
+    def rows():
+        last_key = ''
+        while True:
+            entries = db.session.execute(
+                select(OmdbCacheEntry.key, OmdbCacheEntry.payload, OmdbCacheEntry.fetched_at)
+                .where(OmdbCacheEntry.kind == 'details', OmdbCacheEntry.key > last_key)
+                .order_by(OmdbCacheEntry.key)
+                .limit(batch_size)
+            ).all()
+            if not entries:
+                return
+            for entry in entries:
+                yield from _omdb_rows((), entry.payload, kinds, entry.fetched_at)
+            last_key = entries[-1].key
+
+    counts = _write_batches(rows(), _writer(OMDB_COLUMNS), batch_size)
+    if reindex:
+        reindex_catalog()
+    return counts
@@ -0,0 +1,158 @@
+"""Stored watched-episode counters.
+
+``TVShow.watched_episodes`` and the ``Season`` rows (episodes and watched
+episodes per season) are denormalized from the episode table so that
+progress can be read without touching episodes. Every write path that adds,
+removes or changes episodes reports the rows it changed to
+:func:`apply_episode_changes`, which adjusts the counters in the same
+transaction with relative ``SET n = n + delta`` updates. Relative updates
+stay correct when several requests change the same show concurrently,
+because the database applies them one at a time to the locked row.
+
+:func:`rebuild_counters` recomputes everything from the episode table, for
+backfilling after an upgrade and for repairs.
+"""
+from collections import defaultdict
+
+from sqlalchemy import case, delete, func, insert, select, update
+
+from app import db
+from app.models.models import Episode, Season, TVShow
+from app.services.versions import touch
+
+
+def apply_episode_changes(tv_show_id, removed=(), added=()):
+    """Adjust the counters of a show for episode rows that left and entered it
+
+    ``removed`` and ``added`` are ``(season, watched)`` pairs: the old
+    values of deleted or changed rows and the new values of inserted or
+    changed rows. Leaves the commit to the caller.
+    """
+    if removed or added:
+        touch(TVShow, [tv_show_id])
+
+    deltas = defaultdict(lambda: [0, 0])
+    for season, watched in removed:
+        deltas[season][0] -= 1
+        deltas[season][1] -= 1 if watched else 0
+    for season, watched in added:
+        deltas[season][0] += 1
+        deltas[season][1] += 1 if watched else 0
+
+    watched_delta = sum(watched for _, watched in deltas.values())
+    if watched_delta:
+        db.session.execute(
+            update(TVShow).where(TVShow.id == tv_show_id)
+            .values(watched_episodes=TVShow.watched_episodes + watched_delta)
+            .execution_options(synchronize_session=False)
+        )
+
+    shrunk = False
+    for season, (episodes, watched) in sorted(deltas.items()):
+        if not episodes and not watched:
+            continue
+        result = db.session.execute(
+            update(Season).where(Season.tv_show_id == tv_show_id, Season.number == season)
+            .values(episode_count=Season.episode_count + episodes, watched_count=Season.watched_count + watched)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            db.session.execute(insert(Season).values(
+                tv_show_id=tv_show_id, number=season, episode_count=episodes, watched_count=watched
+            ))
+        shrunk = shrunk or episodes < 0
+    if shrunk:
+        # Seasons whose last episode went away
+        db.session.execute(
+            delete(Season).where(Season.tv_show_id == tv_show_id, Season.episode_count <= 0)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def set_counters(counts):
+    """Overwrite the counters of shows whose episodes were all just written
+
+    ``counts`` maps a show id to ``{season: [episodes, watched]}``. Used
+    when a show's whole episode list is replaced in the current
+    transaction, so the counts are known without reading them back.
+    """
+    if not counts:
+        return
+    show_ids = list(counts)
+    db.session.execute(
+        delete(Season).where(Season.tv_show_id.in_(show_ids)).execution_options(synchronize_session=False)
+    )
+    seasons = [
+        {'tv_show_id': show_id, 'number': season, 'episode_count': episodes, 'watched_count': watched}
+        for show_id, by_season in counts.items()
+        for season, (episodes, watched) in by_season.items()
+        if episodes > 0
+    ]
+    if seasons:
+        db.session.execute(insert(Season), seasons)
+    db.session.execute(update(TVShow), [
+        {'id': show_id, 'watched_episodes': sum(watched for _, watched in by_season.values())}
+        for show_id, by_season in counts.items()
+    ])
+
+
+def _episode_aggregates(tv_show_ids=None):
+    stmt = (
+        select(
+            Episode.tv_show_id,
+            Episode.season,
+            func.count(Episode.id),
+            func.coalesce(func.sum(case((Episode.watched.is_(True), 1), else_=0)), 0),
+        )
+        .group_by(Episode.tv_show_id, Episode.season)
+    )
+    if tv_show_ids is not None:
+        stmt = stmt.where(Episode.tv_show_id.in_(tv_show_ids))
+    return stmt
+
+
+def find_counter_drift(tv_show_ids=None):
+    """Ids of shows whose stored counters disagree with their episodes"""
+    expected = defaultdict(dict)
+    for show_id, season, episodes, watched in db.session.execute(_episode_aggregates(tv_show_ids)):
+        expected[show_id][season] = (episodes, watched)
+
+    stored = defaultdict(dict)
+    season_stmt = select(Season.tv_show_id, Season.number, Season.episode_count, Season.watched_count)
+    show_stmt = select(TVShow.id, TVShow.watched_episodes)
+    if tv_show_ids is not None:
+        season_stmt = season_stmt.where(Season.tv_show_id.in_(tv_show_ids))
+        show_stmt = show_stmt.where(TVShow.id.in_(tv_show_ids))
+    for show_id, season, episodes, watched in db.session.execute(season_stmt):
+        stored[show_id][season] = (episodes, watched)
+
+    drifted = []
+    for show_id, watched_episodes in db.session.execute(show_stmt):
+        seasons = expected.get(show_id, {})
+        if watched_episodes != sum(watched for _, watched in seasons.values()) or stored.get(show_id, {}) != seasons:
+            drifted.append(show_id)
+    return drifted
+
+
+def rebuild_counters(tv_show_ids=None):
+    """Recompute the counters of the given shows, or of every show, and commit"""
+    season_filter = [] if tv_show_ids is None else [Season.tv_show_id.in_(tv_show_ids)]
+    show_filter = [] if tv_show_ids is None else [TVShow.id.in_(tv_show_ids)]
+
+    db.session.execute(delete(Season).where(*season_filter).execution_options(synchronize_session=False))
+    db.session.execute(
+        insert(Season).from_select(
+            ['tv_show_id', 'number', 'episode_count', 'watched_count'],
+            _episode_aggregates(tv_show_ids).where(Episode.season.is_not(None)),
+        )
+    )
+    watched = (
+        select(func.count(Episode.id))
+        .where(Episode.tv_show_id == TVShow.id, Episode.watched.is_(True))
+        .scalar_subquery()
+    )
+    db.session.execute(
+        update(TVShow).where(*show_filter).values(watched_episodes=watched, version=TVShow.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
@@ -0,0 +1,206 @@
+"""OMDB metadata for titles, filled in by background jobs.
+
+Adding a title by IMDb ID does not wait for OMDB: the title is created
+from whatever the client sent and an ``enrich`` job is queued in the same
+commit. The job fills in the fields that are still empty (a title that is
+just the IMDb ID counts as empty) and refreshes the poster URL, but never
+overwrites anything the user entered. For shows added with ``seasons:
+"omdb"`` it also lays out the real seasons and episode titles. A changed
+poster URL queues a ``poster`` job that downloads the image into the
+poster cache before a grid asks for it.
+
+``refresh_stale`` sweeps the library in batches and queues ``enrich`` for
+titles whose metadata is missing or older than ``OMDB_REFRESH_DAYS``.
+All lookups go through the rate-limited background OMDB client.
+"""
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, or_, select, update
+
+from app import db
+from app.models.models import Episode, Movie, TVShow
+from app.services.episodes import omdb_layout, sync_episodes
+from app.services.genres import set_genres
+from app.services.jobs import JobFailed, enqueue, enqueue_many, prune
+from app.services.omdb import get_background_client, get_client
+from app.services.posters import prefetch_poster
+from app.services.recommendations import RECOMMENDATIONS, rebuild
+from app.services.versions import touch
+
+ENRICH = 'enrich'
+REFRESH_STALE = 'refresh_stale'
+POSTER = 'poster'
+
+REFRESH_DAYS = int(os.getenv('OMDB_REFRESH_DAYS', 30))
+REFRESH_BATCH = 200
+
+TYPES = {'movie': Movie, 'tv': TVShow}
+TYPE_NAMES = {model: name for name, model in TYPES.items()}
+
+# Title columns filled from OMDB detail fields
+OMDB_FIELDS = {
+    Movie: {'title': 'Title', 'year': 'Year', 'genre': 'Genre', 'director': 'Director',
+            'poster_url': 'Poster', 'plot': 'Plot'},
+    TVShow: {'title': 'Title', 'year': 'Year', 'genre': 'Genre', 'creator': 'Writer',
+             'poster_url': 'Poster', 'plot': 'Plot'},
+}
+
+# Replaced whenever OMDB has a value, since poster URLs change upstream
+REFRESHED_FIELDS = ('poster_url',)
+
+
+def needs_enrichment(model, values):
+    """Whether a title with these column values has metadata left to fetch"""
+    imdb_id = values.get('imdb_id')
+    if not imdb_id:
+        return False
+    return values.get('title') == imdb_id or any(not values.get(name) for name in OMDB_FIELDS[model])
+
+
+def enqueue_enrichment(model, title_id, seasons=False):
+    """Queue an ``enrich`` job for one title; None if OMDB is not configured"""
+    if not get_client().configured:
+        return None
+    payload = {'type': TYPE_NAMES[model], 'id': title_id}
+    if seasons:
+        payload['seasons'] = True
+    return enqueue(ENRICH, payload, key=_key(model, title_id))
+
+
+def enqueue_enrichments(model, title_ids):
+    """Queue ``enrich`` jobs for many titles with one INSERT; returns how many were queued"""
+    if not get_client().configured:
+        return 0
+    return enqueue_many(ENRICH, [
+        (_key(model, title_id), {'type': TYPE_NAMES[model], 'id': title_id}) for title_id in title_ids
+    ])
+
+
+def enqueue_refresh():
+    """Queue a sweep of both collections for stale metadata; returns the jobs"""
+    return [
+        enqueue(REFRESH_STALE, {'type': name}, key=f'{REFRESH_STALE}:{name}')
+        for name in TYPES
+    ]
+
+
+def enrich(payload):
+    """Handler of ``enrich`` jobs: fill in one title from OMDB"""
+    model = TYPES[payload['type']]
+    title = db.session.get(model, payload['id'])
+    if title is None or not title.imdb_id:
+        return {'skipped': 'The title no longer exists or has no IMDb ID'}
+
+    client = get_background_client()
+    if not client.configured:
+        raise JobFailed('OMDB_API_KEY is not set')
+    # OmdbError propagates, and the job is retried later
+    data = client.details(title.imdb_id)
+    if data.get('Response') != 'True':
+        raise JobFailed(data.get('Error') or 'OMDB has no details for this title')
+
+    # Every lookup happens before the first write, so the job's transaction
+    # does not hold write locks while it waits on OMDB
+    layout = titles = None
+    if model is TVShow and payload.get('seasons'):
+        layout, titles = omdb_layout(client, title.imdb_id)
+
+    updated = []
+    for name, value in omdb_values(model, data).items():
+        current = getattr(title, name)
+        if value is None or value == current:
+            continue
+        if not current or (name == 'title' and current == title.imdb_id) or name in REFRESHED_FIELDS:
+            setattr(title, name, value)
+            updated.append(name)
+    if 'genre' in updated:
+        set_genres(model, {title.id: title.genre})
+        db.session.expire(title, ['genres'])
+
+    if layout is not None:
+        sync_episodes(title, layout, titles)
+        _retitle_episodes(title.id, titles)
+        updated.append('seasons')
+    # Grid thumbnails are ready before the first page that shows them
+    if 'poster_url' in updated:
+        enqueue(POSTER, {'imdb_id': title.imdb_id}, key=f'{POSTER}:{title.imdb_id}')
+
+    title.enriched_at = datetime.utcnow()
+    return {'updated': updated}
+
+
+def omdb_values(model, data):
+    """Column values for ``model`` from an OMDB details response; None where OMDB has none"""
+    values = {}
+    for name, field in OMDB_FIELDS[model].items():
+        value = data.get(field)
+        if not value or value == 'N/A':
+            values[name] = None
+        elif name == 'year':
+            try:
+                values[name] = int(value.split('–')[0])
+            except ValueError:
+                values[name] = None
+        else:
+            values[name] = value[:_length(model, name)]
+    return values
+
+
+def refresh_stale(payload):
+    """Handler of ``refresh_stale`` jobs: queue ``enrich`` for one batch of stale titles
+
+    Queues a follow-up job for the next batch until the collection is done.
+    """
+    model = TYPES[payload['type']]
+    after = payload.get('after', 0)
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=REFRESH_DAYS)
+    ids = db.session.execute(
+        select(model.id)
+        .where(model.id > after, model.imdb_id.isnot(None), model.imdb_id != '',
+               or_(model.enriched_at.is_(None), model.enriched_at < cutoff))
+        .order_by(model.id).limit(REFRESH_BATCH)
+    ).scalars().all()
+    queued = enqueue_enrichments(model, ids)
+    if len(ids) == REFRESH_BATCH:
+        enqueue(REFRESH_STALE, {'type': payload['type'], 'after': ids[-1]})
+    # Finished jobs are cleaned up by the sweep as well
+    prune(now)
+    return {'checked': len(ids), 'queued': queued, 'more': len(ids) == REFRESH_BATCH}
+
+
+HANDLERS = {
+    ENRICH: enrich,
+    REFRESH_STALE: refresh_stale,
+    POSTER: prefetch_poster,
+    RECOMMENDATIONS: rebuild,
+}
+
+
+def _retitle_episodes(tv_show_id, titles):
+    # Episodes created before the real layout was known carry placeholder titles
+    rows = [
+        {'show': tv_show_id, 'number_': number, 'season_': season, 'placeholder': f'Episode {number}',
+         'new_title': title}
+        for (season, number), title in titles.items() if title != f'Episode {number}'
+    ]
+    if not rows:
+        return
+    table = Episode.__table__
+    db.session.execute(
+        update(table)
+        .where(and_(table.c.tv_show_id == bindparam('show'), table.c.season == bindparam('season_'),
+                    table.c.episode_number == bindparam('number_'), table.c.title == bindparam('placeholder')))
+        .values(title=bindparam('new_title')),
+        rows,
+    )
+    touch(TVShow, [tv_show_id])
+
+
+def _key(model, title_id):
+    return f'{ENRICH}:{TYPE_NAMES[model]}:{title_id}'
+
+
+def _length(model, name):
+    return getattr(model.__table__.c[name].type, 'length', None)
@@ -0,0 +1,409 @@
+"""Set-based creation and updates of a show's episodes.
+
+A show's episodes follow a season layout, a list with the number of
+episodes in each season (``[10, 12, 8]``). :func:`sync_episodes` makes
+the stored episodes match a layout with one bulk DELETE and one bulk
+INSERT, keeping the watched state of every episode that stays.
+
+Every write here also updates the show's stored counters through
+:mod:`app.services.counters` in the same transaction.
+
+:func:`update_episodes` applies one change to every episode matched by a
+selection (explicit ids, a season, an episode-number range, or everything
+up to a given episode) with set-based UPDATE statements, one per distinct
+old (season, watched) pair, and reports only the rows whose values
+actually changed.
+"""
+from collections import Counter, defaultdict
+
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.models import Episode
+from app.services.counters import apply_episode_changes
+from app.services.omdb import OmdbError
+from app.services.sync import delete_tracked
+
+# Fields that can be set on a whole selection at once
+BATCH_FIELDS = {'watched': bool, 'season': int}
+
+MAX_IDS = 10000
+
+MAX_SEASONS = 200
+MAX_EPISODES = 20000
+
+# Rows per executemany INSERT
+INSERT_BATCH_SIZE = 5000
+
+TITLE_LENGTH = Episode.__table__.c.title.type.length
+
+
+class EpisodeSelectionError(ValueError):
+    """The request does not describe a valid selection or change"""
+
+
+class SeasonLayoutError(ValueError):
+    """A season layout is malformed or too large"""
+
+
+class EpisodeConflictError(ValueError):
+    """A change would put two episodes of a show at the same position"""
+
+    def __init__(self, season, numbers):
+        self.positions = [(season, number) for number in numbers]
+        if numbers:
+            taken = ', '.join(f'S{season:02d}E{number:02d}' for number in numbers)
+            message = f'Moving these episodes would leave two episodes at {taken}'
+        else:
+            message = 'The episodes were moved by another request; reload them and try again'
+        super().__init__(message)
+
+
+def parse_seasons(value):
+    """Validate a season layout from a request: a list of episode counts"""
+    if not isinstance(value, list) or not all(isinstance(n, int) and not isinstance(n, bool) for n in value):
+        raise SeasonLayoutError('seasons must be a list of episode counts')
+    if any(n < 0 for n in value):
+        raise SeasonLayoutError('Episode counts cannot be negative')
+    if len(value) > MAX_SEASONS:
+        raise SeasonLayoutError(f'A show can have at most {MAX_SEASONS} seasons')
+    if sum(value) > MAX_EPISODES:
+        raise SeasonLayoutError(f'A show can have at most {MAX_EPISODES} episodes')
+    return value
+
+
+def current_layout(tv_show_id):
+    """Season layout of the stored episodes, from the highest episode number per season"""
+    rows = db.session.execute(
+        select(Episode.season, func.max(Episode.episode_number))
+        .where(Episode.tv_show_id == tv_show_id, Episode.season >= 1)
+        .group_by(Episode.season)
+    ).all()
+    counts = dict(rows)
+    return [counts.get(season, 0) for season in range(1, max(counts, default=0) + 1)]
+
+
+def layout_for_total(layout, total):
+    """Fit a layout to a new total, changing the end of the show only
+
+    Growing adds episodes to the last season; shrinking removes them from
+    the end, dropping whole seasons if needed.
+    """
+    if not layout:
+        return [total] if total > 0 else []
+    fitted = []
+    remaining = total
+    for count in layout:
+        if remaining <= 0:
+            break
+        fitted.append(min(count, remaining))
+        remaining -= fitted[-1]
+    if remaining > 0:
+        fitted[-1] += remaining
+    return fitted
+
+
+def omdb_layout(client, imdb_id):
+    """Season layout and episode titles of a series, from OMDB
+
+    Returns ``(layout, titles)`` where ``titles`` maps ``(season, number)``
+    to an episode title, or ``(None, None)`` if OMDB has no usable data.
+    Season lookups go through the client's cache.
+    """
+    if not client.configured or not imdb_id:
+        return None, None
+    try:
+        details = client.details(imdb_id)
+        total_seasons = int(details.get('totalSeasons') or 0)
+    except (OmdbError, ValueError):
+        return None, None
+    if details.get('Response') != 'True' or total_seasons <= 0:
+        return None, None
+
+    layout = []
+    titles = {}
+    for season in range(1, min(total_seasons, MAX_SEASONS) + 1):
+        try:
+            data = client.season(imdb_id, season)
+        except OmdbError:
+            return None, None
+        numbers = []
+        for episode in data.get('Episodes') or []:
+            try:
+                number = int(episode.get('Episode'))
+            except (TypeError, ValueError):
+                continue
+            numbers.append(number)
+            if episode.get('Title'):
+                titles[(season, number)] = episode['Title'][:TITLE_LENGTH]
+        layout.append(max(numbers, default=0))
+
+    if not any(layout) or sum(layout) > MAX_EPISODES:
+        return None, None
+    return layout, titles
+
+
+def sync_episodes(tv_show, layout, titles=None, is_new=False):
+    """Make the stored episodes of ``tv_show`` match ``layout``
+
+    Episodes outside the layout are deleted and missing positions are
+    inserted, each with a single bulk statement; existing episodes keep
+    their title and watched state. Sets ``total_episodes`` and leaves the
+    commit to the caller. ``is_new`` skips the queries for existing rows.
+    """
+    titles = titles or {}
+    existing = set()
+    removed = []
+    if not is_new:
+        # Everything past the last season or past the end of its season goes
+        outside = and_(
+            Episode.tv_show_id == tv_show.id,
+            or_(
+                Episode.season < 1,
+                Episode.season > len(layout),
+                Episode.episode_number < 1,
+                *(and_(Episode.season == season, Episode.episode_number > count)
+                  for season, count in enumerate(layout, 1))
+            ),
+        )
+        deleted = delete_tracked(Episode, outside, Episode.season, Episode.watched)
+        removed = [(row.season, row.watched) for row in deleted]
+        existing = set(db.session.execute(
+            select(Episode.season, Episode.episode_number).where(Episode.tv_show_id == tv_show.id)
+        ).tuples())
+
+    added = []
+    rows = []
+    for season, count in enumerate(layout, 1):
+        for number in range(1, count + 1):
+            if (season, number) in existing:
+                continue
+            rows.append({
+                'tv_show_id': tv_show.id,
+                'season': season,
+                'episode_number': number,
+                'title': titles.get((season, number)) or f'Episode {number}',
+                'watched': False,
+            })
+            added.append((season, False))
+            if len(rows) >= INSERT_BATCH_SIZE:
+                db.session.execute(insert(Episode), rows)
+                rows = []
+    if rows:
+        db.session.execute(insert(Episode), rows)
+    apply_episode_changes(tv_show.id, removed=removed, added=added)
+
+    tv_show.total_episodes = sum(layout)
+    # Loaded relationships and counters no longer match the tables
+    db.session.expire(tv_show, ['episodes', 'seasons', 'watched_episodes'])
+
+
+def parse_episode_update(data):
+    """Split a request body into ``(selection, values)``
+
+    Selectors, which are combined with AND:
+
+    - ``ids``: a list of episode ids
+    - ``season``: a season number
+    - ``from`` / ``to``: an inclusive episode-number range
+    - ``up_to``: an episode id; selects that episode and every episode
+      before it in season/episode order
+
+    ``set`` holds the new values, limited to :data:`BATCH_FIELDS`.
+    """
+    if not isinstance(data, dict):
+        raise EpisodeSelectionError('Request body must be a JSON object')
+
+    selection = {}
+    if 'ids' in data:
+        ids = data['ids']
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise EpisodeSelectionError('ids must be a list of integers')
+        if len(ids) > MAX_IDS:
+            raise EpisodeSelectionError(f'At most {MAX_IDS} ids can be updated at once')
+        selection['ids'] = ids
+    for name in ('season', 'from', 'to', 'up_to'):
+        if name in data:
+            selection[name] = _int_arg(data, name)
+    if not selection:
+        raise EpisodeSelectionError('Select episodes with ids, season, from/to or up_to')
+
+    changes = data.get('set')
+    if not isinstance(changes, dict) or not changes:
+        raise EpisodeSelectionError('set must be an object with the fields to change')
+    return selection, parse_episode_values(changes)
+
+
+def parse_episode_values(changes):
+    """Validate new episode values, limited to :data:`BATCH_FIELDS`
+
+    Seasons are numbered from 1 up to :data:`MAX_SEASONS`, as in a layout.
+    """
+    values = {}
+    for name, value in changes.items():
+        kind = BATCH_FIELDS.get(name)
+        if kind is None:
+            raise EpisodeSelectionError(f'{name} cannot be changed in a batch; allowed: {", ".join(BATCH_FIELDS)}')
+        if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+            raise EpisodeSelectionError(f'{name} must be {"a boolean" if kind is bool else "an integer"}')
+        if name == 'season' and not 1 <= value <= MAX_SEASONS:
+            raise EpisodeSelectionError(f'season must be between 1 and {MAX_SEASONS}')
+        values[name] = value
+    return values
+
+
+def update_episodes(tv_show, selection, values):
+    """Apply ``values`` to the selected episodes of ``tv_show`` and commit
+
+    Returns the changed episodes and the show's recomputed progress.
+    Rows that already hold the new values are left alone and not returned.
+    Raises LookupError if the ``up_to`` episode is not part of the show.
+    """
+    criteria = [Episode.tv_show_id == tv_show.id]
+    if 'ids' in selection:
+        criteria.append(Episode.id.in_(selection['ids']))
+    if 'season' in selection:
+        criteria.append(Episode.season == selection['season'])
+    if 'from' in selection:
+        criteria.append(Episode.episode_number >= selection['from'])
+    if 'to' in selection:
+        criteria.append(Episode.episode_number <= selection['to'])
+    if 'up_to' in selection:
+        criteria.append(_up_to(tv_show, selection['up_to']))
+
+    changed_ids = change_episodes(tv_show.id, criteria, values)
+    db.session.commit()
+
+    changed = []
+    if changed_ids:
+        changed = db.session.execute(
+            select(Episode).where(Episode.id.in_(changed_ids))
+            .order_by(Episode.season, Episode.episode_number, Episode.id)
+        ).scalars().all()
+
+    result = {'episodes': [episode.to_dict() for episode in changed]}
+    result.update(show_progress(tv_show))
+    return result
+
+
+def change_episodes(tv_show_id, criteria, values, attempts=3):
+    """Set ``values`` on the show's episodes matching ``criteria``
+
+    Returns the ids of the rows that changed and updates the show's
+    counters; leaves the commit to the caller. Each UPDATE is guarded by
+    the old values it was computed from, so a row changed by a concurrent
+    request in between is never counted twice; such rows are re-read and
+    retried.
+
+    Raises EpisodeConflictError, after rolling back, if a season change
+    would move an episode onto the position of another one.
+    """
+    # Only touch rows that differ, so the result lists real changes
+    criteria = list(criteria) + [
+        Episode.tv_show_id == tv_show_id,
+        or_(*(
+            or_(getattr(Episode, name) != value, getattr(Episode, name).is_(None))
+            for name, value in values.items()
+        )),
+    ]
+
+    changed_ids = []
+    for _ in range(attempts):
+        before = db.session.execute(
+            select(Episode.id, Episode.season, Episode.episode_number, Episode.watched)
+            .where(*criteria).with_for_update()
+        ).all()
+        if not before:
+            break
+        if 'season' in values:
+            _check_positions(tv_show_id, before, values['season'])
+
+        groups = defaultdict(list)
+        for row in before:
+            groups[(row.season, row.watched)].append(row.id)
+
+        removed = []
+        added = []
+        for (season, watched), ids in groups.items():
+            stmt = (
+                update(Episode)
+                .where(Episode.id.in_(ids), _equals(Episode.season, season), _equals(Episode.watched, watched))
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            try:
+                if db.engine.dialect.update_returning:
+                    done = db.session.execute(stmt.returning(Episode.id)).scalars().all()
+                else:
+                    # The rows are locked by the SELECT ... FOR UPDATE above
+                    db.session.execute(stmt)
+                    done = ids
+            except IntegrityError:
+                # A concurrent change took a position after the check above
+                db.session.rollback()
+                raise EpisodeConflictError(values['season'], [])
+            changed_ids.extend(done)
+            removed.extend([(season, watched)] * len(done))
+            added.extend([(values.get('season', season), values.get('watched', watched))] * len(done))
+        apply_episode_changes(tv_show_id, removed=removed, added=added)
+
+        if len(removed) == len(before):
+            break
+    return changed_ids
+
+
+def _check_positions(tv_show_id, rows, season):
+    """Raise EpisodeConflictError, after rolling back, if moving ``rows`` to ``season`` reuses a position"""
+    # Every row ends up in ``season``, next to the ones already there
+    moved = Counter(row.episode_number for row in rows)
+    ids = {row.id for row in rows}
+    taken = {
+        number for episode_id, number in db.session.execute(
+            select(Episode.id, Episode.episode_number)
+            .where(Episode.tv_show_id == tv_show_id, Episode.season == season)
+        ) if episode_id not in ids
+    }
+    conflicts = sorted(number for number, count in moved.items() if count > 1 or number in taken)
+    if conflicts:
+        db.session.rollback()
+        raise EpisodeConflictError(season, conflicts)
+
+
+def _equals(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def show_progress(tv_show):
+    """Watched count and progress of a show, from its stored counters"""
+    db.session.refresh(tv_show, ['watched_episodes', 'total_episodes', 'seasons'])
+    watched = tv_show.watched_episodes
+    total = tv_show.total_episodes or 0
+    return {
+        'tv_show_id': tv_show.id,
+        'total_episodes': total,
+        'watched_episodes': watched,
+        'progress': round((watched / total) * 100) if total > 0 else 0,
+        'seasons': [season.to_dict() for season in tv_show.seasons],
+    }
+
+
+def _up_to(tv_show, episode_id):
+    anchor = db.session.execute(
+        select(Episode.season, Episode.episode_number)
+        .where(Episode.id == episode_id, Episode.tv_show_id == tv_show.id)
+    ).first()
+    if anchor is None:
+        raise LookupError(f'Episode {episode_id} is not part of this show')
+    season, number = anchor
+    return or_(
+        Episode.season < season,
+        and_(Episode.season == season, Episode.episode_number <= number),
+    )
+
+
+def _int_arg(data, name):
+    value = data[name]
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise EpisodeSelectionError(f'{name} must be an integer')
+    return value
@@ -0,0 +1,205 @@
+"""Streaming export of the whole collection.
+
+:func:`iter_export` produces the export as a sequence of text chunks that
+can be handed straight to a streaming response. Rows are read with
+``yield_per`` so only one batch of titles, and the episodes of one batch
+of shows, is held in memory at a time, however large the collection is.
+
+Titles are exported movies first, then TV shows, each in id order. That
+order makes an export resumable: ``after`` names the last record a client
+received and the export picks up right after it.
+"""
+import json
+import os
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app import db
+from app.models.models import Episode, Movie, TVShow
+from app.services.importer import MOVIE_FIELDS, RECORD_TYPES, TV_SHOW_FIELDS
+
+DEFAULT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 500))
+MAX_BATCH_SIZE = 5000
+
+# Text is buffered up to this size before it is handed to the response
+FLUSH_SIZE = 64 * 1024
+
+FORMATS = ('json', 'ndjson')
+
+MEDIA_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'gzip': 'application/gzip',
+}
+
+EXTENSIONS = {'json': 'json', 'ndjson': 'jsonl'}
+
+# Columns that are exported: what the import reads back, plus ids to resume from.
+# Row versions, change times, stored counters and enrichment state only mean
+# something to this database.
+MOVIE_COLUMNS = ('id',) + MOVIE_FIELDS
+TV_SHOW_COLUMNS = ('id',) + TV_SHOW_FIELDS
+EPISODE_COLUMNS = ('id', 'tv_show_id', 'season', 'episode_number', 'title', 'watched')
+
+
+class ExportError(ValueError):
+    """The export parameters are invalid"""
+
+
+def parse_resume_point(after):
+    """Turn an ``after`` argument into ``(record_type, id)``
+
+    ``after`` is either ``<type>:<id>``, as found in the ``type`` and
+    ``id`` fields of an NDJSON line, or the IMDb ID of a title.
+    """
+    if not after:
+        return None
+
+    record_type, _, record_id = after.partition(':')
+    if record_id:
+        if record_type not in RECORD_TYPES:
+            raise ExportError(f'Unknown record type in after: {record_type}')
+        try:
+            return record_type, int(record_id)
+        except ValueError:
+            raise ExportError('after must be <type>:<id> or an IMDb ID')
+
+    for record_type, model in (('movie', Movie), ('tv', TVShow)):
+        record_id = db.session.execute(
+            select(model.id).where(model.imdb_id == after)
+        ).scalar()
+        if record_id is not None:
+            return record_type, record_id
+    raise ExportError(f'No title with IMDb ID {after}')
+
+
+def iter_export(fmt='json', after=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield the export as text chunks in the given format
+
+    ``after`` is a ``(record_type, id)`` resume point from
+    :func:`parse_resume_point`.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    export_date = datetime.utcnow().isoformat()
+
+    movie_after = 0
+    show_after = 0
+    if after:
+        record_type, record_id = after
+        if record_type == 'movie':
+            movie_after = record_id
+        else:
+            movie_after = None
+            show_after = record_id
+
+    movies = iter_movies(movie_after, batch_size) if movie_after is not None else iter(())
+    shows = iter_tv_shows(show_after, batch_size)
+
+    if fmt == 'ndjson':
+        pieces = _ndjson_pieces(export_date, movies, shows)
+    else:
+        pieces = _json_pieces(export_date, movies, shows)
+
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= FLUSH_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip-compress a stream of text chunks as it is produced"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_movies(after_id=0, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield exported movie dicts with an id greater than ``after_id``"""
+    table = Movie.__table__
+    stmt = select(*_columns(table, MOVIE_COLUMNS)).where(table.c.id > after_id).order_by(table.c.id)
+    # Plain rows rather than ORM objects, so nothing piles up in the session
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    for row in result.mappings():
+        yield _title_dict(row)
+
+
+def iter_tv_shows(after_id=0, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield exported TV show dicts, with episodes, with an id greater than ``after_id``"""
+    table = TVShow.__table__
+    episodes = Episode.__table__
+    stmt = select(*_columns(table, TV_SHOW_COLUMNS)).where(table.c.id > after_id).order_by(table.c.id)
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+
+    for partition in result.mappings().partitions():
+        # One episode query per batch of shows
+        by_show = {row['id']: [] for row in partition}
+        episode_rows = db.session.execute(
+            select(*_columns(episodes, EPISODE_COLUMNS))
+            .where(episodes.c.tv_show_id.in_(list(by_show)))
+            .order_by(episodes.c.tv_show_id, episodes.c.id)
+        ).mappings()
+        for episode in episode_rows:
+            by_show[episode['tv_show_id']].append(dict(episode))
+
+        for row in partition:
+            show = _title_dict(row)
+            show_episodes = by_show[row['id']]
+            seasons = {}
+            for episode in show_episodes:
+                season = seasons.setdefault(episode['season'], {
+                    'season': episode['season'], 'episode_count': 0, 'watched_count': 0
+                })
+                season['episode_count'] += 1
+                season['watched_count'] += 1 if episode['watched'] else 0
+            watched = sum(season['watched_count'] for season in seasons.values())
+            total = show['total_episodes'] or 0
+            show['watched_episodes'] = watched
+            show['progress'] = round((watched / total) * 100) if total > 0 else 0
+            show['seasons'] = [seasons[number] for number in sorted(seasons)]
+            show['episodes'] = show_episodes
+            yield show
+
+
+def _columns(table, names):
+    return [table.c[name] for name in names]
+
+
+def _title_dict(row):
+    return {key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in row.items()}
+
+
+def _json_pieces(export_date, movies, shows):
+    # Same document as the old client-side export, one title per line
+    yield '{"exportDate": %s,\n"movies": [' % json.dumps(export_date)
+    yield from _json_array(movies)
+    yield '],\n"tvShows": ['
+    yield from _json_array(shows)
+    yield ']}\n'
+
+
+def _json_array(records):
+    separator = '\n'
+    for record in records:
+        yield separator
+        yield json.dumps(record)
+        separator = ',\n'
+
+
+def _ndjson_pieces(export_date, movies, shows):
+    yield json.dumps({'type': 'export', 'exportDate': export_date}) + '\n'
+    for record_type, records in (('movie', movies), ('tv', shows)):
+        for record in records:
+            yield json.dumps({'type': record_type, **record}) + '\n'
@@ -0,0 +1,186 @@
+"""Normalized genres for filtering and facet counts.
+
+``Movie.genre`` and ``TVShow.genre`` stay the comma-separated display
+strings that OMDB and the export format use. Each write that sets one also
+calls :func:`set_genres`, which keeps a ``Genre`` row per distinct name and
+the ``movie_genre`` / ``tv_show_genre`` association rows in step with the
+string. Filters then become indexed lookups on the association tables, and
+a genre only matches as a whole name, so "Drama" no longer matches
+"Docudrama".
+
+Names compare case-insensitively: "drama" is stored under an existing
+"Drama" rather than as a second genre.
+"""
+from sqlalchemy import String, and_, cast, delete, false, func, insert, literal, select, union_all
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.models import Genre, Movie, TVShow, movie_genre, tv_show_genre
+
+NAME_LENGTH = Genre.__table__.c.name.type.length
+
+MATCH_MODES = ('any', 'all')
+
+# Titles per batch when rebuilding the association tables
+REBUILD_BATCH_SIZE = 1000
+
+# (association table, column holding the title id) per model
+LINKS = {
+    Movie: (movie_genre, movie_genre.c.movie_id),
+    TVShow: (tv_show_genre, tv_show_genre.c.tv_show_id),
+}
+
+
+class GenreFilterError(ValueError):
+    """Raised for malformed genre filter parameters"""
+
+
+def split_genres(value):
+    """Distinct genre names in a comma-separated genre string, in order"""
+    names = {}
+    for part in (value or '').split(','):
+        name = part.strip()[:NAME_LENGTH]
+        if name and name.lower() not in names:
+            names[name.lower()] = name
+    return list(names.values())
+
+
+def set_genres(model, genre_strings):
+    """Replace the genre links of titles from their genre strings
+
+    ``genre_strings`` maps a title id to its genre string. Missing genres
+    are created. Leaves the commit to the caller.
+    """
+    if not genre_strings:
+        return
+    table, title_column = LINKS[model]
+    names = {title_id: split_genres(value) for title_id, value in genre_strings.items()}
+    genre_ids = _genre_ids({name for title_names in names.values() for name in title_names})
+
+    db.session.execute(
+        delete(table).where(title_column.in_(list(genre_strings))).execution_options(synchronize_session=False)
+    )
+    rows = [
+        {title_column.name: title_id, 'genre_id': genre_ids[name.lower()]}
+        for title_id, title_names in names.items()
+        for name in title_names
+    ]
+    if rows:
+        db.session.execute(insert(table), rows)
+
+
+def _genre_ids(names):
+    """Ids of the given genre names keyed by lower-cased name, creating missing ones"""
+    if not names:
+        return {}
+    ids = _existing_genre_ids()
+    missing = {name.lower(): name for name in names if name.lower() not in ids}
+    if missing:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Genre), [{'name': name} for name in missing.values()])
+        except IntegrityError:
+            # A concurrent request created some of them first
+            pass
+        ids = _existing_genre_ids()
+    return ids
+
+
+def _existing_genre_ids():
+    # There are only ever a few dozen genres
+    return {name.lower(): genre_id for genre_id, name in db.session.execute(select(Genre.id, Genre.name))}
+
+
+def parse_genre_args(args):
+    """Read ``genre`` and ``genre_match`` from the request arguments
+
+    ``genre`` is a comma-separated list and may be repeated.
+    ``genre_match`` is ``any`` (the default) or ``all``. Returns
+    ``(names, match_all)``.
+    """
+    names = []
+    for value in args.getlist('genre'):
+        names.extend(split_genres(value))
+    match = (args.get('genre_match') or 'any').lower()
+    if match not in MATCH_MODES:
+        raise GenreFilterError(f'genre_match must be one of: {", ".join(MATCH_MODES)}')
+    return names, match == 'all'
+
+
+def genre_filter(model, names, match_all=False):
+    """Criterion matching titles that have any, or all, of the named genres"""
+    table, title_column = LINKS[model]
+    wanted = {name.lower() for name in names}
+    genre_ids = [genre_id for key, genre_id in _existing_genre_ids().items() if key in wanted]
+    if not genre_ids or (match_all and len(genre_ids) < len(wanted)):
+        return false()
+
+    titles = select(title_column).where(table.c.genre_id.in_(genre_ids))
+    if match_all and len(genre_ids) > 1:
+        titles = titles.group_by(title_column).having(func.count() == len(genre_ids))
+    return model.id.in_(titles)
+
+
+def facet_counts(models=(Movie, TVShow)):
+    """Genre and year counts per model, from a single UNION ALL query
+
+    Returns ``{model: {'genres': [{'name', 'count'}], 'years': [{'year', 'count'}]}}``
+    with genres by name and years newest first.
+    """
+    parts = []
+    for model in models:
+        table, title_column = LINKS[model]
+        key = literal(model.__tablename__)
+        parts.append(
+            select(key.label('model'), literal('genre').label('facet'), Genre.name.label('value'),
+                   func.count(title_column).label('count'))
+            .select_from(table.join(Genre, Genre.id == table.c.genre_id))
+            .group_by(Genre.name)
+        )
+        parts.append(
+            select(key.label('model'), literal('year').label('facet'), cast(model.year, String).label('value'),
+                   func.count(model.id).label('count'))
+            .where(model.year.is_not(None))
+            .group_by(model.year)
+        )
+
+    facets = {model: {'genres': [], 'years': []} for model in models}
+    by_table = {model.__tablename__: model for model in models}
+    for row in db.session.execute(union_all(*parts)):
+        model_facets = facets[by_table[row.model]]
+        if row.facet == 'genre':
+            model_facets['genres'].append({'name': row.value, 'count': row.count})
+        else:
+            model_facets['years'].append({'year': int(row.value), 'count': row.count})
+    for model_facets in facets.values():
+        model_facets['genres'].sort(key=lambda genre: genre['name'].lower())
+        model_facets['years'].sort(key=lambda year: year['year'], reverse=True)
+    return facets
+
+
+def rebuild_genres(models=(Movie, TVShow)):
+    """Recompute every genre link from the genre strings and commit"""
+    for model in models:
+        table, _ = LINKS[model]
+        db.session.execute(delete(table).execution_options(synchronize_session=False))
+        after = 0
+        while True:
+            rows = db.session.execute(
+                select(model.id, model.genre).where(model.id > after).order_by(model.id).limit(REBUILD_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            set_genres(model, {title_id: genre for title_id, genre in rows if genre})
+            after = rows[-1].id
+    db.session.commit()
+
+
+def needs_backfill(model):
+    """True if titles have genre strings but no genre links at all yet"""
+    table, _ = LINKS[model]
+    has_links = db.session.execute(select(literal(1)).select_from(table).limit(1)).first() is not None
+    if has_links:
+        return False
+    return db.session.execute(
+        select(literal(1)).where(and_(model.genre.is_not(None), model.genre != '')).limit(1)
+    ).first() is not None
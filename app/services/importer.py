@@ -0,0 +1,558 @@
+"""Bulk import of exported collections.
+
+The export format is a single JSON object, ``{"movies": [...], "tvShows":
+[...], "exportDate": ...}``, or JSON Lines with one ``{"type": "movie" |
+"tv", ...}`` record per line, optionally gzip-compressed.
+:func:`iter_export_records` and :func:`iter_ndjson_records` walk them
+incrementally from a file-like stream, yielding one record at a time, so
+memory use depends on the size of a record rather than the size of the
+file. :class:`BulkImporter` groups the records into chunks and upserts each
+chunk by ``imdb_id`` with executemany INSERT/UPDATE statements inside one
+transaction per chunk.
+
+Records may be as bare as ``{"imdb_id": "tt0111161"}``; new titles that
+are missing metadata get an OMDB enrichment job queued with their chunk.
+"""
+import codecs
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models.models import Episode, Movie, TVShow
+from app.services.counters import set_counters
+from app.services.enrichment import enqueue_enrichments, needs_enrichment
+from app.services.genres import set_genres
+from app.services.omdb import get_client
+from app.services.sync import delete_tracked
+from app.services.versions import touch
+
+DEFAULT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+MAX_CHUNK_SIZE = 10000
+
+# Keys of the export object that hold records, and the record type they hold
+EXPORT_SECTIONS = {'movies': 'movie', 'tvShows': 'tv'}
+RECORD_TYPES = ('movie', 'tv')
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+MOVIE_FIELDS = ('title', 'year', 'genre', 'director', 'poster_url', 'plot', 'imdb_id',
+                'watched', 'rating', 'notes', 'watch_later', 'created_at')
+TV_SHOW_FIELDS = ('title', 'year', 'genre', 'creator', 'poster_url', 'plot', 'imdb_id',
+                  'total_episodes', 'rating', 'notes', 'watch_later', 'created_at')
+
+_json_decoder = json.JSONDecoder()
+
+
+def _column_lengths(model):
+    return {column.name: getattr(column.type, 'length', None) for column in model.__table__.columns}
+
+
+# Looked up once; going through the ORM attributes per value is slow
+MOVIE_LENGTHS = _column_lengths(Movie)
+TV_SHOW_LENGTHS = _column_lengths(TVShow)
+EPISODE_LENGTHS = _column_lengths(Episode)
+
+
+class ImportFormatError(ValueError):
+    """The uploaded file is not a valid export"""
+
+
+class ImportRecordError(ValueError):
+    """A single record cannot be imported"""
+
+
+class _JsonStreamReader:
+    """Just enough of a pull parser to step through the export object"""
+
+    def __init__(self, stream, read_size, max_value_size):
+        self.stream = stream
+        self.read_size = read_size
+        self.max_value_size = max_value_size
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Append the next chunk, dropping what was already consumed"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.read_size)
+        try:
+            text = self.decoder.decode(chunk or b'', final=not chunk)
+        except UnicodeDecodeError:
+            raise ImportFormatError('File is not valid UTF-8')
+        self.eof = not chunk
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, or '' at the end of the stream"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ImportFormatError(f'Expected {char!r} but found {found!r}' if found else f'Expected {char!r}')
+        self.pos += 1
+
+    def value(self):
+        """Decode one complete JSON value, reading more input as needed"""
+        self.peek()
+        while True:
+            try:
+                value, end = _json_decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if len(self.buffer) - self.pos > self.max_value_size:
+                    raise ImportFormatError('Record is too large')
+                if not self.fill():
+                    raise ImportFormatError(f'Invalid JSON: {e.msg}')
+                continue
+            # A bare number ending exactly at the buffer edge may be cut off
+            if end == len(self.buffer) and not self.eof and isinstance(value, (int, float)):
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_export_records(stream, read_size=64 * 1024, max_record_size=16 * 1024 * 1024):
+    """Yield ``(record_type, record)`` pairs from an export file stream
+
+    ``record_type`` is ``'movie'`` or ``'tv'``. Other top-level keys such
+    as ``exportDate`` are skipped.
+    """
+    reader = _JsonStreamReader(stream, read_size, max_record_size)
+
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ImportFormatError('Expected an object key')
+        reader.expect(':')
+
+        record_type = EXPORT_SECTIONS.get(key)
+        if record_type is None:
+            reader.value()
+        else:
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    yield record_type, reader.value()
+                    separator = reader.peek()
+                    reader.pos += 1
+                    if separator == ']':
+                        break
+                    if separator != ',':
+                        raise ImportFormatError(f'Expected \',\' or \']\' in "{key}"')
+
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == '}':
+            break
+        if separator != ',':
+            raise ImportFormatError('Expected \',\' or \'}\' after a top-level value')
+
+    if reader.peek():
+        raise ImportFormatError('Unexpected data after the export object')
+
+
+def iter_ndjson_records(stream, read_size=64 * 1024, max_record_size=16 * 1024 * 1024):
+    """Yield ``(record_type, record)`` pairs from a JSON Lines export stream
+
+    Each line is an object whose ``type`` key is ``'movie'`` or ``'tv'``;
+    lines of any other type, such as the export header, are skipped.
+    """
+    reader = _JsonStreamReader(stream, read_size, max_record_size)
+
+    line = 0
+    while reader.peek():
+        line += 1
+        record = reader.value()
+        if not isinstance(record, dict):
+            raise ImportFormatError(f'Line {line} is not a JSON object')
+        record_type = record.pop('type', None)
+        if record_type in RECORD_TYPES:
+            yield record_type, record
+
+
+class _PrefixedStream:
+    """A read-only stream that replays bytes already read from another"""
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix + self.stream.read(), b''
+            return data
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+
+def open_export(stream, ndjson=False):
+    """Yield the records of an export stream in either format
+
+    Gzip-compressed streams are recognised by their magic number and
+    decompressed on the fly.
+    """
+    prefix = stream.read(len(GZIP_MAGIC))
+    stream = _PrefixedStream(prefix, stream)
+    if prefix == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+
+    try:
+        if ndjson:
+            yield from iter_ndjson_records(stream)
+        else:
+            yield from iter_export_records(stream)
+    except (OSError, EOFError) as e:
+        # Corrupt or truncated gzip data
+        raise ImportFormatError(f'Invalid gzip data: {e}')
+
+
+class BulkImporter:
+    """Upsert exported movies and TV shows in chunks
+
+    Each chunk is written with one executemany INSERT for new titles and
+    one executemany UPDATE for titles whose ``imdb_id`` already exists, and
+    committed as a unit. If a chunk fails, it is retried one record at a
+    time so that a single bad record only fails itself.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, keep_records=True):
+        self.chunk_size = max(1, min(chunk_size, MAX_CHUNK_SIZE))
+        self.keep_records = keep_records
+        self.report = {
+            'movies': {'created': 0, 'updated': 0, 'failed': 0},
+            'tv_shows': {'created': 0, 'updated': 0, 'failed': 0},
+            'episodes': 0,
+            'enrichment_queued': 0,
+        }
+        if keep_records:
+            self.report['records'] = []
+
+    def run(self, records):
+        """Import ``(record_type, record)`` pairs and return the report"""
+        pending = {'movie': [], 'tv': []}
+        try:
+            for index, (record_type, record) in enumerate(records):
+                chunk = pending[record_type]
+                chunk.append((index, record))
+                if len(chunk) >= self.chunk_size:
+                    self._import_chunk(record_type, chunk)
+                    pending[record_type] = []
+        except ImportFormatError:
+            # Records read before a malformed part of the file still count
+            self._flush(pending)
+            raise
+
+        self._flush(pending)
+        return self.report
+
+    def _flush(self, pending):
+        for record_type, chunk in pending.items():
+            if chunk:
+                self._import_chunk(record_type, chunk)
+
+    def _import_chunk(self, record_type, chunk):
+        model = Movie if record_type == 'movie' else TVShow
+        normalize = normalize_movie if record_type == 'movie' else normalize_tv_show
+
+        entries = []
+        by_imdb_id = {}
+        for index, record in chunk:
+            try:
+                row, episodes = normalize(record)
+            except ImportRecordError as e:
+                self._record(record_type, index, record, 'failed', error=str(e))
+                continue
+            # Within a chunk the last record for an imdb_id wins
+            if row['imdb_id'] and row['imdb_id'] in by_imdb_id:
+                previous = by_imdb_id.pop(row['imdb_id'])
+                entries.remove(previous)
+                self._record(record_type, previous[0], previous[1], 'skipped',
+                             error='Superseded by a later record with the same imdb_id')
+            entry = (index, record, row, episodes)
+            entries.append(entry)
+            if row['imdb_id']:
+                by_imdb_id[row['imdb_id']] = entry
+
+        if not entries:
+            return
+
+        enrichment = get_client().configured
+        try:
+            results = self._write(model, entries)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            results = self._write_one_by_one(model, entries)
+
+        for (index, record, row, episodes), (status, record_id, error) in zip(entries, results):
+            self._record(record_type, index, record, status, record_id=record_id, error=error)
+            if status == 'created' and enrichment and needs_enrichment(model, row):
+                self.report['enrichment_queued'] += 1
+
+    def _write(self, model, entries):
+        """Write entries with bulk statements; returns (status, id, error) per entry"""
+        imdb_ids = [row['imdb_id'] for _, _, row, _ in entries if row['imdb_id']]
+        existing = {}
+        if imdb_ids:
+            existing = dict(db.session.execute(
+                select(model.imdb_id, model.id).where(model.imdb_id.in_(imdb_ids))
+            ).all())
+
+        ids = {}
+        new_entries = [entry for entry in entries if entry[2]['imdb_id'] not in existing]
+        if new_entries:
+            rows = []
+            for _, _, row, _ in new_entries:
+                row = dict(row)
+                if row['created_at'] is None:
+                    row['created_at'] = datetime.utcnow()
+                rows.append(row)
+            inserted = db.session.execute(
+                insert(model).returning(model.id, sort_by_parameter_order=True), rows
+            ).scalars().all()
+            ids.update((entry[0], record_id) for entry, record_id in zip(new_entries, inserted))
+            # Queued in the chunk's transaction, so only for rows that commit
+            enqueue_enrichments(model, [
+                record_id for entry, record_id in zip(new_entries, inserted) if needs_enrichment(model, entry[2])
+            ])
+
+        updates = []
+        for index, record, row, episodes in entries:
+            if row['imdb_id'] not in existing:
+                continue
+            ids[index] = existing[row['imdb_id']]
+            # Fields missing from the record keep their stored values
+            row = {name: value for name, value in row.items() if name in record}
+            row['id'] = ids[index]
+            if model is TVShow:
+                # Without an episode list the stored episodes are kept, and
+                # so is the total_episodes that matches them
+                if episodes is None:
+                    row.pop('total_episodes', None)
+                else:
+                    row['total_episodes'] = len(episodes)
+            if row.get('created_at', True) is None:
+                row.pop('created_at')
+            updates.append(row)
+        if updates:
+            db.session.execute(update(model), updates)
+            touch(model, [row['id'] for row in updates])
+
+        # Updates without a genre keep their stored genres
+        set_genres(model, {
+            ids[index]: row['genre'] for index, record, row, _ in entries
+            if row['imdb_id'] not in existing or 'genre' in record
+        })
+
+        if model is TVShow:
+            self._write_episodes(entries, ids, existing)
+
+        return [('updated' if row['imdb_id'] in existing else 'created', ids[index], None)
+                for index, _, row, _ in entries]
+
+    def _write_one_by_one(self, model, entries):
+        results = []
+        for entry in entries:
+            try:
+                with db.session.begin_nested():
+                    results.append(self._write(model, [entry])[0])
+            except SQLAlchemyError as e:
+                results.append(('failed', None, str(getattr(e, 'orig', None) or e)))
+        db.session.commit()
+        return results
+
+    def _write_episodes(self, entries, ids, existing):
+        # Updated shows that carry an episode list have it replaced
+        replaced = [ids[index] for index, _, row, episodes in entries
+                    if row['imdb_id'] in existing and episodes is not None]
+        if replaced:
+            delete_tracked(Episode, Episode.tv_show_id.in_(replaced))
+
+        rows = []
+        # Every show written here gets a whole new episode list, so its
+        # counters are set from the rows rather than adjusted
+        counts = {}
+        for index, _, row, episodes in entries:
+            if row['imdb_id'] in existing and episodes is None:
+                continue
+            if episodes is None:
+                # Same default episode list as adding a show through the API
+                episodes = default_episodes(row['total_episodes'])
+            by_season = counts[ids[index]] = {}
+            for episode in episodes:
+                season = by_season.setdefault(episode['season'], [0, 0])
+                season[0] += 1
+                season[1] += 1 if episode['watched'] else 0
+            rows.extend(dict(episode, tv_show_id=ids[index]) for episode in episodes)
+            if len(rows) >= self.chunk_size:
+                self._insert_episodes(rows)
+                rows = []
+        if rows:
+            self._insert_episodes(rows)
+        set_counters(counts)
+
+    def _insert_episodes(self, rows):
+        db.session.execute(insert(Episode), rows)
+        self.report['episodes'] += len(rows)
+
+    def _record(self, record_type, index, record, status, record_id=None, error=None):
+        section = self.report['movies' if record_type == 'movie' else 'tv_shows']
+        if status in section:
+            section[status] += 1
+
+        if self.keep_records:
+            entry = {
+                'index': index,
+                'type': record_type,
+                'imdb_id': record.get('imdb_id') if isinstance(record, dict) else None,
+                'title': record.get('title') if isinstance(record, dict) else None,
+                'status': status,
+            }
+            if record_id is not None:
+                entry['id'] = record_id
+            if error:
+                entry['error'] = error
+            self.report['records'].append(entry)
+
+
+def normalize_movie(record):
+    row = _normalize_common(record, MOVIE_LENGTHS, MOVIE_FIELDS)
+    row['director'] = _text(record.get('director'), MOVIE_LENGTHS['director'])
+    row['watched'] = bool(record.get('watched', False))
+    return row, None
+
+
+def normalize_tv_show(record):
+    row = _normalize_common(record, TV_SHOW_LENGTHS, TV_SHOW_FIELDS)
+    row['creator'] = _text(record.get('creator'), TV_SHOW_LENGTHS['creator'])
+
+    episodes = record.get('episodes')
+    if episodes is not None:
+        if not isinstance(episodes, list):
+            raise ImportRecordError('episodes must be a list')
+        # Episode positions are unique per show; a later duplicate wins
+        by_position = {}
+        for number, episode in enumerate(episodes, 1):
+            episode = _normalize_episode(episode, number)
+            by_position[(episode['season'], episode['episode_number'])] = episode
+        episodes = list(by_position.values())
+        row['total_episodes'] = len(episodes)
+    else:
+        row['total_episodes'] = max(_int(record.get('total_episodes')) or 0, 0)
+    return row, episodes
+
+
+def default_episodes(total_episodes):
+    return [
+        {'season': 1, 'episode_number': number, 'title': f'Episode {number}', 'watched': False}
+        for number in range(1, total_episodes + 1)
+    ]
+
+
+def _normalize_common(record, lengths, fields):
+    if not isinstance(record, dict):
+        raise ImportRecordError('Record must be an object')
+
+    imdb_id = _text(record.get('imdb_id'), lengths['imdb_id']) or None
+    # The IMDb ID stands in for the title until OMDB enrichment fills it in
+    title = _text(record.get('title'), lengths['title']) or imdb_id
+    if not title:
+        raise ImportRecordError('title or imdb_id is required')
+
+    row = dict.fromkeys(fields)
+    row.update(
+        title=title,
+        year=_year(record.get('year')),
+        genre=_text(record.get('genre'), lengths['genre']),
+        poster_url=_text(record.get('poster_url'), lengths['poster_url']),
+        plot=_text(record.get('plot'), lengths['plot']),
+        imdb_id=imdb_id,
+        rating=_float(record.get('rating')),
+        notes=_text(record.get('notes'), lengths['notes']),
+        watch_later=bool(record.get('watch_later', False)),
+        created_at=_datetime(record.get('created_at')),
+    )
+    return row
+
+
+def _normalize_episode(episode, position):
+    if not isinstance(episode, dict):
+        raise ImportRecordError('Episodes must be objects')
+    return {
+        'season': _int(episode.get('season')) or 1,
+        'episode_number': _int(episode.get('episode_number')) or position,
+        'title': _text(episode.get('title'), EPISODE_LENGTHS['title']) or None,
+        'watched': bool(episode.get('watched', False)),
+    }
+
+
+def _text(value, length=None):
+    if value is None:
+        return ''
+    value = str(value).strip()
+    return value[:length] if length else value
+
+
+def _int(value):
+    if value is None or value == '' or isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _year(value):
+    # OMDB style ranges such as "2008–2013" keep their first year
+    if isinstance(value, str):
+        value = value.strip()[:4]
+    return _int(value)
+
+
+def _float(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _datetime(value):
+    if isinstance(value, str) and value:
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        # Stored naive in UTC, like datetime.utcnow()
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    return None
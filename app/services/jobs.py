@@ -0,0 +1,289 @@
+"""Background jobs queued in the database.
+
+Work that should not hold up a request, such as fetching OMDB metadata for
+a title that was just added, is queued with :func:`enqueue` as a ``Job``
+row in the same transaction as the change that needs it, so a job exists
+exactly when that change was committed. A :class:`Worker` runs a pool of
+threads that claim due jobs, call the handler registered for their kind
+and record the outcome in the same transaction as the handler's writes.
+
+Handlers raise :class:`JobFailed` for failures that retrying cannot fix.
+Any other exception is retried after an exponential backoff with jitter
+until the job has had ``max_attempts`` attempts.
+
+Claiming is a conditional UPDATE from ``queued`` to ``running``, so any
+number of threads and processes can share the table without a broker. A
+job whose worker died stays ``running`` until its lease of
+``JOB_LEASE_SECONDS`` runs out, and is then claimed again.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, insert, or_, select, update
+
+from app import db
+from app.models.models import Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATUSES = (QUEUED, RUNNING, DONE, FAILED)
+
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+RETRY_BACKOFF = float(os.getenv('JOB_RETRY_BACKOFF', 30))
+RETRY_MAX_DELAY = float(os.getenv('JOB_RETRY_MAX_DELAY', 3600))
+LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', 300))
+RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 7))
+
+# Due jobs looked at per claim; others may be taken by concurrent workers
+CLAIM_BATCH = 5
+ERROR_LENGTH = 1000
+
+
+class JobFailed(Exception):
+    """Raised by handlers for failures that retrying cannot fix"""
+
+
+def enqueue(kind, payload=None, key=None, delay=0, max_attempts=None):
+    """Queue a job in the current transaction and return it
+
+    If a job with the same ``key`` is still waiting to run, that job is
+    returned instead of queueing another. Leaves the commit to the caller.
+    """
+    if key is not None:
+        existing = Job.query.filter_by(key=key, status=QUEUED).first()
+        if existing is not None:
+            return existing
+    job = Job(
+        kind=kind,
+        key=key,
+        payload=json.dumps(payload or {}, sort_keys=True),
+        status=QUEUED,
+        attempts=0,
+        max_attempts=max_attempts or MAX_ATTEMPTS,
+        run_after=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    return job
+
+
+def enqueue_many(kind, jobs):
+    """Queue ``(key, payload)`` pairs with one INSERT; returns how many were queued
+
+    Like :func:`enqueue`, keys that are already waiting are skipped.
+    """
+    jobs = dict(jobs)
+    if not jobs:
+        return 0
+    keys = [key for key in jobs if key is not None]
+    waiting = set()
+    for start in range(0, len(keys), 500):
+        waiting.update(db.session.execute(
+            select(Job.key).where(Job.key.in_(keys[start:start + 500]), Job.status == QUEUED)
+        ).scalars())
+    now = datetime.utcnow()
+    rows = [
+        {'kind': kind, 'key': key, 'payload': json.dumps(payload or {}, sort_keys=True), 'status': QUEUED,
+         'attempts': 0, 'max_attempts': MAX_ATTEMPTS, 'run_after': now, 'created_at': now}
+        for key, payload in jobs.items() if key not in waiting
+    ]
+    if rows:
+        db.session.execute(insert(Job), rows)
+    return len(rows)
+
+
+def status_counts():
+    """Number of jobs in each status"""
+    counts = dict.fromkeys(STATUSES, 0)
+    counts.update(db.session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+    return counts
+
+
+def retry(job):
+    """Queue a failed job again with a fresh set of attempts"""
+    job.status = QUEUED
+    job.attempts = 0
+    job.run_after = datetime.utcnow()
+    job.error = None
+    job.finished_at = None
+
+
+def prune(now=None):
+    """Delete finished jobs older than ``JOB_RETENTION_DAYS``"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=RETENTION_DAYS)
+    db.session.execute(
+        Job.__table__.delete().where(Job.status.in_((DONE, FAILED)), Job.finished_at < cutoff)
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before the attempt after ``attempts`` failed ones"""
+    delay = min(RETRY_MAX_DELAY, RETRY_BACKOFF * 2 ** max(attempts - 1, 0))
+    # Jitter keeps jobs that failed together from retrying together
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def claim(worker_id):
+    """Mark the next due job as running for ``worker_id`` and return its id, or None"""
+    now = datetime.utcnow()
+    due = or_(
+        and_(Job.status == QUEUED, Job.run_after <= now),
+        and_(Job.status == RUNNING, Job.locked_at < now - timedelta(seconds=LEASE_SECONDS)),
+    )
+    # Rows locked by other workers are skipped where the database can lock
+    # rows; elsewhere the conditional UPDATE below settles races
+    candidates = db.session.execute(
+        select(Job.id).where(due).order_by(Job.run_after, Job.id).limit(CLAIM_BATCH)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    claimed = None
+    for job_id in candidates:
+        result = db.session.execute(
+            update(Job).where(Job.id == job_id, due)
+            .values(status=RUNNING, locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            claimed = job_id
+            break
+    db.session.commit()
+    return claimed
+
+
+def run_job(job_id, worker_id, handlers):
+    """Run a claimed job and record its outcome; returns the new status"""
+    job = db.session.get(Job, job_id)
+    kind, payload, attempts, max_attempts = job.kind, job.payload, job.attempts, job.max_attempts
+    try:
+        handler = handlers.get(kind)
+        if handler is None:
+            raise JobFailed(f'No handler for jobs of kind {kind!r}')
+        result = handler(json.loads(payload or '{}'))
+    except Exception as e:
+        db.session.rollback()
+        now = datetime.utcnow()
+        if isinstance(e, JobFailed) or attempts >= max_attempts:
+            values = {'status': FAILED, 'finished_at': now}
+            logger.warning('Job %s (%s) failed: %s', job_id, kind, e)
+        else:
+            values = {'status': QUEUED, 'run_after': now + timedelta(seconds=backoff(attempts))}
+            logger.info('Job %s (%s) will be retried: %s', job_id, kind, e)
+        values['error'] = f'{type(e).__name__}: {e}'[:ERROR_LENGTH]
+        status = _finish(job_id, worker_id, values)
+        db.session.commit()
+        return status
+
+    status = _finish(job_id, worker_id, {
+        'status': DONE,
+        'result': json.dumps(result) if result is not None else None,
+        'error': None,
+        'finished_at': datetime.utcnow(),
+    })
+    if status is None:
+        # Another worker took the job over, so this run's writes are dropped
+        db.session.rollback()
+        return None
+    db.session.commit()
+    return status
+
+
+def _finish(job_id, worker_id, values):
+    result = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == RUNNING, Job.locked_by == worker_id)
+        .values(locked_by=None, locked_at=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return values['status'] if result.rowcount == 1 else None
+
+
+class Worker:
+    """A pool of threads running due jobs with the given handlers
+
+    ``handlers`` maps job kinds to functions taking the job's payload and
+    returning a JSON-serializable result (or None).
+    """
+
+    def __init__(self, app, handlers, threads=2, poll_interval=POLL_INTERVAL, name=None):
+        self.app = app
+        self.handlers = handlers
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stopping.clear()
+        for number in range(self.threads):
+            thread = threading.Thread(
+                target=self._loop, args=(f'{self.name}:{number}',), name=f'job-worker-{number}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """Stop claiming jobs and wait for running ones to finish"""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_once(self, worker_id=None):
+        """Run one due job; its new status, or None if nothing was due"""
+        worker_id = worker_id or self.name
+        with self.app.app_context():
+            job_id = claim(worker_id)
+            if job_id is None:
+                return None
+            return run_job(job_id, worker_id, self.handlers) or RUNNING
+
+    def run_until_empty(self):
+        """Run due jobs in this thread until none are left; returns how many ran
+
+        Jobs scheduled for a later retry are not due and are left queued.
+        """
+        count = 0
+        while self.run_once() is not None:
+            count += 1
+        return count
+
+    def _loop(self, worker_id):
+        while not self._stopping.is_set():
+            try:
+                ran = self.run_once(worker_id)
+            except Exception:
+                logger.exception('Job worker %s failed to run a job', worker_id)
+                ran = None
+            if ran is None:
+                self._stopping.wait(self.poll_interval)
+
+
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def ensure_worker(app, handlers):
+    """Start this process's worker once, unless ``JOB_WORKER_THREADS`` is 0
+
+    Safe to call on every request; a forked child starts its own worker.
+    """
+    global _worker, _worker_pid
+    threads = app.config['JOB_WORKER_THREADS']
+    if threads <= 0 or _worker_pid == os.getpid():
+        return _worker
+    with _worker_lock:
+        if _worker_pid != os.getpid():
+            _worker = Worker(app, handlers, threads=threads).start()
+            _worker_pid = os.getpid()
+    return _worker
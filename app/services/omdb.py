@@ -0,0 +1,462 @@
+"""Shared OMDB API client.
+
+Every OMDB lookup in the app goes through ``get_client()`` so that URL
+building, API key handling and response caching live in one place. Results
+are cached per kind of lookup (``search``, ``details`` or ``season``) in an
+:class:`~app.services.omdb_cache.OmdbCache`; stale entries are served
+immediately while a background thread refreshes them.
+
+Upstream calls share one keep-alive connection pool, are bounded by
+connect/read timeouts and retried with exponential backoff. A circuit
+breaker stops calling OMDB for a while after repeated failures, and
+concurrent identical lookups are coalesced into a single request.
+
+Searches and details are answered from the local title catalog
+(:mod:`app.services.catalog`) when it knows the answer, and details OMDB
+sends are added to it.
+
+Background jobs use ``get_background_client()`` instead: the same cache,
+connections and breaker, plus a :class:`RateLimiter` so that a sweep of
+the library cannot exhaust the API quota that interactive lookups need.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+from flask import current_app
+
+from app.services.catalog import Catalog
+from app.services.omdb_cache import FRESH, STALE, OmdbCache
+from app.utils.metrics import OMDB_LOOKUPS, OMDB_SECONDS, add_time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = 'http://www.omdbapi.com/'
+
+# "Not found" style answers are worth caching so repeated misses do not
+# burn quota, but only briefly in case the title appears upstream later
+NEGATIVE_TTL = 3600
+CACHEABLE_ERRORS = ('not found', 'incorrect imdb id', 'too many results')
+
+
+class OmdbError(Exception):
+    """Raised when OMDB cannot be reached or returns an unusable response"""
+
+
+class OmdbUnavailable(OmdbError):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Open after ``failure_threshold`` consecutive failures
+
+    While open every call is rejected. After ``reset_timeout`` seconds a
+    single trial call is let through (half-open); its outcome closes the
+    breaker again or re-opens it for another ``reset_timeout``.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers share its result"""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` calls per second in bursts of up to ``burst``
+
+    Shared by all threads of a process; a rate of 0 or less disables it.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def build_session(pool_size=10, max_retries=2, backoff_factor=0.3, adapter_class=None):
+    """Keep-alive session that retries connection errors and 429/5xx answers
+
+    ``adapter_class`` replaces requests' ``HTTPAdapter`` for both schemes.
+    """
+    # requests is the slowest import on the startup path, so it is only
+    # loaded once a session is needed
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False
+    )
+    adapter = (adapter_class or HTTPAdapter)(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class OmdbClient:
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, cache=None, session=None,
+                 timeout=(3.05, 10.0), breaker=None, limiter=None, session_options=None, catalog=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.cache = cache
+        self.catalog = catalog
+        self._session = session
+        self.session_options = session_options or {}
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter
+        self.flight = SingleFlight()
+        self._revalidating = set()
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    @property
+    def session(self):
+        """The HTTP session, built with ``session_options`` on first use"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = build_session(**self.session_options)
+        return self._session
+
+    def search(self, query, media_type=''):
+        """Search titles by name, optionally restricted to movie/series/episode"""
+        local = self.catalog.search(query, media_type) if self.catalog else None
+        if local is not None and self.catalog.covers(local):
+            OMDB_LOOKUPS.inc('search', 'catalog')
+            return local
+
+        params = {'s': query.strip()}
+        if media_type:
+            params['type'] = media_type
+        try:
+            results = self._get('search', params)
+        except OmdbError:
+            # A few local matches beat an error
+            if local is None:
+                raise
+            OMDB_LOOKUPS.inc('search', 'catalog')
+            return local
+        return self.catalog.merge(results, local) if self.catalog else results
+
+    def details(self, imdb_id):
+        """Full details (including the long plot) for one IMDb ID"""
+        imdb_id = imdb_id.strip()
+        local = self.catalog.details(imdb_id) if self.catalog else None
+        if local is not None and (local.complete or not self.configured):
+            OMDB_LOOKUPS.inc('details', 'catalog')
+            return local.payload
+
+        try:
+            payload = self._get('details', {'i': imdb_id, 'plot': 'full'})
+        except OmdbError:
+            # Titles known only from the dumps, or from an old response,
+            # are still better than an error
+            if local is None:
+                raise
+            OMDB_LOOKUPS.inc('details', 'catalog')
+            return local.payload
+        if self.catalog is not None and payload.get('Response') == 'True':
+            self.catalog.remember(payload)
+        return payload
+
+    def season(self, imdb_id, season):
+        """Episode list of one season of a series"""
+        return self._get('season', {'i': imdb_id.strip(), 'Season': str(season)})
+
+    def max_age(self, kind):
+        """Seconds a response of this kind is served without refetching, for Cache-Control"""
+        return self.cache.ttls[kind] if self.cache else 0
+
+    def stats(self):
+        stats = self.cache.stats() if self.cache else {}
+        stats['coalesced'] = self.flight.coalesced
+        stats['circuit'] = self.breaker.state
+        return stats
+
+    def _get(self, kind, params):
+        key = cache_key(kind, params)
+        if self.cache is None:
+            return self.flight.do(key, lambda: self._fetch(params))
+
+        cached, state = self.cache.lookup(key)
+        OMDB_LOOKUPS.inc(kind, state or 'miss')
+        if state == FRESH:
+            return cached.payload
+        if state == STALE:
+            self._revalidate_in_background(kind, params, key)
+            return cached.payload
+
+        return self.flight.do(key, lambda: self._fetch_and_store(key, kind, params))
+
+    def _fetch_and_store(self, key, kind, params):
+        payload = self._fetch(params)
+        self._store(key, kind, payload)
+        return payload
+
+    def _fetch(self, params):
+        import requests
+
+        if self.limiter is not None:
+            self.limiter.acquire()
+        if not self.breaker.allow():
+            raise OmdbUnavailable('OMDB is temporarily unavailable')
+
+        started = time.perf_counter()
+        client_error = False
+        try:
+            response = self.session.get(
+                self.base_url,
+                params={'apikey': self.api_key, **params},
+                timeout=self.timeout
+            )
+            # OMDB answers a bad API key or request with a 4xx and its usual
+            # error body, which is passed on like any other "Response": "False"
+            client_error = 400 <= response.status_code < 500 and response.status_code != 429
+            if not client_error:
+                response.raise_for_status()
+            payload = response.json()
+            if client_error and not (isinstance(payload, dict) and payload.get('Response') == 'False'):
+                raise ValueError(f'OMDB answered HTTP {response.status_code}')
+        except (requests.RequestException, ValueError) as e:
+            # Client errors say nothing about OMDB's health; only transport
+            # errors, 5xx and 429 answers count against the breaker
+            if client_error:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            self._observe(started, 'error')
+            raise OmdbError(str(e)) from e
+
+        self.breaker.record_success()
+        self._observe(started, 'ok')
+        return payload
+
+    def _observe(self, started, outcome):
+        elapsed = time.perf_counter() - started
+        OMDB_SECONDS.observe(elapsed, outcome)
+        add_time('omdb', elapsed)
+
+    def _store(self, key, kind, payload):
+        if payload.get('Response') == 'True':
+            self.cache.store(key, kind, payload)
+            return
+
+        error = str(payload.get('Error', '')).lower()
+        if any(marker in error for marker in CACHEABLE_ERRORS):
+            self.cache.store(key, kind, payload, ttl=min(NEGATIVE_TTL, self.cache.ttls[kind]))
+
+    def _revalidate_in_background(self, kind, params, key):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        app = current_app._get_current_object()
+
+        def revalidate():
+            try:
+                with app.app_context():
+                    self.flight.do(key, lambda: self._fetch_and_store(key, kind, params))
+            except OmdbError as e:
+                # Keep serving the stale copy until a later attempt succeeds
+                logger.warning('Revalidating %s failed: %s', key, e)
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        threading.Thread(target=revalidate, name=f'omdb-revalidate-{kind}', daemon=True).start()
+
+
+def cache_key(kind, params):
+    """Stable key for a lookup; case-insensitive and bounded in length"""
+    normalized = urlencode(sorted((name, str(value).strip().lower()) for name, value in params.items()))
+    key = f'{kind}:{normalized}'
+    if len(key) > 255:
+        key = f'{kind}:sha256:{hashlib.sha256(normalized.encode("utf-8")).hexdigest()}'
+    return key
+
+
+_client = None
+_background_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide client, building it from the environment on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                cache = OmdbCache(
+                    ttls={
+                        'search': int(os.getenv('OMDB_SEARCH_TTL', 24 * 3600)),
+                        'details': int(os.getenv('OMDB_DETAILS_TTL', 7 * 24 * 3600)),
+                        'season': int(os.getenv('OMDB_SEASON_TTL', 24 * 3600)),
+                    },
+                    stale_ttl=int(os.getenv('OMDB_STALE_TTL', 7 * 24 * 3600)),
+                    memory_size=int(os.getenv('OMDB_CACHE_MEMORY_SIZE', 512)),
+                    max_rows=int(os.getenv('OMDB_CACHE_MAX_ROWS', 50000)),
+                )
+                session_options = {
+                    'pool_size': int(os.getenv('OMDB_POOL_SIZE', 10)),
+                    'max_retries': int(os.getenv('OMDB_MAX_RETRIES', 2)),
+                    'backoff_factor': float(os.getenv('OMDB_RETRY_BACKOFF', 0.3)),
+                }
+                breaker = CircuitBreaker(
+                    failure_threshold=int(os.getenv('OMDB_BREAKER_THRESHOLD', 5)),
+                    reset_timeout=float(os.getenv('OMDB_BREAKER_RESET', 30)),
+                )
+                _client = OmdbClient(
+                    api_key=os.getenv('OMDB_API_KEY', ''),
+                    base_url=os.getenv('OMDB_BASE_URL', DEFAULT_BASE_URL),
+                    cache=cache,
+                    session_options=session_options,
+                    timeout=(
+                        float(os.getenv('OMDB_CONNECT_TIMEOUT', 3.05)),
+                        float(os.getenv('OMDB_READ_TIMEOUT', 10)),
+                    ),
+                    breaker=breaker,
+                    catalog=get_catalog(),
+                )
+    return _client
+
+
+def get_catalog():
+    """The local catalog configured by the environment, or None if it is disabled"""
+    if os.getenv('CATALOG_ENABLED', '1') == '0':
+        return None
+    return Catalog(max_age=int(os.getenv('CATALOG_DETAILS_MAX_AGE', 30 * 24 * 3600)))
+
+
+def get_background_client():
+    """Return the rate-limited client for background jobs
+
+    It shares the cache, connection pool and circuit breaker of
+    ``get_client()``, so lookups made by either one are seen by both.
+    """
+    global _background_client
+    if _background_client is None:
+        client = get_client()
+        with _client_lock:
+            if _background_client is None:
+                _background_client = OmdbClient(
+                    api_key=client.api_key,
+                    base_url=client.base_url,
+                    cache=client.cache,
+                    session=client.session,
+                    timeout=client.timeout,
+                    breaker=client.breaker,
+                    catalog=client.catalog,
+                    limiter=RateLimiter(
+                        rate=float(os.getenv('OMDB_RATE_LIMIT', 5)),
+                        burst=int(os.getenv('OMDB_RATE_BURST', 5)),
+                    ),
+                )
+    return _background_client
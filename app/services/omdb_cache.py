@@ -0,0 +1,211 @@
+"""Two-tier cache for OMDB responses.
+
+Lookups go to a small in-process LRU first and then to the ``omdb_cache``
+table, which all gunicorn workers share. Each entry carries its own expiry
+(set from the per-kind TTL when it is stored); once expired it may still be
+served for ``stale_ttl`` seconds while the caller refreshes it in the
+background. The table is kept under ``max_rows`` by periodically evicting
+expired rows and then the least recently used ones.
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models.models import OmdbCacheEntry
+
+logger = logging.getLogger(__name__)
+
+CachedResponse = namedtuple('CachedResponse', ['payload', 'fetched_at', 'expires_at'])
+
+FRESH = 'fresh'
+STALE = 'stale'
+
+# Shared rows only get their LRU timestamp refreshed this often, so cache
+# hits do not turn into a database write on every request
+TOUCH_INTERVAL = timedelta(hours=1)
+
+# Run table eviction once every this many stores
+EVICT_EVERY = 100
+
+
+class LRUCache:
+    """Thread-safe, size-bounded mapping that drops the least recently used key"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class OmdbCache:
+    """In-process LRU in front of the shared ``omdb_cache`` table"""
+
+    def __init__(self, ttls, stale_ttl, memory_size=512, max_rows=50000):
+        self.ttls = ttls
+        self.stale_ttl = timedelta(seconds=stale_ttl)
+        self.max_rows = max_rows
+        self.memory = LRUCache(memory_size)
+        self.table = OmdbCacheEntry.__table__
+        self._stores = 0
+        self._counters = dict.fromkeys(
+            ('memory_hits', 'db_hits', 'stale_hits', 'misses', 'stores', 'evictions', 'errors'), 0)
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        """Return ``(CachedResponse, FRESH | STALE)`` or ``(None, None)``"""
+        now = datetime.utcnow()
+
+        entry = self.memory.get(key)
+        if entry is not None:
+            state = self._state(entry, now)
+            if state is not None:
+                self._count('stale_hits' if state == STALE else 'memory_hits')
+                return entry, state
+            self.memory.delete(key)
+
+        entry = self._load(key, now)
+        if entry is not None:
+            state = self._state(entry, now)
+            if state is not None:
+                self.memory.set(key, entry)
+                self._count('stale_hits' if state == STALE else 'db_hits')
+                return entry, state
+
+        self._count('misses')
+        return None, None
+
+    def store(self, key, kind, payload, ttl=None):
+        """Save a response in both tiers, by default with the TTL for its kind"""
+        now = datetime.utcnow()
+        ttl = self.ttls[kind] if ttl is None else ttl
+        entry = CachedResponse(payload, now, now + timedelta(seconds=ttl))
+        self.memory.set(key, entry)
+        self._count('stores')
+
+        try:
+            with db.engine.begin() as connection:
+                # Portable upsert: both statements share one transaction
+                connection.execute(delete(self.table).where(self.table.c.key == key))
+                connection.execute(self.table.insert().values(
+                    key=key,
+                    kind=kind,
+                    payload=json.dumps(payload),
+                    fetched_at=entry.fetched_at,
+                    expires_at=entry.expires_at,
+                    accessed_at=now
+                ))
+        except SQLAlchemyError:
+            # The shared tier is best effort; the response is still served
+            self._count('errors')
+            logger.exception('Could not persist OMDB cache entry %s', key)
+            return entry
+
+        with self._lock:
+            self._stores += 1
+            run_eviction = self._stores % EVICT_EVERY == 1
+        if run_eviction:
+            self.evict()
+
+        return entry
+
+    def evict(self):
+        """Drop rows past their stale window, then trim to ``max_rows``"""
+        cutoff = datetime.utcnow() - self.stale_ttl
+        try:
+            with db.engine.begin() as connection:
+                removed = connection.execute(
+                    delete(self.table).where(self.table.c.expires_at < cutoff)
+                ).rowcount
+
+                excess = connection.execute(select(func.count()).select_from(self.table)).scalar() - self.max_rows
+                if excess > 0:
+                    oldest = select(self.table.c.key).order_by(self.table.c.accessed_at).limit(excess)
+                    removed += connection.execute(
+                        delete(self.table).where(self.table.c.key.in_(oldest.scalar_subquery()))
+                    ).rowcount
+        except SQLAlchemyError:
+            self._count('errors')
+            logger.exception('OMDB cache eviction failed')
+            return 0
+
+        self._count('evictions', max(removed, 0))
+        return removed
+
+    def clear(self):
+        self.memory.clear()
+        with db.engine.begin() as connection:
+            connection.execute(delete(self.table))
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters['memory_hits'] + counters['db_hits'] + counters['stale_hits'] + counters['misses']
+        hits = lookups - counters['misses']
+        counters['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+        counters['memory_entries'] = len(self.memory)
+        return counters
+
+    def _load(self, key, now):
+        try:
+            with db.engine.connect() as connection:
+                row = connection.execute(
+                    select(self.table.c.payload, self.table.c.fetched_at,
+                           self.table.c.expires_at, self.table.c.accessed_at)
+                    .where(self.table.c.key == key)
+                ).first()
+                if row is None:
+                    return None
+
+                if now - row.accessed_at > TOUCH_INTERVAL:
+                    connection.execute(
+                        update(self.table).where(self.table.c.key == key).values(accessed_at=now)
+                    )
+                    connection.commit()
+        except SQLAlchemyError:
+            self._count('errors')
+            logger.exception('Could not read OMDB cache entry %s', key)
+            return None
+
+        return CachedResponse(json.loads(row.payload), row.fetched_at, row.expires_at)
+
+    def _state(self, entry, now):
+        if now < entry.expires_at:
+            return FRESH
+        if now < entry.expires_at + self.stale_ttl:
+            return STALE
+        return None
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
@@ -0,0 +1,540 @@
+"""Poster images served from a local, size-bounded disk cache.
+
+``/api/posters/<imdb_id>`` looks up the poster URL of a title (stored on
+the title, or from OMDB for titles outside the library), downloads the
+image once and stores it under the SHA-256 of its bytes, so a poster that
+is reached through several URLs is kept once. Resized variants at the
+widths in ``WIDTHS`` are made from the original on first request, as WebP
+for browsers that accept it and JPEG otherwise, and stored next to it
+under the same digest. Without Pillow the original is served at every
+width.
+
+The ``poster_source`` table maps each source URL to the digest of its
+image, so all worker processes share the downloads. Files are evicted
+least recently used first once the cache grows past ``POSTER_CACHE_MAX_MB``;
+a file's modification time records its last use, refreshed at most hourly.
+
+Stored poster URLs are user input, so only http(s) URLs on public
+addresses are fetched unless ``POSTER_ALLOWED_HOSTS`` lists the hosts to
+fetch from. Connections go to the address that was checked, so a host
+cannot pass the check and then resolve to a private address when the
+download connects (DNS rebinding). Titles without a usable poster get a placeholder SVG that is
+generated here.
+"""
+import functools
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from urllib.parse import urljoin, urlsplit
+from xml.sax.saxutils import escape
+
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models.models import Movie, PosterSource, TVShow
+from app.services.omdb import OmdbError, SingleFlight, build_session, get_client
+
+logger = logging.getLogger(__name__)
+
+# Widths variants are made at: grid cards at 1x, at 2x and detail views
+WIDTHS = (180, 360, 720)
+DEFAULT_WIDTH = 180
+
+JPEG = 'jpeg'
+WEBP = 'webp'
+MEDIA_TYPES = {'jpeg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp'}
+EXTENSIONS = {'jpeg': 'jpg', 'png': 'png', 'gif': 'gif', 'webp': 'webp'}
+
+SAVE_OPTIONS = {
+    JPEG: {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+    WEBP: {'format': 'WEBP', 'quality': 80, 'method': 4},
+}
+
+# URLs without a usable image are tried again after this long
+MISS_TTL = timedelta(days=1)
+# A file's modification time is only refreshed this often, in seconds
+TOUCH_INTERVAL = 3600
+# Eviction trims the cache to this fraction of its budget
+LOW_WATER = 0.9
+MAX_REDIRECTS = 3
+# Larger images are not decoded at all
+MAX_PIXELS = 40_000_000
+
+Poster = namedtuple('Poster', ['path', 'mimetype', 'etag', 'fetched_at'])
+
+
+class PosterUnavailable(Exception):
+    """Raised when a poster cannot be fetched right now but may be later"""
+
+
+class PosterError(ValueError):
+    """Raised for malformed poster request parameters"""
+
+
+@functools.lru_cache(maxsize=None)
+def resize_formats():
+    """Formats variants can be written in, best first; empty without Pillow"""
+    # Pillow is imported on first use, which keeps it off the startup path
+    try:
+        from PIL import features
+    except ImportError:
+        return ()
+    return (WEBP, JPEG) if features.check('webp') else (JPEG,)
+
+
+def sniff(data):
+    """Image format of ``data`` from its first bytes, or None if it is not an image"""
+    if data.startswith(b'\xff\xd8\xff'):
+        return JPEG
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return WEBP
+    return None
+
+
+class PosterCache:
+    """Downloads each poster once and serves resized variants from ``directory``"""
+
+    def __init__(self, directory, max_bytes, session=None, timeout=(3.05, 10.0), max_download=5 * 1024 * 1024,
+                 allowed_hosts=()):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        if session is None:
+            session = build_session(max_retries=1, adapter_class=None if allowed_hosts else public_adapter())
+        self.session = session
+        self.timeout = timeout
+        self.max_download = max_download
+        self.allowed_hosts = tuple(allowed_hosts)
+        self.flight = SingleFlight()
+        self.table = PosterSource.__table__
+        self._size = None
+        self._lock = threading.Lock()
+        self._evicting = threading.Lock()
+
+    def poster(self, url, width=None, fmt=None):
+        """The cached image for ``url`` at ``width`` in ``fmt``, or None if it has none
+
+        Without a width or a format Pillow can write, the original is
+        returned. Raises :class:`PosterUnavailable` for failures that may
+        go away.
+        """
+        original = self.original(url)
+        if original is None:
+            return None
+        digest, kind, fetched_at = original
+        path = self._path(digest, kind)
+        if width is not None and fmt in resize_formats():
+            variant = self._path(f'{digest}-{width}', fmt)
+            if os.path.exists(variant):
+                self._touch(variant)
+                return Poster(variant, MEDIA_TYPES[fmt], f'{digest}-{width}.{fmt}', fetched_at)
+            if self.flight.do(variant, lambda: self._resize(path, variant, width, fmt)):
+                return Poster(variant, MEDIA_TYPES[fmt], f'{digest}-{width}.{fmt}', fetched_at)
+        # Images Pillow cannot read are passed on as they are
+        self._touch(path)
+        return Poster(path, MEDIA_TYPES[kind], digest, fetched_at)
+
+    def original(self, url):
+        """``(digest, format, fetched_at)`` of the image downloaded from ``url``, or None"""
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        row = self._load(key)
+        if row is not None:
+            if row.digest is None:
+                if datetime.utcnow() - row.fetched_at < MISS_TTL:
+                    return None
+            elif os.path.exists(self._path(row.digest, row.format)):
+                return row.digest, row.format, row.fetched_at
+        # Evicted, never fetched or due for another try
+        return self.flight.do(key, lambda: self._fetch(key, url))
+
+    def evict(self):
+        """Delete least recently used files until the cache is within its budget
+
+        Returns how many files were deleted. Concurrent calls in one process
+        leave the work to the first.
+        """
+        if not self._evicting.acquire(blocking=False):
+            return 0
+        try:
+            files = sorted(self._files())
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for _, size, path in files:
+                if total <= self.max_bytes * LOW_WATER:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            with self._lock:
+                self._size = total
+            return removed
+        finally:
+            self._evicting.release()
+
+    def size(self):
+        """Bytes on disk, as last counted plus what this process wrote since"""
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._files())
+            return self._size
+
+    def _fetch(self, key, url):
+        # Not recorded as a miss, so that a changed allow list applies at once
+        if not self._allowed(url):
+            logger.warning('Not fetching poster from %s', url)
+            return None
+        data = self._download(url)
+        kind = sniff(data) if data else None
+        digest = None
+        if kind is not None:
+            digest = hashlib.sha256(data).hexdigest()
+            path = self._path(digest, kind)
+            if not os.path.exists(path):
+                self._write(path, data)
+        now = datetime.utcnow()
+        self._save(key, digest, kind, now)
+        return (digest, kind, now) if digest else None
+
+    def _download(self, url):
+        """The image bytes at ``url``; None for a permanent miss"""
+        import requests
+
+        for redirects in range(MAX_REDIRECTS + 1):
+            if redirects and not self._allowed(url):
+                logger.warning('Not following poster redirect to %s', url)
+                return None
+            try:
+                response = self.session.get(url, timeout=self.timeout, stream=True, allow_redirects=False)
+            except requests.RequestException as e:
+                raise PosterUnavailable(str(e)) from e
+            with response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers['Location'])
+                    continue
+                if response.status_code in (408, 429) or response.status_code >= 500:
+                    raise PosterUnavailable(f'{url} answered with HTTP {response.status_code}')
+                if response.status_code != 200:
+                    return None
+                if int(response.headers.get('Content-Length') or 0) > self.max_download:
+                    return None
+                data = bytearray()
+                try:
+                    for chunk in response.iter_content(64 * 1024):
+                        data += chunk
+                        if len(data) > self.max_download:
+                            return None
+                except requests.RequestException as e:
+                    raise PosterUnavailable(str(e)) from e
+                return bytes(data)
+        return None
+
+    def _allowed(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            return False
+        host = parts.hostname.lower()
+        if self.allowed_hosts:
+            return any(host == allowed or host.endswith('.' + allowed) for allowed in self.allowed_hosts)
+        try:
+            return bool(public_addresses(host, parts.port))
+        except (socket.gaierror, UnicodeError) as e:
+            raise PosterUnavailable(f'Cannot resolve {host}: {e}') from e
+
+    def _resize(self, source, target, width, fmt):
+        from PIL import Image
+
+        try:
+            with Image.open(source) as image:
+                if image.width * image.height > MAX_PIXELS:
+                    return False
+                # JPEGs are decoded straight at a fraction of their size
+                image.draft('RGB', (width, max(1, image.height * width // image.width)))
+                image = _flatten(image)
+                if image.width > width:
+                    image = image.resize((width, max(1, round(image.height * width / image.width))),
+                                         getattr(Image, 'Resampling', Image).LANCZOS)
+                buffer = io.BytesIO()
+                image.save(buffer, **SAVE_OPTIONS[fmt])
+        except FileNotFoundError as e:
+            raise PosterUnavailable('Poster was evicted while it was being resized') from e
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            logger.warning('Cannot resize poster %s: %s', source, e)
+            return False
+        self._write(target, buffer.getvalue())
+        return True
+
+    def _write(self, path, data):
+        # Readers never see a partly written file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp, 'wb') as out:
+            out.write(data)
+        os.replace(temp, path)
+
+        size = self.size()
+        with self._lock:
+            self._size = size + len(data)
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _touch(self, path):
+        try:
+            if time.time() - os.stat(path).st_mtime > TOUCH_INTERVAL:
+                os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _files(self):
+        """``(mtime, size, path)`` of every cached file"""
+        if not os.path.isdir(self.directory):
+            return
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, entry.path
+
+    def _path(self, name, fmt):
+        return os.path.join(self.directory, name[:2], f'{name}.{EXTENSIONS[fmt]}')
+
+    def _load(self, key):
+        try:
+            with db.engine.connect() as connection:
+                return connection.execute(
+                    select(self.table.c.digest, self.table.c.format, self.table.c.fetched_at)
+                    .where(self.table.c.url_hash == key)
+                ).first()
+        except SQLAlchemyError:
+            logger.exception('Could not read poster source %s', key)
+            return None
+
+    def _save(self, key, digest, kind, now):
+        try:
+            with db.engine.begin() as connection:
+                # Portable upsert: both statements share one transaction
+                connection.execute(delete(self.table).where(self.table.c.url_hash == key))
+                connection.execute(self.table.insert().values(
+                    url_hash=key, digest=digest, format=kind, fetched_at=now
+                ))
+        except SQLAlchemyError:
+            # The file is on disk either way; the next miss finds it by digest
+            logger.exception('Could not save poster source %s', key)
+
+
+def public_addresses(host, port=None):
+    """Addresses of ``host``, or an empty list unless all of them are public"""
+    addresses = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    if all(ipaddress.ip_address(address.split('%')[0]).is_global for address in addresses):
+        return addresses
+    return []
+
+
+@functools.lru_cache(maxsize=None)
+def public_adapter():
+    """requests adapter class that only opens connections to public addresses
+
+    Each new connection resolves the host once, checks the addresses and
+    connects to the first of them; the Host header and the TLS server name
+    still carry the host name. Built on first use, since it needs requests.
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    from urllib3.exceptions import NewConnectionError
+
+    class PublicOnly:
+        def _new_conn(self):
+            # urllib3 resolves _dns_host to connect; pin it to the checked address
+            host = self._dns_host
+            try:
+                addresses = public_addresses(host, self.port)
+            except (socket.gaierror, UnicodeError) as e:
+                raise NewConnectionError(self, f'Cannot resolve {host}: {e}')
+            if not addresses:
+                raise NewConnectionError(self, f'{host} does not resolve to public addresses only')
+            self._dns_host = addresses[0]
+            try:
+                return super()._new_conn()
+            finally:
+                self._dns_host = host
+
+    class PublicHTTPConnection(PublicOnly, HTTPConnection):
+        pass
+
+    class PublicHTTPSConnection(PublicOnly, HTTPSConnection):
+        pass
+
+    class PublicHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = PublicHTTPConnection
+
+    class PublicHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = PublicHTTPSConnection
+
+    class PublicAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': PublicHTTPConnectionPool,
+                'https': PublicHTTPSConnectionPool,
+            }
+
+    return PublicAdapter
+
+
+def _flatten(image):
+    # Transparent areas become white, since JPEG has no alpha channel
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        from PIL import Image
+
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def parse_width(args):
+    """The variant width for a ``w`` argument: the smallest of ``WIDTHS`` that is at least as wide"""
+    try:
+        width = int(args.get('w', DEFAULT_WIDTH))
+    except ValueError:
+        raise PosterError('w must be an integer')
+    if width < 1:
+        raise PosterError('w must be at least 1')
+    return next((size for size in WIDTHS if size >= width), WIDTHS[-1])
+
+
+def choose_format(accept):
+    """Variant format for a request's ``Accept`` header: WebP if it is listed, else JPEG"""
+    # Some browsers send image/* without being able to decode WebP
+    if WEBP in resize_formats() and any(value == 'image/webp' for value in accept.values()):
+        return WEBP
+    return JPEG
+
+
+def poster_source(imdb_id):
+    """``(poster URL, title)`` for an IMDb ID, from the library or else OMDB
+
+    The URL is None when there is no poster to fetch.
+    """
+    for model in (Movie, TVShow):
+        row = db.session.execute(
+            select(model.poster_url, model.title).where(model.imdb_id == imdb_id)
+        ).first()
+        if row is not None:
+            return _usable(row.poster_url), row.title or ''
+
+    client = get_client()
+    if not client.configured:
+        return None, ''
+    try:
+        data = client.details(imdb_id)
+    except OmdbError as e:
+        raise PosterUnavailable(str(e)) from e
+    if data.get('Response') != 'True':
+        return None, ''
+    return _usable(data.get('Poster')), data.get('Title', '')
+
+
+def _usable(url):
+    return url if url and url != 'N/A' else None
+
+
+def placeholder_svg(title='', width=DEFAULT_WIDTH):
+    """A 2:3 placeholder poster showing the title"""
+    height = width * 3 // 2
+    lines = _wrap(title, 18)[:3] or ['']
+    size = max(10, width // 12)
+    top = height // 2 - (len(lines) - 1) * size * 0.65
+    text = ''.join(
+        f'<tspan x="50%" y="{top + number * size * 1.3:.0f}">{escape(line)}</tspan>'
+        for number, line in enumerate(lines)
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}">'
+        '<defs><linearGradient id="g" x1="0" y1="0" x2="1" y2="1">'
+        '<stop offset="0" stop-color="#302b63"/><stop offset="1" stop-color="#24243e"/></linearGradient></defs>'
+        f'<rect width="{width}" height="{height}" fill="url(#g)"/>'
+        f'<text fill="#a0a0a0" font-family="sans-serif" font-size="{size}" text-anchor="middle">{text}</text>'
+        f'<text x="50%" y="{height - size}" fill="#6c6c8a" font-family="sans-serif" font-size="{size * 3 // 4}" '
+        'text-anchor="middle">No Poster</text>'
+        '</svg>'
+    )
+
+
+def _wrap(text, columns):
+    lines = []
+    for word in (text or '').split():
+        if lines and len(lines[-1]) + 1 + len(word) <= columns:
+            lines[-1] += ' ' + word
+        else:
+            lines.append(word[:columns])
+    return lines
+
+
+def prefetch_poster(payload):
+    """Handler of ``poster`` jobs: download a title's poster and make its grid variants"""
+    url, _ = poster_source(payload['imdb_id'])
+    if url is None:
+        return {'poster': False}
+    cache = get_cache()
+    for fmt in resize_formats() or (None,):
+        for width in (DEFAULT_WIDTH, DEFAULT_WIDTH * 2):
+            if cache.poster(url, width, fmt) is None:
+                return {'poster': False}
+    return {'poster': True}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide poster cache, configured from the environment on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                allowed_hosts = [
+                    host.strip().lower() for host in os.getenv('POSTER_ALLOWED_HOSTS', '').split(',') if host.strip()
+                ]
+                _cache = PosterCache(
+                    directory=os.getenv('POSTER_CACHE_DIR') or os.path.join(current_app.instance_path, 'posters'),
+                    max_bytes=int(float(os.getenv('POSTER_CACHE_MAX_MB', 500)) * 1024 * 1024),
+                    session=build_session(
+                        pool_size=int(os.getenv('POSTER_POOL_SIZE', 10)),
+                        max_retries=1,
+                        # Listed hosts are trusted wherever they resolve to
+                        adapter_class=None if allowed_hosts else public_adapter(),
+                    ),
+                    timeout=(
+                        float(os.getenv('POSTER_CONNECT_TIMEOUT', 3.05)),
+                        float(os.getenv('POSTER_READ_TIMEOUT', 10)),
+                    ),
+                    max_download=int(float(os.getenv('POSTER_MAX_DOWNLOAD_MB', 5)) * 1024 * 1024),
+                    allowed_hosts=allowed_hosts,
+                )
+    return _cache
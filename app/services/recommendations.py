@@ -0,0 +1,543 @@
+"""Similar titles and recommendations from a feature matrix of the collection.
+
+Every movie and show is a sparse row of features: its genres, the people
+who made it (director or creator), its decade and the words of its plot.
+Features are weighted by TF-IDF, each group of features is scaled to its
+weight in ``GROUP_WEIGHTS`` and rows are L2-normalised, so the cosine
+similarity of two titles is the dot product of their rows.
+
+:func:`rebuild_index` writes the matrix as NumPy arrays into a new
+directory under ``RECOMMENDATIONS_DIR`` (default:
+instance/recommendations) and then points ``CURRENT`` at it. Rows are
+stored twice: by title (CSR), to read a title's features, and by feature
+(CSC), so a query only adds up the postings of its own features, with one
+``bincount``, instead of touching every title. Processes open the arrays
+memory-mapped, so all workers share one copy in the page cache, and pick
+up a new build on their next query.
+
+Writes do not wait for a rebuild. When the collection versions change,
+each process reads the titles updated since its build began and scores
+them from a small in-memory delta that shadows their old rows; deleted
+titles drop out when results are loaded. Once the delta reaches
+``RECOMMENDATIONS_REBUILD_DELTA`` titles a ``recommendations`` job
+rebuilds the index. Words that are new since the build only count after
+the next one.
+
+NumPy is imported on first use; without it queries raise
+:class:`RecommendationsUnavailable`.
+"""
+import functools
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.models.models import Movie, TVShow
+from app.services.genres import split_genres
+from app.services.jobs import enqueue
+from app.services.sync import SETTLE_SECONDS
+from app.services.versions import collection_versions
+
+RECOMMENDATIONS = 'recommendations'
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Titles changed since the last build before a rebuild is queued
+REBUILD_DELTA = int(os.getenv('RECOMMENDATIONS_REBUILD_DELTA', 1000))
+BUILD_BATCH = 2000
+
+# Strongest features of a taste profile that are scored
+PROFILE_FEATURES = 300
+
+# Models in the index, by type code; a row's key is type code << 32 | id
+MODELS = (Movie, TVShow)
+TYPE_NAMES = ('movie', 'tv')
+TYPE_CODES = {'movie': 0, 'tv': 1, 'all': None}
+PEOPLE = {Movie: 'director', TVShow: 'creator'}
+ID_BITS = 32
+
+# Feature groups by token prefix, and how much of a row each one makes up
+GROUPS = ('g', 'p', 'd', 'w')
+GROUP_WEIGHTS = {'g': 1.0, 'p': 0.6, 'd': 0.3, 'w': 1.0}
+
+MIN_WORD_LENGTH = 3
+STOPWORDS = frozenset('''
+    about after again against all also and any are around back because been before being between both but
+    can come could did does doing down during each even ever every few find finds for from get gets had has
+    have her here hers him his how into its just later life lives made make makes man many more most much
+    must new now off once one only other our out over own same she should since some still such take takes
+    than that the their them then there these they this those through time together too two under until
+    very was way were what when where which while who whom whose why will with woman world would year years
+    yet you young your
+'''.split())
+
+CURRENT = 'CURRENT'
+ARRAYS = ('keys', 'stamps', 'indptr', 'indices', 'data', 'postings_ptr', 'postings_rows', 'postings_data', 'idf',
+          'groups')
+
+_WORD = re.compile(r'\w+')
+
+
+class RecommendationError(ValueError):
+    """Raised for malformed recommendation parameters"""
+
+
+class RecommendationsUnavailable(RuntimeError):
+    """Raised when recommendations cannot be computed in this process"""
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    # NumPy is imported on first use, which keeps it off the startup path
+    try:
+        import numpy
+    except ImportError:
+        raise RecommendationsUnavailable('Recommendations need NumPy (pip install numpy)') from None
+    return numpy
+
+
+def parse_recommendation_args(args, default_type='all'):
+    """``(limit, type code or None for both)`` from query arguments"""
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise RecommendationError('limit must be an integer')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise RecommendationError(f'limit must be between 1 and {MAX_LIMIT}')
+    media_type = args.get('type') or default_type
+    if media_type not in TYPE_CODES:
+        raise RecommendationError('type must be movie, tv or all')
+    return limit, TYPE_CODES[media_type]
+
+
+def similar_titles(model, title_id, limit=DEFAULT_LIMIT, type_code=None, versions=None):
+    """Titles most similar to one title, best first, as dicts with a ``score``
+
+    None if the title is not in the index.
+    """
+    state = current_state(versions)
+    key = _key(MODELS.index(model), title_id)
+    vector = state.vector(key)
+    if vector is None:
+        return None
+    columns, weights = vector
+    return _load(state.rank(columns, weights, limit, [key], type_code), limit)
+
+
+def recommend(limit=DEFAULT_LIMIT, type_code=None, versions=None):
+    """Unwatched titles ranked by similarity to the watched ones
+
+    Watched titles (shows with any episode watched) make up a taste
+    profile, weighted by their rating, and are left out of the results.
+    """
+    state = current_state(versions)
+    if not state.watched:
+        return []
+    # The same for every request until the collection changes
+    items = state.recommendations.get((limit, type_code))
+    if items is None:
+        columns, weights = state.profile(state.watched)
+        items = _load(state.rank(columns, weights, limit, list(state.watched), type_code), limit)
+        state.recommendations[(limit, type_code)] = items
+    return items
+
+
+def index_build(versions=None):
+    """Name of the build queries are answered from, for ETags"""
+    return current_state(versions).name
+
+
+def enqueue_rebuild():
+    """Queue a ``recommendations`` job that rebuilds the index; leaves the commit to the caller"""
+    return enqueue(RECOMMENDATIONS, key=RECOMMENDATIONS)
+
+
+def rebuild(payload):
+    """Handler of ``recommendations`` jobs: rebuild the index from the database"""
+    return rebuild_index()
+
+
+def index_directory():
+    """Directory the index builds are kept in"""
+    return os.getenv('RECOMMENDATIONS_DIR') or os.path.join(current_app.instance_path, 'recommendations')
+
+
+def rebuild_index(directory=None):
+    """Build the feature matrix of the whole collection and switch queries to it
+
+    Returns a summary of the build.
+    """
+    np = _numpy()
+    directory = directory or index_directory()
+    started = datetime.utcnow()
+    timer = time.perf_counter()
+
+    columns = {}
+    keys, stamps, indptr, indices, counts = array('q'), array('q'), array('q', [0]), array('i'), array('f')
+    for code, model in enumerate(MODELS):
+        rows = db.session.execute(
+            select(model.id, model.updated_at, model.genre, getattr(model, PEOPLE[model]), model.year, model.plot)
+            .order_by(model.id).execution_options(yield_per=BUILD_BATCH)
+        )
+        for title_id, updated_at, genre, people, year, plot in rows:
+            for token, count in _tokens(genre, people, year, plot).items():
+                indices.append(columns.setdefault(token, len(columns)))
+                counts.append(count)
+            keys.append(_key(code, title_id))
+            stamps.append(_stamp(updated_at))
+            indptr.append(len(indices))
+
+    tokens = list(columns)
+    arrays = {
+        'keys': np.frombuffer(keys, dtype=np.int64),
+        'stamps': np.frombuffer(stamps, dtype=np.int64),
+        'indptr': np.frombuffer(indptr, dtype=np.int64),
+        'indices': np.frombuffer(indices, dtype=np.int32),
+        'groups': np.array([GROUPS.index(token[0]) for token in tokens], dtype=np.int8),
+    }
+    titles, features = len(keys), len(tokens)
+    # Smoothed IDF: a feature every title has still counts a little
+    frequency = np.bincount(arrays['indices'], minlength=features)
+    arrays['idf'] = (np.log((1 + titles) / (1 + frequency)) + 1).astype(np.float32)
+    arrays['data'], rows = _weigh(np, arrays['indptr'], arrays['indices'], np.frombuffer(counts, dtype=np.float32),
+                                  arrays['idf'], arrays['groups'])
+
+    # The same matrix by feature: postings of each feature, in row order
+    order = np.argsort(arrays['indices'], kind='stable')
+    arrays['postings_rows'] = rows[order].astype(np.int32)
+    arrays['postings_data'] = arrays['data'][order]
+    arrays['postings_ptr'] = np.concatenate(([0], np.cumsum(frequency))).astype(np.int64)
+
+    name = f'build-{started:%Y%m%d%H%M%S%f}-{os.getpid()}'
+    path = os.path.join(directory, name)
+    os.makedirs(path)
+    for array_name in ARRAYS:
+        np.save(os.path.join(path, f'{array_name}.npy'), arrays[array_name])
+    with open(os.path.join(path, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+        json.dump(tokens, f)
+    meta = {'built_at': started.isoformat(), 'titles': titles, 'features': features,
+            'nonzeros': len(indices), 'seconds': round(time.perf_counter() - timer, 3)}
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    previous = _current_name(directory)
+    pointer = os.path.join(directory, f'{CURRENT}.{os.getpid()}.tmp')
+    with open(pointer, 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(directory, CURRENT))
+    # Processes still mapping the previous build keep it until they reload;
+    # older ones are unused (and mapped files outlive their names anyway)
+    for entry in os.listdir(directory):
+        if entry.startswith('build-') and entry not in (name, previous):
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+    return {'build': name, **meta}
+
+
+class Index:
+    """One build of the feature matrix, memory-mapped from its directory"""
+
+    def __init__(self, path):
+        np = _numpy()
+        self.name = os.path.basename(path)
+        for array_name in ARRAYS:
+            setattr(self, array_name, _load_array(np, os.path.join(path, f'{array_name}.npy')))
+        with open(os.path.join(path, 'vocabulary.json'), encoding='utf-8') as f:
+            self.columns = {token: column for column, token in enumerate(json.load(f))}
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.built_at = datetime.fromisoformat(json.load(f)['built_at'])
+        self.types = np.asarray(self.keys >> ID_BITS, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def row(self, key):
+        """Row number of a key, or None"""
+        np = _numpy()
+        row = int(np.searchsorted(self.keys, key))
+        return row if row < len(self.keys) and self.keys[row] == key else None
+
+    def rows(self, keys):
+        """Row numbers of the keys that are in the index"""
+        np = _numpy()
+        keys = np.asarray(keys, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        return rows[self.keys[rows] == keys] if len(self.keys) else rows[:0]
+
+
+class Delta:
+    """Rows of titles changed since a build, weighted with that build's IDF"""
+
+    def __init__(self, index, titles):
+        np = _numpy()
+        keys, indptr, indices, counts = [], [0], [], []
+        for key, values in titles:
+            for token, count in _tokens(*values).items():
+                column = index.columns.get(token)
+                if column is not None:
+                    indices.append(column)
+                    counts.append(count)
+            keys.append(key)
+            indptr.append(len(indices))
+        self.keys = keys
+        self.positions = {key: position for position, key in enumerate(keys)}
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int32)
+        self.data, self.rows = _weigh(np, self.indptr, self.indices, np.array(counts, dtype=np.float32),
+                                      index.idf, index.groups)
+        self.key_array = np.array(keys, dtype=np.int64)
+        self.types = np.asarray(self.key_array >> ID_BITS, dtype=np.int8)
+        # Rows of the build that these titles replace
+        self.shadowed = np.zeros(len(index), dtype=bool)
+        self.shadowed[index.rows(keys)] = True
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class State:
+    """An index, the delta on top of it and the watched titles, as of some collection versions"""
+
+    def __init__(self, index, versions, delta, watched):
+        self.index = index
+        self.name = index.name
+        self.versions = versions
+        self.delta = delta
+        self.watched = watched
+        # recommend() results by (limit, type code)
+        self.recommendations = {}
+
+    def vector(self, key):
+        """``(columns, weights)`` of one title, or None"""
+        position = self.delta.positions.get(key)
+        if position is not None:
+            start, end = self.delta.indptr[position], self.delta.indptr[position + 1]
+            return self.delta.indices[start:end], self.delta.data[start:end]
+        row = self.index.row(key)
+        if row is None or self.delta.shadowed[row]:
+            return None
+        start, end = self.index.indptr[row], self.index.indptr[row + 1]
+        return self.index.indices[start:end], self.index.data[start:end]
+
+    def profile(self, weighted):
+        """``(columns, weights)`` of the weighted sum of titles, trimmed to its strongest features"""
+        np = _numpy()
+        index, delta = self.index, self.delta
+        keys = np.fromiter(weighted, dtype=np.int64, count=len(weighted))
+        weights = np.fromiter(weighted.values(), dtype=np.float64, count=len(weighted))
+        total = np.zeros(len(index.columns))
+
+        rows = np.searchsorted(index.keys, keys)
+        found = rows < len(index)
+        found[found] = index.keys[rows[found]] == keys[found]
+        found[found] = ~delta.shadowed[rows[found]]
+        positions, owners = _segments(np, index.indptr, rows[found])
+        total += np.bincount(index.indices[positions], weights=index.data[positions] * weights[found][owners],
+                             minlength=len(total))
+
+        in_delta = [n for n, key in enumerate(weighted) if key in delta.positions]
+        if in_delta:
+            segments = np.array([delta.positions[int(keys[n])] for n in in_delta], dtype=np.int64)
+            positions, owners = _segments(np, delta.indptr, segments)
+            total += np.bincount(delta.indices[positions], weights=delta.data[positions] * weights[in_delta][owners],
+                                 minlength=len(total))
+
+        columns = np.flatnonzero(total)
+        if len(columns) > PROFILE_FEATURES:
+            columns = columns[np.argpartition(-np.abs(total[columns]), PROFILE_FEATURES)[:PROFILE_FEATURES]]
+        weights = total[columns]
+        norm = np.sqrt(np.dot(weights, weights))
+        return columns, weights / norm if norm else weights
+
+    def rank(self, columns, weights, limit, exclude=(), type_code=None):
+        """``[(score, key)]`` of the titles closest to a vector, best first
+
+        Returns more than ``limit`` so titles deleted since can be skipped.
+        """
+        np = _numpy()
+        index, delta = self.index, self.delta
+        columns = np.asarray(columns, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        positions, owners = _segments(np, index.postings_ptr, columns)
+        scores = np.bincount(index.postings_rows[positions], weights=index.postings_data[positions] * weights[owners],
+                             minlength=len(index))
+        scores[delta.shadowed] = 0
+        scores[index.rows(exclude)] = 0
+        if type_code is not None:
+            scores[index.types != type_code] = 0
+
+        take = limit * 2 + 10
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > take:
+            candidates = candidates[np.argpartition(-scores[candidates], take)[:take]]
+        ranked = [(float(scores[row]), int(index.keys[row])) for row in candidates]
+
+        if len(delta):
+            query = np.zeros(len(index.columns))
+            query[columns] = weights
+            scores = np.bincount(delta.rows, weights=delta.data * query[delta.indices], minlength=len(delta))
+            scores[np.isin(delta.key_array, np.asarray(exclude, dtype=np.int64))] = 0
+            if type_code is not None:
+                scores[delta.types != type_code] = 0
+            ranked += [(float(scores[position]), delta.keys[position]) for position in np.flatnonzero(scores > 0)]
+        ranked.sort(reverse=True)
+        return ranked[:take]
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def current_state(versions=None):
+    """This process's :class:`State`, brought up to date with the collection
+
+    Builds the index first if there is none yet.
+    """
+    global _state
+    directory = index_directory()
+    name = _current_name(directory)
+    if name is None:
+        with _state_lock:
+            if _current_name(directory) is None:
+                rebuild_index(directory)
+        name = _current_name(directory)
+    versions = versions or collection_versions()
+    state = _state
+    if state is not None and state.name == name and state.versions == versions:
+        return state
+
+    with _state_lock:
+        state = _state
+        if state is None or state.name != name:
+            index = Index(os.path.join(directory, name))
+        elif state.versions == versions:
+            return state
+        else:
+            index = state.index
+        delta = Delta(index, _changed_titles(index, index.built_at - timedelta(seconds=SETTLE_SECONDS)))
+        _state = state = State(index, versions, delta, _watched_titles())
+    if len(state.delta) >= REBUILD_DELTA:
+        enqueue_rebuild()
+        db.session.commit()
+    return state
+
+
+def _current_name(directory):
+    try:
+        with open(os.path.join(directory, CURRENT), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _load_array(np, path):
+    try:
+        # A plain view of the map: indexing np.memmap itself is much slower
+        return np.asarray(np.load(path, mmap_mode='r'))
+    except ValueError:
+        # Empty arrays cannot be mapped
+        return np.load(path)
+
+
+def _changed_titles(index, since):
+    # Rows written shortly before the build began may or may not be in it:
+    # those with the same updated_at as in the build are left out
+    np = _numpy()
+    titles, stamps = [], []
+    for code, model in enumerate(MODELS):
+        rows = db.session.execute(
+            select(model.id, model.updated_at, model.genre, getattr(model, PEOPLE[model]), model.year, model.plot)
+            .where(model.updated_at > since).order_by(model.id)
+        )
+        for title_id, updated_at, *values in rows:
+            titles.append((_key(code, title_id), values))
+            stamps.append(_stamp(updated_at))
+    if not titles or not len(index):
+        return titles
+    keys = np.array([key for key, _ in titles], dtype=np.int64)
+    rows = np.minimum(np.searchsorted(index.keys, keys), len(index) - 1)
+    unchanged = (index.keys[rows] == keys) & (index.stamps[rows] == np.array(stamps, dtype=np.int64))
+    return [title for title, same in zip(titles, unchanged) if not same]
+
+
+def _watched_titles():
+    # Taste weights: ratings above 5 of 10 pull towards a title, below push away
+    watched = {}
+    for code, model, criterion in ((0, Movie, Movie.watched.is_(True)), (1, TVShow, TVShow.watched_episodes > 0)):
+        for title_id, rating in db.session.execute(select(model.id, model.rating).where(criterion)):
+            watched[_key(code, title_id)] = 0.5 if rating is None else max(-1.0, min(1.0, (rating - 5) / 5))
+    return watched
+
+
+def _load(ranked, limit):
+    found = {}
+    for code, model in enumerate(MODELS):
+        ids = [key & ((1 << ID_BITS) - 1) for _, key in ranked if key >> ID_BITS == code]
+        if not ids:
+            continue
+        rows = db.session.execute(
+            select(model.id, model.title, model.year, model.genre, model.poster_url, model.imdb_id, model.rating)
+            .where(model.id.in_(ids))
+        )
+        for row in rows:
+            found[_key(code, row.id)] = {'type': TYPE_NAMES[code], **row._mapping}
+    items = [{**found[key], 'score': round(score, 4)} for score, key in ranked if key in found]
+    return items[:limit]
+
+
+def _key(code, title_id):
+    return code << ID_BITS | title_id
+
+
+def _stamp(updated_at):
+    # updated_at in microseconds, to compare with the build's
+    return int(updated_at.timestamp() * 1_000_000) if updated_at else 0
+
+
+def _tokens(genre, people, year, plot):
+    counts = {}
+    for name in split_genres(genre):
+        counts[f'g:{name.lower()}'] = 1
+    for person in (people or '').split(','):
+        person = person.strip().lower()
+        if person:
+            counts[f'p:{person}'] = 1
+    if year:
+        counts[f'd:{year // 10 * 10}'] = 1
+    for word in _WORD.findall((plot or '').lower()):
+        if len(word) >= MIN_WORD_LENGTH and not word.isdigit() and word not in STOPWORDS:
+            token = f'w:{word}'
+            counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+def _weigh(np, indptr, indices, counts, idf, groups):
+    # Sublinear TF-IDF, each group scaled to its weight, then unit rows;
+    # returns the weights and the row of each entry
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    data = (1 + np.log(counts)) * idf[indices]
+    group = groups[indices].astype(np.int64)
+    cells = rows * len(GROUPS) + group
+    norms = np.sqrt(np.bincount(cells, weights=data * data, minlength=(len(indptr) - 1) * len(GROUPS)))
+    data *= np.array([GROUP_WEIGHTS[name] for name in GROUPS])[group] / norms[cells]
+    data /= np.sqrt(np.bincount(rows, weights=data * data, minlength=len(indptr) - 1))[rows]
+    return data.astype(np.float32), rows
+
+
+def _segments(np, pointers, segments):
+    # Positions of all entries of the given segments of a CSR/CSC array, and
+    # which of the segments each one belongs to
+    starts = np.asarray(pointers[segments], dtype=np.int64)
+    lengths = np.asarray(pointers[segments + 1], dtype=np.int64) - starts
+    before = np.cumsum(lengths) - lengths
+    positions = np.repeat(starts - before, lengths) + np.arange(lengths.sum())
+    return positions, np.repeat(np.arange(len(segments)), lengths)
@@ -0,0 +1,400 @@
+"""Ranked full-text search over the collection.
+
+Titles are searched by title, director/creator, plot and notes, with the
+title weighted highest. Every query word is matched as a prefix, so
+results update while the user types. One- and two-letter words, and words
+found in a large share of all titles ("the"), only match titles, since in
+plots they would match nearly everything. A word that matches nothing is
+widened to the closest indexed words so a typo still finds the title.
+
+The index lives in the database and is kept in step by the database
+itself, so every write path (ORM, bulk import, raw SQL) is covered:
+
+- SQLite: an FTS5 table per collection, external-content over the title
+  table and maintained by triggers, ranked with ``bm25``.
+- PostgreSQL: a generated ``tsvector`` column with a GIN index, ranked
+  with ``ts_rank_cd``; ``pg_trgm`` adds typo tolerance when available.
+- Anything else, or SQLite built without FTS5: unranked ``LIKE`` matching.
+
+:func:`get_backend` picks the backend for the current engine.
+:func:`install_search` creates the index (from :func:`upgrade_schema
+<app.utils.schema.upgrade_schema>`) and :func:`rebuild_search` rebuilds it.
+"""
+import bisect
+import difflib
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import and_, column, false, func, literal, literal_column, or_, select, table, text
+from sqlalchemy.exc import DBAPIError
+
+from app import db
+from app.models.models import Movie, TVShow
+from app.utils.pagination import PaginationError, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+RELEVANCE = 'relevance'
+
+# Query words beyond this are ignored
+MAX_WORDS = 8
+
+# Shorter words are only matched against titles
+MIN_FULL_TEXT_LENGTH = 3
+
+# So are words found in more than this share of all titles, once that
+# share is large enough for the plot matches to be slow
+COMMON_WORD_SHARE = 0.2
+COMMON_WORD_MIN_TITLES = 2000
+
+# Words shorter than this are never corrected
+MIN_TYPO_LENGTH = 4
+
+# Seconds before the word list used for typo corrections is reloaded
+VOCABULARY_TTL = 300
+
+# Replacement words tried for a word that matches nothing
+MAX_CORRECTIONS = 3
+
+# Indexed columns per model, most important first, with their rank weights
+FIELDS = {
+    Movie: (('title', 10.0), ('director', 4.0), ('plot', 1.0), ('notes', 2.0)),
+    TVShow: (('title', 10.0), ('creator', 4.0), ('plot', 1.0), ('notes', 2.0)),
+}
+
+_WORD = re.compile(r'\w+')
+
+_backends = {}
+
+
+def search_words(term):
+    """Lower-cased words of a search term, at most :data:`MAX_WORDS`"""
+    return _WORD.findall((term or '').lower())[:MAX_WORDS]
+
+
+class LikeSearch:
+    """Unranked fallback: every word must appear in one of the fields"""
+
+    name = 'like'
+
+    def install(self, connection):
+        return False
+
+    def rebuild(self, connection):
+        pass
+
+    def hits(self, model, words):
+        criteria = [
+            or_(*(getattr(model, field).ilike(f'%{word}%') for field, _ in FIELDS[model]))
+            for word in words
+        ]
+        return select(model.id.label('id'), literal(0.0).label('rank')).where(*criteria).subquery()
+
+
+class SqliteSearch:
+    """FTS5 tables ``<table>_fts`` with a ``<table>_fts_vocab`` word list"""
+
+    name = 'fts5'
+
+    def __init__(self):
+        self.vocabularies = {}
+        self.lock = threading.Lock()
+
+    def install(self, connection):
+        created = False
+        for model, fields in FIELDS.items():
+            name = model.__tablename__
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': f'{name}_fts'}
+            ).first()
+            if exists:
+                continue
+            columns = ', '.join(field for field, _ in fields)
+            new_values = ', '.join(f'new.{field}' for field, _ in fields)
+            old_values = ', '.join(f'old.{field}' for field, _ in fields)
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE {name}_fts USING fts5({columns}, content='{name}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            ))
+            connection.execute(text(f"CREATE VIRTUAL TABLE {name}_fts_vocab USING fts5vocab({name}_fts, 'row')"))
+            # External-content tables are told about every change to the source rows
+            connection.execute(text(
+                f"CREATE TRIGGER {name}_fts_insert AFTER INSERT ON {name} BEGIN "
+                f"INSERT INTO {name}_fts(rowid, {columns}) VALUES (new.id, {new_values}); END"
+            ))
+            connection.execute(text(
+                f"CREATE TRIGGER {name}_fts_delete AFTER DELETE ON {name} BEGIN "
+                f"INSERT INTO {name}_fts({name}_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END"
+            ))
+            connection.execute(text(
+                f"CREATE TRIGGER {name}_fts_update AFTER UPDATE OF {columns} ON {name} BEGIN "
+                f"INSERT INTO {name}_fts({name}_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+                f"INSERT INTO {name}_fts(rowid, {columns}) VALUES (new.id, {new_values}); END"
+            ))
+            created = True
+        return created
+
+    def rebuild(self, connection):
+        for model in FIELDS:
+            name = model.__tablename__
+            connection.execute(text(f"INSERT INTO {name}_fts({name}_fts) VALUES ('rebuild')"))
+
+    def hits(self, model, words):
+        name = model.__tablename__
+        vocabulary = self._vocabulary(model)
+        groups = []
+        for word in words:
+            if len(word) < MIN_FULL_TEXT_LENGTH or vocabulary.is_common(word):
+                groups.append(f'{{title}} : "{word}"*')
+                continue
+            options = [f'"{word}"*']
+            if len(word) >= MIN_TYPO_LENGTH:
+                options.extend(f'"{term}"' for term in vocabulary.corrections(word))
+            groups.append(options[0] if len(options) == 1 else '(' + ' OR '.join(options) + ')')
+
+        fts = literal_column(f'{name}_fts')
+        weights = [literal(weight) for _, weight in FIELDS[model]]
+        return (
+            select(literal_column('rowid').label('id'), func.bm25(fts, *weights).label('rank'))
+            .select_from(table(f'{name}_fts'))
+            .where(fts.op('MATCH')(' '.join(groups)))
+            .subquery()
+        )
+
+    def _vocabulary(self, model):
+        with self.lock:
+            vocabulary = self.vocabularies.get(model)
+            if vocabulary is None or vocabulary.expires < time.monotonic():
+                rows = db.session.execute(
+                    select(column('term'), column('doc')).select_from(table(f'{model.__tablename__}_fts_vocab'))
+                ).all()
+                total = db.session.execute(select(func.count(model.id))).scalar()
+                vocabulary = self.vocabularies[model] = _Vocabulary(rows, total)
+            return vocabulary
+
+
+class PostgresSearch:
+    """Generated ``search_vector`` columns with GIN indexes"""
+
+    name = 'tsvector'
+
+    def __init__(self):
+        self.trigram = False
+
+    def install(self, connection):
+        created = False
+        for model, fields in FIELDS.items():
+            name = model.__tablename__
+            exists = connection.execute(text(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = :name AND column_name = 'search_vector'"
+            ), {'name': name}).first()
+            if exists:
+                continue
+            labels = 'ABCD'
+            vector = ' || '.join(
+                f"setweight(to_tsvector('simple', coalesce({field}, '')), '{labels[i]}')"
+                for i, (field, _) in enumerate(fields)
+            )
+            connection.execute(text(
+                f'ALTER TABLE {name} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({vector}) STORED'
+            ))
+            connection.execute(text(f'CREATE INDEX ix_{name}_search ON {name} USING GIN (search_vector)'))
+            created = True
+
+        # Typo tolerance needs pg_trgm, which may not be allowed on managed databases
+        try:
+            with connection.begin_nested():
+                connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                for model in FIELDS:
+                    name = model.__tablename__
+                    connection.execute(text(
+                        f'CREATE INDEX IF NOT EXISTS ix_{name}_title_trgm ON {name} USING GIN (title gin_trgm_ops)'
+                    ))
+            self.trigram = True
+        except DBAPIError as e:
+            logger.info('pg_trgm unavailable, search has no typo tolerance: %s', e)
+        return created
+
+    def rebuild(self, connection):
+        # Generated columns are always current; only the indexes can be rebuilt
+        for model in FIELDS:
+            connection.execute(text(f'REINDEX INDEX ix_{model.__tablename__}_search'))
+
+    def hits(self, model, words):
+        vector = literal_column(f'{model.__tablename__}.search_vector')
+        query = func.to_tsquery('simple', ' & '.join(f'{word}:*' for word in words))
+        matched = vector.op('@@')(query)
+        rank = func.ts_rank_cd(vector, query)
+        if self.trigram:
+            phrase = ' '.join(words)
+            matched = or_(matched, literal(phrase).op('<%')(model.title))
+            rank = rank + func.word_similarity(phrase, model.title)
+        return select(model.id.label('id'), (-rank).label('rank')).where(matched).subquery()
+
+
+def get_backend():
+    """The search backend for the current database"""
+    engine = db.engine
+    backend = _backends.get(engine)
+    if backend is None:
+        backend = _backends[engine] = _detect_backend(engine)
+    return backend
+
+
+def _detect_backend(engine):
+    if engine.dialect.name == 'postgresql':
+        backend = PostgresSearch()
+        with engine.begin() as connection:
+            backend.trigram = connection.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).first() is not None
+        return backend
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            installed = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': f'{Movie.__tablename__}_fts'},
+            ).first()
+        if installed:
+            return SqliteSearch()
+    return LikeSearch()
+
+
+def install_search():
+    """Create the search index if needed, filling it from existing rows"""
+    engine = db.engine
+    if engine.dialect.name == 'postgresql':
+        backend = PostgresSearch()
+    elif engine.dialect.name == 'sqlite':
+        backend = SqliteSearch()
+    else:
+        backend = LikeSearch()
+
+    try:
+        with engine.begin() as connection:
+            if backend.install(connection):
+                backend.rebuild(connection)
+    except DBAPIError as e:
+        # SQLite builds without FTS5 fall back to LIKE
+        logger.warning('Full-text search unavailable, using LIKE matching: %s', e)
+        backend = LikeSearch()
+    _backends[engine] = backend
+    return backend
+
+
+def rebuild_search():
+    """Rebuild the search index from the title tables"""
+    backend = get_backend()
+    with db.engine.begin() as connection:
+        backend.rebuild(connection)
+    return backend
+
+
+def search_hits(model, term):
+    """Subquery of ``(id, rank)`` for titles matching ``term``, lower rank first
+
+    Returns None if the term has no words to search for.
+    """
+    words = search_words(term)
+    if not words:
+        return None
+    return get_backend().hits(model, words)
+
+
+def search_filter(model, term):
+    """Criterion matching the titles found by ``term``"""
+    hits = search_hits(model, term)
+    if hits is None:
+        return false()
+    return model.id.in_(select(hits.c.id))
+
+
+def rank_by_search(query, model, term):
+    """Restrict ``query`` to the titles found by ``term`` and add their rank
+
+    Returns ``(query, rank)``; the query yields ``(title, rank)`` rows for
+    :func:`paginate_ranked`. Raises PaginationError if the term has no
+    words, since there is nothing to rank by.
+    """
+    hits = search_hits(model, term)
+    if hits is None:
+        raise PaginationError('sort=relevance needs a search term')
+    return query.join(hits, hits.c.id == model.id).add_columns(hits.c.rank), hits.c.rank
+
+
+def paginate_ranked(query, model, rank, limit, cursor, entity=lambda row: row[0], descending=False):
+    """Fetch one page of a :func:`rank_by_search` query, best matches first
+
+    Works like :func:`app.utils.pagination.paginate` with the rank as the
+    sort value; the cursor holds ``(rank, id)`` of the last row.
+    ``descending`` (``sort=-relevance``) puts the weakest matches first.
+    The rank is the last column of each row, and ``entity`` extracts what
+    is returned for a row: by default the model instance in front of it.
+    """
+    if cursor is not None:
+        last_rank, last_id = cursor
+        if not isinstance(last_rank, (int, float)):
+            raise PaginationError('Invalid cursor')
+        if descending:
+            after = or_(rank < last_rank, and_(rank == last_rank, model.id < last_id))
+        else:
+            after = or_(rank > last_rank, and_(rank == last_rank, model.id > last_id))
+        query = query.filter(after)
+
+    if descending:
+        query = query.order_by(rank.desc(), model.id.desc())
+    else:
+        query = query.order_by(rank, model.id)
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(RELEVANCE, descending, rows[-1][-1], entity(rows[-1]).id)
+
+    return [entity(row) for row in rows], next_cursor
+
+
+class _Vocabulary:
+    """Snapshot of the indexed words and their document counts
+
+    Used to spot common words and to correct typos. A snapshot misses
+    words added since it was taken; such a word only gains a few needless
+    alternatives until the next reload.
+    """
+
+    def __init__(self, rows, total):
+        rows = sorted(rows)
+        self.terms = [term for term, _ in rows]
+        self.expires = time.monotonic() + VOCABULARY_TTL
+        self.common_count = max(total * COMMON_WORD_SHARE, COMMON_WORD_MIN_TITLES)
+        # Documents per term, summed in term order, to estimate prefix matches
+        self.cumulative = [0]
+        for _, documents in rows:
+            self.cumulative.append(self.cumulative[-1] + documents)
+        # Typos rarely hit the first letter, so candidates share it
+        self.by_initial = defaultdict(list)
+        for term in self.terms:
+            self.by_initial[term[0]].append(term)
+
+    def _prefix_range(self, word):
+        start = bisect.bisect_left(self.terms, word)
+        end = bisect.bisect_left(self.terms, word[:-1] + chr(ord(word[-1]) + 1), start)
+        return start, end
+
+    def is_common(self, word):
+        """Whether titles with a word starting with ``word`` are too many to search plots for"""
+        start, end = self._prefix_range(word)
+        # Overcounts documents with several such words, which is fine for a cut-off
+        return self.cumulative[end] - self.cumulative[start] > self.common_count
+
+    def corrections(self, word):
+        """Closest words to ``word`` if no indexed word starts with it"""
+        start, end = self._prefix_range(word)
+        if end > start:
+            return []
+        candidates = [term for term in self.by_initial.get(word[0], ()) if abs(len(term) - len(word)) <= 2]
+        return difflib.get_close_matches(word, candidates, n=MAX_CORRECTIONS, cutoff=0.75)
@@ -0,0 +1,105 @@
+"""Collection totals and recent titles for the dashboard.
+
+:func:`collection_stats` computes every dashboard number with one aggregate
+query and finds the newest titles with a ``UNION ALL ... ORDER BY created_at
+LIMIT n`` over both collections, so the dashboard never needs the full
+lists. The result is cached in process under the collection versions of
+:mod:`app.services.versions`; any commit that changes movies or TV shows,
+in this worker or another, bumps a version and so makes the next call
+recompute.
+"""
+import threading
+
+from sqlalchemy import case, func, literal, select, true, union_all
+
+from app import db
+from app.models.models import Movie, TVShow
+from app.services.versions import collection_versions
+
+RECENT_LIMIT = 6
+
+_lock = threading.Lock()
+_cache = {'stats': None, 'versions': None}
+
+
+def collection_stats(versions=None):
+    """Dashboard totals and recent titles, from the cache when it is current
+
+    ``versions`` is a :func:`~app.services.versions.collection_versions`
+    result the caller already holds; it is read here otherwise.
+    """
+    if versions is None:
+        versions = collection_versions()
+    with _lock:
+        if _cache['stats'] is not None and _cache['versions'] == versions:
+            return _cache['stats']
+
+    stats = compute_stats()
+
+    with _lock:
+        _cache['stats'] = stats
+        _cache['versions'] = versions
+    return stats
+
+
+def compute_stats(limit=RECENT_LIMIT):
+    """Query the dashboard totals and the ``limit`` newest titles"""
+    movie_totals = select(
+        func.count(Movie.id).label('movie_count'),
+        _count_true(Movie.watched).label('watched_movies'),
+        _count_true(Movie.watch_later).label('watch_later_movies'),
+    ).subquery()
+    tv_totals = select(
+        func.count(TVShow.id).label('tv_count'),
+        func.coalesce(func.sum(TVShow.watched_episodes), 0).label('watched_episodes'),
+        _count_true(TVShow.watch_later).label('watch_later_tv_shows'),
+    ).subquery()
+    totals = db.session.execute(
+        select(movie_totals, tv_totals).select_from(movie_totals.join(tv_totals, true()))
+    ).mappings().one()
+
+    stats = dict(totals)
+    stats['watched_count'] = stats['watched_movies'] + stats['watched_episodes']
+    stats['watch_later_count'] = stats['watch_later_movies'] + stats['watch_later_tv_shows']
+    stats['recent'] = recent_titles(limit)
+    return stats
+
+
+def recent_titles(limit=RECENT_LIMIT):
+    """The ``limit`` most recently added movies and shows, newest first"""
+    newest = union_all(
+        select(literal('movie').label('type'), Movie.id.label('id'), Movie.created_at.label('created_at')),
+        select(literal('tv').label('type'), TVShow.id.label('id'), TVShow.created_at.label('created_at')),
+    ).subquery()
+    rows = db.session.execute(
+        select(newest.c.type, newest.c.id)
+        .order_by(newest.c.created_at.desc().nulls_last(), newest.c.id.desc())
+        .limit(limit)
+    ).all()
+
+    # Only the few winners are loaded in full
+    movie_ids = [row.id for row in rows if row.type == 'movie']
+    show_ids = [row.id for row in rows if row.type == 'tv']
+    movies = {}
+    shows = {}
+    if movie_ids:
+        movies = {movie.id: movie for movie in db.session.execute(
+            select(Movie).where(Movie.id.in_(movie_ids))
+        ).scalars()}
+    if show_ids:
+        shows = {show.id: show for show in db.session.execute(
+            select(TVShow).where(TVShow.id.in_(show_ids))
+        ).scalars()}
+
+    recent = []
+    for row in rows:
+        if row.type == 'movie':
+            recent.append({'type': 'movie', **movies[row.id].to_dict()})
+        else:
+            recent.append({'type': 'tv', **shows[row.id].to_dict(include_episodes=False)})
+    return recent
+
+
+def _count_true(column):
+    return func.coalesce(func.sum(case((column.is_(True), 1), else_=0)), 0)
+
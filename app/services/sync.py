@@ -0,0 +1,231 @@
+"""Delta sync for clients that keep a local copy of the library.
+
+Movies, TV shows and episodes carry an ``updated_at`` column that every
+insert and update sets, and deleting a title (or bulk-deleting episodes)
+leaves a ``Tombstone`` row. :func:`changes` reads each of these streams in
+``(updated_at, id)`` order, strictly after the position the client reached
+last time, and returns the rows together with a new opaque token holding
+the new positions. A client that is up to date gets empty lists back.
+
+Timestamps are taken when a statement runs, not when its transaction
+commits, so a slow transaction can commit rows that are older than rows
+another client has already seen. Positions are therefore never advanced
+past ``SYNC_SETTLE_SECONDS`` ago unless a page is full: the last few
+seconds of changes are sent again on the next sync, and clients apply
+them idempotently.
+
+Tombstones are kept for ``SYNC_TOMBSTONE_DAYS``. A token older than that
+cannot be continued and the client is told to start over with ``reset``.
+"""
+import base64
+import binascii
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, event, insert, or_, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.models import Episode, Movie, TVShow, Tombstone
+from app.utils.serialization import FIELDS, columns_for, serialize_rows
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+SETTLE_SECONDS = float(os.getenv('SYNC_SETTLE_SECONDS', 10))
+TOMBSTONE_DAYS = int(os.getenv('SYNC_TOMBSTONE_DAYS', 30))
+
+# Response key, also the tombstone kind, of each synced model
+KINDS = {Movie: 'movies', TVShow: 'tv_shows', Episode: 'episodes'}
+MODELS = {kind: model for model, kind in KINDS.items()}
+
+TOMBSTONES = 'tombstones'
+
+
+class SyncError(ValueError):
+    """Raised for malformed sync parameters"""
+
+
+def parse_sync_args(args):
+    """Read ``since``, ``limit`` and ``include`` from the request arguments
+
+    Returns ``(token, limit, include_episodes)``; ``token`` is None for a
+    full sync.
+    """
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise SyncError('limit must be an integer')
+    if limit < 1:
+        raise SyncError('limit must be at least 1')
+    limit = min(limit, MAX_LIMIT)
+
+    include = {part.strip() for part in args.get('include', '').split(',') if part.strip()}
+    token = decode_token(args['since']) if args.get('since') else None
+    return token, limit, 'episodes' in include
+
+
+def changes(token, limit=DEFAULT_LIMIT, include_episodes=False):
+    """Rows changed and deleted since ``token``, and the token to continue from
+
+    Returns a dict with the changed ``movies`` and ``tv_shows`` (and
+    ``episodes`` if requested), ``deleted`` ids per kind, the new ``token``,
+    ``more`` when another request would return more changes right away, and
+    ``reset`` when the client has to drop its copy and take this response
+    as the start of a full sync.
+    """
+    now = datetime.utcnow()
+    settled = now - timedelta(seconds=SETTLE_SECONDS)
+    kinds = ['movies', 'tv_shows'] + (['episodes'] if include_episodes else [])
+
+    reset = (
+        token is None
+        or any(kind not in token for kind in kinds)
+        or token[TOMBSTONES] is None
+        or token[TOMBSTONES][0] < now - timedelta(days=TOMBSTONE_DAYS)
+    )
+    if reset:
+        # Everything that exists now, then deletions from here on
+        token = {kind: None for kind in kinds}
+        token[TOMBSTONES] = (settled, 0)
+
+    response = {'deleted': {kind: [] for kind in kinds}}
+    positions = {}
+    more = False
+    for kind in kinds:
+        model = MODELS[kind]
+        fields = FIELDS[model]
+        query = select(*columns_for(model, fields, extra=('updated_at',)))
+        rows, positions[kind], full = _read(model, model.updated_at, query, token[kind], limit, settled)
+        response[kind] = serialize_rows(rows, model, fields)
+        more = more or full
+
+    tombstones, positions[TOMBSTONES], full = _read(
+        Tombstone, Tombstone.deleted_at,
+        select(Tombstone.id, Tombstone.kind, Tombstone.record_id, Tombstone.deleted_at)
+        .where(Tombstone.kind.in_(kinds)),
+        token[TOMBSTONES], limit, settled,
+    )
+    more = more or full
+    for kind, ids in _deleted_ids(tombstones).items():
+        response['deleted'][kind] = ids
+
+    response['token'] = encode_token(positions)
+    response['more'] = more
+    response['reset'] = reset
+    return response
+
+
+def _read(model, column, query, position, limit, settled):
+    """One page of a stream after ``position``: ``(rows, new position, full)``"""
+    if position is not None:
+        value, last_id = position
+        query = query.where(or_(column > value, and_(column == value, model.id > last_id)))
+    rows = db.session.execute(query.order_by(column, model.id).limit(limit + 1)).all()
+    full = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return rows, position, full
+
+    last = (getattr(rows[-1], column.key), rows[-1].id)
+    if full:
+        return rows, last, full
+    # Rows from the last few seconds are sent again next time
+    reached = min(last, (settled, 0))
+    if position is not None and reached < position:
+        reached = position
+    return rows, reached, full
+
+
+def _deleted_ids(tombstones):
+    """Deleted ids per kind, leaving out ids that exist again"""
+    deleted = {}
+    for tombstone in tombstones:
+        deleted.setdefault(tombstone.kind, set()).add(tombstone.record_id)
+    for kind, ids in deleted.items():
+        model = MODELS[kind]
+        # SQLite can hand the id of a deleted row to a new one
+        alive = set(db.session.execute(select(model.id).where(model.id.in_(list(ids)))).scalars())
+        deleted[kind] = sorted(ids - alive)
+    return deleted
+
+
+def encode_token(positions):
+    """Opaque, URL-safe token for the given stream positions"""
+    payload = {
+        name: None if position is None else [position[0].isoformat(), position[1]]
+        for name, position in positions.items()
+    }
+    data = json.dumps(payload, separators=(',', ':'), sort_keys=True)
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_token(token):
+    """Stream positions from a token made by :func:`encode_token`"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        positions = {}
+        for name, position in payload.items():
+            if name not in MODELS and name != TOMBSTONES:
+                raise ValueError(name)
+            if position is None:
+                positions[name] = None
+                continue
+            value, last_id = position
+            if not isinstance(last_id, int):
+                raise ValueError(last_id)
+            positions[name] = (datetime.fromisoformat(value), last_id)
+    except (binascii.Error, ValueError, TypeError, AttributeError):
+        raise SyncError('Invalid sync token')
+    if TOMBSTONES not in positions:
+        raise SyncError('Invalid sync token')
+    return positions
+
+
+def delete_tracked(model, criterion, *columns):
+    """Bulk DELETE rows of ``model`` matching ``criterion``, leaving tombstones
+
+    Returns the deleted rows with the given ``columns``. Leaves the commit
+    to the caller.
+    """
+    stmt = delete(model).where(criterion).execution_options(synchronize_session=False)
+    if db.engine.dialect.delete_returning:
+        rows = db.session.execute(stmt.returning(model.id, *columns)).all()
+    else:
+        rows = db.session.execute(select(model.id, *columns).where(criterion)).all()
+        db.session.execute(stmt)
+    record_deleted(model, [row.id for row in rows])
+    return rows
+
+
+def record_deleted(model, ids):
+    """Leave tombstones for rows of ``model`` that were bulk-deleted"""
+    if not ids:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert(Tombstone), [
+        {'kind': KINDS[model], 'record_id': record_id, 'deleted_at': now} for record_id in ids
+    ])
+    _prune(db.session, now)
+
+
+def _prune(session, now):
+    # Deletes are rare, so expired tombstones go whenever new ones are written
+    session.execute(
+        delete(Tombstone).where(Tombstone.deleted_at < now - timedelta(days=TOMBSTONE_DAYS))
+        .execution_options(synchronize_session=False)
+    )
+
+
+@event.listens_for(Session, 'before_flush')
+def _tombstone_deleted_titles(session, flush_context, instances):
+    # Episodes deleted with their show need no tombstones of their own
+    titles = [obj for obj in session.deleted if isinstance(obj, (Movie, TVShow))]
+    if not titles:
+        return
+    now = datetime.utcnow()
+    for obj in titles:
+        session.add(Tombstone(kind=KINDS[type(obj)], record_id=obj.id, deleted_at=now))
+    _prune(session, now)
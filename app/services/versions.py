@@ -0,0 +1,149 @@
+"""Version counters for conditional GETs.
+
+Every commit that changes a collection bumps its ``CollectionVersion`` row
+("movies" or "tv_shows") in the same transaction, and every commit that
+changes a title, or the episodes of a show, bumps that row's ``version``
+column. Responses derive their ETags from these numbers, so a request that
+revalidates can be answered with 304 Not Modified after reading one small
+row instead of the rows it describes.
+
+Changes are noticed in two places: ORM flushes (new, changed and deleted
+objects) and bulk statements executed through the session, by the table
+they write to. Bulk writes cannot tell which titles they touched, so the
+code issuing them reports those with :func:`touch`. Versions are kept in
+the database rather than in process, so every worker sees the same ones.
+"""
+from datetime import datetime
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.models import CollectionVersion, Episode, Movie, Season, TVShow
+
+MOVIES = 'movies'
+TV_SHOWS = 'tv_shows'
+
+# Collection each table belongs to
+COLLECTIONS = {
+    'movie': MOVIES,
+    'movie_genre': MOVIES,
+    'tv_show': TV_SHOWS,
+    'tv_show_genre': TV_SHOWS,
+    'season': TV_SHOWS,
+    'episode': TV_SHOWS,
+}
+
+# Models with a row version
+VERSIONED = (Movie, TVShow)
+
+
+def collection_versions(names=(MOVIES, TV_SHOWS)):
+    """``{name: (version, updated_at)}`` for the given collections
+
+    Collections that were never written have version 0 and no timestamp.
+    """
+    versions = {name: (0, None) for name in names}
+    rows = db.session.execute(
+        select(CollectionVersion.name, CollectionVersion.version, CollectionVersion.updated_at)
+        .where(CollectionVersion.name.in_(list(names)))
+    )
+    for name, version, updated_at in rows:
+        versions[name] = (version, updated_at)
+    return versions
+
+
+def last_change(versions):
+    """Latest ``updated_at`` of a :func:`collection_versions` result, or None"""
+    return max((updated_at for _, updated_at in versions.values() if updated_at), default=None)
+
+
+def touch(model, ids):
+    """Bump the row version of ``ids`` when the session commits
+
+    For bulk statements that change titles or their episodes without
+    loading them.
+    """
+    _pending(db.session).setdefault(model, set()).update(ids)
+
+
+def _pending(session):
+    return session.info.setdefault('versions_touched', {})
+
+
+def _changed_collections(session):
+    return session.info.setdefault('versions_changed', set())
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_flush(session, flush_context, instances):
+    changed = _changed_collections(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        collection = COLLECTIONS.get(getattr(obj, '__tablename__', None))
+        if collection is None or (obj in session.dirty and not session.is_modified(obj)):
+            continue
+        changed.add(collection)
+        if isinstance(obj, VERSIONED):
+            # New rows start at 1 and deleted ones have no version left
+            if obj in session.dirty:
+                _pending(session).setdefault(type(obj), set()).add(obj.id)
+        elif isinstance(obj, (Episode, Season)) and obj.tv_show_id is not None:
+            _pending(session).setdefault(TVShow, set()).add(obj.tv_show_id)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_statement(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    collection = COLLECTIONS.get(orm_execute_state.statement.table.name)
+    if collection is not None:
+        _changed_collections(orm_execute_state.session).add(collection)
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_versions(session):
+    # Savepoints are part of the enclosing transaction
+    if session.in_nested_transaction():
+        return
+    # Pending ORM changes are only seen once they are flushed
+    session.flush()
+    touched = session.info.pop('versions_touched', {})
+    changed = session.info.pop('versions_changed', set())
+
+    for model, ids in touched.items():
+        ids = sorted(ids)
+        for start in range(0, len(ids), 500):
+            session.execute(
+                update(model).where(model.id.in_(ids[start:start + 500]))
+                .values(version=model.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+
+    now = datetime.utcnow()
+    for name in sorted(changed):
+        result = session.execute(
+            update(CollectionVersion).where(CollectionVersion.name == name)
+            .values(version=CollectionVersion.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            try:
+                with session.begin_nested():
+                    session.execute(insert(CollectionVersion).values(name=name, version=1, updated_at=now))
+            except IntegrityError:
+                # Created by a concurrent commit in between
+                session.execute(
+                    update(CollectionVersion).where(CollectionVersion.name == name)
+                    .values(version=CollectionVersion.version + 1, updated_at=now)
+                )
+    # The bumps above are writes to tracked tables themselves
+    session.info.pop('versions_changed', None)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_on_rollback(session, previous_transaction):
+    # A savepoint rolling back leaves the rest of the transaction in place
+    if previous_transaction.parent is not None:
+        return
+    session.info.pop('versions_touched', None)
+    session.info.pop('versions_changed', None)
@@ -31,16 +31,49 @@ const importDataBtn = document.getElementById('import-data-btn');
 const importFile = document.getElementById('import-file');
 const themeButtons = document.querySelectorAll('.theme-btn');
 const toast = document.getElementById('toast');
+const movieSortFilter = document.getElementById('movie-sort-filter');
+const tvSortFilter = document.getElementById('tv-sort-filter');
+const moviesSentinel = document.getElementById('movies-sentinel');
+const tvShowsSentinel = document.getElementById('tv-shows-sentinel');
+const watchLaterSentinel = document.getElementById('watch-later-sentinel');
 
 // State
+const PAGE_SIZE = 48;
+// Library responses carry ETags: keep them in the HTTP cache but always
+// revalidate, so an unchanged page costs a 304 instead of a download
+const REVALIDATE = { cache: 'no-cache' };
 let movies = [];
 let tvShows = [];
+let watchLaterItems = [];
 let currentMovieId = null;
 let currentTvShowId = null;
-let movieGenres = new Set();
-let movieYears = new Set();
-let tvGenres = new Set();
-let tvYears = new Set();
+// Genre and year counts for the filter menus, from /api/facets
+let movieFacets = { genres: [], years: [] };
+let tvFacets = { genres: [], years: [] };
+
+// Every item loaded by any view, so detail modals can open from any grid
+const movieCache = new Map();
+const tvShowCache = new Map();
+
+// Cursor state for the paginated grids. Bumping `generation` discards
+// responses that belong to a query the user has since changed.
+const moviePager = { cursor: null, done: false, loading: false, generation: 0 };
+const tvPager = { cursor: null, done: false, loading: false, generation: 0 };
+const watchLaterPager = { sources: [], done: false, loading: false, generation: 0 };
+
+// Local copy of the whole library, persisted in IndexedDB and kept current
+// with the deltas from /api/sync, so reopening the app only asks for changes
+const LIBRARY_DB = 'cinemate-library';
+const SYNC_PAGE_SIZE = 1000;
+const library = { db: null, token: null, syncing: null };
+
+// Grid posters are served resized from the local poster cache, see posterSrc
+const POSTER_WIDTH = 180;
+
+// Titles added by IMDb ID are filled in from OMDB by a background job;
+// its status is polled for up to two minutes
+const JOB_POLL_INTERVAL = 1500;
+const JOB_POLL_ATTEMPTS = 80;
 
 // Initialize
 document.addEventListener('DOMContentLoaded', () => {
@@ -50,6 +83,10 @@ document.addEventListener('DOMContentLoaded', () => {
     // Load data
     fetchMovies();
     fetchTvShows();
+    fetchWatchLater();
+    updateDashboard();
+    fetchFacets();
+    startLibrarySync();
     
     // Set up event listeners
     setupEventListeners();
@@ -141,20 +178,37 @@ function setupEventListeners() {
     movieForm.addEventListener('submit', handleMovieFormSubmit);
     tvForm.addEventListener('submit', handleTvFormSubmit);
     
-    // Search and filters
-    movieSearch.addEventListener('input', filterMovies);
-    tvSearch.addEventListener('input', filterTvShows);
-    watchLaterSearch.addEventListener('input', filterWatchLater);
+    // Keep the total in step with a per-season layout
+    document.getElementById('tv-seasons').addEventListener('input', (e) => {
+        const seasons = parseSeasonLayout(e.target.value);
+        if (seasons) {
+            document.getElementById('tv-total-episodes').value = seasons.reduce((sum, count) => sum + count, 0);
+        }
+    });
+    
+    // Search and filters (applied server-side, so typing is debounced)
+    movieSearch.addEventListener('input', () => preferBestMatch(movieSearch, movieSortFilter));
+    tvSearch.addEventListener('input', () => preferBestMatch(tvSearch, tvSortFilter));
+    movieSearch.addEventListener('input', debounce(filterMovies, 300));
+    tvSearch.addEventListener('input', debounce(filterTvShows, 300));
+    watchLaterSearch.addEventListener('input', debounce(filterWatchLater, 300));
     
     movieGenreFilter.addEventListener('change', filterMovies);
     movieYearFilter.addEventListener('change', filterMovies);
     movieWatchedFilter.addEventListener('change', filterMovies);
+    movieSortFilter.addEventListener('change', filterMovies);
     
     tvGenreFilter.addEventListener('change', filterTvShows);
     tvYearFilter.addEventListener('change', filterTvShows);
+    tvSortFilter.addEventListener('change', filterTvShows);
     
     watchLaterTypeFilter.addEventListener('change', filterWatchLater);
     
+    // Infinite scroll
+    observeSentinel(moviesSentinel, () => fetchMovies(false));
+    observeSentinel(tvShowsSentinel, () => fetchTvShows(false));
+    observeSentinel(watchLaterSentinel, () => fetchWatchLater(false));
+    
     // OMDB Search
     searchBtn.addEventListener('click', searchOMDB);
     
@@ -215,77 +269,202 @@ function toggleTheme() {
 }
 
 // API Functions
-async function fetchMovies() {
+async function fetchMovies(reset = true) {
+    if (reset) {
+        moviePager.generation++;
+        moviePager.cursor = null;
+        moviePager.done = false;
+        moviePager.loading = false;
+        movies = [];
+        movieGrid.innerHTML = '';
+    }
+    if (moviePager.loading || moviePager.done) return;
+    
+    const generation = moviePager.generation;
+    moviePager.loading = true;
+    
     try {
-        const response = await fetch('/api/movies');
-        movies = await response.json();
+        const params = buildMovieQuery();
+        params.set('limit', PAGE_SIZE);
+        if (moviePager.cursor) {
+            params.set('cursor', moviePager.cursor);
+        }
         
-        // Extract genres and years
-        movieGenres = new Set();
-        movieYears = new Set();
+        const response = await fetch(`/api/movies/?${params}`, REVALIDATE);
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(error.error || 'Failed to load movies');
+        }
+        const page = await response.json();
         
-        movies.forEach(movie => {
-            if (movie.genre) {
-                movie.genre.split(',').forEach(genre => {
-                    movieGenres.add(genre.trim());
-                });
-            }
-            if (movie.year) {
-                movieYears.add(movie.year);
-            }
-        });
+        // Drop the page if the filters changed while it was loading
+        if (generation !== moviePager.generation) return;
         
-        // Populate filters
-        populateMovieFilters();
+        moviePager.cursor = page.next_cursor;
+        moviePager.done = !page.next_cursor;
+        movies = movies.concat(page.items);
+        page.items.forEach(movie => movieCache.set(movie.id, movie));
         
         // Render movies
-        renderMovies();
-        
-        // Update dashboard
-        updateDashboard();
-        
-        // Render watch later
-        renderWatchLater();
+        appendMovieCards(page.items);
     } catch (error) {
         console.error('Error fetching movies:', error);
         showToast('Failed to load movies', 'error');
+    } finally {
+        if (generation === moviePager.generation) {
+            moviePager.loading = false;
+        }
+    }
+    
+    // Keep loading while the end of the grid is still on screen
+    if (generation === moviePager.generation && !moviePager.done && isSentinelVisible(moviesSentinel)) {
+        fetchMovies(false);
     }
 }
 
-async function fetchTvShows() {
+async function fetchTvShows(reset = true) {
+    if (reset) {
+        tvPager.generation++;
+        tvPager.cursor = null;
+        tvPager.done = false;
+        tvPager.loading = false;
+        tvShows = [];
+        tvShowsGrid.innerHTML = '';
+    }
+    if (tvPager.loading || tvPager.done) return;
+    
+    const generation = tvPager.generation;
+    tvPager.loading = true;
+    
     try {
-        const response = await fetch('/api/tv');
-        tvShows = await response.json();
+        const params = buildTvQuery();
+        params.set('limit', PAGE_SIZE);
+        if (tvPager.cursor) {
+            params.set('cursor', tvPager.cursor);
+        }
         
-        // Extract genres and years
-        tvGenres = new Set();
-        tvYears = new Set();
+        const response = await fetch(`/api/tv/?${params}`, REVALIDATE);
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(error.error || 'Failed to load TV shows');
+        }
+        const page = await response.json();
         
-        tvShows.forEach(show => {
-            if (show.genre) {
-                show.genre.split(',').forEach(genre => {
-                    tvGenres.add(genre.trim());
-                });
-            }
-            if (show.year) {
-                tvYears.add(show.year);
-            }
-        });
+        // Drop the page if the filters changed while it was loading
+        if (generation !== tvPager.generation) return;
         
-        // Populate filters
-        populateTvFilters();
+        tvPager.cursor = page.next_cursor;
+        tvPager.done = !page.next_cursor;
+        tvShows = tvShows.concat(page.items);
+        page.items.forEach(cacheTvShow);
         
         // Render TV shows
-        renderTvShows();
-        
-        // Update dashboard
-        updateDashboard();
-        
-        // Render watch later
-        renderWatchLater();
+        appendTvShowCards(page.items);
     } catch (error) {
         console.error('Error fetching TV shows:', error);
         showToast('Failed to load TV shows', 'error');
+    } finally {
+        if (generation === tvPager.generation) {
+            tvPager.loading = false;
+        }
+    }
+    
+    // Keep loading while the end of the grid is still on screen
+    if (generation === tvPager.generation && !tvPager.done && isSentinelVisible(tvShowsSentinel)) {
+        fetchTvShows(false);
+    }
+}
+
+async function fetchWatchLater(reset = true) {
+    if (reset) {
+        const typeFilter = watchLaterTypeFilter.value;
+        const search = watchLaterSearch.value.trim();
+        
+        watchLaterPager.generation++;
+        watchLaterPager.done = false;
+        watchLaterPager.loading = false;
+        watchLaterPager.sources = [];
+        if (typeFilter === '' || typeFilter === 'movie') {
+            watchLaterPager.sources.push({ type: 'movie', url: '/api/movies/', search, cursor: null, done: false, buffer: [] });
+        }
+        if (typeFilter === '' || typeFilter === 'tv') {
+            watchLaterPager.sources.push({ type: 'tv', url: '/api/tv/', search, cursor: null, done: false, buffer: [] });
+        }
+        watchLaterItems = [];
+        watchLaterGrid.innerHTML = '';
+    }
+    if (watchLaterPager.loading || watchLaterPager.done) return;
+    
+    const generation = watchLaterPager.generation;
+    watchLaterPager.loading = true;
+    
+    try {
+        // Movies and TV shows are paged separately; refill whichever
+        // buffers ran dry, then merge both title-sorted streams
+        await Promise.all(watchLaterPager.sources
+            .filter(source => !source.done && source.buffer.length === 0)
+            .map(fetchWatchLaterSourcePage));
+        
+        if (generation !== watchLaterPager.generation) return;
+        
+        const batch = [];
+        while (true) {
+            const sources = watchLaterPager.sources;
+            // An item can only be placed once every unfinished source has
+            // a buffered item to compare it with
+            if (sources.some(source => !source.done && source.buffer.length === 0)) break;
+            
+            const candidates = sources.filter(source => source.buffer.length > 0);
+            if (candidates.length === 0) {
+                watchLaterPager.done = true;
+                break;
+            }
+            
+            const next = candidates.reduce((best, source) =>
+                compareTitles(source.buffer[0], best.buffer[0]) < 0 ? source : best
+            );
+            batch.push(next.buffer.shift());
+        }
+        
+        watchLaterItems = watchLaterItems.concat(batch);
+        appendWatchLaterCards(batch);
+    } catch (error) {
+        console.error('Error fetching watch later:', error);
+        showToast('Failed to load watch later list', 'error');
+    } finally {
+        if (generation === watchLaterPager.generation) {
+            watchLaterPager.loading = false;
+        }
+    }
+    
+    if (generation === watchLaterPager.generation && !watchLaterPager.done && isSentinelVisible(watchLaterSentinel)) {
+        fetchWatchLater(false);
+    }
+}
+
+async function fetchWatchLaterSourcePage(source) {
+    const params = new URLSearchParams({ watch_later: 'true', limit: PAGE_SIZE });
+    if (source.search) {
+        params.set('search', source.search);
+    }
+    if (source.cursor) {
+        params.set('cursor', source.cursor);
+    }
+    
+    const response = await fetch(`${source.url}?${params}`, REVALIDATE);
+    if (!response.ok) {
+        throw new Error('Failed to load watch later list');
+    }
+    const page = await response.json();
+    
+    source.cursor = page.next_cursor;
+    source.done = !page.next_cursor;
+    source.buffer = page.items.map(item => ({...item, type: source.type}));
+    
+    if (source.type === 'movie') {
+        page.items.forEach(movie => movieCache.set(movie.id, movie));
+    } else {
+        page.items.forEach(cacheTvShow);
     }
 }
 
@@ -305,26 +484,18 @@ async function addMovie(movieData) {
         }
         
         const newMovie = await response.json();
-        movies.push(newMovie);
+        movieCache.set(newMovie.id, newMovie);
         
-        // Update filters
-        if (newMovie.genre) {
-            newMovie.genre.split(',').forEach(genre => {
-                movieGenres.add(genre.trim());
-            });
-        }
-        if (newMovie.year) {
-            movieYears.add(newMovie.year);
-        }
-        
-        populateMovieFilters();
-        
-        // Re-render
-        renderMovies();
+        // Reload so the new movie lands in its sorted position
+        fetchMovies();
         updateDashboard();
-        renderWatchLater();
+        fetchWatchLater();
+        fetchFacets();
         
         showToast('Movie added successfully');
+        if (newMovie.job) {
+            watchJob(newMovie.job);
+        }
     } catch (error) {
         console.error('Error adding movie:', error);
         showToast(error.message, 'error');
@@ -349,32 +520,17 @@ async function updateMovie(movieId, movieData) {
         const updatedMovie = await response.json();
         
         // Update local data
+        movieCache.set(movieId, updatedMovie);
         const index = movies.findIndex(m => m.id === movieId);
         if (index !== -1) {
             movies[index] = updatedMovie;
         }
         
-        // Re-extract genres and years
-        movieGenres = new Set();
-        movieYears = new Set();
-        
-        movies.forEach(movie => {
-            if (movie.genre) {
-                movie.genre.split(',').forEach(genre => {
-                    movieGenres.add(genre.trim());
-                });
-            }
-            if (movie.year) {
-                movieYears.add(movie.year);
-            }
-        });
-        
-        populateMovieFilters();
-        
         // Re-render
         renderMovies();
         updateDashboard();
-        renderWatchLater();
+        fetchWatchLater();
+        fetchFacets();
         
         showToast('Movie updated successfully');
     } catch (error) {
@@ -402,23 +558,7 @@ async function deleteMovie() {
         
         // Update local data
         movies = movies.filter(m => m.id !== currentMovieId);
-        
-        // Re-extract genres and years
-        movieGenres = new Set();
-        movieYears = new Set();
-        
-        movies.forEach(movie => {
-            if (movie.genre) {
-                movie.genre.split(',').forEach(genre => {
-                    movieGenres.add(genre.trim());
-                });
-            }
-            if (movie.year) {
-                movieYears.add(movie.year);
-            }
-        });
-        
-        populateMovieFilters();
+        movieCache.delete(currentMovieId);
         
         // Close modal
         movieDetailsModal.style.display = 'none';
@@ -426,7 +566,8 @@ async function deleteMovie() {
         // Re-render
         renderMovies();
         updateDashboard();
-        renderWatchLater();
+        fetchWatchLater();
+        fetchFacets();
         
         showToast('Movie deleted successfully');
     } catch (error) {
@@ -451,26 +592,18 @@ async function addTvShow(tvData) {
         }
         
         const newTvShow = await response.json();
-        tvShows.push(newTvShow);
-        
-        // Update filters
-        if (newTvShow.genre) {
-            newTvShow.genre.split(',').forEach(genre => {
-                tvGenres.add(genre.trim());
-            });
-        }
-        if (newTvShow.year) {
-            tvYears.add(newTvShow.year);
-        }
+        cacheTvShow(newTvShow);
         
-        populateTvFilters();
-        
-        // Re-render
-        renderTvShows();
+        // Reload so the new show lands in its sorted position
+        fetchTvShows();
         updateDashboard();
-        renderWatchLater();
+        fetchWatchLater();
+        fetchFacets();
         
         showToast('TV show added successfully');
+        if (newTvShow.job) {
+            watchJob(newTvShow.job);
+        }
     } catch (error) {
         console.error('Error adding TV show:', error);
         showToast(error.message, 'error');
@@ -495,32 +628,13 @@ async function updateTvShow(tvId, tvData) {
         const updatedTvShow = await response.json();
         
         // Update local data
-        const index = tvShows.findIndex(t => t.id === tvId);
-        if (index !== -1) {
-            tvShows[index] = updatedTvShow;
-        }
-        
-        // Re-extract genres and years
-        tvGenres = new Set();
-        tvYears = new Set();
-        
-        tvShows.forEach(show => {
-            if (show.genre) {
-                show.genre.split(',').forEach(genre => {
-                    tvGenres.add(genre.trim());
-                });
-            }
-            if (show.year) {
-                tvYears.add(show.year);
-            }
-        });
-        
-        populateTvFilters();
+        storeTvShow(updatedTvShow);
         
         // Re-render
         renderTvShows();
         updateDashboard();
-        renderWatchLater();
+        fetchWatchLater();
+        fetchFacets();
         
         showToast('TV show updated successfully');
     } catch (error) {
@@ -529,29 +643,40 @@ async function updateTvShow(tvId, tvData) {
     }
 }
 
-async function updateEpisode(tvId, episodeId, episodeData) {
+async function updateEpisodes(tvId, selection, changes, message = 'Episodes updated successfully') {
     try {
-        const response = await fetch(`/api/tv/${tvId}/episodes/${episodeId}`, {
-            method: 'PUT',
+        // One request for any number of episodes; the response holds only
+        // the episodes that changed and the show's new progress
+        const response = await fetch(`/api/tv/${tvId}/episodes`, {
+            method: 'PATCH',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify(episodeData)
+            body: JSON.stringify({ ...selection, set: changes })
         });
         
         if (!response.ok) {
             const error = await response.json();
-            throw new Error(error.error || 'Failed to update episode');
+            throw new Error(error.error || 'Failed to update episodes');
         }
         
-        // Fetch updated TV show
-        const tvResponse = await fetch(`/api/tv/${tvId}`);
-        const updatedTvShow = await tvResponse.json();
+        const result = await response.json();
         
         // Update local data
-        const index = tvShows.findIndex(t => t.id === tvId);
-        if (index !== -1) {
-            tvShows[index] = updatedTvShow;
+        const tvShow = tvShowCache.get(tvId);
+        if (tvShow) {
+            const updatedTvShow = {
+                ...tvShow,
+                watched_episodes: result.watched_episodes,
+                total_episodes: result.total_episodes,
+                progress: result.progress,
+                seasons: result.seasons
+            };
+            if (tvShow.episodes) {
+                const changed = new Map(result.episodes.map(episode => [episode.id, episode]));
+                updatedTvShow.episodes = tvShow.episodes.map(episode => changed.get(episode.id) || episode);
+            }
+            storeTvShow(updatedTvShow);
         }
         
         // Re-render
@@ -563,10 +688,15 @@ async function updateEpisode(tvId, episodeId, episodeData) {
             renderTvShowDetails(tvId);
         }
         
-        showToast('Episode updated successfully');
+        showToast(message);
     } catch (error) {
-        console.error('Error updating episode:', error);
+        console.error('Error updating episodes:', error);
         showToast(error.message, 'error');
+        
+        // The checkboxes may no longer match the server
+        if (currentTvShowId === tvId && tvDetailsModal.style.display === 'flex') {
+            renderTvShowDetails(tvId);
+        }
     }
 }
 
@@ -587,23 +717,7 @@ async function deleteTvShow(tvId) {
         
         // Update local data
         tvShows = tvShows.filter(t => t.id !== tvId);
-        
-        // Re-extract genres and years
-        tvGenres = new Set();
-        tvYears = new Set();
-        
-        tvShows.forEach(show => {
-            if (show.genre) {
-                show.genre.split(',').forEach(genre => {
-                    tvGenres.add(genre.trim());
-                });
-            }
-            if (show.year) {
-                tvYears.add(show.year);
-            }
-        });
-        
-        populateTvFilters();
+        tvShowCache.delete(tvId);
         
         // Close modal if open
         tvDetailsModal.style.display = 'none';
@@ -611,7 +725,8 @@ async function deleteTvShow(tvId) {
         // Re-render
         renderTvShows();
         updateDashboard();
-        renderWatchLater();
+        fetchWatchLater();
+        fetchFacets();
         
         showToast('TV show deleted successfully');
     } catch (error) {
@@ -648,60 +763,31 @@ async function searchOMDB() {
 function renderMovies() {
     if (!movieGrid) return;
     
-    // Apply filters
-    const searchTerm = movieSearch.value.toLowerCase();
-    const genreFilter = movieGenreFilter.value;
-    const yearFilter = movieYearFilter.value ? parseInt(movieYearFilter.value) : null;
-    const watchedFilter = movieWatchedFilter.value;
-    
-    const filteredMovies = movies.filter(movie => {
-        // Search filter
-        if (searchTerm && !movie.title.toLowerCase().includes(searchTerm)) {
-            return false;
-        }
-        
-        // Genre filter
-        if (genreFilter && (!movie.genre || !movie.genre.toLowerCase().includes(genreFilter.toLowerCase()))) {
-            return false;
-        }
-        
-        // Year filter
-        if (yearFilter && movie.year !== yearFilter) {
-            return false;
-        }
-        
-        // Watched filter
-        if (watchedFilter === 'true' && !movie.watched) {
-            return false;
-        } else if (watchedFilter === 'false' && movie.watched) {
-            return false;
-        }
-        
-        return true;
-    });
-    
-    // Sort by title
-    filteredMovies.sort((a, b) => a.title.localeCompare(b.title));
-    
-    // Render
     movieGrid.innerHTML = '';
+    appendMovieCards(movies);
+}
+
+function appendMovieCards(items) {
+    if (!movieGrid) return;
     
-    if (filteredMovies.length === 0) {
-        movieGrid.innerHTML = '<p class="no-results">No movies found</p>';
+    if (movies.length === 0) {
+        if (moviePager.done) {
+            movieGrid.innerHTML = '<p class="no-results">No movies found</p>';
+        }
         return;
     }
     
-    filteredMovies.forEach(movie => {
+    // Filtering and sorting happen server-side; cards arrive in page order
+    items.forEach(movie => {
         const card = document.createElement('div');
         card.className = 'media-card';
         card.dataset.id = movie.id;
         
-        const posterUrl = movie.poster_url && movie.poster_url !== 'N/A' 
-            ? movie.poster_url 
-            : 'https://via.placeholder.com/300x450?text=No+Poster';
+        const posterUrl = posterSrc(movie);
+        const posterUrl2x = posterSrc(movie, POSTER_WIDTH * 2);
         
         card.innerHTML = `
-            <img src="${posterUrl}" alt="${movie.title}">
+            <img src="${posterUrl}" srcset="${posterUrl2x} 2x" alt="${movie.title}" loading="lazy">
             <div class="media-info">
                 <h3 class="media-title">${movie.title}</h3>
                 <div class="media-meta">
@@ -723,52 +809,31 @@ function renderMovies() {
 function renderTvShows() {
     if (!tvShowsGrid) return;
     
-    // Apply filters
-    const searchTerm = tvSearch.value.toLowerCase();
-    const genreFilter = tvGenreFilter.value;
-    const yearFilter = tvYearFilter.value ? parseInt(tvYearFilter.value) : null;
-    
-    const filteredTvShows = tvShows.filter(show => {
-        // Search filter
-        if (searchTerm && !show.title.toLowerCase().includes(searchTerm)) {
-            return false;
-        }
-        
-        // Genre filter
-        if (genreFilter && (!show.genre || !show.genre.toLowerCase().includes(genreFilter.toLowerCase()))) {
-            return false;
-        }
-        
-        // Year filter
-        if (yearFilter && show.year !== yearFilter) {
-            return false;
-        }
-        
-        return true;
-    });
-    
-    // Sort by title
-    filteredTvShows.sort((a, b) => a.title.localeCompare(b.title));
-    
-    // Render
     tvShowsGrid.innerHTML = '';
+    appendTvShowCards(tvShows);
+}
+
+function appendTvShowCards(items) {
+    if (!tvShowsGrid) return;
     
-    if (filteredTvShows.length === 0) {
-        tvShowsGrid.innerHTML = '<p class="no-results">No TV shows found</p>';
+    if (tvShows.length === 0) {
+        if (tvPager.done) {
+            tvShowsGrid.innerHTML = '<p class="no-results">No TV shows found</p>';
+        }
         return;
     }
     
-    filteredTvShows.forEach(show => {
+    // Filtering and sorting happen server-side; cards arrive in page order
+    items.forEach(show => {
         const card = document.createElement('div');
         card.className = 'media-card';
         card.dataset.id = show.id;
         
-        const posterUrl = show.poster_url && show.poster_url !== 'N/A' 
-            ? show.poster_url 
-            : 'https://via.placeholder.com/300x450?text=No+Poster';
+        const posterUrl = posterSrc(show);
+        const posterUrl2x = posterSrc(show, POSTER_WIDTH * 2);
         
         card.innerHTML = `
-            <img src="${posterUrl}" alt="${show.title}">
+            <img src="${posterUrl}" srcset="${posterUrl2x} 2x" alt="${show.title}" loading="lazy">
             <div class="media-info">
                 <h3 class="media-title">${show.title}</h3>
                 <div class="media-meta">
@@ -789,58 +854,27 @@ function renderTvShows() {
     });
 }
 
-function renderWatchLater() {
+function appendWatchLaterCards(items) {
     if (!watchLaterGrid) return;
     
-    // Get all watch later items
-    const watchLaterMovies = movies.filter(movie => movie.watch_later);
-    const watchLaterTvShows = tvShows.filter(show => show.watch_later);
-    
-    // Apply filters
-    const searchTerm = watchLaterSearch.value.toLowerCase();
-    const typeFilter = watchLaterTypeFilter.value;
-    
-    let filteredItems = [];
-    
-    if (typeFilter === '' || typeFilter === 'movie') {
-        filteredItems = filteredItems.concat(
-            watchLaterMovies.filter(movie => 
-                !searchTerm || movie.title.toLowerCase().includes(searchTerm)
-            ).map(movie => ({...movie, type: 'movie'}))
-        );
-    }
-    
-    if (typeFilter === '' || typeFilter === 'tv') {
-        filteredItems = filteredItems.concat(
-            watchLaterTvShows.filter(show => 
-                !searchTerm || show.title.toLowerCase().includes(searchTerm)
-            ).map(show => ({...show, type: 'tv'}))
-        );
-    }
-    
-    // Sort by title
-    filteredItems.sort((a, b) => a.title.localeCompare(b.title));
-    
-    // Render
-    watchLaterGrid.innerHTML = '';
-    
-    if (filteredItems.length === 0) {
-        watchLaterGrid.innerHTML = '<p class="no-results">No items in watch later list</p>';
+    if (watchLaterItems.length === 0) {
+        if (watchLaterPager.done) {
+            watchLaterGrid.innerHTML = '<p class="no-results">No items in watch later list</p>';
+        }
         return;
     }
     
-    filteredItems.forEach(item => {
+    items.forEach(item => {
         const card = document.createElement('div');
         card.className = 'media-card';
         card.dataset.id = item.id;
         card.dataset.type = item.type;
         
-        const posterUrl = item.poster_url && item.poster_url !== 'N/A' 
-            ? item.poster_url 
-            : 'https://via.placeholder.com/300x450?text=No+Poster';
+        const posterUrl = posterSrc(item);
+        const posterUrl2x = posterSrc(item, POSTER_WIDTH * 2);
         
         card.innerHTML = `
-            <img src="${posterUrl}" alt="${item.title}">
+            <img src="${posterUrl}" srcset="${posterUrl2x} 2x" alt="${item.title}" loading="lazy">
             <div class="media-info">
                 <h3 class="media-title">${item.title}</h3>
                 <div class="media-meta">
@@ -883,7 +917,7 @@ function renderSearchResults(results) {
         
         const posterUrl = item.Poster && item.Poster !== 'N/A' 
             ? item.Poster 
-            : 'https://via.placeholder.com/300x450?text=No+Poster';
+            : placeholderSrc(item.Title);
         
         card.innerHTML = `
             <img src="${posterUrl}" alt="${item.Title}">
@@ -940,7 +974,7 @@ function showOMDBDetails(details) {
     
     const posterUrl = details.Poster && details.Poster !== 'N/A' 
         ? details.Poster 
-        : 'https://via.placeholder.com/300x450?text=No+Poster';
+        : placeholderSrc(details.Title);
     
     modalContent.innerHTML = `
         <div class="modal-header">
@@ -991,7 +1025,7 @@ function addToCollection(item) {
     
     if (type === 'movie') {
         // Check if movie already exists
-        const existingMovie = movies.find(m => m.imdb_id === item.imdbID);
+        const existingMovie = [...movieCache.values()].find(m => m.imdb_id === item.imdbID);
         if (existingMovie) {
             showToast('Movie already in your collection', 'info');
             return;
@@ -1015,7 +1049,7 @@ function addToCollection(item) {
         addMovie(movieData);
     } else if (type === 'series') {
         // Check if TV show already exists
-        const existingShow = tvShows.find(s => s.imdb_id === item.imdbID);
+        const existingShow = [...tvShowCache.values()].find(s => s.imdb_id === item.imdbID);
         if (existingShow) {
             showToast('TV show already in your collection', 'info');
             return;
@@ -1030,7 +1064,9 @@ function addToCollection(item) {
             poster_url: item.Poster,
             plot: item.Plot,
             imdb_id: item.imdbID,
-            total_episodes: item.totalSeasons ? parseInt(item.totalSeasons) * 10 : 10, // Estimate
+            // Real per-season counts from OMDB, with an estimate if they are unavailable
+            seasons: 'omdb',
+            total_episodes: item.totalSeasons ? parseInt(item.totalSeasons) * 10 : 10,
             rating: item.imdbRating ? parseFloat(item.imdbRating) : null,
             watch_later: true
         };
@@ -1040,39 +1076,40 @@ function addToCollection(item) {
     }
 }
 
-function updateDashboard() {
-    // Update counts
-    document.getElementById('movie-count').textContent = movies.length;
-    document.getElementById('tv-count').textContent = tvShows.length;
-    
-    const watchedMovies = movies.filter(movie => movie.watched).length;
-    const watchedEpisodes = tvShows.reduce((total, show) => {
-        return total + show.episodes.filter(episode => episode.watched).length;
-    }, 0);
-    document.getElementById('watched-count').textContent = watchedMovies + watchedEpisodes;
+async function updateDashboard() {
+    // Totals and the newest titles come precomputed from /api/stats, so the
+    // dashboard never depends on which grid pages happen to be loaded
+    let stats;
+    try {
+        const response = await fetch('/api/stats', REVALIDATE);
+        if (!response.ok) {
+            throw new Error('Failed to load dashboard');
+        }
+        stats = await response.json();
+    } catch (error) {
+        console.error('Error fetching dashboard:', error);
+        showToast('Failed to load dashboard', 'error');
+        return;
+    }
     
-    const watchLaterCount = movies.filter(movie => movie.watch_later).length + 
-                           tvShows.filter(show => show.watch_later).length;
-    document.getElementById('watch-later-count').textContent = watchLaterCount;
+    // Update counts
+    document.getElementById('movie-count').textContent = stats.movie_count;
+    document.getElementById('tv-count').textContent = stats.tv_count;
+    document.getElementById('watched-count').textContent = stats.watched_count;
+    document.getElementById('watch-later-count').textContent = stats.watch_later_count;
+    
+    // Recent items arrive newest first, movies and TV shows already merged
+    const recentItems = stats.recent;
+    recentItems.forEach(({type, ...record}) => {
+        if (type === 'movie') {
+            movieCache.set(record.id, record);
+        } else {
+            cacheTvShow(record);
+        }
+    });
     
     // Render recent items
     if (recentItemsGrid) {
-        // Combine movies and TV shows, sort by created_at
-        const allItems = [
-            ...movies.map(movie => ({...movie, type: 'movie'})),
-            ...tvShows.map(show => ({...show, type: 'tv'}))
-        ];
-        
-        // Sort by created_at (newest first)
-        allItems.sort((a, b) => {
-            const dateA = new Date(a.created_at);
-            const dateB = new Date(b.created_at);
-            return dateB - dateA;
-        });
-        
-        // Take the 6 most recent items
-        const recentItems = allItems.slice(0, 6);
-        
         recentItemsGrid.innerHTML = '';
         
         if (recentItems.length === 0) {
@@ -1086,12 +1123,11 @@ function updateDashboard() {
             card.dataset.id = item.id;
             card.dataset.type = item.type;
             
-            const posterUrl = item.poster_url && item.poster_url !== 'N/A' 
-                ? item.poster_url 
-                : 'https://via.placeholder.com/300x450?text=No+Poster';
+            const posterUrl = posterSrc(item);
+            const posterUrl2x = posterSrc(item, POSTER_WIDTH * 2);
             
             card.innerHTML = `
-                <img src="${posterUrl}" alt="${item.title}">
+                <img src="${posterUrl}" srcset="${posterUrl2x} 2x" alt="${item.title}">
                 <div class="media-info">
                     <h3 class="media-title">${item.title}</h3>
                     <div class="media-meta">
@@ -1121,56 +1157,123 @@ function updateDashboard() {
 }
 
 // Filter Functions
-function populateMovieFilters() {
-    // Genres
-    movieGenreFilter.innerHTML = '<option value="">All Genres</option>';
-    [...movieGenres].sort().forEach(genre => {
-        const option = document.createElement('option');
-        option.value = genre;
-        option.textContent = genre;
-        movieGenreFilter.appendChild(option);
-    });
+async function fetchFacets() {
+    try {
+        const response = await fetch('/api/facets', REVALIDATE);
+        if (!response.ok) {
+            throw new Error('Failed to load filters');
+        }
+        const facets = await response.json();
+        movieFacets = facets.movies;
+        tvFacets = facets.tv_shows;
+    } catch (error) {
+        console.error('Error fetching facets:', error);
+        return;
+    }
     
-    // Years
-    movieYearFilter.innerHTML = '<option value="">All Years</option>';
-    [...movieYears].sort((a, b) => b - a).forEach(year => {
+    populateMovieFilters();
+    populateTvFilters();
+}
+
+function populateFilterOptions(select, allLabel, options) {
+    // Rebuilding the options must not reset the active selection
+    const selected = select.value;
+    
+    select.innerHTML = `<option value="">${allLabel}</option>`;
+    if (selected && !options.some(option => String(option.value) === selected)) {
+        // Keep an active filter that no longer matches anything
+        options = [{ value: selected, count: 0 }, ...options];
+    }
+    options.forEach(({ value, count }) => {
         const option = document.createElement('option');
-        option.value = year;
-        option.textContent = year;
-        movieYearFilter.appendChild(option);
+        option.value = value;
+        option.textContent = `${value} (${count})`;
+        select.appendChild(option);
     });
+    
+    select.value = selected;
+}
+
+function populateMovieFilters() {
+    // Genres arrive sorted by name and years newest first
+    populateFilterOptions(movieGenreFilter, 'All Genres',
+        movieFacets.genres.map(genre => ({ value: genre.name, count: genre.count })));
+    populateFilterOptions(movieYearFilter, 'All Years',
+        movieFacets.years.map(year => ({ value: year.year, count: year.count })));
 }
 
 function populateTvFilters() {
-    // Genres
-    tvGenreFilter.innerHTML = '<option value="">All Genres</option>';
-    [...tvGenres].sort().forEach(genre => {
-        const option = document.createElement('option');
-        option.value = genre;
-        option.textContent = genre;
-        tvGenreFilter.appendChild(option);
-    });
+    populateFilterOptions(tvGenreFilter, 'All Genres',
+        tvFacets.genres.map(genre => ({ value: genre.name, count: genre.count })));
+    populateFilterOptions(tvYearFilter, 'All Years',
+        tvFacets.years.map(year => ({ value: year.year, count: year.count })));
+}
+
+function buildMovieQuery() {
+    const params = new URLSearchParams();
+    const searchTerm = movieSearch.value.trim();
     
-    // Years
-    tvYearFilter.innerHTML = '<option value="">All Years</option>';
-    [...tvYears].sort((a, b) => b - a).forEach(year => {
-        const option = document.createElement('option');
-        option.value = year;
-        option.textContent = year;
-        tvYearFilter.appendChild(option);
-    });
+    if (searchTerm) {
+        params.set('search', searchTerm);
+    }
+    if (movieGenreFilter.value) {
+        params.set('genre', movieGenreFilter.value);
+    }
+    if (movieYearFilter.value) {
+        params.set('year', movieYearFilter.value);
+    }
+    if (movieWatchedFilter.value) {
+        params.set('watched', movieWatchedFilter.value);
+    }
+    params.set('sort', sortFor(movieSortFilter, searchTerm));
+    
+    return params;
+}
+
+function buildTvQuery() {
+    const params = new URLSearchParams();
+    const searchTerm = tvSearch.value.trim();
+    
+    if (searchTerm) {
+        params.set('search', searchTerm);
+    }
+    if (tvGenreFilter.value) {
+        params.set('genre', tvGenreFilter.value);
+    }
+    if (tvYearFilter.value) {
+        params.set('year', tvYearFilter.value);
+    }
+    params.set('sort', sortFor(tvSortFilter, searchTerm));
+    
+    return params;
+}
+
+function preferBestMatch(searchInput, sortSelect) {
+    // Searching switches a default title sort to ranked results and back
+    const searching = searchInput.value.trim() !== '';
+    if (searching && sortSelect.value === 'title') {
+        sortSelect.value = 'relevance';
+    } else if (!searching && sortSelect.value === 'relevance') {
+        sortSelect.value = 'title';
+    }
+}
+
+function sortFor(sortSelect, searchTerm) {
+    // Best Match needs a search term to rank by
+    const sort = sortSelect.value || 'title';
+    return sort === 'relevance' && !searchTerm ? 'title' : sort;
 }
 
 function filterMovies() {
-    renderMovies();
+    fetchMovies();
 }
 
 function filterTvShows() {
-    renderTvShows();
+    fetchTvShows();
 }
 
 function filterWatchLater() {
-    renderWatchLater();
+    fetchWatchLater();
 }
 
 // Form Handling
@@ -1199,6 +1302,7 @@ function resetTvForm() {
     document.getElementById('tv-poster').value = '';
     document.getElementById('tv-plot').value = '';
     document.getElementById('tv-total-episodes').value = '';
+    document.getElementById('tv-seasons').value = '';
     document.getElementById('tv-rating').value = '';
     document.getElementById('tv-watch-later').checked = false;
     document.getElementById('tv-notes').value = '';
@@ -1252,6 +1356,13 @@ function handleTvFormSubmit(e) {
         notes: document.getElementById('tv-notes').value
     };
     
+    // An optional per-season layout such as "10, 12, 8" takes precedence
+    const seasons = parseSeasonLayout(document.getElementById('tv-seasons').value);
+    if (seasons) {
+        tvData.seasons = seasons;
+        tvData.total_episodes = seasons.reduce((sum, count) => sum + count, 0);
+    }
+    
     if (tvId) {
         // Update existing TV show
         updateTvShow(parseInt(tvId), tvData);
@@ -1264,9 +1375,17 @@ function handleTvFormSubmit(e) {
     tvModal.style.display = 'none';
 }
 
+function parseSeasonLayout(value) {
+    const counts = value.split(',').map(part => part.trim()).filter(part => part !== '');
+    if (counts.length === 0 || counts.some(part => !/^\d+$/.test(part))) {
+        return null;
+    }
+    return counts.map(part => parseInt(part));
+}
+
 // Detail Views
 function showMovieDetails(movieId) {
-    const movie = movies.find(m => m.id === movieId);
+    const movie = movieCache.get(movieId);
     if (!movie) return;
     
     currentMovieId = movieId;
@@ -1280,9 +1399,7 @@ function showMovieDetails(movieId) {
     document.getElementById('movie-details-plot').textContent = movie.plot || 'No plot available';
     document.getElementById('movie-details-notes').textContent = movie.notes || 'No notes';
     
-    const posterUrl = movie.poster_url && movie.poster_url !== 'N/A' 
-        ? movie.poster_url 
-        : 'https://via.placeholder.com/300x450?text=No+Poster';
+    const posterUrl = posterSrc(movie, POSTER_WIDTH * 2);
     document.getElementById('movie-details-poster').src = posterUrl;
     
     // Show/hide watched badge
@@ -1305,12 +1422,26 @@ function showMovieDetails(movieId) {
     movieDetailsModal.style.display = 'flex';
 }
 
-function showTvShowDetails(tvId) {
-    const tvShow = tvShows.find(t => t.id === tvId);
+async function showTvShowDetails(tvId) {
+    const tvShow = tvShowCache.get(tvId);
     if (!tvShow) return;
     
     currentTvShowId = tvId;
     
+    // The list endpoint omits episodes, so load them for this show only
+    if (!tvShow.episodes) {
+        try {
+            const response = await fetch(`/api/tv/${tvId}`, REVALIDATE);
+            const detailedTvShow = await response.json();
+            
+            storeTvShow(detailedTvShow);
+        } catch (error) {
+            console.error('Error fetching TV show:', error);
+            showToast('Failed to load episodes', 'error');
+            return;
+        }
+    }
+    
     renderTvShowDetails(tvId);
     
     // Show modal
@@ -1318,7 +1449,7 @@ function showTvShowDetails(tvId) {
 }
 
 function renderTvShowDetails(tvId) {
-    const tvShow = tvShows.find(t => t.id === tvId);
+    const tvShow = tvShowCache.get(tvId);
     if (!tvShow) return;
     
     // Populate TV show details
@@ -1333,9 +1464,7 @@ function renderTvShowDetails(tvId) {
     // Update progress bar
     document.getElementById('tv-details-progress-bar').style.width = `${tvShow.progress}%`;
     
-    const posterUrl = tvShow.poster_url && tvShow.poster_url !== 'N/A' 
-        ? tvShow.poster_url 
-        : 'https://via.placeholder.com/300x450?text=No+Poster';
+    const posterUrl = posterSrc(tvShow, POSTER_WIDTH * 2);
     document.getElementById('tv-details-poster').src = posterUrl;
     
     // Render episodes
@@ -1355,7 +1484,28 @@ function renderTvShowDetails(tvId) {
         return a.episode_number - b.episode_number;
     });
     
+    let currentSeason = null;
     sortedEpisodes.forEach(episode => {
+        // Season headers carry the "mark season watched" action
+        if (episode.season !== currentSeason) {
+            currentSeason = episode.season;
+            const season = episode.season;
+            const seasonHeader = document.createElement('div');
+            seasonHeader.className = 'season-header';
+            const counts = (tvShow.seasons || []).find(s => s.season === season);
+            seasonHeader.innerHTML = `
+                <span>Season ${season ?? '?'}${counts ? ` &middot; ${counts.watched_count}/${counts.episode_count} watched` : ''}</span>
+                ${season !== null ? '<button class="secondary-btn season-watched-btn">Mark season watched</button>' : ''}
+            `;
+            const seasonButton = seasonHeader.querySelector('.season-watched-btn');
+            if (seasonButton) {
+                seasonButton.addEventListener('click', () => {
+                    updateEpisodes(tvShow.id, { season }, { watched: true }, `Season ${season} marked as watched`);
+                });
+            }
+            episodesList.appendChild(seasonHeader);
+        }
+        
         const episodeItem = document.createElement('div');
         episodeItem.className = `episode-item ${episode.watched ? 'watched' : ''}`;
         episodeItem.dataset.id = episode.id;
@@ -1367,14 +1517,22 @@ function renderTvShowDetails(tvId) {
                 <input type="checkbox" id="episode-${episode.id}" ${episode.watched ? 'checked' : ''}>
                 <label for="episode-${episode.id}">Watched</label>
             </div>
+            <button class="episode-up-to-btn" title="Mark everything up to here as watched">
+                <i class="fas fa-check-double"></i> Up to here
+            </button>
         `;
         
         // Add event listener to checkbox
         const checkbox = episodeItem.querySelector(`#episode-${episode.id}`);
         checkbox.addEventListener('change', () => {
-            updateEpisode(tvShow.id, episode.id, {
+            updateEpisodes(tvShow.id, { ids: [episode.id] }, {
                 watched: checkbox.checked
-            });
+            }, 'Episode updated successfully');
+        });
+        
+        episodeItem.querySelector('.episode-up-to-btn').addEventListener('click', () => {
+            updateEpisodes(tvShow.id, { up_to: episode.id }, { watched: true },
+                `Marked up to S${episode.season} E${episode.episode_number} as watched`);
         });
         
         episodesList.appendChild(episodeItem);
@@ -1382,7 +1540,7 @@ function renderTvShowDetails(tvId) {
 }
 
 function editMovie() {
-    const movie = movies.find(m => m.id === currentMovieId);
+    const movie = movieCache.get(currentMovieId);
     if (!movie) return;
     
     // Populate form
@@ -1408,7 +1566,7 @@ function editMovie() {
 }
 
 function toggleMovieWatched() {
-    const movie = movies.find(m => m.id === currentMovieId);
+    const movie = movieCache.get(currentMovieId);
     if (!movie) return;
     
     updateMovie(currentMovieId, {
@@ -1421,98 +1579,306 @@ function toggleMovieWatched() {
 
 // Data Export/Import
 function exportData() {
-    const data = {
-        movies,
-        tvShows,
-        exportDate: new Date().toISOString()
-    };
-    
-    const dataStr = JSON.stringify(data, null, 2);
-    const dataUri = 'data:application/json;charset=utf-8,'+ encodeURIComponent(dataStr);
-    
-    const exportFileDefaultName = `cinemate-export-${new Date().toISOString().slice(0, 10)}.json`;
-    
+    // The server streams the export straight into the download, so the
+    // collection never has to be loaded into the page
     const linkElement = document.createElement('a');
-    linkElement.setAttribute('href', dataUri);
-    linkElement.setAttribute('download', exportFileDefaultName);
+    linkElement.setAttribute('href', '/api/export?format=json');
+    linkElement.setAttribute('download', '');
     linkElement.click();
     
-    showToast('Data exported successfully');
+    showToast('Export started');
 }
 
-function importData(e) {
+async function importData(e) {
     const file = e.target.files[0];
     if (!file) return;
     
-    const reader = new FileReader();
-    reader.onload = async function(e) {
+    // Confirm import
+    if (!confirm(`Import ${file.name}? Titles already in your collection will be updated.`)) {
+        e.target.value = '';
+        return;
+    }
+    
+    try {
+        showToast('Importing...', 'info');
+        
+        // The server parses the file as it streams in, so send it as-is.
+        // Gzipped files are recognised by the server from their contents.
+        const isJsonLines = /\.(jsonl|ndjson)(\.gz)?$/i.test(file.name);
+        const response = await fetch('/api/import?report=summary', {
+            method: 'POST',
+            headers: {
+                'Content-Type': isJsonLines ? 'application/x-ndjson' : 'application/json'
+            },
+            body: file
+        });
+        const report = await response.json();
+        
+        if (!response.ok) {
+            throw new Error(report.error || 'Invalid import file format');
+        }
+        
+        // Reload every view from the server
+        refreshViews();
+        syncLibrary();
+        
+        const imported = report.movies.created + report.movies.updated +
+                         report.tv_shows.created + report.tv_shows.updated;
+        const failed = report.movies.failed + report.tv_shows.failed;
+        if (failed > 0) {
+            showToast(`Imported ${imported} titles, ${failed} failed`, 'info');
+        } else {
+            showToast(`Imported ${imported} titles successfully`);
+        }
+    } catch (error) {
+        console.error('Import error:', error);
+        showToast('Failed to import data: ' + error.message, 'error');
+    }
+    
+    // Reset file input
+    e.target.value = '';
+}
+
+// Library Snapshot
+async function startLibrarySync() {
+    library.db = await openLibraryStore();
+    await loadLibrarySnapshot();
+    await syncLibrary();
+    
+    // Pick up edits made on other devices when the app comes back into view
+    document.addEventListener('visibilitychange', async () => {
+        if (document.visibilityState === 'visible' && await syncLibrary()) {
+            refreshViews();
+        }
+    });
+}
+
+function openLibraryStore() {
+    return new Promise(resolve => {
+        if (!window.indexedDB) {
+            resolve(null);
+            return;
+        }
+        const request = indexedDB.open(LIBRARY_DB, 1);
+        request.onupgradeneeded = () => {
+            const store = request.result;
+            store.createObjectStore('movies', { keyPath: 'id' });
+            store.createObjectStore('tv_shows', { keyPath: 'id' });
+            store.createObjectStore('meta');
+        };
+        request.onsuccess = () => resolve(request.result);
+        // Private browsing and similar: keep the snapshot in memory only
+        request.onerror = () => resolve(null);
+    });
+}
+
+function loadLibrarySnapshot() {
+    if (!library.db) return Promise.resolve();
+    return new Promise(resolve => {
+        const transaction = library.db.transaction(['movies', 'tv_shows', 'meta'], 'readonly');
+        transaction.objectStore('movies').getAll().onsuccess = e => {
+            e.target.result.forEach(movie => {
+                if (!movieCache.has(movie.id)) movieCache.set(movie.id, movie);
+            });
+        };
+        transaction.objectStore('tv_shows').getAll().onsuccess = e => {
+            e.target.result.forEach(show => {
+                if (!tvShowCache.has(show.id)) cacheTvShow(show);
+            });
+        };
+        transaction.objectStore('meta').get('token').onsuccess = e => {
+            library.token = e.target.result || null;
+        };
+        transaction.oncomplete = () => resolve();
+        transaction.onerror = () => resolve();
+    });
+}
+
+function syncLibrary() {
+    // Concurrent callers share the sync that is already running
+    if (!library.syncing) {
+        library.syncing = pullLibraryChanges().finally(() => {
+            library.syncing = null;
+        });
+    }
+    return library.syncing;
+}
+
+async function pullLibraryChanges() {
+    let changed = false;
+    try {
+        let more = true;
+        while (more) {
+            const params = new URLSearchParams({ limit: SYNC_PAGE_SIZE });
+            if (library.token) {
+                params.set('since', library.token);
+            }
+            const response = await fetch(`/api/sync?${params}`);
+            if (!response.ok) {
+                throw new Error('Failed to sync library');
+            }
+            const delta = await response.json();
+            changed = applyLibraryDelta(delta) || changed;
+            await saveLibraryDelta(delta);
+            library.token = delta.token;
+            more = delta.more;
+        }
+    } catch (error) {
+        console.error('Error syncing library:', error);
+    }
+    return changed;
+}
+
+function applyLibraryDelta(delta) {
+    // On a reset the stored snapshot is rebuilt (see saveLibraryDelta); the
+    // caches also hold fresh grid items, so they are updated in place
+    delta.movies.forEach(movie => {
+        movieCache.set(movie.id, movie);
+        const index = movies.findIndex(m => m.id === movie.id);
+        if (index !== -1) {
+            movies[index] = movie;
+        }
+    });
+    // Synced shows come without episodes, which are loaded again when opened
+    delta.tv_shows.forEach(storeTvShow);
+    delta.deleted.movies.forEach(id => movieCache.delete(id));
+    delta.deleted.tv_shows.forEach(id => tvShowCache.delete(id));
+    
+    return !delta.reset && (delta.movies.length + delta.tv_shows.length +
+                            delta.deleted.movies.length + delta.deleted.tv_shows.length) > 0;
+}
+
+function saveLibraryDelta(delta) {
+    if (!library.db) return Promise.resolve();
+    return new Promise(resolve => {
+        const transaction = library.db.transaction(['movies', 'tv_shows', 'meta'], 'readwrite');
+        const movieStore = transaction.objectStore('movies');
+        const showStore = transaction.objectStore('tv_shows');
+        if (delta.reset) {
+            movieStore.clear();
+            showStore.clear();
+        }
+        delta.movies.forEach(movie => movieStore.put(movie));
+        delta.tv_shows.forEach(show => showStore.put(show));
+        delta.deleted.movies.forEach(id => movieStore.delete(id));
+        delta.deleted.tv_shows.forEach(id => showStore.delete(id));
+        // The token is saved with the rows, so the two never disagree
+        transaction.objectStore('meta').put(delta.token, 'token');
+        transaction.oncomplete = () => resolve();
+        transaction.onerror = () => resolve();
+    });
+}
+
+function refreshViews() {
+    // Unchanged pages come back as 304s, see REVALIDATE
+    fetchMovies();
+    fetchTvShows();
+    fetchWatchLater();
+    updateDashboard();
+    fetchFacets();
+}
+
+async function watchJob(job) {
+    // OMDB details arrive in the background; show them once the job is done
+    for (let attempt = 0; attempt < JOB_POLL_ATTEMPTS; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
         try {
-            const data = JSON.parse(e.target.result);
-            
-            if (!data.movies || !data.tvShows) {
-                throw new Error('Invalid import file format');
+            const response = await fetch(`/api/jobs/${job.id}`);
+            if (!response.ok) {
+                return;
             }
-            
-            // Confirm import
-            if (!confirm(`Import ${data.movies.length} movies and ${data.tvShows.length} TV shows? This will replace your current collection.`)) {
+            const current = await response.json();
+            if (current.status === 'done') {
+                refreshViews();
+                syncLibrary();
+                return;
+            }
+            if (current.status === 'failed') {
+                showToast('Could not fetch details from OMDB', 'error');
                 return;
             }
-            
-            // TODO: Implement proper import via API
-            // For now, just replace the local data and refresh
-            movies = data.movies;
-            tvShows = data.tvShows;
-            
-            // Re-extract genres and years
-            movieGenres = new Set();
-            movieYears = new Set();
-            tvGenres = new Set();
-            tvYears = new Set();
-            
-            movies.forEach(movie => {
-                if (movie.genre) {
-                    movie.genre.split(',').forEach(genre => {
-                        movieGenres.add(genre.trim());
-                    });
-                }
-                if (movie.year) {
-                    movieYears.add(movie.year);
-                }
-            });
-            
-            tvShows.forEach(show => {
-                if (show.genre) {
-                    show.genre.split(',').forEach(genre => {
-                        tvGenres.add(genre.trim());
-                    });
-                }
-                if (show.year) {
-                    tvYears.add(show.year);
-                }
-            });
-            
-            // Update UI
-            populateMovieFilters();
-            populateTvFilters();
-            renderMovies();
-            renderTvShows();
-            updateDashboard();
-            renderWatchLater();
-            
-            showToast('Data imported successfully');
         } catch (error) {
-            console.error('Import error:', error);
-            showToast('Failed to import data: ' + error.message, 'error');
+            console.error('Error checking job:', error);
+            return;
         }
-        
-        // Reset file input
-        e.target.value = '';
+    }
+}
+
+function posterSrc(item, width = POSTER_WIDTH) {
+    // Library posters come through the local cache. v changes with the
+    // poster URL, so the browser can keep each version for good
+    if (item.imdb_id) {
+        return `/api/posters/${encodeURIComponent(item.imdb_id)}?w=${width}&v=${hashString(item.poster_url || '')}`;
+    }
+    if (item.poster_url && item.poster_url !== 'N/A') {
+        return item.poster_url;
+    }
+    return placeholderSrc(item.title, width);
+}
+
+function placeholderSrc(title, width = POSTER_WIDTH) {
+    return `/api/posters/placeholder?w=${width}&title=${encodeURIComponent(title || '')}`;
+}
+
+function hashString(value) {
+    // 32-bit FNV-1a; only used to version URLs
+    let hash = 0x811c9dc5;
+    for (let i = 0; i < value.length; i++) {
+        hash ^= value.charCodeAt(i);
+        hash = Math.imul(hash, 0x01000193);
+    }
+    return (hash >>> 0).toString(36);
+}
+
+// Utility Functions
+function cacheTvShow(show) {
+    tvShowCache.set(show.id, show);
+}
+
+function storeTvShow(show) {
+    // Replace a show everywhere it is held locally
+    cacheTvShow(show);
+    const index = tvShows.findIndex(t => t.id === show.id);
+    if (index !== -1) {
+        tvShows[index] = show;
+    }
+}
+
+function compareTitles(a, b) {
+    // Same ordering as the API's title sort: title, then id
+    if (a.title !== b.title) {
+        return a.title < b.title ? -1 : 1;
+    }
+    return a.id - b.id;
+}
+
+function debounce(callback, delay) {
+    let timer = null;
+    return (...args) => {
+        clearTimeout(timer);
+        timer = setTimeout(() => callback(...args), delay);
     };
+}
+
+function observeSentinel(sentinel, loadMore) {
+    if (!sentinel) return;
     
-    reader.readAsText(file);
+    // Load the next page shortly before the end of the grid scrolls into view
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadMore();
+        }
+    }, { rootMargin: '400px' });
+    observer.observe(sentinel);
+}
+
+function isSentinelVisible(sentinel) {
+    if (!sentinel || sentinel.offsetParent === null) return false;
+    
+    const rect = sentinel.getBoundingClientRect();
+    return rect.top < window.innerHeight + 400;
 }
 
-// Utility Functions
 function showToast(message, type = 'success') {
     const toastIcon = document.querySelector('.toast-icon');
     const toastMessage = document.querySelector('.toast-message');
@@ -0,0 +1,61 @@
+"""Database engine setup: SQLite pragmas and read-replica routing.
+
+Engine options themselves (pool sizes, timeouts) come from ``app.config``.
+:func:`configure_engines` runs once per app and sets up what cannot be
+passed as engine options:
+
+- SQLite connections switch to WAL, so readers and the single writer no
+  longer block each other, with ``synchronous=NORMAL`` (durable at every
+  checkpoint, and consistent after a crash) and a ``busy_timeout`` for
+  writers waiting on the lock.
+
+- With ``DATABASE_REPLICA_URL`` set, :class:`RoutingSession` sends the ORM
+  reads of GET and HEAD requests to the ``replica`` bind. Flushes, DML
+  statements and ``SELECT ... FOR UPDATE`` go to the primary, and once a
+  request has written, the rest of it reads from the primary as well, so
+  it sees its own changes. Work outside a request (jobs, scripts) and
+  direct ``db.engine`` use always hit the primary.
+"""
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA = 'replica'
+READ_METHODS = ('GET', 'HEAD')
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        if not has_request_context() or request.method not in READ_METHODS or g.get('primary_only'):
+            return False
+        if REPLICA not in self._db.engines:
+            return False
+        if self._flushing or isinstance(clause, UpdateBase) or getattr(clause, '_for_update_arg', None) is not None:
+            # Everything after the first write reads its own changes
+            g.primary_only = True
+            return False
+        return True
+
+
+def configure_engines(app, db):
+    """Install the SQLite pragmas from ``SQLITE_PRAGMAS`` on each SQLite engine of ``app``"""
+    pragmas = app.config['SQLITE_PRAGMAS']
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and pragmas:
+                event.listen(engine, 'connect', _pragma_setter(pragmas))
+
+
+def _pragma_setter(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return set_pragmas
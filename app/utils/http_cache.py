@@ -0,0 +1,58 @@
+"""ETag and Last-Modified validators for conditional GETs.
+
+Routes build an ETag from whatever identifies the state of a response,
+usually version counters from :mod:`app.services.versions`, and call
+:func:`not_modified` before doing any real work. When the client already
+holds that state it gets an empty 304 response; otherwise the route
+builds its response and passes it through :func:`with_validators`.
+
+``Cache-Control: no-cache`` lets browsers keep the response but makes them
+revalidate it on every use, which is exactly one cheap request per load.
+"""
+import hashlib
+from datetime import timezone
+
+from flask import current_app, request
+
+REVALIDATE = 'no-cache'
+
+
+def make_etag(*parts):
+    """A strong ETag value (unquoted) for the given parts"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def content_etag(data):
+    """A strong ETag value (unquoted) for a response body"""
+    return hashlib.sha1(data).hexdigest()
+
+
+def not_modified(etag, last_modified=None, cache_control=REVALIDATE):
+    """An empty 304 response if the client's copy is current, else None
+
+    ``If-None-Match`` wins over ``If-Modified-Since`` when both are sent, as
+    the HTTP spec requires; the date only has one-second resolution.
+    """
+    if request.if_none_match:
+        current = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        current = _http_date(last_modified) <= request.if_modified_since
+    else:
+        current = False
+    if not current:
+        return None
+    return with_validators(current_app.response_class(status=304), etag, last_modified, cache_control)
+
+
+def with_validators(response, etag, last_modified=None, cache_control=REVALIDATE):
+    """Set ETag, Last-Modified and Cache-Control on a response and return it"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _http_date(last_modified)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def _http_date(value):
+    # Stored timestamps are naive UTC; HTTP dates have whole seconds
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
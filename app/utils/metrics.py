@@ -0,0 +1,225 @@
+"""Request metrics in the Prometheus text format, Server-Timing and profiling.
+
+:func:`init_metrics` wraps every request of an app. Each request records,
+per endpoint (``request.endpoint``, so label values stay bounded), its
+latency, response size and the number and duration of its SQL queries.
+Its response carries a ``Server-Timing`` header splitting the time into
+``db``, ``omdb``, ``serialize`` and ``total``, which browser dev tools
+show next to the request. Every SQL statement is also timed by kind,
+inside requests or not, and the OMDB client reports its round trips and
+cache lookups here. ``GET /metrics`` renders it all with :func:`render`.
+
+Numbers are kept in the memory of each process: behind gunicorn every
+worker reports its own, and Prometheus adds them up across scrapes of all
+workers (``rate()`` and ``sum()`` work as usual).
+
+With ``PROFILE_REQUESTS`` enabled, a request sent with ``X-Profile: 1``
+runs under cProfile. The stats are written to ``PROFILE_DIR`` and the file
+name comes back in ``X-Profile-File``; open it with ``python -m pstats``.
+"""
+import cProfile
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Phases of a request reported in Server-Timing, besides the total
+PHASES = ('db', 'omdb', 'serialize')
+
+
+class Counter:
+    """A monotonically increasing count per label values"""
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *values, amount=1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram:
+    """Observations counted into cumulative ``le`` buckets per label values"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(values)
+            if state is None:
+                state = self._values[values] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for label_values, (counts, total) in sorted(values.items()):
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                yield f'{self.name}_bucket', {**labels, 'le': le}, cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time to build a response',
+                            LATENCY_BUCKETS, ('endpoint', 'method', 'status'))
+RESPONSE_BYTES = Histogram('http_response_size_bytes', 'Size of response bodies with a known length',
+                           SIZE_BUCKETS, ('endpoint',))
+REQUEST_QUERIES = Histogram('http_request_db_queries', 'SQL statements run per request',
+                            COUNT_BUCKETS, ('endpoint',))
+REQUEST_DB_SECONDS = Histogram('http_request_db_seconds', 'Time spent in SQL per request',
+                               LATENCY_BUCKETS, ('endpoint',))
+QUERY_SECONDS = Histogram('db_query_duration_seconds', 'Duration of SQL statements by kind',
+                          QUERY_BUCKETS, ('statement',))
+OMDB_SECONDS = Histogram('omdb_request_duration_seconds', 'Duration of OMDB API round trips',
+                         LATENCY_BUCKETS, ('outcome',))
+OMDB_LOOKUPS = Counter('omdb_cache_lookups_total', 'OMDB lookups by kind and cache result',
+                       ('kind', 'result'))
+
+REGISTRY = [REQUEST_SECONDS, RESPONSE_BYTES, REQUEST_QUERIES, REQUEST_DB_SECONDS, QUERY_SECONDS,
+            OMDB_SECONDS, OMDB_LOOKUPS]
+
+STATEMENT_KINDS = ('select', 'insert', 'update', 'delete', 'with')
+KEYWORD = re.compile(r'\s*(\w+)')
+
+
+def init_metrics(app, db):
+    """Record metrics for every request of ``app`` and every statement on its engines"""
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    profile_dir = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_started = time.perf_counter()
+        g.request_timings = dict.fromkeys(PHASES, 0.0)
+        g.request_queries = 0
+        if app.config['PROFILE_REQUESTS'] and request.headers.get('X-Profile') == '1':
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            response.headers['X-Profile-File'] = _dump_profile(profiler, profile_dir)
+
+        endpoint = request.endpoint or 'unmatched'
+        timings = g.request_timings
+        REQUEST_SECONDS.observe(elapsed, endpoint, request.method, str(response.status_code))
+        REQUEST_QUERIES.observe(g.request_queries, endpoint)
+        REQUEST_DB_SECONDS.observe(timings['db'], endpoint)
+        if response.content_length is not None:
+            RESPONSE_BYTES.observe(response.content_length, endpoint)
+
+        queries = g.request_queries
+        entries = [f'db;dur={timings["db"] * 1000:.1f};desc="{queries} {"query" if queries == 1 else "queries"}"']
+        entries += [f'{phase};dur={timings[phase] * 1000:.1f}' for phase in PHASES[1:] if timings[phase]]
+        entries.append(f'total;dur={elapsed * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(entries)
+        return response
+
+
+def add_time(phase, seconds):
+    """Add ``seconds`` to ``phase`` of the current request's Server-Timing, if in a request"""
+    if has_request_context():
+        timings = g.get('request_timings')
+        if timings is not None:
+            timings[phase] += seconds
+
+
+@contextmanager
+def timed(phase):
+    """Time the block as ``phase`` of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(phase, time.perf_counter() - start)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            if labels:
+                label_text = ','.join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+                lines.append(f'{name}{{{label_text}}} {_number(value)}')
+            else:
+                lines.append(f'{name} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.metrics_started
+    match = KEYWORD.match(statement)
+    keyword = match.group(1).lower() if match else ''
+    QUERY_SECONDS.observe(elapsed, keyword if keyword in STATEMENT_KINDS else 'other')
+    if has_request_context() and 'request_timings' in g:
+        g.request_timings['db'] += elapsed
+        g.request_queries += 1
+
+
+def _dump_profile(profiler, directory):
+    os.makedirs(directory, exist_ok=True)
+    name = f'{re.sub(r"[^A-Za-z0-9_.-]", "_", request.endpoint or "unmatched")}-{time.time():.6f}.prof'
+    profiler.dump_stats(os.path.join(directory, name))
+    return name
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
@@ -0,0 +1,119 @@
+"""Keyset pagination helpers shared by the collection list endpoints.
+
+Pages are ordered by ``(sort column, id)`` so that ordering is stable even
+when many rows share a title, year or rating. The cursor handed back to the
+client is an opaque, URL-safe token that encodes the sort and the position
+of the last row on the page; the next page continues strictly after it
+instead of using OFFSET, so deep pages cost the same as the first one.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+SORT_FIELDS = ('title', 'year', 'rating', 'created_at')
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class PaginationError(ValueError):
+    """Raised for malformed limit, sort or cursor parameters"""
+
+
+def parse_page_args(args, default_sort='title', sort_fields=SORT_FIELDS):
+    """Read ``limit``, ``sort`` and ``cursor`` from the request arguments
+
+    ``sort`` is one of ``sort_fields``, optionally prefixed with ``-`` for
+    descending order. Returns ``(limit, sort_field, descending, cursor)``.
+    """
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be at least 1')
+    limit = min(limit, MAX_LIMIT)
+
+    sort = args.get('sort') or default_sort
+    descending = sort.startswith('-')
+    sort_field = sort.lstrip('-')
+    if sort_field not in sort_fields:
+        raise PaginationError(f'sort must be one of: {", ".join(sort_fields)}')
+
+    cursor = None
+    if args.get('cursor'):
+        cursor = decode_cursor(args['cursor'], sort_field, descending)
+
+    return limit, sort_field, descending, cursor
+
+
+def encode_cursor(sort_field, descending, value, row_id):
+    """Build the opaque token pointing just after the given row"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort_field, descending, value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort_field, descending):
+    """Decode a cursor and check that it belongs to the requested sort"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor_sort, cursor_desc, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+    if cursor_sort != sort_field or cursor_desc != descending or not isinstance(row_id, int):
+        raise PaginationError('Cursor does not match the requested sort')
+
+    if sort_field == 'created_at' and value is not None:
+        try:
+            value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise PaginationError('Invalid cursor')
+
+    return value, row_id
+
+
+def paginate(query, model, sort_field, descending, limit, cursor, entity=lambda row: row):
+    """Apply keyset ordering to ``query`` and fetch one page
+
+    ``entity`` extracts the model instance from a result row, for queries
+    that add extra columns. Returns ``(rows, next_cursor)`` where
+    ``next_cursor`` is None on the last page. NULL sort values are ordered
+    after all other values in both directions.
+    """
+    column = getattr(model, sort_field)
+    id_column = model.id
+
+    if cursor is not None:
+        value, last_id = cursor
+        id_after = id_column < last_id if descending else id_column > last_id
+        if value is None:
+            # Already inside the trailing block of NULLs
+            query = query.filter(and_(column.is_(None), id_after))
+        else:
+            column_after = column < value if descending else column > value
+            query = query.filter(or_(
+                column_after,
+                and_(column == value, id_after),
+                column.is_(None)
+            ))
+
+    if descending:
+        query = query.order_by(column.is_(None), column.desc(), id_column.desc())
+    else:
+        query = query.order_by(column.is_(None), column.asc(), id_column.asc())
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = entity(rows[-1])
+        next_cursor = encode_cursor(sort_field, descending, getattr(last, sort_field), last.id)
+
+    return rows, next_cursor
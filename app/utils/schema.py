@@ -0,0 +1,122 @@
+"""In-place upgrades for databases created by older versions.
+
+``db.create_all()`` creates missing tables but never changes existing ones.
+:func:`upgrade_schema` runs after it and brings older tables up to date.
+Every step checks the live schema first, so it is safe to run repeatedly.
+:func:`init_schema` does both; production runs it once per deploy through
+``flask --app wsgi init-db``, not in every web process.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, delete, exists, func, inspect, select, text, update
+
+from app import db
+from app.models.models import Episode, Movie, TVShow
+from app.services.catalog import install_catalog
+from app.services.counters import rebuild_counters
+from app.services.genres import needs_backfill, rebuild_genres
+from app.services.search import install_search
+
+
+def init_schema():
+    """Create missing tables, then upgrade existing ones"""
+    db.create_all()
+    upgrade_schema()
+
+
+def upgrade_schema():
+    """Apply any pending upgrades to the current database"""
+    added = _add_missing_columns()
+    _add_missing_indexes()
+
+    # Stored counters start at zero and need one pass over the episodes
+    if ('tv_show', 'watched_episodes') in added:
+        rebuild_counters()
+
+    # Rows that predate change tracking count as changed when they were added
+    for model in (Movie, TVShow, Episode):
+        if (model.__tablename__, 'updated_at') in added:
+            _backfill_updated_at(model)
+
+    # Genre links are derived from the genre strings of existing titles
+    missing_genres = [model for model in (Movie, TVShow) if needs_backfill(model)]
+    if missing_genres:
+        rebuild_genres(missing_genres)
+
+    # Full-text index, filled from the existing titles when first created
+    install_search()
+    install_catalog()
+
+
+def _add_missing_columns():
+    """Add model columns that older tables lack; returns (table, column) pairs"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    dialect = db.engine.dialect
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            # New columns need a server default or NULLs to fill existing rows
+            spec = f'{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect)}'
+            if column.server_default is not None:
+                spec += f' DEFAULT {column.server_default.arg}'
+            if not column.nullable and column.server_default is not None:
+                spec += ' NOT NULL'
+            with db.engine.begin() as connection:
+                connection.execute(text(
+                    f'ALTER TABLE {dialect.identifier_preparer.quote(table.name)} ADD COLUMN {spec}'
+                ))
+            added.append((table.name, column.name))
+    return added
+
+
+def _backfill_updated_at(model):
+    now = datetime.utcnow()
+    value = func.coalesce(model.created_at, now) if hasattr(model, 'created_at') else now
+    with db.engine.begin() as connection:
+        connection.execute(update(model.__table__).where(model.updated_at.is_(None)).values(updated_at=value))
+
+
+def _add_missing_indexes():
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing = [index for index in table.indexes if index.name not in existing]
+        if not missing:
+            continue
+        with db.engine.begin() as connection:
+            if table is Episode.__table__ and 'uq_episode_position' not in existing:
+                _dedupe_episodes(connection)
+            for index in missing:
+                index.create(connection)
+
+
+def _dedupe_episodes(connection):
+    # The unique index needs every position to be set and to occur once.
+    # The lowest id of each position is kept, watched if any copy was.
+    table = Episode.__table__
+    other = table.alias('other')
+    connection.execute(update(table).where(table.c.season.is_(None)).values(season=1))
+    same_position = and_(
+        other.c.tv_show_id == table.c.tv_show_id,
+        other.c.season == table.c.season,
+        other.c.episode_number == table.c.episode_number,
+    )
+    connection.execute(
+        update(table)
+        .where(exists().where(same_position, other.c.watched.is_(True)))
+        .values(watched=True)
+    )
+    keep = (
+        select(func.min(table.c.id))
+        .group_by(table.c.tv_show_id, table.c.season, table.c.episode_number)
+    )
+    connection.execute(delete(table).where(table.c.id.not_in(keep)))
@@ -0,0 +1,123 @@
+"""Column-projected serialization for list responses.
+
+Loading ORM entities only to call ``to_dict()`` on them costs an identity
+map entry, attribute instrumentation and an ``isoformat()`` per row. List
+endpoints instead select just the columns a response needs, with
+:func:`project`, and turn the plain rows into dicts with :func:`serialize_rows`.
+The dicts have the same keys and values as ``to_dict()``.
+:func:`json_response` then encodes them with orjson when it is installed
+and with the standard library otherwise. Either way datetimes come out in
+``isoformat()`` form.
+
+Clients can ask for a sparse fieldset with ``fields=id,title,year``; only
+those columns are queried and sent.
+"""
+import json
+from datetime import datetime
+
+from flask import current_app
+
+from app.models.models import Episode, Movie, TVShow
+from app.utils.metrics import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+# Fields of each model's to_dict(), in order
+FIELDS = {
+    Movie: ('id', 'title', 'year', 'genre', 'director', 'poster_url', 'plot', 'imdb_id', 'watched', 'rating',
+            'notes', 'watch_later', 'created_at', 'updated_at'),
+    TVShow: ('id', 'title', 'year', 'genre', 'creator', 'poster_url', 'plot', 'imdb_id', 'total_episodes',
+             'watched_episodes', 'progress', 'rating', 'notes', 'watch_later', 'created_at', 'updated_at'),
+    Episode: ('id', 'tv_show_id', 'season', 'episode_number', 'title', 'watched'),
+}
+
+# Fields computed from other columns, and those columns
+COMPUTED = {
+    'progress': ('total_episodes', 'watched_episodes'),
+}
+
+
+class FieldError(ValueError):
+    """Raised for unknown names in a ``fields`` parameter"""
+
+
+def parse_fields(args, model):
+    """Read the ``fields`` sparse fieldset for ``model``; all fields if absent"""
+    value = args.get('fields', '')
+    if not value.strip():
+        return FIELDS[model]
+    fields = []
+    for part in value.split(','):
+        name = part.strip()
+        if not name or name in fields:
+            continue
+        if name not in FIELDS[model]:
+            raise FieldError(f'fields must be a subset of: {", ".join(FIELDS[model])}')
+        fields.append(name)
+    return tuple(fields)
+
+
+def project(query, model, fields, extra=()):
+    """Make ``query`` select the columns for ``fields`` instead of entities
+
+    The requested stored fields come first, in order, followed by whatever
+    else is needed: the columns of computed fields, ``id`` and the names in
+    ``extra`` (any column attributes of the model, such as the sort column
+    that pagination reads).
+    """
+    return query.with_entities(*columns_for(model, fields, extra))
+
+
+def columns_for(model, fields, extra=()):
+    """Columns to select for :func:`project`, in the order it describes"""
+    names = [name for name in fields if name not in COMPUTED]
+    for name in fields:
+        names.extend(COMPUTED.get(name, ()))
+    names.extend(('id',) + tuple(extra))
+    return [getattr(model, name) for name in dict.fromkeys(names)]
+
+
+def serialize_rows(rows, model, fields):
+    """Dicts with ``fields`` from rows selected by :func:`project`"""
+    with timed('serialize'):
+        stored = [name for name in fields if name not in COMPUTED]
+        items = [dict(zip(stored, row)) for row in rows]
+        if 'progress' in fields:
+            for item, row in zip(items, rows):
+                total = row.total_episodes
+                watched = row.watched_episodes or 0
+                item['progress'] = round((watched / total) * 100) if total and total > 0 else 0
+        if 'watched_episodes' in stored:
+            for item in items:
+                item['watched_episodes'] = item['watched_episodes'] or 0
+    return items
+
+
+def encode(payload):
+    """JSON bytes for ``payload`` with the fastest available encoder"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return encode_stdlib(payload)
+
+
+def encode_stdlib(payload):
+    """JSON bytes for ``payload`` with the standard library encoder"""
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    """A JSON response encoded with :func:`encode`, like ``jsonify`` but faster"""
+    with timed('serialize'):
+        data = encode(payload)
+    return current_app.response_class(data, status=status, mimetype='application/json')
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
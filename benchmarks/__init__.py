@@ -0,0 +1,14 @@
+# This file makes the benchmarks directory a Python package
+
+
+def bench_app():
+    """The production app and its database handle, with the tables created
+
+    Import it after the benchmark has set ``DATABASE_URL`` and friends.
+    """
+    from wsgi import app, db
+    from app.utils.schema import init_schema
+
+    with app.app_context():
+        init_schema()
+    return app, db
@@ -0,0 +1,131 @@
+"""Benchmark loading and querying the local title catalog.
+
+Writes gzipped title.basics and title.ratings dumps in IMDb's format with
+``--titles`` generated titles (a fifth of them series, one in ten rows an
+episode that is skipped), loads them with the same code as
+load_catalog.py and reports the time, the peak memory of the process and
+the size of the database. Then it times searches for title prefixes and
+details lookups straight from :class:`Catalog <app.services.catalog.Catalog>`
+and through GET /api/search and /api/details. OMDB points at a closed
+port, so a lookup the catalog cannot answer fails the benchmark.
+
+Usage:
+    python -m benchmarks.bench_catalog [--titles 1000000] [--queries 500]
+"""
+import argparse
+import gzip
+import itertools
+import os
+import random
+import resource
+import tempfile
+import time
+
+from benchmarks import bench_app
+from benchmarks.bench_search import make_vocabulary
+from benchmarks.library import GENRES
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=1000000, help='title rows in the basics dump')
+    parser.add_argument('--queries', type=int, default=500, help='lookups per scenario')
+    return parser.parse_args()
+
+
+def write_dumps(directory, count, rng, vocabulary):
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    basics = os.path.join(directory, 'title.basics.tsv.gz')
+    ratings = os.path.join(directory, 'title.ratings.tsv.gz')
+    with gzip.open(basics, 'wt', encoding='utf-8') as out, gzip.open(ratings, 'wt', encoding='utf-8') as votes:
+        out.write('tconst\ttitleType\tprimaryTitle\toriginalTitle\tisAdult\tstartYear\tendYear\t'
+                  'runtimeMinutes\tgenres\n')
+        votes.write('tconst\taverageRating\tnumVotes\n')
+        for number in range(1, count + 1):
+            kind = rng.choices(['movie', 'tvSeries', 'tvEpisode'], [7, 2, 1])[0]
+            title = ' '.join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(1, 4))).title()
+            year = rng.randint(1920, 2024)
+            end = str(min(year + rng.randint(1, 10), 2024)) if kind == 'tvSeries' else '\\N'
+            genres = ','.join(rng.sample(GENRES, rng.randint(1, 3)))
+            out.write(f'tt{number:07d}\t{kind}\t{title}\t{title}\t0\t{year}\t{end}\t{rng.randint(20, 180)}\t{genres}\n')
+            if rng.random() < 0.3:
+                # Votes are heavy-tailed: a few titles have most of them
+                votes.write(f'tt{number:07d}\t{rng.uniform(1, 10):.1f}\t{int(rng.paretovariate(1.2) * 5)}\n')
+    return basics, ratings
+
+
+def timed(run, items):
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        run(item)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return f'{timings[len(timings) // 2] * 1000:>10.3f}{timings[int(len(timings) * 0.95)] * 1000:>10.3f}'
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{os.path.join(workdir, "catalog.db")}',
+        'JOB_WORKER_THREADS': '0',
+        'OMDB_API_KEY': 'bench',
+        # Nothing listens here: every upstream call fails
+        'OMDB_BASE_URL': 'http://127.0.0.1:9/',
+        'OMDB_MAX_RETRIES': '0',
+    })
+    app, db = bench_app()
+    from app.services.catalog import load_catalog, reindex_catalog
+    from app.services.omdb import get_client
+
+    rng = random.Random(23)
+    vocabulary = make_vocabulary(rng, 50000)
+    start = time.perf_counter()
+    basics, ratings = write_dumps(workdir, args.titles, rng, vocabulary)
+    size = (os.path.getsize(basics) + os.path.getsize(ratings)) / 1024 / 1024
+    print(f'{args.titles} titles written in {time.perf_counter() - start:.1f}s, {size:.1f} MB gzipped')
+
+    with app.app_context():
+        start = time.perf_counter()
+        loaded = load_catalog(basics, reindex=False)['loaded']
+        load_catalog(ratings, reindex=False)
+        loaded_at = time.perf_counter()
+        reindex_catalog()
+        indexed_at = time.perf_counter()
+    database = os.path.getsize(os.path.join(workdir, 'catalog.db')) / 1024 / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{loaded} titles loaded in {loaded_at - start:.1f}s, indexed in {indexed_at - loaded_at:.1f}s; '
+          f'peak RSS {peak:.0f} MB, database {database:.0f} MB')
+
+    # Prefixes of words from the whole vocabulary, as typed into the search box
+    prefixes = [word[:rng.randint(2, len(word))] for word in rng.choices(vocabulary[:20000], k=args.queries)]
+    ids = [f'tt{rng.randint(1, args.titles):07d}' for _ in range(args.queries)]
+    catalog = get_client().catalog
+    http = app.test_client()
+
+    def search(query):
+        catalog.search(query)
+
+    def details(imdb_id):
+        catalog.details(imdb_id)
+
+    def get(url):
+        response = http.get(url)
+        assert response.status_code == 200, response.get_json()
+
+    with app.test_request_context():
+        # Misses would go to OMDB, which is unreachable here
+        matched = [query for query in prefixes if catalog.search(query) is not None]
+        known = [imdb_id for imdb_id in ids if catalog.details(imdb_id) is not None]
+        print(f'{len(matched)} of {len(prefixes)} searches and {len(known)} of {len(ids)} lookups '
+              f'found in the catalog')
+        print(f"{'scenario':<34}{'p50 ms':>10}{'p95 ms':>10}")
+        print(f"{'Catalog.search':<34}{timed(search, prefixes)}")
+        print(f"{'Catalog.details':<34}{timed(details, ids)}")
+    print(f"{'GET /api/search':<34}{timed(get, [f'/api/search?query={query}' for query in matched])}")
+    print(f"{'GET /api/details':<34}{timed(get, [f'/api/details/{imdb_id}' for imdb_id in known])}")
+
+
+if __name__ == '__main__':
+    main()
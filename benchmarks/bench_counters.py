@@ -0,0 +1,157 @@
+"""Stress the stored watched-episode counters and time progress reads.
+
+Several threads hammer a handful of shows through the API at once: batch
+PATCHes over seasons and ranges, single-episode PUTs and resizes. After
+that the stored counters must match a recount of the episode table
+exactly. Requests that fail because the database is busy are retried; a
+failed request must never leave the counters off.
+
+Then times a page of shows with progress read from the stored counters
+against the grouped episode aggregate it replaces.
+
+Exits with status 1 when any show's counters drift, so it can guard the
+counters in CI; tests/test_counters.py covers the same updates.
+
+Usage:
+    python -m benchmarks.bench_counters [--threads 8] [--operations 300] [--filler-shows 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import bench_app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--operations', type=int, default=300, help='requests per thread')
+    parser.add_argument('--shows', type=int, default=4, help='shows shared by the threads')
+    parser.add_argument('--filler-shows', type=int, default=2000,
+                        help='shows of 50 episodes for the read timing')
+    return parser.parse_args()
+
+
+def random_request(rng, show):
+    show_id, episode_ids = show
+    kind = rng.random()
+    if kind < 0.35:
+        body = {'season': rng.randint(1, 4), 'set': {'watched': rng.random() < 0.6}}
+        return 'patch', f'/api/tv/{show_id}/episodes', body
+    if kind < 0.55:
+        start = rng.randint(1, 20)
+        body = {'from': start, 'to': start + rng.randint(0, 10), 'set': {'watched': rng.random() < 0.5}}
+        return 'patch', f'/api/tv/{show_id}/episodes', body
+    if kind < 0.65:
+        body = {'up_to': rng.choice(episode_ids), 'set': {'watched': True}}
+        return 'patch', f'/api/tv/{show_id}/episodes', body
+    if kind < 0.90:
+        return 'put', f'/api/tv/{show_id}/episodes/{rng.choice(episode_ids)}', {'watched': rng.random() < 0.5}
+    layout = [rng.randint(5, 25) for _ in range(rng.randint(2, 4))]
+    return 'put', f'/api/tv/{show_id}', {'seasons': layout}
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "counters.db")}'
+
+    from sqlalchemy import func, insert, select
+    app, db = bench_app()
+    from app.models.models import Episode, TVShow
+    from app.services.counters import find_counter_drift
+
+    client = app.test_client()
+    shows = []
+    for n in range(args.shows):
+        data = client.post('/api/tv/', json={'title': f'Shared {n}', 'imdb_id': f'tt{n:07d}',
+                                             'seasons': [20, 20, 20, 20]}).get_json()
+        shows.append((data['id'], [episode['id'] for episode in data['episodes']]))
+
+    stats = {'ok': 0, 'retried': 0, 'gave_up': 0}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        thread_client = app.test_client()
+        for _ in range(args.operations):
+            show = rng.choice(shows)
+            # Episode ids change when a show is resized; refresh them now and then
+            if rng.random() < 0.05:
+                episodes = thread_client.get(f'/api/tv/{show[0]}/episodes').get_json()
+                show = (show[0], [episode['id'] for episode in episodes] or show[1])
+            method, url, body = random_request(rng, show)
+            for attempt in range(5):
+                response = getattr(thread_client, method)(url, json=body)
+                if response.status_code < 500:
+                    break
+                with lock:
+                    stats['retried'] += 1
+                time.sleep(0.01 * (attempt + 1))
+            with lock:
+                stats['ok' if response.status_code < 500 else 'gave_up'] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    with app.app_context():
+        drifted = find_counter_drift()
+    print(f'{args.threads} threads x {args.operations} requests on {args.shows} shows in {seconds:.1f}s: '
+          f'{stats["ok"]} ok, {stats["retried"]} busy retries, {stats["gave_up"]} gave up')
+    print(f'counter drift: {len(drifted)} show(s)' + (f' {drifted}' if drifted else ' - consistent'))
+    if drifted:
+        print('FAIL: stored counters do not match the episodes')
+        sys.exit(1)
+
+    # Progress reads: stored counters vs the grouped aggregate they replace
+    with app.app_context():
+        show_ids = db.session.execute(
+            insert(TVShow).returning(TVShow.id),
+            [{'title': f'Filler {n}', 'imdb_id': f'tt9{n:07d}', 'total_episodes': 50} for n in range(args.filler_shows)],
+        ).scalars().all()
+        db.session.execute(insert(Episode), [
+            {'tv_show_id': show_id, 'season': 1, 'episode_number': n, 'title': f'Episode {n}', 'watched': n % 3 == 0}
+            for show_id in show_ids for n in range(1, 51)
+        ])
+        db.session.commit()
+        from app.services.counters import rebuild_counters
+        rebuild_counters(show_ids)
+
+        def counters():
+            return [show.to_dict(include_episodes=False)
+                    for show in TVShow.query.order_by(TVShow.title, TVShow.id).limit(48)]
+
+        def aggregate():
+            watched = (
+                select(Episode.tv_show_id, func.count(Episode.id).label('watched'))
+                .where(Episode.watched.is_(True)).group_by(Episode.tv_show_id).subquery()
+            )
+            rows = db.session.execute(
+                select(TVShow, func.coalesce(watched.c.watched, 0))
+                .outerjoin(watched, watched.c.tv_show_id == TVShow.id)
+                .order_by(TVShow.title, TVShow.id).limit(48)
+            ).all()
+            return [(show.id, count) for show, count in rows]
+
+        episodes = db.session.execute(select(func.count(Episode.id))).scalar()
+        print(f'page of 48 shows, {len(show_ids) + args.shows} shows / {episodes} episodes:')
+        for name, func_ in (('stored counters', counters), ('grouped aggregate', aggregate)):
+            func_()
+            start = time.perf_counter()
+            for _ in range(20):
+                func_()
+                db.session.expire_all()
+            print(f'  {name:18s} {(time.perf_counter() - start) / 20 * 1000:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Benchmark episode creation, resizing and lookups on large shows.
+
+Creates shows with thousands of episodes through POST /api/tv with a season
+layout and resizes them through PUT, against the previous behaviour of one
+ORM object per episode (re-implemented here as the baseline). Then times
+lookups by (show, season, episode number) in a table filled with other
+shows, with and without the composite index.
+
+Usage:
+    python -m benchmarks.bench_episodes [--episodes 5000] [--seasons 10] [--filler-shows 200]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks import bench_app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--episodes', type=int, default=5000, help='episodes in the large show')
+    parser.add_argument('--seasons', type=int, default=10)
+    parser.add_argument('--filler-shows', type=int, default=200,
+                        help='other shows of 500 episodes each, for the lookup test')
+    parser.add_argument('--lookups', type=int, default=2000)
+    return parser.parse_args()
+
+
+def legacy_create(db, TVShow, Episode, imdb_id, total):
+    show = TVShow(title='Legacy', imdb_id=imdb_id, total_episodes=total)
+    db.session.add(show)
+    db.session.commit()
+    for i in range(1, total + 1):
+        db.session.add(Episode(tv_show_id=show.id, season=1, episode_number=i, title=f'Episode {i}', watched=False))
+    db.session.commit()
+    # The old route serialized the new show too
+    return show.to_dict()['id']
+
+
+def legacy_shrink(db, TVShow, Episode, show_id, total):
+    show = db.session.get(TVShow, show_id)
+    for episode in Episode.query.filter_by(tv_show_id=show_id).filter(Episode.episode_number > total).all():
+        db.session.delete(episode)
+    show.total_episodes = total
+    db.session.commit()
+    return show.to_dict()
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "episodes.db")}'
+
+    from sqlalchemy import insert, select, text
+    app, db = bench_app()
+    from app.models.models import Episode, TVShow
+
+    client = app.test_client()
+    per_season = args.episodes // args.seasons
+    layout = [per_season] * args.seasons
+
+    print(f'show with {per_season * args.seasons} episodes in {args.seasons} seasons')
+    seconds, response = timed(lambda: client.post('/api/tv/', json={'title': 'Bulk', 'imdb_id': 'tt1', 'seasons': layout}))
+    show_id = response.get_json()['id']
+    print(f'create  bulk   {seconds * 1000:9.1f} ms')
+    with app.app_context():
+        seconds, legacy_id = timed(lambda: legacy_create(db, TVShow, Episode, 'tt2', per_season * args.seasons))
+    print(f'create  legacy {seconds * 1000:9.1f} ms')
+
+    half = per_season * args.seasons // 2
+    seconds, _ = timed(lambda: client.put(f'/api/tv/{show_id}', json={'total_episodes': half}))
+    print(f'shrink  bulk   {seconds * 1000:9.1f} ms  (to {half})')
+    with app.app_context():
+        seconds, _ = timed(lambda: legacy_shrink(db, TVShow, Episode, legacy_id, half))
+    print(f'shrink  legacy {seconds * 1000:9.1f} ms')
+
+    seconds, _ = timed(lambda: client.put(f'/api/tv/{show_id}', json={'seasons': layout}))
+    print(f'regrow  bulk   {seconds * 1000:9.1f} ms  (back to {per_season * args.seasons})')
+
+    # Lookups in a table holding many other shows
+    with app.app_context():
+        filler_ids = db.session.execute(
+            insert(TVShow).returning(TVShow.id),
+            [{'title': f'Filler {n}', 'imdb_id': f'tt9{n:07d}', 'total_episodes': 500} for n in range(args.filler_shows)],
+        ).scalars().all()
+        rows = [{'tv_show_id': filler_id, 'season': 1 + n // 50, 'episode_number': 1 + n % 50,
+                 'title': f'Episode {n}', 'watched': False}
+                for filler_id in filler_ids for n in range(500)]
+        db.session.execute(insert(Episode), rows)
+        db.session.commit()
+        total_rows = db.session.execute(select(db.func.count(Episode.id))).scalar()
+
+        rng = random.Random(1)
+        positions = [(rng.choice(filler_ids), rng.randint(1, 10), rng.randint(1, 50)) for _ in range(args.lookups)]
+        stmt = select(Episode.id).where(Episode.tv_show_id == db.bindparam('show', 1),
+                                        Episode.season == db.bindparam('season', 1),
+                                        Episode.episode_number == db.bindparam('number', 1))
+
+        def lookups():
+            for show, season, number in positions:
+                db.session.execute(stmt, {'show': show, 'season': season, 'number': number}).scalar()
+
+        plan = []
+        if db.engine.name == 'sqlite':
+            sql = str(stmt.compile(db.engine, compile_kwargs={'literal_binds': True}))
+            plan = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+        seconds, _ = timed(lookups)
+        print(f'{args.lookups} position lookups in {total_rows} episodes')
+        print(f'lookup  indexed   {seconds * 1000:9.1f} ms  {" / ".join(row[-1] for row in plan)}')
+
+        db.session.execute(text('DROP INDEX uq_episode_position'))
+        db.session.execute(text('DROP INDEX ix_episode_show_watched'))
+        seconds, _ = timed(lookups)
+        print(f'lookup  no index  {seconds * 1000:9.1f} ms')
+        db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
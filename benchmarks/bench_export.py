@@ -0,0 +1,104 @@
+"""Benchmark GET /api/export against building the whole export in memory.
+
+Loads a synthetic collection through the bulk importer, then streams it back
+out through the endpoint in each format, consuming the response chunk by
+chunk the way a WSGI server would. The baseline loads every title with
+``to_dict`` and serializes the document in one go, which is what the
+client-side export amounted to. Peak Python heap during each run is
+measured with tracemalloc in a second pass, so it does not skew the timings.
+
+Usage:
+    python -m benchmarks.bench_export [--movies 80000] [--shows 20000] [--episodes 10]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import bench_app
+from benchmarks.bench_import import write_export
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', type=int, default=80000)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--episodes', type=int, default=10, help='episodes per show')
+    parser.add_argument('--batch-size', type=int, default=500)
+    return parser.parse_args()
+
+
+def stream_export(client, query):
+    response = client.get(f'/api/export?{query}', buffered=False)
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    return size
+
+
+def build_in_memory():
+    from sqlalchemy.orm import selectinload
+    from app.models.models import Movie, TVShow
+
+    data = {
+        'movies': [movie.to_dict() for movie in Movie.query.order_by(Movie.id)],
+        'tvShows': [show.to_dict() for show in TVShow.query.options(selectinload(TVShow.episodes)).order_by(TVShow.id)],
+    }
+    return len(json.dumps(data, indent=2))
+
+
+def measure(func):
+    start = time.perf_counter()
+    size = func()
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, size, peak / (1024 * 1024)
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    export_path = os.path.join(workdir, 'export.json')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "export.db")}'
+
+    write_export(export_path, args.movies, args.shows, args.episodes)
+
+    app, db = bench_app()
+
+    client = app.test_client()
+    with open(export_path, 'rb') as export:
+        client.post('/api/import?report=summary', input_stream=export, content_type='application/json')
+
+    records = args.movies + args.shows
+    print(f'{records} titles ({args.shows * args.episodes} episodes)')
+
+    runs = [
+        ('json', lambda: stream_export(client, f'format=json&batch_size={args.batch_size}')),
+        ('ndjson', lambda: stream_export(client, f'format=ndjson&batch_size={args.batch_size}')),
+        ('ndjson+gzip', lambda: stream_export(client, f'format=ndjson&compress=gzip&batch_size={args.batch_size}')),
+    ]
+    for name, func in runs:
+        seconds, size, peak = measure(func)
+        print(f'stream {name:12s} {seconds:7.2f}s  {records / seconds:8.0f} titles/s  '
+              f'{size / (1024 * 1024):6.1f} MB  peak heap {peak:6.1f} MB')
+
+    def baseline():
+        with app.app_context():
+            size = build_in_memory()
+            db.session.remove()
+            return size
+
+    seconds, size, peak = measure(baseline)
+    print(f'in-memory {"json":9s} {seconds:7.2f}s  {records / seconds:8.0f} titles/s  '
+          f'{size / (1024 * 1024):6.1f} MB  peak heap {peak:6.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Load test gunicorn setups against a local SQLite database.
+
+Seeds a database, then serves a copy of it with each setup in turn and hits
+it from ``--clients`` concurrent client threads for ``--duration`` seconds.
+The request mix is 70% list pages, 10% single movies, 10% adds and 10%
+updates. Reports requests per second, p50/p95 latency and failed requests,
+which are mostly "database is locked" errors under concurrent writes.
+
+Setups:
+
+- ``default``: ``gunicorn wsgi:app`` without a config file (one sync worker)
+  on SQLite's rollback journal, which is how the app used to run
+- ``sync-wal``: the same single sync worker on WAL
+- ``template``: gunicorn.conf.py (threaded workers, preloaded app) on WAL
+- ``template-journal``: gunicorn.conf.py on the rollback journal
+
+Usage:
+    python -m benchmarks.bench_gunicorn [--clients 16] [--duration 10] [--titles 2000] [--setups default,template]
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks import bench_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (gunicorn arguments, environment) per setup
+SETUPS = {
+    'default': (['--workers', '1'], {'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_SYNCHRONOUS': 'full',
+                                      'SQLITE_BUSY_TIMEOUT_MS': '5000'}),
+    'sync-wal': (['--workers', '1'], {}),
+    'template': (['-c', os.path.join(ROOT, 'gunicorn.conf.py')], {}),
+    'template-journal': (['-c', os.path.join(ROOT, 'gunicorn.conf.py')], {'SQLITE_JOURNAL_MODE': 'delete'}),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16, help='concurrent client threads')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per setup')
+    parser.add_argument('--titles', type=int, default=2000, help='movies seeded')
+    parser.add_argument('--setups', default=','.join(SETUPS), help='comma-separated setups to run')
+    return parser.parse_args()
+
+
+def seed(path, count):
+    app, db = bench_app()
+    from app.models.models import Movie
+
+    with app.app_context():
+        db.session.execute(Movie.__table__.insert(), [
+            {'title': f'Movie {n}', 'year': 1950 + n % 70, 'genre': 'Drama', 'director': f'Director {n % 300}',
+             'plot': 'A plot. ' * 20, 'watched': n % 3 == 0}
+            for n in range(1, count + 1)
+        ])
+        db.session.commit()
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    # Fold the write-ahead log into the file, so copies of it are complete
+    import sqlite3
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=delete')
+    connection.close()
+
+
+def serve(setup, database, port):
+    arguments, env = SETUPS[setup]
+    if '-c' not in arguments:
+        # No config file at all, not even the gunicorn.conf.py in this directory
+        empty = os.path.join(os.path.dirname(database), 'empty.conf.py')
+        open(empty, 'w').close()
+        arguments = ['-c', empty] + arguments
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', PORT=str(port), **env)
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', *arguments, '--bind', f'127.0.0.1:{port}',
+                                'wsgi:app'], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(200):
+        try:
+            if requests.get(f'{url}/api/movies/?limit=1', timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f'gunicorn did not start for setup {setup}')
+
+
+def load(url, clients, duration, titles):
+    timings = []
+    failures = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        mine = []
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            began = time.perf_counter()
+            if roll < 0.7:
+                response = session.get(f'{url}/api/movies/?limit=24&sort=title&page={rng.randint(1, 20)}')
+            elif roll < 0.8:
+                response = session.get(f'{url}/api/movies/{rng.randint(1, titles)}')
+            elif roll < 0.9:
+                # Unique IMDb IDs, since every blank one is stored as ''; without OMDB_API_KEY no jobs are queued
+                imdb_id = f'tt{rng.randrange(10 ** 9):09d}'
+                response = session.post(f'{url}/api/movies/', json={'title': f'Added {imdb_id}', 'imdb_id': imdb_id})
+            else:
+                response = session.put(f'{url}/api/movies/{rng.randint(1, titles)}',
+                                       json={'watched': rng.random() < 0.5, 'rating': rng.randint(1, 10)})
+            elapsed = time.perf_counter() - began
+            mine.append((elapsed, response.status_code))
+        with lock:
+            timings.extend(elapsed for elapsed, _ in mine)
+            failures.extend(status for _, status in mine if status >= 400)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(timings), failures
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    template = os.path.join(workdir, 'seed.db')
+    os.environ.update({'DATABASE_URL': f'sqlite:///{template}', 'JOB_WORKER_THREADS': '0', 'APP_ENV': 'production'})
+    seed(template, args.titles)
+
+    print(f'{"setup":<18}{"requests":>10}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"failed":>8}')
+    for number, setup in enumerate(args.setups.split(',')):
+        database = os.path.join(workdir, f'{setup}.db')
+        shutil.copy(template, database)
+        process, url = serve(setup, database, 8700 + number)
+        try:
+            timings, failures = load(url, args.clients, args.duration, args.titles)
+        finally:
+            process.terminate()
+            process.wait()
+        p50 = timings[len(timings) // 2] * 1000
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000
+        print(f'{setup:<18}{len(timings):>10}{len(timings) / args.duration:>9.1f}{p50:>9.1f}{p95:>9.1f}'
+              f'{len(failures):>8}')
+
+
+if __name__ == '__main__':
+    main()
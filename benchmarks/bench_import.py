@@ -0,0 +1,120 @@
+"""Benchmark POST /api/import against per-row ``db.session.add`` + commit.
+
+Writes a synthetic export file to disk (streamed, so generating it does not
+hold the collection in memory), imports it through the endpoint into a fresh
+SQLite database and reports throughput and peak RSS. The per-row baseline
+runs on a prefix of the same records in a second database and is
+extrapolated.
+
+Usage:
+    python -m benchmarks.bench_import [--movies 80000] [--shows 20000] [--episodes 10]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks import bench_app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', type=int, default=80000)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--episodes', type=int, default=10, help='episodes per show')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--baseline-records', type=int, default=2000,
+                        help='records imported row by row for the baseline')
+    return parser.parse_args()
+
+
+def write_export(path, movies, shows, episodes):
+    with open(path, 'w', encoding='utf-8') as out:
+        out.write('{"exportDate": "2024-01-01T00:00:00Z", "movies": [')
+        for n in range(movies):
+            out.write(',' if n else '')
+            json.dump({
+                'title': f'Movie {n}', 'year': 1950 + n % 75, 'genre': 'Drama, Thriller',
+                'director': f'Director {n % 500}', 'poster_url': '', 'plot': 'Plot ' * 20,
+                'imdb_id': f'tt{n:08d}', 'watched': n % 2 == 0, 'rating': n % 10,
+                'notes': '', 'watch_later': n % 7 == 0, 'created_at': '2024-01-01T00:00:00',
+            }, out)
+        out.write('], "tvShows": [')
+        for n in range(shows):
+            out.write(',' if n else '')
+            json.dump({
+                'title': f'Show {n}', 'year': 1980 + n % 45, 'genre': 'Comedy',
+                'creator': f'Creator {n % 300}', 'poster_url': '', 'plot': 'Plot ' * 20,
+                'imdb_id': f'tt9{n:07d}', 'total_episodes': episodes, 'rating': None,
+                'notes': '', 'watch_later': False, 'created_at': '2024-01-01T00:00:00',
+                'episodes': [
+                    {'season': 1, 'episode_number': e, 'title': f'Episode {e}', 'watched': e % 3 == 0}
+                    for e in range(1, episodes + 1)
+                ],
+            }, out)
+        out.write(']}')
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    export_path = os.path.join(workdir, 'export.json')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "bulk.db")}'
+
+    write_export(export_path, args.movies, args.shows, args.episodes)
+    records = args.movies + args.shows
+    size_mb = os.path.getsize(export_path) / (1024 * 1024)
+
+    app, db = bench_app()
+    from app.models.models import Movie
+    from app.services.importer import iter_export_records, normalize_movie
+
+    rss_before = peak_rss_mb()
+    with app.app_context(), open(export_path, 'rb') as export:
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post(f'/api/import?report=summary&chunk_size={args.chunk_size}',
+                               input_stream=export, content_type='application/json')
+        bulk_seconds = time.perf_counter() - start
+        report = response.get_json()
+    rss_after = peak_rss_mb()
+
+    print(f'{records} titles ({args.shows * args.episodes} episodes), {size_mb:.1f} MB file')
+    print(f'bulk import:    {bulk_seconds:8.2f}s  {records / bulk_seconds:9.0f} titles/s  '
+          f'peak RSS {rss_after:.0f} MB (+{rss_after - rss_before:.0f} MB during import)')
+    print(f'                movies={report["movies"]} tv_shows={report["tv_shows"]} episodes={report["episodes"]}')
+
+    # Per-row baseline on the first movies of the same file, in its own database
+    baseline_db = os.path.join(workdir, 'per_row.db')
+    engine = db.create_engine(f'sqlite:///{baseline_db}')
+    with app.app_context():
+        db.metadata.create_all(engine)
+        from sqlalchemy.orm import Session
+        with Session(engine) as session, open(export_path, 'rb') as export:
+            count = 0
+            start = time.perf_counter()
+            for record_type, record in iter_export_records(export):
+                if record_type != 'movie' or count >= args.baseline_records:
+                    break
+                row, _ = normalize_movie(record)
+                session.add(Movie(**row))
+                session.commit()
+                count += 1
+            baseline_seconds = time.perf_counter() - start
+
+    rate = count / baseline_seconds
+    print(f'per-row commit: {baseline_seconds:8.2f}s  {rate:9.0f} titles/s  '
+          f'({count} records; ~{records / rate:.0f}s extrapolated for {records})')
+
+
+if __name__ == '__main__':
+    main()
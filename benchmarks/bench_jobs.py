@@ -0,0 +1,120 @@
+"""Benchmark adding titles by IMDb ID: OMDB inside the request vs a background job.
+
+Runs against benchmarks.stub_omdb with a per-lookup delay. The inline path
+does what ``POST /api/movies`` used to do, an OMDB details lookup followed
+by the insert, within the request; the queued path posts the bare IMDb ID
+and lets the job worker enrich the movie afterwards. Reports request
+latency for both, then how long the worker pool takes to drain the queue
+under the OMDB rate limit, and checks that every movie was enriched.
+
+Usage:
+    python -m benchmarks.bench_jobs [--titles 200] [--delay 0.1] [--threads 1,4] [--rate 20] [--fail-every 0]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import bench_app
+from benchmarks.stub_omdb import StubOmdbServer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=200, help='movies added per run')
+    parser.add_argument('--delay', type=float, default=0.1, help='stub response delay in seconds')
+    parser.add_argument('--threads', default='1,4', help='comma-separated worker pool sizes')
+    parser.add_argument('--rate', type=float, default=20, help='OMDB requests per second for jobs')
+    parser.add_argument('--fail-every', type=int, default=0, help='stub answers every Nth request with a 503')
+    return parser.parse_args()
+
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))] * 1000
+
+
+def main():
+    args = parse_args()
+    server = StubOmdbServer(('127.0.0.1', 0), delay=args.delay, fail_every=args.fail_every).start()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{os.path.join(workdir, "jobs.db")}',
+        'OMDB_API_KEY': 'bench',
+        'OMDB_BASE_URL': server.url,
+        'OMDB_RATE_LIMIT': str(args.rate),
+        'OMDB_RATE_BURST': '1',
+        'JOB_WORKER_THREADS': '0',
+        'JOB_RETRY_BACKOFF': '0.2',
+    })
+
+    app, db = bench_app()
+    from app.models.models import Movie
+    from app.services.enrichment import HANDLERS
+    from app.services.jobs import Worker, status_counts
+    from app.services.omdb import get_client
+
+    client = app.test_client()
+    counter = iter(range(1, 10 ** 7))
+
+    def next_ids(count):
+        # Odd numbers are movies in the stub; fresh ids miss the OMDB cache
+        return [f'tt{next(counter) * 2 + 1:07d}' for _ in range(count)]
+
+    def inline_add(imdb_id):
+        with app.app_context():
+            data = get_client().details(imdb_id)
+        return client.post('/api/movies/', json={
+            'imdb_id': imdb_id, 'title': data['Title'], 'year': int(data['Year'][:4]), 'genre': data['Genre'],
+            'director': data['Director'], 'poster_url': data['Poster'], 'plot': data['Plot'],
+        })
+
+    def queued_add(imdb_id):
+        return client.post('/api/movies/', json={'imdb_id': imdb_id})
+
+    print(f'{"path":<10}{"titles":>8}{"p50 ms":>10}{"p95 ms":>10}{"total s":>10}')
+    for label, add in (('inline', inline_add), ('queued', queued_add)):
+        timings = []
+        start = time.perf_counter()
+        for imdb_id in next_ids(args.titles):
+            began = time.perf_counter()
+            response = add(imdb_id)
+            timings.append(time.perf_counter() - began)
+            assert response.status_code == 201, response.get_data(as_text=True)
+        total = time.perf_counter() - start
+        print(f'{label:<10}{args.titles:>8}{percentile(timings, 0.5):>10.1f}{percentile(timings, 0.95):>10.1f}'
+              f'{total:>10.2f}')
+
+    print()
+    print(f'{"threads":<10}{"jobs":>8}{"drain s":>10}{"jobs/s":>10}{"upstream":>10}')
+    for index, threads in enumerate(int(value) for value in args.threads.split(',')):
+        if index:
+            # Queue another batch for this pool size
+            for imdb_id in next_ids(args.titles):
+                queued_add(imdb_id)
+        with app.app_context():
+            jobs = status_counts()['queued']
+        server.reset_counters()
+        worker = Worker(app, HANDLERS, threads=threads, poll_interval=0.05).start()
+        start = time.perf_counter()
+        while True:
+            with app.app_context():
+                counts = status_counts()
+            if counts['queued'] + counts['running'] == 0:
+                break
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        worker.stop()
+        print(f'{threads:<10}{jobs:>8}{elapsed:>10.2f}{jobs / elapsed:>10.1f}{server.requests:>10}')
+
+    with app.app_context():
+        counts = status_counts()
+        bare = Movie.query.filter(Movie.title == Movie.imdb_id).count()
+        db.session.remove()
+    print()
+    print(f'jobs: {counts}; movies still without OMDB details: {bare}')
+    assert counts['failed'] == 0 and bare == 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark OMDB transport: bare requests.get vs the pooled, coalescing client.
+
+Runs against benchmarks.stub_omdb with caching disabled, so every lookup
+is an upstream call unless it is coalesced.
+
+Usage:
+    python -m benchmarks.bench_omdb_client [--lookups 200] [--concurrency 20] [--delay 0.05]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from app.services.omdb import OmdbClient
+from benchmarks.stub_omdb import StubOmdbServer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lookups', type=int, default=200, help='distinct sequential lookups')
+    parser.add_argument('--concurrency', type=int, default=20, help='threads issuing the same lookup')
+    parser.add_argument('--delay', type=float, default=0.05, help='stub response delay in seconds')
+    return parser.parse_args()
+
+
+def run(label, server, func):
+    server.reset_counters()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<44} {elapsed * 1000:>9.1f}ms  upstream requests={server.requests:<5} '
+          f'connections={server.connections}')
+
+
+def main():
+    args = parse_args()
+    server = StubOmdbServer(('127.0.0.1', 0), delay=args.delay).start()
+
+    def bare_sequential():
+        for n in range(args.lookups):
+            requests.get(server.url, params={'apikey': 'bench', 'i': f'tt{n:07d}', 'plot': 'full'}).json()
+
+    client = OmdbClient('bench', base_url=server.url, cache=None)
+
+    def pooled_sequential():
+        for n in range(args.lookups):
+            client.details(f'tt{n:07d}')
+
+    def bare_concurrent():
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(
+                lambda _: requests.get(server.url, params={'apikey': 'bench', 's': 'alien'}).json(),
+                range(args.concurrency)
+            ))
+
+    def coalesced_concurrent():
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(lambda _: client.search('alien'), range(args.concurrency)))
+
+    print(f'stub delay {args.delay * 1000:.0f}ms, {args.lookups} sequential lookups, '
+          f'{args.concurrency} concurrent identical searches')
+    run('requests.get, sequential', server, bare_sequential)
+    run('pooled session, sequential', server, pooled_sequential)
+    run('requests.get, concurrent identical', server, bare_concurrent)
+    run('pooled + single-flight, concurrent identical', server, coalesced_concurrent)
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark grid posters: remote full-size originals vs the local poster cache.
+
+Serves generated 600x900 JPEG posters from benchmarks.stub_omdb (with a
+per-request delay standing in for the image CDN) and loads one grid page
+of posters three ways:
+
+- the originals straight from the stub, which is what the grid did before
+- ``/api/posters/<imdb_id>?w=180`` on a cold cache (download and resize)
+- the same on a warm cache, as every later page load is
+
+Reports bytes per page and median latency per poster.
+
+Usage:
+    python -m benchmarks.bench_posters [--page 48] [--delay 0.05]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import requests
+
+from benchmarks import bench_app
+from benchmarks.stub_omdb import StubOmdbServer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--page', type=int, default=48, help='posters per grid page')
+    parser.add_argument('--delay', type=float, default=0.05, help='stub response delay in seconds')
+    return parser.parse_args()
+
+
+def median_ms(timings):
+    timings = sorted(timings)
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    args = parse_args()
+    server = StubOmdbServer(('127.0.0.1', 0), delay=args.delay, posters=True).start()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{os.path.join(workdir, "posters.db")}',
+        'POSTER_CACHE_DIR': os.path.join(workdir, 'posters'),
+        'POSTER_ALLOWED_HOSTS': '127.0.0.1',
+        'JOB_WORKER_THREADS': '0',
+    })
+
+    app, db = bench_app()
+    from app.models.models import Movie
+    from app.services.posters import resize_formats
+
+    numbers = range(1, args.page * 2, 2)
+    with app.app_context():
+        db.session.add_all(
+            Movie(title=f'Movie {n}', imdb_id=f'tt{n:07d}', poster_url=f'{server.url}posters/{n}.jpg')
+            for n in numbers
+        )
+        db.session.commit()
+    # Generate the stub's images up front so they are not part of any timing
+    for n in numbers:
+        server.poster(n)
+
+    client = app.test_client()
+    session = requests.Session()
+    accept = {'Accept': 'image/webp,*/*'}
+
+    def remote(n):
+        return session.get(f'{server.url}posters/{n}.jpg').content
+
+    def cached(n):
+        response = client.get(f'/api/posters/tt{n:07d}?w=180', headers=accept)
+        data = response.get_data()
+        response.close()
+        return data
+
+    print(f'variants written as: {", ".join(resize_formats()) or "originals only (no Pillow)"}')
+    print(f'{"path":<22}{"posters":>9}{"KB/page":>10}{"median ms":>11}')
+    for label, fetch in (('remote originals', remote), ('cache, cold', cached), ('cache, warm', cached)):
+        timings = []
+        total = 0
+        for n in numbers:
+            start = time.perf_counter()
+            total += len(fetch(n))
+            timings.append(time.perf_counter() - start)
+        print(f'{label:<22}{len(timings):>9}{total / 1024:>10.0f}{median_ms(timings):>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Check the number of SQL queries each endpoint runs against a budget.
+
+Seeds a database through ``POST /api/import``, calls every endpoint in
+``BUDGETS`` and reads its query count from the ``Server-Timing`` header
+that ``app.utils.metrics`` adds. List endpoints are called at two page
+sizes, after a warm-up call of each, and their counts must match, so an
+N+1 query pattern fails the check. A budget is a ceiling, not an exact
+count: an endpoint that gets cheaper passes, and its budget can then be
+lowered.
+
+Exits with status 1 when an endpoint goes over its budget or its count
+grows with the page size. tests/test_query_counts.py runs the same
+checks with the test suite.
+
+Usage:
+    python -m benchmarks.bench_queries [--verbose]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+from benchmarks import bench_app
+from benchmarks.bench_import import write_export
+
+# (method, path, JSON body, most SQL statements allowed); {page} is a page size
+BUDGETS = [
+    ('GET', '/api/movies/?limit={page}', None, 2),
+    ('GET', '/api/movies/?limit={page}&sort=title&genre=Drama', None, 3),
+    ('GET', '/api/movies/?limit={page}&search=movie', None, 2),
+    ('GET', '/api/movies/1', None, 3),
+    ('GET', '/api/tv/?limit={page}', None, 2),
+    ('GET', '/api/tv/1', None, 5),
+    ('GET', '/api/tv/1/episodes', None, 2),
+    ('GET', '/api/sync?limit={page}', None, 3),
+    ('GET', '/api/stats', None, 1),
+    ('GET', '/api/facets', None, 2),
+    ('GET', '/api/jobs/?limit={page}', None, 2),
+    ('GET', '/api/movies/1/similar?limit={page}', None, 3),
+    ('GET', '/api/recommendations?limit={page}', None, 3),
+    ('POST', '/api/movies/', {'title': 'Budget movie', 'imdb_id': 'tt7000001', 'genre': 'Drama'}, 7),
+    ('PUT', '/api/movies/1', {'watched': True, 'rating': 8}, 5),
+    ('PATCH', '/api/tv/1/episodes', {'season': 1, 'set': {'watched': True}}, 10),
+    ('PUT', '/api/tv/1/episodes/1', {'watched': False}, 8),
+]
+
+PAGE_SIZES = (5, 50)
+QUERIES = re.compile(r'desc="(\d+) quer(?:y|ies)"')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--verbose', action='store_true', help='show the Server-Timing header of each call')
+    return parser.parse_args()
+
+
+def query_count(client, method, path, body):
+    response = client.open(path, method=method, json=body)
+    assert response.status_code < 400, f'{method} {path}: {response.status_code} {response.get_data(as_text=True)}'
+    return int(QUERIES.search(response.headers['Server-Timing']).group(1)), response.headers['Server-Timing']
+
+
+def seed(client, directory):
+    """Import the library the budgets are checked against"""
+    export = os.path.join(directory, 'export.json')
+    write_export(export, 200, 100, 10)
+    with open(export, 'rb') as source:
+        response = client.post('/api/import', data=source.read(), content_type='application/json')
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+
+def measure(client, method, path, body, verbose=False):
+    """Query counts of one endpoint, at each page size if it takes one"""
+    sizes = PAGE_SIZES if '{page}' in path else (None,)
+    if method == 'GET':
+        # Fills process-wide caches (e.g. the search vocabulary, memoised recommendations) first
+        for size in sizes:
+            query_count(client, method, path.format(page=size), body)
+    counts = []
+    for size in sizes:
+        count, timing = query_count(client, method, path.format(page=size), body)
+        counts.append(count)
+        if verbose:
+            print(f'    {timing}')
+    return counts
+
+
+def check(label, counts, budget):
+    """Failure messages for an endpoint's counts, empty if it is within budget"""
+    failures = []
+    if max(counts) > budget:
+        failures.append(f'{label}: {max(counts)} queries, budget {budget}')
+    if len(set(counts)) > 1:
+        failures.append(f'{label}: query count grows with the page size ({counts})')
+    return failures
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{os.path.join(workdir, "queries.db")}',
+        'JOB_WORKER_THREADS': '0',
+        'OMDB_API_KEY': '',
+    })
+    app, db = bench_app()
+    client = app.test_client()
+    seed(client, workdir)
+
+    failures = []
+    print(f'{"endpoint":<58}{"queries":>9}{"budget":>8}')
+    for method, path, body, budget in BUDGETS:
+        counts = measure(client, method, path, body, args.verbose)
+        label = f'{method} {path.format(page="N")}'
+        print(f'{label:<58}{"/".join(map(str, counts)):>9}{budget:>8}')
+        failures.extend(check(label, counts, budget))
+
+    if failures:
+        print('FAIL:\n  ' + '\n  '.join(failures))
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Benchmark similar-title and recommendation queries on a large collection.
+
+Seeds movies and shows with generated genres, people and plots, and marks
+some as watched and rated. It times a full build of the feature matrix,
+then the matrix part of a similar-titles query (``rank``) next to the
+whole GET /api/movies/<id>/similar request, and GET /api/recommendations
+first and when its result is memoised.
+Finally it updates ``--updates`` titles and times the first query after
+the change, which reads them into the delta, and the queries after it.
+
+Usage:
+    python -m benchmarks.bench_recommendations [--titles 100000] [--queries 200] [--updates 500]
+"""
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks import bench_app
+from benchmarks.bench_search import make_vocabulary, percentile
+
+GENRES = ['Drama', 'Comedy', 'Action', 'Thriller', 'Romance', 'Horror', 'Crime', 'Adventure', 'Sci-Fi', 'Fantasy',
+          'Animation', 'Documentary', 'Mystery', 'Family', 'War', 'Western', 'Musical', 'History', 'Biography', 'Sport']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=100000, help='titles seeded, a fifth of them shows')
+    parser.add_argument('--queries', type=int, default=200, help='queries per scenario')
+    parser.add_argument('--updates', type=int, default=500, help='titles changed before the delta scenario')
+    return parser.parse_args()
+
+
+def seed(db, Movie, TVShow, count, rng, vocabulary):
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    people = [' '.join(rng.choices(vocabulary[100:], k=2)).title() for _ in range(max(count // 20, 10))]
+
+    def title(i):
+        return {
+            'title': ' '.join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(1, 4))).title(),
+            'year': rng.randint(1950, 2024),
+            'genre': ', '.join(rng.sample(GENRES, rng.randint(1, 3))),
+            'plot': ' '.join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(15, 40))),
+            'imdb_id': f'tt{i:08d}',
+            'rating': round(rng.uniform(1, 10), 1) if rng.random() < 0.05 else None,
+        }
+
+    shows = count // 5
+    for model, total, person, start in ((Movie, count - shows, 'director', 0), (TVShow, shows, 'creator', count)):
+        for offset in range(0, total, 10000):
+            rows = []
+            for i in range(start + offset, start + min(offset + 10000, total)):
+                row = {**title(i), person: rng.choice(people)}
+                if model is Movie:
+                    row['watched'] = rng.random() < 0.02
+                else:
+                    row['total_episodes'] = 10
+                    row['watched_episodes'] = 3 if rng.random() < 0.02 else 0
+                rows.append(row)
+            db.session.execute(model.__table__.insert(), rows)
+    db.session.commit()
+
+
+def timed(run, items):
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        run(item)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return f'{percentile(timings, 0.5):>10.2f}{percentile(timings, 0.95):>10.2f}'
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{os.path.join(workdir, "recommendations.db")}',
+        'RECOMMENDATIONS_DIR': os.path.join(workdir, 'recommendations'),
+        'RECOMMENDATIONS_REBUILD_DELTA': str(args.updates * 10),
+        'JOB_WORKER_THREADS': '0',
+        # Nothing else writes here; the default margin would re-read the last seeded titles
+        'SYNC_SETTLE_SECONDS': '0',
+    })
+    app, db = bench_app()
+    from app.models.models import Movie, TVShow
+    from app.services.recommendations import current_state, index_directory, rebuild_index
+
+    rng = random.Random(11)
+    vocabulary = make_vocabulary(rng, 20000)
+    client = app.test_client()
+
+    with app.app_context():
+        seed(db, Movie, TVShow, args.titles, rng, vocabulary)
+        build = rebuild_index()
+        directory = os.path.join(index_directory(), build['build'])
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        movie_ids = db.session.execute(db.select(Movie.id).order_by(db.func.random()).limit(args.queries)).scalars().all()
+        state = current_state()
+
+    print(f'{build["titles"]} titles, {build["features"]} features, {build["nonzeros"]} non-zeros: '
+          f'built in {build["seconds"]:.1f}s, {size / 1024 / 1024:.1f} MB on disk')
+
+    def rank(movie_id):
+        # Movies are type code 0, so their index keys are their ids
+        columns, weights = state.vector(movie_id)
+        state.rank(columns, weights, 10, [movie_id])
+
+    def similar(movie_id):
+        response = client.get(f'/api/movies/{movie_id}/similar?type=all')
+        assert response.status_code == 200, response.get_json()
+
+    def recommendations(limit):
+        response = client.get(f'/api/recommendations?limit={limit}')
+        assert response.status_code == 200, response.get_json()
+
+    print(f"{'scenario':<34}{'p50 ms':>10}{'p95 ms':>10}")
+    print(f"{'rank, similar title':<34}{timed(rank, movie_ids)}")
+    print(f"{'GET /api/movies/<id>/similar':<34}{timed(similar, movie_ids)}")
+    # Each limit is computed once per collection version, then memoised
+    print(f"{'GET /api/recommendations':<34}{timed(recommendations, range(1, 21))}")
+    print(f"{'GET /api/recommendations, again':<34}{timed(recommendations, range(1, 21))}")
+
+    with app.app_context():
+        changed = movie_ids[:args.updates] + db.session.execute(
+            db.select(Movie.id).order_by(db.func.random()).limit(max(args.updates - len(movie_ids), 0))
+        ).scalars().all()
+        db.session.execute(
+            db.update(Movie).where(Movie.id.in_(changed))
+            .values(plot='A heist crew plans one last job', updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+    print(f"{f'first query after {len(changed)} updates':<34}{timed(similar, movie_ids[:1])}")
+    print(f"{'GET /api/movies/<id>/similar':<34}{timed(similar, movie_ids)}")
+
+
+if __name__ == '__main__':
+    main()
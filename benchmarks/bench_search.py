@@ -0,0 +1,148 @@
+"""Benchmark library search latency against a seeded SQLite database.
+
+Seeds movies with generated titles, directors and plots, then times
+GET /api/movies?search= for whole words, prefixes typed one letter at a
+time (search-as-you-type), typos and multi-word queries. It compares the
+full-text index, both title-sorted and ranked, against the previous
+``title ILIKE '%term%'`` filter, which is re-implemented here as the
+baseline.
+
+Usage:
+    python -m benchmarks.bench_search [--movies 100000] [--queries 50]
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks import bench_app
+
+CONSONANTS = 'bcdfghjklmnprstvwz'
+VOWELS = 'aeiou'
+
+# The most frequent words of any real text, ahead of the generated ones
+STOPWORDS = ['the', 'of', 'and', 'a', 'to', 'in', 'his', 'her', 'is', 'with', 'an', 'on', 'for', 'who', 'their']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=50, help='queries per scenario')
+    return parser.parse_args()
+
+
+def make_vocabulary(rng, size):
+    """Pronounceable made-up words, most frequent first"""
+    words = set()
+    while len(words) < size:
+        syllables = rng.randint(1, 4)
+        words.add(''.join(rng.choice(CONSONANTS) + rng.choice(VOWELS) + rng.choice(['', '', rng.choice(CONSONANTS)])
+                          for _ in range(syllables)))
+    words = sorted(words - set(STOPWORDS))
+    rng.shuffle(words)
+    return STOPWORDS + words
+
+
+def seed(db, Movie, count, rng, vocabulary):
+    """Insert movies in batches; returns the seconds spent, index upkeep included"""
+    # Zipf-like word frequencies, as in real text
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    start = time.perf_counter()
+    for offset in range(0, count, 10000):
+        rows = []
+        for i in range(offset, min(offset + 10000, count)):
+            rows.append({
+                'title': ' '.join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(1, 4))).title(),
+                'year': 1950 + i % 75,
+                'genre': 'Drama',
+                'director': ' '.join(rng.choices(vocabulary, k=2)).title(),
+                'poster_url': '',
+                'plot': ' '.join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(15, 40))),
+                'imdb_id': f'tt{i:08d}',
+                'notes': '',
+            })
+        db.session.execute(Movie.__table__.insert(), rows)
+    db.session.commit()
+    return time.perf_counter() - start
+
+
+def typo(rng, word):
+    position = rng.randrange(1, len(word))
+    return word[:position] + rng.choice('aeiouxyz') + word[position + 1:]
+
+
+def percentile(timings, fraction):
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))] * 1000
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "search.db")}'
+
+    app, db = bench_app()
+    from app.models.models import Movie
+    from app.services.search import get_backend
+
+    rng = random.Random(7)
+    vocabulary = make_vocabulary(rng, 20000)
+    client = app.test_client()
+
+    with app.app_context():
+        seconds = seed(db, Movie, args.movies, rng, vocabulary)
+        backend = get_backend().name
+        titles = db.session.execute(db.select(Movie.title).order_by(db.func.random()).limit(args.queries)).scalars().all()
+
+        def legacy(term):
+            # The old route: a substring match on the title only
+            movies = (Movie.query.filter(Movie.title.ilike(f'%{term.lower()}%'))
+                      .order_by(Movie.title, Movie.id).limit(49).all())
+            return len(json.dumps([movie.to_dict() for movie in movies[:48]]))
+
+    print(f'{args.movies} movies seeded in {seconds:.1f}s with the {backend} index maintained by triggers')
+
+    # Search for the longest word of each title, as a user would
+    words = [max(title.lower().split(), key=len) for title in titles]
+    scenarios = {
+        'whole word': words,
+        'as you type': [word[:length] for word in words for length in range(2, len(word) + 1)],
+        'typo': [typo(rng, word) for word in words if len(word) >= 5],
+        'two words': [title.lower() for title in titles if ' ' in title],
+    }
+
+    def api(sort):
+        def run(term):
+            response = client.get(f'/api/movies/?search={term}&limit=48&sort={sort}')
+            assert response.status_code == 200, response.get_json()
+            return len(response.get_json()['items'])
+        return run
+
+    modes = [
+        ('ILIKE title (before)', legacy, True),
+        ('fts, title sort', api('title'), False),
+        ('fts, relevance', api('relevance'), False),
+    ]
+
+    print(f"{'scenario':<14}{'mode':<24}{'queries':>8}{'p50 ms':>10}{'p95 ms':>10}{'hits/q':>8}")
+    for scenario, terms in scenarios.items():
+        for label, run, needs_context in modes:
+            timings = []
+            hits = 0
+            for term in terms:
+                start = time.perf_counter()
+                if needs_context:
+                    with app.app_context():
+                        hits += min(run(term), 48)
+                else:
+                    hits += run(term)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f'{scenario:<14}{label:<24}{len(terms):>8}{percentile(timings, 0.5):>10.2f}'
+                  f'{percentile(timings, 0.95):>10.2f}{hits / max(len(terms), 1):>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark list serialization paths against a seeded SQLite database.
+
+Serializes the first N movies (10k and 100k by default) four ways:
+
+- ORM entities, ``to_dict()`` per row and ``jsonify``: the path every list
+  endpoint took before column projection
+- projected rows, :func:`serialize_rows` and the stdlib encoder
+- projected rows, :func:`serialize_rows` and orjson (if installed)
+- the same with a sparse fieldset (``fields=id,title,year,poster_url``)
+
+Each run covers the query, the dict building and the encoding, which is
+all a list endpoint does besides pagination. All full-field variants must
+produce the same JSON document.
+
+Usage:
+    python -m benchmarks.bench_serialization [--rows 10000,100000] [--runs 5]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import bench_app
+
+SPARSE_FIELDS = ('id', 'title', 'year', 'poster_url')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='10000,100000', help='comma-separated row counts')
+    parser.add_argument('--runs', type=int, default=5)
+    return parser.parse_args()
+
+
+def seed(db, Movie, count):
+    start = datetime.utcnow() - timedelta(days=365)
+    for offset in range(0, count, 10000):
+        db.session.execute(Movie.__table__.insert(), [
+            {
+                'title': f'Movie {i:06d}',
+                'year': 1970 + i % 50,
+                'genre': 'Drama, Thriller',
+                'director': f'Director {i % 300}',
+                'poster_url': f'https://m.media-amazon.com/images/M/{i:08d}.jpg',
+                'plot': 'A film about something that happens to someone, told over two hours.',
+                'imdb_id': f'tt{i:07d}',
+                'watched': i % 3 == 0,
+                'rating': (i % 90) / 10 if i % 4 else None,
+                'notes': '',
+                'watch_later': i % 7 == 0,
+                'created_at': start + timedelta(seconds=i),
+                'updated_at': start + timedelta(seconds=i),
+            }
+            for i in range(offset + 1, min(offset + 10000, count) + 1)
+        ])
+    db.session.commit()
+
+
+def measure(func, runs):
+    timings = []
+    body = b''
+    for _ in range(runs):
+        start = time.perf_counter()
+        body = func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, body
+
+
+def main():
+    args = parse_args()
+    counts = [int(value) for value in args.rows.split(',')]
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "serialization.db")}'
+
+    from flask import jsonify
+    app, db = bench_app()
+    from app.models.models import Movie
+    from app.utils import serialization
+    from app.utils.serialization import FIELDS, encode_stdlib, project, serialize_rows
+
+    with app.app_context():
+        seed(db, Movie, max(counts))
+
+    def orm_path(limit):
+        movies = Movie.query.order_by(Movie.id).limit(limit).all()
+        body = jsonify({'items': [movie.to_dict() for movie in movies]}).get_data()
+        # Drop the entities, as the end of a request would
+        db.session.remove()
+        return body
+
+    def projected(limit, fields, encode):
+        rows = project(Movie.query, Movie, fields).order_by(Movie.id).limit(limit).all()
+        return encode({'items': serialize_rows(rows, Movie, fields)})
+
+    variants = [
+        ('to_dict + jsonify', lambda limit: orm_path(limit)),
+        ('projected + json', lambda limit: projected(limit, FIELDS[Movie], encode_stdlib)),
+    ]
+    if serialization.orjson is not None:
+        variants.append(('projected + orjson', lambda limit: projected(limit, FIELDS[Movie], serialization.encode)))
+    else:
+        print('orjson is not installed; skipping the orjson variants')
+    variants.append((f'sparse + {serialization.BACKEND}',
+                     lambda limit: projected(limit, SPARSE_FIELDS, serialization.encode)))
+
+    print(f"{'rows':>8}  {'path':<22}{'median ms':>11}{'bytes':>12}{'speedup':>9}")
+    with app.app_context():
+        for count in counts:
+            baseline = None
+            expected = None
+            for label, func in variants:
+                median, body = measure(lambda: func(count), args.runs)
+                if baseline is None:
+                    baseline = median
+                    expected = json.loads(body)
+                elif not label.startswith('sparse'):
+                    assert json.loads(body) == expected, label
+                print(f'{count:>8}  {label:<22}{median:>11.1f}{len(body):>12}{baseline / median:>8.1f}x')
+    print('all full-field paths produce the same document')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Measure how long a web process takes to start, against a budget.
+
+Each run starts a fresh interpreter that imports ``wsgi``, which builds the
+production app through ``create_app``, and then answers one API request,
+as a new gunicorn worker does. Reports the median import and first-request
+times and any of ``LAZY_MODULES`` that the import loaded.
+
+Exits with status 1 when the median import time is over ``--budget``
+milliseconds or a lazily imported module was loaded at startup.
+tests/test_startup.py runs the same check with the test suite.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 7] [--budget 1000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Heavy dependencies that are only imported when first needed
+LAZY_MODULES = ('requests', 'urllib3', 'PIL', 'numpy')
+
+# Median time to import wsgi allowed, in milliseconds
+BUDGET_MS = 1000
+
+CHILD = f'''
+import json, sys, time
+start = time.perf_counter()
+import wsgi
+imported = time.perf_counter()
+response = wsgi.app.test_client().get('/api/movies/?limit=1')
+assert response.status_code == 200, response.status_code
+answered = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'request_ms': (answered - imported) * 1000,
+    'loaded': [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7, help='fresh interpreters to start')
+    parser.add_argument('--budget', type=float, default=BUDGET_MS, help='median import time allowed, in ms')
+    return parser.parse_args()
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def measure(runs):
+    """Start ``runs`` fresh web processes; returns the median import and
+    first-request times in ms and the lazy modules any of them loaded"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    env = dict(os.environ, APP_ENV='production', JOB_WORKER_THREADS='0',
+               DATABASE_URL=f'sqlite:///{os.path.join(workdir, "startup.db")}')
+
+    # Production apps leave the schema alone, so it is created up front
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'wsgi', 'init-db'],
+                   cwd=root, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', CHILD], cwd=root, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+
+    import_ms = median(result['import_ms'] for result in results)
+    request_ms = median(result['request_ms'] for result in results)
+    loaded = sorted({name for result in results for name in result['loaded']})
+    return import_ms, request_ms, loaded
+
+
+def main():
+    args = parse_args()
+    import_ms, request_ms, loaded = measure(args.runs)
+    print(f'{"runs":<24}{args.runs:>10}')
+    print(f'{"import wsgi, median ms":<24}{import_ms:>10.1f}')
+    print(f'{"first request, ms":<24}{request_ms:>10.1f}')
+    print(f'{"budget ms":<24}{args.budget:>10.0f}')
+    print(f'lazy modules loaded at startup: {", ".join(loaded) or "none"}')
+
+    if import_ms > args.budget or loaded:
+        print('FAIL: startup is over budget' if import_ms > args.budget else
+              'FAIL: a lazily imported module is loaded at startup')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
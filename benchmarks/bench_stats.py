@@ -0,0 +1,209 @@
+"""Benchmark time-to-dashboard and payload size against a seeded SQLite database.
+
+Compares three ways of filling the dashboard:
+
+- the original client behaviour: download every page of /api/movies and
+  /api/tv and compute totals and recent titles from the full lists
+- the five ``count=true`` list requests the dashboard made before /api/stats
+- GET /api/stats, both cold (movies version just bumped) and cached
+
+Usage:
+    python -m benchmarks.bench_stats [--movies 20000] [--shows 5000] [--episodes 20] [--runs 5]
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import bench_app
+
+SUMMARY_URLS = [
+    '/api/movies/?sort=-created_at&limit=6&count=true',
+    '/api/tv/?sort=-created_at&limit=6&count=true',
+    '/api/movies/?watched=true&limit=1&count=true',
+    '/api/movies/?watch_later=true&limit=1&count=true',
+    '/api/tv/?watch_later=true&limit=1&count=true',
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', type=int, default=20000)
+    parser.add_argument('--shows', type=int, default=5000)
+    parser.add_argument('--episodes', type=int, default=20, help='episodes per show')
+    parser.add_argument('--runs', type=int, default=5)
+    return parser.parse_args()
+
+
+def seed(db, Movie, TVShow, Episode, movies, shows, episodes_per_show):
+    """Insert titles with executemany; created_at is spread so recency matters"""
+    start = datetime.utcnow() - timedelta(days=365)
+    db.session.execute(Movie.__table__.insert(), [
+        {
+            'title': f'Movie {i:06d}',
+            'year': 1970 + i % 50,
+            'genre': 'Drama, Thriller',
+            'director': f'Director {i % 300}',
+            'poster_url': '',
+            'plot': 'A film about something that happens to someone.',
+            'imdb_id': f'tt{i:07d}',
+            'watched': i % 3 == 0,
+            'watch_later': i % 7 == 0,
+            'created_at': start + timedelta(minutes=2 * i),
+        }
+        for i in range(1, movies + 1)
+    ])
+    db.session.execute(TVShow.__table__.insert(), [
+        {
+            'title': f'Show {i:05d}',
+            'year': 1990 + i % 30,
+            'genre': 'Drama, Comedy',
+            'creator': f'Creator {i % 50}',
+            'poster_url': '',
+            'plot': 'A long running series.',
+            'imdb_id': f'tt9{i:06d}',
+            'total_episodes': episodes_per_show,
+            'watched_episodes': episodes_per_show // 2,
+            'watch_later': i % 3 == 0,
+            'created_at': start + timedelta(minutes=2 * i + 1),
+        }
+        for i in range(1, shows + 1)
+    ])
+    db.session.execute(Episode.__table__.insert(), [
+        {
+            'tv_show_id': show_id,
+            'season': 1,
+            'episode_number': number,
+            'title': f'Episode {number}',
+            'watched': number <= episodes_per_show // 2,
+        }
+        for show_id in range(1, shows + 1)
+        for number in range(1, episodes_per_show + 1)
+    ])
+    db.session.commit()
+
+
+def fetch_all(client, url):
+    """Follow next_cursor through every page, as the old client did"""
+    items = []
+    size = 0
+    requests = 0
+    cursor = None
+    while True:
+        response = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+        size += len(response.data)
+        requests += 1
+        page = response.get_json()
+        items.extend(page['items'])
+        cursor = page.get('next_cursor')
+        if not cursor:
+            return items, size, requests
+
+
+def full_collection(client):
+    movies, movie_bytes, movie_requests = fetch_all(client, '/api/movies/?limit=200')
+    shows, show_bytes, show_requests = fetch_all(client, '/api/tv/?limit=200')
+    # The old updateDashboard: filter, merge, sort and slice on the client
+    dashboard = {
+        'movie_count': len(movies),
+        'tv_count': len(shows),
+        'watched_count': sum(1 for m in movies if m['watched']) + sum(s['watched_episodes'] for s in shows),
+        'watch_later_count': sum(1 for m in movies if m['watch_later']) + sum(1 for s in shows if s['watch_later']),
+        'recent': sorted(movies + shows, key=lambda item: item['created_at'] or '', reverse=True)[:6],
+    }
+    return dashboard, movie_bytes + show_bytes, movie_requests + show_requests
+
+
+def summaries(client):
+    responses = [client.get(url) for url in SUMMARY_URLS]
+    pages = [response.get_json() for response in responses]
+    dashboard = {
+        'movie_count': pages[0]['total'],
+        'tv_count': pages[1]['total'],
+        'watched_count': pages[2]['total'] + pages[1]['watched_episodes'],
+        'watch_later_count': pages[3]['total'] + pages[4]['total'],
+        'recent': sorted(pages[0]['items'] + pages[1]['items'],
+                         key=lambda item: item['created_at'] or '', reverse=True)[:6],
+    }
+    return dashboard, sum(len(response.data) for response in responses), len(responses)
+
+
+def stats(client):
+    response = client.get('/api/stats')
+    return response.get_json(), len(response.data), 1
+
+
+def measure(label, func, runs, counter, before=None):
+    timings = []
+    for _ in range(runs):
+        if before:
+            before()
+        counter['queries'] = 0
+        start = time.perf_counter()
+        dashboard, size, requests = func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        'scenario': label,
+        'requests': requests,
+        'queries': counter['queries'],
+        'bytes': size,
+        'median_ms': round(timings[len(timings) // 2] * 1000, 2),
+        'dashboard': dashboard,
+    }
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "stats.db")}'
+
+    from sqlalchemy import event
+    app, db = bench_app()
+    from app.models.models import CollectionVersion, Episode, Movie, TVShow
+    from app.services.versions import MOVIES
+
+    counter = {'queries': 0}
+    with app.app_context():
+        seed(db, Movie, TVShow, Episode, args.movies, args.shows, args.episodes)
+
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_queries(*_):
+            counter['queries'] += 1
+
+    def bump_version():
+        # What any commit that changes a movie does; the cached stats are for the old version
+        with app.app_context():
+            db.session.execute(
+                db.update(CollectionVersion).where(CollectionVersion.name == MOVIES)
+                .values(version=CollectionVersion.version + 1)
+            )
+            db.session.commit()
+
+    client = app.test_client()
+    results = [
+        measure('full collection', lambda: full_collection(client), args.runs, counter),
+        measure('five count=true requests', lambda: summaries(client), args.runs, counter),
+        measure('GET /api/stats cold', lambda: stats(client), args.runs, counter, before=bump_version),
+        measure('GET /api/stats cached', lambda: stats(client), args.runs, counter),
+    ]
+
+    print(f'{args.movies} movies / {args.shows} shows / {args.shows * args.episodes} episodes, {args.runs} runs')
+    for result in results:
+        print(f"{result['scenario']:<26} requests={result['requests']:<4} queries={result['queries']:<5} "
+              f"bytes={result['bytes']:<10} median={result['median_ms']:>9.2f}ms")
+
+    # Every approach has to produce the same dashboard
+    expected = results[0]['dashboard']
+    for result in results[1:]:
+        dashboard = result['dashboard']
+        for key in ('movie_count', 'tv_count', 'watched_count', 'watch_later_count'):
+            assert dashboard[key] == expected[key], (result['scenario'], key)
+        assert [item['id'] for item in dashboard['recent']] == [item['id'] for item in expected['recent']], \
+            result['scenario']
+    print('all scenarios agree on the dashboard')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Benchmark GET /api/tv against a seeded SQLite database.
+
+Compares the legacy per-show ``to_dict()`` path (one lazy episode query per
+show) with the aggregated list mode and ``?include=episodes``.
+
+Usage:
+    python -m benchmarks.bench_tv_list [--shows 500] [--episodes 100] [--runs 5]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks import bench_app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, default=500)
+    parser.add_argument('--episodes', type=int, default=100, help='episodes per show')
+    parser.add_argument('--runs', type=int, default=5)
+    return parser.parse_args()
+
+
+def seed(db, TVShow, Episode, shows, episodes_per_show):
+    """Insert shows and episodes with executemany so seeding stays fast"""
+    now = datetime.utcnow()
+    db.session.execute(TVShow.__table__.insert(), [
+        {
+            'title': f'Show {i:05d}',
+            'year': 1990 + i % 30,
+            'genre': 'Drama, Comedy',
+            'creator': f'Creator {i % 50}',
+            'poster_url': '',
+            'plot': 'A long running series.',
+            'imdb_id': f'tt{i:07d}',
+            'total_episodes': episodes_per_show,
+            'watch_later': i % 3 == 0,
+            'created_at': now,
+        }
+        for i in range(1, shows + 1)
+    ])
+    db.session.execute(Episode.__table__.insert(), [
+        {
+            'tv_show_id': show_id,
+            'season': 1,
+            'episode_number': number,
+            'title': f'Episode {number}',
+            'watched': number % 4 != 0,
+        }
+        for show_id in range(1, shows + 1)
+        for number in range(1, episodes_per_show + 1)
+    ])
+    db.session.commit()
+
+
+def measure(label, func, runs, counter):
+    timings = []
+    for _ in range(runs):
+        counter['queries'] = 0
+        start = time.perf_counter()
+        size = func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        'scenario': label,
+        'queries': counter['queries'],
+        'median_ms': round(timings[len(timings) // 2] * 1000, 2),
+        'min_ms': round(timings[0] * 1000, 2),
+        'bytes': size,
+    }
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+
+    from sqlalchemy import event
+    app, db = bench_app()
+    from app.models.models import TVShow, Episode
+
+    counter = {'queries': 0}
+
+    with app.app_context():
+        seed(db, TVShow, Episode, args.shows, args.episodes)
+
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_queries(*_):
+            counter['queries'] += 1
+
+        def legacy():
+            db.session.expunge_all()
+            shows = [show.to_dict() for show in TVShow.query.all()]
+            return len(json.dumps(shows))
+
+        client = app.test_client()
+
+        def list_mode():
+            db.session.expunge_all()
+            return len(client.get('/api/tv/').data)
+
+        def with_episodes():
+            db.session.expunge_all()
+            return len(client.get('/api/tv/?include=episodes').data)
+
+        results = [
+            measure('legacy to_dict per show', legacy, args.runs, counter),
+            measure('GET /api/tv', list_mode, args.runs, counter),
+            measure('GET /api/tv?include=episodes', with_episodes, args.runs, counter),
+        ]
+
+    print(f'{args.shows} shows / {args.shows * args.episodes} episodes, {args.runs} runs')
+    for result in results:
+        print(f"{result['scenario']:<32} queries={result['queries']:<5} "
+              f"median={result['median_ms']:>9.2f}ms min={result['min_ms']:>9.2f}ms "
+              f"bytes={result['bytes']}")
+
+
+if __name__ == '__main__':
+    main()
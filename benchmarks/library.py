@@ -0,0 +1,122 @@
+"""Seeded synthetic libraries for benchmarks.
+
+A :class:`Library` describes a collection: how many movies and shows, and
+how many seasons per show and episodes per season. It generates the same
+titles for the same ``seed``: titles and plots made of made-up words,
+Zipf-distributed like real text, genres, people, years, ratings and
+watched flags, with shows watched up to some episode. :func:`write_export`
+streams it to an export file and :func:`seed_app` loads that through
+``POST /api/import``, so the app's own importer fills in genres, season
+counters and search indexes exactly as it does for users.
+
+Usage:
+    python -m benchmarks.library out.json [--movies 5000] [--shows 500] [--seasons 3] [--episodes 10] [--seed 1]
+"""
+import argparse
+import itertools
+import json
+import random
+
+from benchmarks.bench_search import make_vocabulary
+
+GENRES = ['Drama', 'Comedy', 'Action', 'Thriller', 'Romance', 'Horror', 'Crime', 'Adventure', 'Sci-Fi', 'Fantasy',
+          'Animation', 'Documentary', 'Mystery', 'Family', 'War', 'Western', 'Musical', 'History', 'Biography', 'Sport']
+
+
+class Library:
+    """Generates the movie and show records of a synthetic collection"""
+
+    def __init__(self, movies=5000, shows=500, seasons=3, episodes=10, seed=1):
+        self.movies = movies
+        self.shows = shows
+        self.seasons = seasons
+        self.episodes = episodes
+        self.seed = seed
+        rng = random.Random(seed)
+        self.words = make_vocabulary(rng, 5000)
+        self._weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(self.words))))
+        self.people = [' '.join(rng.choices(self.words[100:], k=2)).title()
+                       for _ in range(max((movies + shows) // 20, 10))]
+
+    def __repr__(self):
+        return (f'Library(movies={self.movies}, shows={self.shows}, seasons={self.seasons}, '
+                f'episodes={self.episodes}, seed={self.seed})')
+
+    def _text(self, rng, low, high):
+        return ' '.join(rng.choices(self.words, cum_weights=self._weights, k=rng.randint(low, high)))
+
+    def _title(self, rng, number):
+        return {
+            'title': self._text(rng, 1, 4).title(),
+            'year': rng.randint(1950, 2024),
+            'genre': ', '.join(rng.sample(GENRES, rng.randint(1, 3))),
+            'poster_url': '',
+            'plot': self._text(rng, 15, 40).capitalize() + '.',
+            'imdb_id': f'tt{number:08d}',
+            'rating': round(rng.uniform(1, 10), 1) if rng.random() < 0.5 else None,
+            'notes': '',
+            'watch_later': rng.random() < 0.1,
+            'created_at': f'2024-01-01T00:{number // 60 % 60:02d}:{number % 60:02d}',
+        }
+
+    def iter_movies(self):
+        rng = random.Random(f'{self.seed}:movies')
+        for n in range(1, self.movies + 1):
+            yield {**self._title(rng, n), 'director': rng.choice(self.people), 'watched': rng.random() < 0.3}
+
+    def iter_shows(self):
+        rng = random.Random(f'{self.seed}:shows')
+        total = self.seasons * self.episodes
+        for n in range(1, self.shows + 1):
+            # Most shows are untouched; the others are watched up to some episode
+            watched = rng.randint(0, total) if rng.random() < 0.4 else 0
+            yield {
+                **self._title(rng, self.movies + n),
+                'creator': rng.choice(self.people),
+                'total_episodes': total,
+                'episodes': [
+                    {'season': season, 'episode_number': number, 'title': f'Episode {number}',
+                     'watched': (season - 1) * self.episodes + number <= watched}
+                    for season in range(1, self.seasons + 1) for number in range(1, self.episodes + 1)
+                ],
+            }
+
+
+def write_export(path, library):
+    """Write ``library`` as an export file, one record at a time"""
+    with open(path, 'w', encoding='utf-8') as out:
+        out.write('{"exportDate": "2024-01-01T00:00:00Z", "movies": [')
+        for n, movie in enumerate(library.iter_movies()):
+            out.write(',' if n else '')
+            json.dump(movie, out)
+        out.write('], "tvShows": [')
+        for n, show in enumerate(library.iter_shows()):
+            out.write(',' if n else '')
+            json.dump(show, out)
+        out.write(']}')
+
+
+def seed_app(client, path):
+    """Import an export file through the API; returns the import report"""
+    with open(path, 'rb') as source:
+        response = client.post('/api/import?report=summary', data=source, content_type='application/json')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='export file to write')
+    parser.add_argument('--movies', type=int, default=5000)
+    parser.add_argument('--shows', type=int, default=500)
+    parser.add_argument('--seasons', type=int, default=3, help='seasons per show')
+    parser.add_argument('--episodes', type=int, default=10, help='episodes per season')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    library = Library(args.movies, args.shows, args.seasons, args.episodes, args.seed)
+    write_export(args.path, library)
+    print(f'Wrote {library} to {args.path}')
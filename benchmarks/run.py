@@ -0,0 +1,433 @@
+"""Run benchmark scenarios against the app and report them as JSON.
+
+Seeds a :class:`~benchmarks.library.Library` into a fresh SQLite database,
+starts the stub OMDB server and runs every scenario against every target:
+
+- ``client``: the Flask test client inside this process
+- ``gunicorn``: gunicorn.conf.py with ``--workers`` processes, over HTTP
+
+Both get ``--clients`` concurrent client threads and their own copy of the
+seeded database. A scenario sends ``--warmup`` unmeasured requests, then
+``--requests`` measured ones, drawn from random generators seeded per
+client thread, so every run sends the same requests. Each result has
+throughput, p50/p95/p99 latency, failed requests, SQL queries per request
+(from the ``Server-Timing`` header) and peak RSS while it ran: of this
+process for ``client``, of the gunicorn master and workers together for
+``gunicorn`` (read from /proc, so on Linux only).
+
+The table goes to stderr and the JSON report, with the commit and the
+machine it ran on, to ``--output`` (stdout by default). ``--compare``
+prints the change against an earlier report; with ``--max-regression``
+the run exits with status 1 when a p95 latency grew by more than that many
+percent, so it can guard performance in CI.
+
+Usage:
+    python -m benchmarks.run [--targets client,gunicorn] [--scenarios movies_list,tv_list] [--requests 500]
+        [--clients 8] [--workers 2] [--movies 5000] [--shows 500] [--seasons 3] [--episodes 10]
+        [--seed 1] [--output report.json] [--compare baseline.json] [--max-regression 20]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from benchmarks import bench_app
+from benchmarks.library import GENRES, Library, seed_app, write_export
+from benchmarks.stub_omdb import StubOmdbServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = ('client', 'gunicorn')
+QUERIES = re.compile(r'desc="(\d+) quer(?:y|ies)"')
+RSS_INTERVAL = 0.2
+
+
+def movies_list(rng, sample):
+    sort = rng.choice(['title', '-year', '-rating', '-created_at'])
+    extra = rng.choice(['', f'&genre={rng.choice(GENRES)}', '&watched=false', f'&search={rng.choice(sample.words)}'])
+    return 'GET', f'/api/movies/?limit=24&sort={sort}{extra}', None
+
+
+def tv_list(rng, sample):
+    sort = rng.choice(['title', '-year', '-created_at'])
+    extra = rng.choice(['', f'&genre={rng.choice(GENRES)}', f'&search={rng.choice(sample.words)}'])
+    return 'GET', f'/api/tv/?limit=24&sort={sort}{extra}', None
+
+
+def update_episode(rng, sample):
+    show_id, episode_id = rng.choice(sample.episodes)
+    return 'PUT', f'/api/tv/{show_id}/episodes/{episode_id}', {'watched': rng.random() < 0.5}
+
+
+def omdb_search(rng, sample):
+    # A small set of terms, so most searches are answered from the OMDB cache
+    return 'GET', f'/api/search?query={rng.choice(sample.words[:50])}', None
+
+
+def omdb_details(rng, sample):
+    return 'GET', f'/api/details/tt{rng.randint(1, 500):07d}', None
+
+
+def mixed(rng, sample):
+    roll = rng.random()
+    scenario = (movies_list if roll < 0.6 else tv_list if roll < 0.8 else update_episode if roll < 0.9 else
+                omdb_search if roll < 0.95 else omdb_details)
+    return scenario(rng, sample)
+
+
+SCENARIOS = {scenario.__name__: scenario for scenario in
+             (movies_list, tv_list, update_episode, omdb_search, omdb_details, mixed)}
+
+
+class Sample:
+    """IDs and words scenarios pick their requests from"""
+
+    def __init__(self, app, db, library):
+        from app.models.models import Episode
+
+        with app.app_context():
+            rows = db.session.execute(
+                db.select(Episode.tv_show_id, Episode.id).order_by(Episode.id).limit(5000)
+            ).all()
+            self.episodes = [tuple(row) for row in rows] or [(1, 1)]
+        self.words = library.words[15:515]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--targets', default=','.join(TARGETS), help='comma-separated targets to run')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated scenarios to run')
+    parser.add_argument('--requests', type=int, default=500, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='unmeasured requests before each scenario')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent client threads')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--movies', type=int, default=5000)
+    parser.add_argument('--shows', type=int, default=500)
+    parser.add_argument('--seasons', type=int, default=3, help='seasons per show')
+    parser.add_argument('--episodes', type=int, default=10, help='episodes per season')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--stub-delay', type=float, default=0.05, help='stub OMDB response delay in seconds')
+    parser.add_argument('--output', default='-', help='JSON report file, - for stdout')
+    parser.add_argument('--compare', help='earlier JSON report to compare with')
+    parser.add_argument('--max-regression', type=float, help='fail when a p95 latency grew by more percent')
+    return parser.parse_args()
+
+
+class InProcess:
+    """Sends requests through the Flask test client, one client per thread"""
+    name = 'client'
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def pids(self):
+        return [os.getpid()]
+
+    def send(self, method, path, body):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+    def close(self):
+        pass
+
+
+class Gunicorn:
+    """Sends requests over HTTP to gunicorn workers, one session per thread"""
+    name = 'gunicorn'
+
+    def __init__(self, database, workers, port=8790):
+        import requests
+
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', PORT=str(port), WEB_CONCURRENCY=str(workers),
+                   APP_ENV='production')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+             '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.url = f'http://127.0.0.1:{port}'
+        self._requests = requests
+        self._local = threading.local()
+        for _ in range(200):
+            try:
+                if requests.get(f'{self.url}/api/movies/?limit=1', timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.1)
+        self.close()
+        raise RuntimeError('gunicorn did not start')
+
+    def pids(self):
+        return [self.process.pid] + child_pids(self.process.pid)
+
+    def send(self, method, path, body):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        try:
+            response = session.request(method, self.url + path, json=body, timeout=30)
+        except self._requests.RequestException:
+            return 599, ''
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def child_pids(parent):
+    """PIDs whose parent is ``parent``, from /proc"""
+    children = []
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else ():
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command may contain spaces; fields after it are fixed
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if ppid == parent:
+                children.append(int(entry))
+    return children
+
+
+def rss_mb(pids):
+    """Resident memory of the processes together, or None where /proc is missing"""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            if not os.path.isdir('/proc'):
+                return None
+    return total / 1024
+
+
+class RssSampler:
+    """Peak of :func:`rss_mb` over the pids of a target, sampled in a thread"""
+
+    def __init__(self, target):
+        self.target = target
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            current = rss_mb(self.target.pids())
+            if current is not None:
+                self.peak = max(self.peak or 0, current)
+            if self._stop.wait(RSS_INTERVAL):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        if self.peak is None and self.target.name == 'client':
+            # Without /proc: the peak of this process so far, in kilobytes on Linux and bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(target, name, sample, args):
+    scenario = SCENARIOS[name]
+    timings, queries, failures = [], [], []
+    lock = threading.Lock()
+    shares = [args.requests // args.clients + (n < args.requests % args.clients) for n in range(args.clients)]
+
+    def client(number, count, measured):
+        rng = random.Random(f'{args.seed}:{name}:{number}:{measured}')
+        mine = []
+        for _ in range(count):
+            method, path, body = scenario(rng, sample)
+            began = time.perf_counter()
+            status, timing = target.send(method, path, body)
+            elapsed = time.perf_counter() - began
+            match = QUERIES.search(timing)
+            mine.append((elapsed, int(match.group(1)) if match else None, status))
+        if measured:
+            with lock:
+                timings.extend(elapsed for elapsed, _, _ in mine)
+                queries.extend(count for _, count, _ in mine if count is not None)
+                failures.extend(status for _, _, status in mine if status >= 400)
+
+    def run(counts, measured):
+        threads = [threading.Thread(target=client, args=(n, count, measured)) for n, count in enumerate(counts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    run([args.warmup // args.clients + 1] * args.clients, False)
+    with RssSampler(target) as rss:
+        started = time.perf_counter()
+        run(shares, True)
+        seconds = time.perf_counter() - started
+    timings.sort()
+    return {
+        'target': target.name,
+        'scenario': name,
+        'requests': len(timings),
+        'failed': len(failures),
+        'seconds': round(seconds, 3),
+        'throughput': round(len(timings) / seconds, 1),
+        'latency_ms': {label: round(percentile(timings, fraction) * 1000, 2)
+                       for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))},
+        'queries': {'mean': round(sum(queries) / len(queries), 2), 'max': max(queries)} if queries else None,
+        'peak_rss_mb': round(rss.peak, 1) if rss.peak is not None else None,
+    }
+
+
+def metadata(args, library):
+    def git(*command):
+        try:
+            return subprocess.run(['git', *command], cwd=ROOT, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'library': repr(library),
+        'args': {name: value for name, value in vars(args).items() if name not in ('output', 'compare')},
+    }
+
+
+def compare(report, baseline_path, max_regression):
+    """Print changes against an earlier report; returns the regressions over ``max_regression``"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    before = {(result['target'], result['scenario']): result for result in baseline['results']}
+    regressions = []
+
+    def change(new, old):
+        return (new - old) / old * 100 if old else 0.0
+
+    log(f'\nCompared with {(baseline["meta"].get("commit") or "?")[:12]}:')
+    log(f'{"target":<10}{"scenario":<16}{"p50":>9}{"p95":>9}{"p99":>9}{"req/s":>9}{"queries":>9}')
+    for result in report['results']:
+        old = before.get((result['target'], result['scenario']))
+        if old is None:
+            continue
+        latency = {label: change(result['latency_ms'][label], old['latency_ms'][label]) for label in ('p50', 'p95', 'p99')}
+        throughput = change(result['throughput'], old['throughput'])
+        queries = (change(result['queries']['mean'], old['queries']['mean'])
+                   if result['queries'] and old['queries'] else 0.0)
+        log(f'{result["target"]:<10}{result["scenario"]:<16}{latency["p50"]:>+8.0f}%{latency["p95"]:>+8.0f}%'
+            f'{latency["p99"]:>+8.0f}%{throughput:>+8.0f}%{queries:>+8.0f}%')
+        if max_regression is not None and latency['p95'] > max_regression:
+            regressions.append(f'{result["target"]} {result["scenario"]}: p95 {latency["p95"]:+.0f}%')
+    return regressions
+
+
+def log(message):
+    print(message, file=sys.stderr)
+
+
+def main():
+    args = parse_args()
+    unknown = set(args.scenarios.split(',')) - set(SCENARIOS) | set(args.targets.split(',')) - set(TARGETS)
+    if unknown:
+        sys.exit(f'Unknown scenarios or targets: {", ".join(sorted(unknown))}')
+
+    server = StubOmdbServer(('127.0.0.1', 0), delay=args.stub_delay).start()
+    workdir = tempfile.mkdtemp(prefix='cinemate-bench-')
+    database = os.path.join(workdir, 'client.db')
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{database}',
+        'OMDB_API_KEY': 'bench',
+        'OMDB_BASE_URL': server.url,
+        'JOB_WORKER_THREADS': '0',
+        'RECOMMENDATIONS_DIR': os.path.join(workdir, 'recommendations'),
+    })
+    app, db = bench_app()
+
+    library = Library(args.movies, args.shows, args.seasons, args.episodes, args.seed)
+    export = os.path.join(workdir, 'library.json')
+    write_export(export, library)
+    started = time.perf_counter()
+    seed_app(app.test_client(), export)
+    log(f'Seeded {library} in {time.perf_counter() - started:.1f}s')
+    sample = Sample(app, db, library)
+
+    # Every target starts from the same data: fold the write-ahead log into
+    # the file, then copy it
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    connection = sqlite3.connect(database)
+    connection.execute('PRAGMA journal_mode=delete')
+    connection.close()
+    pristine = os.path.join(workdir, 'gunicorn.db')
+    shutil.copy(database, pristine)
+
+    results = []
+    log(f'{"target":<10}{"scenario":<16}{"requests":>9}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+        f'{"queries":>9}{"RSS MB":>9}{"failed":>8}')
+    for target_name in args.targets.split(','):
+        target = InProcess(app) if target_name == 'client' else Gunicorn(pristine, args.workers)
+        try:
+            for name in args.scenarios.split(','):
+                result = run_scenario(target, name, sample, args)
+                results.append(result)
+                latency = result['latency_ms']
+                queries = f'{result["queries"]["mean"]:.1f}' if result['queries'] else '-'
+                rss = f'{result["peak_rss_mb"]:.0f}' if result['peak_rss_mb'] is not None else '-'
+                log(f'{target_name:<10}{name:<16}{result["requests"]:>9}{result["throughput"]:>9.1f}'
+                    f'{latency["p50"]:>9.1f}{latency["p95"]:>9.1f}{latency["p99"]:>9.1f}{queries:>9}{rss:>9}'
+                    f'{result["failed"]:>8}')
+        finally:
+            target.close()
+    server.shutdown()
+
+    report = {'meta': metadata(args, library), 'results': results}
+    if args.output == '-':
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        log(f'Report written to {args.output}')
+
+    if args.compare:
+        regressions = compare(report, args.compare, args.max_regression)
+        if regressions:
+            log('FAIL:\n  ' + '\n  '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
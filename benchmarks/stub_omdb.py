@@ -0,0 +1,191 @@
+"""Local stand-in for omdbapi.com used by the benchmarks.
+
+Answers ``s=`` searches and ``i=`` lookups with deterministic fake data
+after an optional delay, and counts requests and accepted TCP connections
+so that connection reuse can be measured. With ``fail_every`` set, every
+Nth request is answered with a 503 to exercise retries. With ``posters``
+set, details point at ``/posters/<n>.jpg`` on the stub itself, which
+serves a generated full-size JPEG (this needs Pillow). With ``api_key``
+set, requests with another key get OMDB's 401 "Invalid API key!" answer.
+
+Usage:
+    python -m benchmarks.stub_omdb [--port 8765] [--delay 0.05] [--fail-every 0] [--posters] [--api-key KEY]
+"""
+import argparse
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def fake_details(imdb_id):
+    number = int(''.join(ch for ch in imdb_id if ch.isdigit()) or 0)
+    is_series = number % 2 == 0
+    return {
+        'Title': f'Title {number}',
+        'Year': f'{1980 + number % 40}' + ('–' if is_series else ''),
+        'Genre': ['Drama', 'Comedy', 'Action', 'Sci-Fi'][number % 4],
+        'Director': 'N/A' if is_series else f'Director {number % 97}',
+        'Writer': f'Writer {number % 89}',
+        'Actors': f'Actor {number % 83}, Actor {number % 79}',
+        'Plot': f'Plot of title {number}.',
+        'Poster': 'N/A',
+        'imdbRating': f'{5 + number % 50 / 10:.1f}',
+        'imdbID': imdb_id,
+        'Type': 'series' if is_series else 'movie',
+        'totalSeasons': '3' if is_series else None,
+        'Response': 'True',
+    }
+
+
+class StubOmdbServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay=0.0, fail_every=0, posters=False, api_key=None):
+        super().__init__(address, StubOmdbHandler)
+        self.delay = delay
+        self.fail_every = fail_every
+        self.posters = posters
+        self.api_key = api_key
+        self._images = {}
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def count_request(self):
+        """Count a request; returns whether it should fail"""
+        with self._lock:
+            self.requests += 1
+            return bool(self.fail_every) and self.requests % self.fail_every == 0
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = 0
+            self.connections = 0
+
+    def poster(self, number):
+        """A 600x900 JPEG, different per number and made once"""
+        with self._lock:
+            data = self._images.get(number)
+        if data is None:
+            from PIL import Image, ImageDraw
+
+            image = Image.new('RGB', (600, 900), ((number * 37) % 256, (number * 91) % 256, (number * 53) % 256))
+            draw = ImageDraw.Draw(image)
+            for offset in range(0, 900, 30):
+                draw.line((0, offset, 600, 900 - offset), fill=(255 - offset % 256, 128, offset % 256), width=3)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=92)
+            data = buffer.getvalue()
+            with self._lock:
+                self._images[number] = data
+        return data
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class StubOmdbHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # second write waits on the client's delayed ACK on kept-alive sockets
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        fail = self.server.count_request()
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if fail:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        path = urlparse(self.path).path
+        if path.startswith('/posters/') and path.endswith('.jpg'):
+            digits = path[len('/posters/'):-len('.jpg')]
+            if not digits.isdigit():
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self._send(self.server.poster(int(digits)), 'image/jpeg')
+            return
+
+        query = {name: values[0] for name, values in parse_qs(urlparse(self.path).query).items()}
+        if self.server.api_key and query.get('apikey') != self.server.api_key:
+            self._send(b'{"Response":"False","Error":"Invalid API key!"}', 'application/json; charset=utf-8',
+                       status=401)
+            return
+        if 's' in query:
+            body = {
+                'Search': [
+                    {'Title': f'{query["s"]} {n}', 'Year': str(2000 + n), 'imdbID': f'tt{n:07d}',
+                     'Type': 'movie', 'Poster': 'N/A'}
+                    for n in range(1, 11)
+                ],
+                'totalResults': '10',
+                'Response': 'True',
+            }
+        elif query.get('i', '').startswith('tt'):
+            body = fake_details(query['i'])
+            if self.server.posters:
+                number = int(''.join(ch for ch in query['i'] if ch.isdigit()) or 0)
+                body['Poster'] = f'http://{self.headers["Host"]}/posters/{number}.jpg'
+            if 'Season' in query:
+                season = int(query['Season'])
+                body = {
+                    'Title': body['Title'],
+                    'Season': str(season),
+                    'totalSeasons': '3',
+                    'Episodes': [
+                        {'Title': f'Episode {n}', 'Episode': str(n), 'imdbID': f'{query["i"]}s{season}e{n}'}
+                        for n in range(1, 9 + season)
+                    ],
+                    'Response': 'True',
+                }
+        else:
+            body = {'Response': 'False', 'Error': 'Incorrect IMDb ID.'}
+
+        self._send(json.dumps(body).encode('utf-8'), 'application/json; charset=utf-8')
+
+    def _send(self, data, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stub OMDB server')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds to wait before answering')
+    parser.add_argument('--fail-every', type=int, default=0, help='answer every Nth request with a 503')
+    parser.add_argument('--posters', action='store_true', help='serve generated poster images')
+    parser.add_argument('--api-key', help='answer requests with any other key with a 401')
+    args = parser.parse_args()
+
+    server = StubOmdbServer(('127.0.0.1', args.port), delay=args.delay, fail_every=args.fail_every,
+                            posters=args.posters, api_key=args.api_key)
+    print(f'Stub OMDB listening on {server.url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
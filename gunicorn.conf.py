@@ -0,0 +1,37 @@
+"""Gunicorn settings for the web service.
+
+Gunicorn reads this file from the working directory; every setting can be
+overridden from the environment. Defaults were checked with
+``python -m benchmarks.bench_gunicorn``: one process per core (at most
+four) with threaded workers, since requests mostly wait on the database or
+OMDB, and the app preloaded in the master so workers start from its
+imported modules. More processes than cores only added latency.
+
+Each process opens up to ``threads`` + ``JOB_WORKER_THREADS`` database
+connections at once; keep ``DB_POOL_SIZE`` + ``DB_MAX_OVERFLOW`` above that.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 20
+keepalive = 5
+# Recycle workers now and then, staggered so they do not restart together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+
+
+def post_fork(server, worker):
+    # Connections the master may have opened must not be shared with workers
+    from wsgi import app, db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
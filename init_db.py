@@ -1,5 +1,6 @@
 from wsgi import db, app
+from app.utils.schema import init_schema
 
 with app.app_context():
-    db.create_all()
-    print("Database tables created successfully!")
\ No newline at end of file
+    init_schema()
+    print("Database tables created successfully!")
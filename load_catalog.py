@@ -0,0 +1,39 @@
+"""Load titles into the local catalog that answers searches before OMDB.
+
+Takes IMDb dataset dumps (https://datasets.imdbws.com/: title.basics.tsv.gz,
+then title.ratings.tsv.gz so titles can be ranked by votes), files of OMDB
+details responses with one JSON object per line, or the responses already
+in the OMDB cache. Files are read as streams, so they can be any size.
+
+Usage:
+    python load_catalog.py title.basics.tsv.gz title.ratings.tsv.gz [--kinds movie,series]
+    python load_catalog.py --from-omdb-cache
+"""
+import argparse
+import time
+
+from wsgi import db, app
+from app.services.catalog import DEFAULT_KINDS, load_catalog, load_omdb_cache, reindex_catalog
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('paths', nargs='*', help='dump files, loaded in order')
+parser.add_argument('--from-omdb-cache', action='store_true', help='also load the cached OMDB details')
+parser.add_argument('--kinds', default=','.join(DEFAULT_KINDS),
+                    help='kinds of title to load: movie, series, episode, game')
+args = parser.parse_args()
+if not args.paths and not args.from_omdb_cache:
+    parser.error('nothing to load')
+kinds = tuple(kind.strip() for kind in args.kinds.split(',') if kind.strip())
+
+with app.app_context():
+    for path in args.paths:
+        start = time.perf_counter()
+        counts = load_catalog(path, kinds, reindex=False)
+        print(f"{path}: {counts['loaded']} loaded, {counts['skipped']} skipped of {counts['read']} "
+              f"in {time.perf_counter() - start:.0f}s")
+    if args.from_omdb_cache:
+        counts = load_omdb_cache(kinds, reindex=False)
+        print(f"OMDB cache: {counts['loaded']} loaded, {counts['skipped']} skipped of {counts['read']}")
+    start = time.perf_counter()
+    backend = reindex_catalog()
+    print(f"Catalog ({backend.name}) indexed in {time.perf_counter() - start:.0f}s")
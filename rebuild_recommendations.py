@@ -0,0 +1,16 @@
+"""Rebuild the feature matrix behind similar titles and recommendations.
+
+Web processes build it on first use and queue a rebuild once enough titles
+have changed; this builds it ahead of time, e.g. after a deploy or a large
+import.
+
+Usage:
+    python rebuild_recommendations.py
+"""
+from wsgi import db, app
+from app.services.recommendations import rebuild_index
+
+with app.app_context():
+    build = rebuild_index()
+    print(f"Recommendation index {build['build']} built: {build['titles']} titles, "
+          f"{build['features']} features in {build['seconds']}s")
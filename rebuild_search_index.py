@@ -0,0 +1,14 @@
+"""Rebuild the full-text search index from the movie and TV show tables.
+
+The index is kept in step with every write by the database itself; this is
+for repairs, e.g. after restoring tables from a backup.
+
+Usage:
+    python rebuild_search_index.py
+"""
+from wsgi import db, app
+from app.services.search import rebuild_search
+
+with app.app_context():
+    backend = rebuild_search()
+    print(f"Search index ({backend.name}) rebuilt successfully!")
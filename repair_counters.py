@@ -0,0 +1,20 @@
+"""Check and rebuild the stored watched-episode counters.
+
+Usage:
+    python repair_counters.py          # rebuild every show's counters
+    python repair_counters.py --check  # only report shows that are off
+"""
+import sys
+
+from wsgi import db, app
+from app.services.counters import find_counter_drift, rebuild_counters
+
+with app.app_context():
+    drifted = find_counter_drift()
+    print(f"{len(drifted)} TV show(s) with counters out of step with their episodes")
+    if drifted:
+        print("  ids: " + ", ".join(str(show_id) for show_id in drifted[:50]) + (" ..." if len(drifted) > 50 else ""))
+    if '--check' in sys.argv[1:]:
+        sys.exit(1 if drifted else 0)
+    rebuild_counters()
+    print("Counters rebuilt successfully!")
@@ -0,0 +1,40 @@
+"""Run background jobs (OMDB enrichment, metadata refresh) in their own process.
+
+Web processes run a few job threads themselves; set JOB_WORKER_THREADS=0
+for them when running this instead.
+
+Usage:
+    python run_worker.py                # run jobs until interrupted
+    python run_worker.py --threads 4    # with 4 worker threads (default: JOB_WORKER_THREADS or 2)
+    python run_worker.py --once         # run the jobs that are due, then exit
+    python run_worker.py --refresh      # queue a sweep for stale metadata first
+"""
+import sys
+import time
+
+from wsgi import db, app
+from app.services.enrichment import HANDLERS, enqueue_refresh
+from app.services.jobs import Worker
+
+args = sys.argv[1:]
+threads = int(args[args.index('--threads') + 1]) if '--threads' in args else max(app.config['JOB_WORKER_THREADS'], 2)
+
+if '--refresh' in args:
+    with app.app_context():
+        enqueue_refresh()
+        db.session.commit()
+    print("Queued a refresh of stale metadata")
+
+worker = Worker(app, HANDLERS, threads=threads)
+if '--once' in args:
+    print(f"Ran {worker.run_until_empty()} job(s)")
+    sys.exit(0)
+
+worker.start()
+print(f"Running background jobs with {threads} thread(s); Ctrl+C to stop")
+try:
+    while True:
+        time.sleep(1)
+except KeyboardInterrupt:
+    print("Stopping after the running jobs finish...")
+    worker.stop()
@@ -0,0 +1,43 @@
+"""Fixtures shared by the tests.
+
+Each test gets a testing app on a fresh SQLite file in its temporary
+directory, rather than the in-memory database, so that several threads
+can use it at once. Nothing here talks to the real OMDB API: the
+process-wide client is left without an API key, and OMDB tests point
+their own client at :mod:`benchmarks.stub_omdb`.
+
+Run from the repository root with ``python -m pytest``.
+"""
+import os
+
+# Read when the process-wide OMDB client is first built
+os.environ['OMDB_API_KEY'] = ''
+
+import pytest
+
+from app import create_app, db
+from app.config import TestingConfig, engine_options
+
+
+def make_app(path):
+    """A testing app on a new SQLite database at ``path``"""
+    url = f'sqlite:///{path}'
+    config = type('FileTestingConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': url,
+        'SQLALCHEMY_ENGINE_OPTIONS': engine_options(url),
+    })
+    return create_app(config)
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path / 'test.db')
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,198 @@
+"""Stored watched-episode counters under concurrent updates, backfill and repair."""
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from sqlalchemy import delete, select, text, update
+
+from app import db
+from app.models.models import Episode, Season, TVShow
+from app.services.counters import find_counter_drift
+from app.utils.schema import upgrade_schema
+from benchmarks.bench_counters import random_request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+THREADS = 6
+
+
+def add_show(client, number, seasons=(20, 20, 20, 20)):
+    response = client.post('/api/tv/', json={'title': f'Show {number}', 'imdb_id': f'tt{number:07d}',
+                                             'seasons': list(seasons)})
+    assert response.status_code == 201, response.get_json()
+    data = response.get_json()
+    return data['id'], [episode['id'] for episode in data['episodes']]
+
+
+def run_threads(app, work):
+    """Run ``work(client, rng)`` in THREADS threads at once; returns the statuses it reported
+
+    ``work`` returns the responses it got. Requests that fail because the
+    database is busy are retried by :func:`send`, so any status of 500 or
+    more left over is a real failure.
+    """
+    statuses = []
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(THREADS)
+
+    def worker(seed):
+        client = app.test_client()
+        rng = random.Random(seed)
+        start.wait()
+        try:
+            codes = work(client, rng)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+            return
+        with lock:
+            statuses.extend(codes)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+    assert all(status < 500 for status in statuses), statuses
+    return statuses
+
+
+def send(client, method, url, body):
+    for attempt in range(5):
+        response = getattr(client, method)(url, json=body)
+        if response.status_code < 500:
+            break
+        time.sleep(0.01 * (attempt + 1))
+    return response.status_code
+
+
+def assert_consistent(app):
+    with app.app_context():
+        assert find_counter_drift() == []
+
+
+def watched_counts(app, show_id):
+    with app.app_context():
+        stored = db.session.get(TVShow, show_id).watched_episodes
+        counted = db.session.execute(
+            select(db.func.count(Episode.id)).where(Episode.tv_show_id == show_id, Episode.watched.is_(True))
+        ).scalar()
+    return stored, counted
+
+
+def test_concurrent_batch_updates(app, client):
+    show_id, _ = add_show(client, 1)
+
+    # Every thread marks every season watched, in its own order; overlapping
+    # batches must not count an episode twice
+    def work(client, rng):
+        seasons = [1, 2, 3, 4]
+        rng.shuffle(seasons)
+        return [send(client, 'patch', f'/api/tv/{show_id}/episodes', {'season': season, 'set': {'watched': True}})
+                for season in seasons]
+
+    run_threads(app, work)
+    assert watched_counts(app, show_id) == (80, 80)
+    assert_consistent(app)
+
+    def work(client, rng):
+        codes = []
+        for _ in range(20):
+            start = rng.randint(1, 20)
+            body = {'from': start, 'to': start + rng.randint(0, 5), 'set': {'watched': rng.random() < 0.5}}
+            if rng.random() < 0.5:
+                body['season'] = rng.randint(1, 4)
+            codes.append(send(client, 'patch', f'/api/tv/{show_id}/episodes', body))
+        return codes
+
+    run_threads(app, work)
+    assert_consistent(app)
+
+
+def test_concurrent_episode_updates(app, client):
+    show_id, episode_ids = add_show(client, 1, seasons=(10, 10))
+
+    def work(client, rng):
+        ids = list(episode_ids)
+        rng.shuffle(ids)
+        return [send(client, 'put', f'/api/tv/{show_id}/episodes/{episode_id}', {'watched': True})
+                for episode_id in ids]
+
+    run_threads(app, work)
+    assert watched_counts(app, show_id) == (20, 20)
+
+    def work(client, rng):
+        return [send(client, 'put', f'/api/tv/{show_id}/episodes/{rng.choice(episode_ids)}',
+                     {'watched': rng.random() < 0.5})
+                for _ in range(30)]
+
+    run_threads(app, work)
+    stored, counted = watched_counts(app, show_id)
+    assert stored == counted
+    assert_consistent(app)
+
+
+def test_concurrent_resizes_and_updates(app, client):
+    shows = [add_show(client, number) for number in range(1, 4)]
+
+    def work(client, rng):
+        codes = []
+        for _ in range(30):
+            show = rng.choice(shows)
+            if rng.random() < 0.3:
+                layout = [rng.randint(5, 25) for _ in range(rng.randint(1, 4))]
+                codes.append(send(client, 'put', f'/api/tv/{show[0]}', {'seasons': layout}))
+            else:
+                method, url, body = random_request(rng, show)
+                codes.append(send(client, method, url, body))
+        return codes
+
+    statuses = run_threads(app, work)
+    # Episodes removed by a concurrent resize are answered with 404
+    assert set(statuses) <= {200, 404}
+    assert_consistent(app)
+
+
+def test_backfill_on_upgrade(app, client):
+    show_id, _ = add_show(client, 1, seasons=(5, 5))
+    client.patch(f'/api/tv/{show_id}/episodes', json={'season': 2, 'set': {'watched': True}})
+    with app.app_context():
+        # A database from before the counters existed
+        db.session.execute(text('ALTER TABLE tv_show DROP COLUMN watched_episodes'))
+        db.session.execute(delete(Season))
+        db.session.commit()
+
+        upgrade_schema()
+
+        assert find_counter_drift() == []
+        assert db.session.get(TVShow, show_id).watched_episodes == 5
+        seasons = db.session.execute(
+            select(Season.number, Season.episode_count, Season.watched_count).order_by(Season.number)
+        ).all()
+        assert [tuple(row) for row in seasons] == [(1, 5, 0), (2, 5, 5)]
+
+
+def test_repair_command(app, client, tmp_path):
+    show_id, _ = add_show(client, 1, seasons=(5, 5))
+    with app.app_context():
+        db.session.execute(update(TVShow).values(watched_episodes=3))
+        db.session.execute(update(Season).where(Season.number == 1).values(watched_count=2))
+        db.session.commit()
+        assert find_counter_drift() == [show_id]
+        database = db.engine.url.database
+
+    env = dict(os.environ, APP_ENV='production', JOB_WORKER_THREADS='0', DATABASE_URL=f'sqlite:///{database}')
+
+    def repair(*args):
+        return subprocess.run([sys.executable, 'repair_counters.py', *args], cwd=ROOT, env=env,
+                              capture_output=True, text=True)
+
+    assert repair('--check').returncode == 1
+    assert repair().returncode == 0
+    assert repair('--check').returncode == 0
+    assert_consistent(app)
@@ -0,0 +1,174 @@
+"""OMDB client and its two-tier cache, against the stub server in benchmarks.stub_omdb."""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app import db
+from app.models.models import OmdbCacheEntry
+from app.services import omdb_cache
+from app.services.omdb import CircuitBreaker, OmdbClient, OmdbError
+from app.services.omdb_cache import LRUCache, OmdbCache
+from benchmarks.stub_omdb import StubOmdbServer
+
+API_KEY = 'test-key'
+TTLS = {'search': 60, 'details': 3600, 'season': 60}
+
+
+class Clock:
+    """Stands in for datetime in app.services.omdb_cache, so entries expire on demand"""
+
+    def __init__(self):
+        self.now = datetime(2024, 1, 1)
+
+    def utcnow(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(omdb_cache, 'datetime', clock)
+    return clock
+
+
+@pytest.fixture
+def stub():
+    server = StubOmdbServer(('127.0.0.1', 0), api_key=API_KEY).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def context(app):
+    with app.app_context():
+        yield
+
+
+def make_client(stub, api_key=API_KEY, stale_ttl=0, breaker=None, **cache_options):
+    cache = OmdbCache(ttls=TTLS, stale_ttl=stale_ttl, **cache_options)
+    return OmdbClient(api_key, base_url=stub.url, cache=cache, breaker=breaker,
+                      session_options={'max_retries': 0})
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_ttl_per_kind(stub, clock):
+    client = make_client(stub)
+    client.search('alien')
+    client.details('tt0000001')
+    assert stub.requests == 2
+
+    client.search('alien')
+    client.details('tt0000001')
+    assert stub.requests == 2
+
+    # Searches expire after a minute, details after an hour
+    clock.advance(TTLS['search'] + 1)
+    client.search('alien')
+    client.details('tt0000001')
+    assert stub.requests == 3
+
+    clock.advance(TTLS['details'])
+    client.details('tt0000001')
+    assert stub.requests == 4
+
+
+def test_stale_while_revalidate(stub, clock):
+    client = make_client(stub, stale_ttl=3600)
+    first = client.details('tt0000001')
+    clock.advance(TTLS['details'] + 1)
+
+    # The stale copy is answered at once while OMDB is asked again behind it
+    stub.delay = 0.5
+    start = time.perf_counter()
+    assert client.details('tt0000001') == first
+    assert time.perf_counter() - start < 0.25
+    assert client.stats()['stale_hits'] == 1
+
+    wait_for(lambda: stub.requests == 2 and not client._revalidating)
+    client.details('tt0000001')
+    assert stub.requests == 2
+    assert client.stats()['memory_hits'] == 1
+
+    # Past the stale window the entry is gone and the lookup waits for OMDB
+    stub.delay = 0
+    clock.advance(TTLS['details'] + 3600 + 1)
+    client.details('tt0000001')
+    assert stub.requests == 3
+    assert client.stats()['misses'] == 2
+
+
+def test_lru_drops_least_recently_used():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert len(cache) == 2
+
+
+def test_table_is_bounded(stub, clock):
+    client = make_client(stub, stale_ttl=60, memory_size=2, max_rows=5)
+    for number in range(8):
+        client.details(f'tt{number:07d}')
+        clock.advance(1)
+    assert len(client.cache.memory) == 2
+
+    client.cache.evict()
+    keys = db.session.execute(select(OmdbCacheEntry.key)).scalars().all()
+    # The least recently used rows went first
+    assert sorted(keys) == sorted(f'details:i=tt{number:07d}&plot=full' for number in range(3, 8))
+
+    # Rows past their stale window go whatever the size
+    clock.advance(TTLS['details'] + 61)
+    client.cache.evict()
+    assert db.session.execute(select(func.count()).select_from(OmdbCacheEntry)).scalar() == 0
+
+
+def test_hit_and_miss_counters(stub, clock):
+    client = make_client(stub)
+    client.details('tt0000001')
+    client.details('tt0000001')
+
+    # Another worker process shares the table but not the memory tier
+    other = make_client(stub)
+    other.details('tt0000001')
+    other.details('tt0000002')
+
+    stats = client.stats()
+    assert (stats['misses'], stats['memory_hits'], stats['stores']) == (1, 1, 1)
+    assert stats['hit_rate'] == 0.5
+    assert stats['circuit'] == 'closed'
+    stats = other.stats()
+    assert (stats['misses'], stats['db_hits'], stats['memory_hits']) == (1, 1, 0)
+    assert stub.requests == 2
+
+
+def test_client_errors_pass_through_without_tripping_the_breaker(stub, clock):
+    client = make_client(stub, api_key='wrong-key', breaker=CircuitBreaker(failure_threshold=2))
+    for _ in range(5):
+        payload = client.details('tt0000001')
+        assert payload == {'Response': 'False', 'Error': 'Invalid API key!'}
+    assert client.breaker.state == 'closed'
+    # Not cached: a fixed key works at once
+    assert stub.requests == 5
+
+    stub.fail_every = 1
+    client.api_key = API_KEY
+    for _ in range(2):
+        with pytest.raises(OmdbError):
+            client.details('tt0000002')
+    assert client.breaker.state == 'open'
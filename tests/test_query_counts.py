@@ -0,0 +1,29 @@
+"""SQL queries per endpoint, against the budgets in benchmarks.bench_queries.
+
+The endpoints run in ``BUDGETS`` order on one seeded database, as in the
+script, since some of them write.
+"""
+import pytest
+
+from app import db
+from benchmarks.bench_queries import BUDGETS, check, measure, seed
+from tests.conftest import make_app
+
+
+@pytest.fixture(scope='module')
+def seeded(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('queries')
+    app = make_app(directory / 'queries.db')
+    client = app.test_client()
+    seed(client, str(directory))
+    yield client
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.mark.parametrize('method, path, body, budget', BUDGETS,
+                         ids=[f'{method} {path}' for method, path, _, _ in BUDGETS])
+def test_query_budget(seeded, method, path, body, budget):
+    label = f'{method} {path.format(page="N")}'
+    assert check(label, measure(seeded, method, path, body), budget) == []
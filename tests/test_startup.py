@@ -0,0 +1,9 @@
+"""Web process startup, against the budget in benchmarks.bench_startup."""
+from benchmarks.bench_startup import BUDGET_MS, measure
+
+
+def test_startup_within_budget():
+    import_ms, _, loaded = measure(runs=3)
+    # Heavy dependencies are imported on first use, not by the web process
+    assert loaded == []
+    assert import_ms <= BUDGET_MS